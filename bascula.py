@@ -0,0 +1,233 @@
+"""Lectura de básculas ganaderas con lector RFID (indicador por puerto serie o TCP).
+
+El indicador envía una línea por lectura con el identificador del animal (chip o arete) y el peso,
+por ejemplo "982000123456789,452.5" o "982 000123456789 452.5 kg". Mientras el animal está en la
+manga llegan varias lecturas seguidas del mismo identificador: se agrupan en una sola pesada con
+la mediana de las muestras, que se emite al cambiar de animal o tras unos segundos sin lecturas.
+
+El lector corre en un hilo y deja las pesadas en una cola; la app las toma por lotes. Incluye un
+simulador TCP de indicador para probar sin equipo:
+
+    python bascula.py --simular --puerto 4001 --ids 982000000000001,982000000000002
+"""
+import argparse
+import queue
+import random
+import re
+import socket
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+
+try:
+    import serial  # pyserial, solo para indicadores por puerto serie
+except ImportError:
+    serial = None
+
+PATRON_LECTURA = re.compile(r"^\s*(?P<id>.+?)[\s,;]+(?P<peso>\d+(?:[.,]\d+)?)\s*(?:kg)?\s*$", re.IGNORECASE)
+SEGUNDOS_ESTABLE = 2.0  # sin lecturas nuevas durante este tiempo la pesada se da por terminada
+SEGUNDOS_RECONEXION = 3.0  # primera espera tras un corte; se duplica en cada fallo seguido
+SEGUNDOS_RECONEXION_MAX = 60.0
+INTENTOS_RECONEXION = 8  # fallos seguidos al abrir el indicador antes de rendirse
+BAUDIOS_POR_DEFECTO = 9600
+
+
+@dataclass
+class Pesada:
+    identificador: str
+    peso: float
+    muestras: int
+    momento: float = field(default_factory=time.time)
+
+
+def normalizar_identificador(valor):
+    """Chip o arete sin espacios ni guiones y en mayúsculas ("982 000-123" y "982000123" son el mismo)."""
+    return re.sub(r"[\s-]", "", str(valor)).upper()
+
+
+def parsear_lectura(linea):
+    """(identificador, peso) de una línea del indicador, o None si no es una lectura válida."""
+    coincidencia = PATRON_LECTURA.match(linea)
+    if not coincidencia:
+        return None
+    identificador = normalizar_identificador(coincidencia.group("id").strip(" ,;"))
+    peso = float(coincidencia.group("peso").replace(",", "."))
+    if not identificador or peso <= 0:
+        return None
+    return identificador, peso
+
+
+class AgrupadorLecturas:
+    """Junta las lecturas consecutivas de un mismo animal en una Pesada."""
+
+    def __init__(self, segundos_estable=SEGUNDOS_ESTABLE):
+        self.segundos_estable = segundos_estable
+        self.actual, self.muestras, self.ultima = None, [], 0.0
+
+    def agregar(self, identificador, peso, momento=None):
+        """Registra una lectura; devuelve la Pesada del animal anterior si este es otro, o None."""
+        momento = time.time() if momento is None else momento
+        terminada = self.cerrar() if identificador != self.actual else None
+        self.actual = identificador
+        self.muestras.append(peso)
+        self.ultima = momento
+        return terminada
+
+    def vencida(self, momento=None):
+        """Pesada en curso si ya pasó el tiempo de estabilidad sin lecturas, o None."""
+        momento = time.time() if momento is None else momento
+        if self.actual is not None and momento - self.ultima >= self.segundos_estable:
+            return self.cerrar()
+        return None
+
+    def cerrar(self):
+        if self.actual is None:
+            return None
+        pesada = Pesada(self.actual, round(statistics.median(self.muestras), 1), len(self.muestras), self.ultima)
+        self.actual, self.muestras = None, []
+        return pesada
+
+
+def abrir_origen(origen, timeout=1.0):
+    """Función que devuelve la siguiente línea (str, "" si no llegó nada a tiempo) y función para cerrar.
+
+    origen: "tcp://host:puerto" o un puerto serie ("/dev/ttyUSB0", "COM3", "serial:///dev/ttyUSB0?baud=4800").
+    """
+    if origen.startswith("tcp://"):
+        host, _, puerto = origen[len("tcp://"):].rpartition(":")
+        conexion = socket.create_connection((host or "localhost", int(puerto)), timeout=timeout)
+        conexion.settimeout(timeout)
+        pendiente = bytearray()
+
+        def leer_tcp():
+            while b"\n" not in pendiente:
+                try:
+                    datos = conexion.recv(4096)
+                except socket.timeout:
+                    return ""
+                if not datos:
+                    raise ConnectionError("El indicador cerró la conexión")
+                pendiente.extend(datos)
+            linea, _, resto = bytes(pendiente).partition(b"\n")
+            pendiente[:] = resto
+            return linea.decode("ascii", "ignore").strip() or ""
+
+        return leer_tcp, conexion.close
+
+    if serial is None:
+        raise RuntimeError("Para leer por puerto serie instala pyserial (pip install pyserial)")
+    puerto, _, opciones = origen.removeprefix("serial://").partition("?")
+    baudios = int(dict(o.split("=", 1) for o in opciones.split("&") if "=" in o).get("baud", BAUDIOS_POR_DEFECTO))
+    puerto_serie = serial.Serial(puerto, baudrate=baudios, timeout=timeout)
+    return (lambda: puerto_serie.readline().decode("ascii", "ignore").strip()), puerto_serie.close
+
+
+class LectorBascula(threading.Thread):
+    """Hilo que lee el indicador y deja cada Pesada en la cola.
+
+    Si se corta se reconecta solo, con esperas que se duplican hasta SEGUNDOS_RECONEXION_MAX; tras
+    INTENTOS_RECONEXION fallos seguidos al abrir el indicador se rinde y el hilo termina con el error.
+    """
+
+    def __init__(self, origen, cola=None, segundos_estable=SEGUNDOS_ESTABLE):
+        super().__init__(daemon=True, name=f"bascula-{origen}")
+        self.origen = origen
+        self.cola = cola if cola is not None else queue.Queue()
+        self.agrupador = AgrupadorLecturas(segundos_estable)
+        self.detenido = threading.Event()
+        self.error = None
+        self.lecturas = 0
+        self.fallos = 0
+
+    def esperar_reconexion(self):
+        espera = min(SEGUNDOS_RECONEXION * 2 ** max(0, self.fallos - 1), SEGUNDOS_RECONEXION_MAX)
+        self.detenido.wait(espera)
+
+    def run(self):
+        while not self.detenido.is_set():
+            try:
+                leer, cerrar = abrir_origen(self.origen)
+            except Exception as e:
+                self.fallos += 1
+                if self.fallos >= INTENTOS_RECONEXION:
+                    self.error = f"Sin conexión tras {self.fallos} intentos: {e}"
+                    return
+                self.error = str(e)
+                self.esperar_reconexion()
+                continue
+            self.error, self.fallos = None, 0
+            try:
+                while not self.detenido.is_set():
+                    lectura = parsear_lectura(leer())
+                    pesada = self.agrupador.agregar(*lectura) if lectura else self.agrupador.vencida()
+                    if lectura: self.lecturas += 1
+                    if pesada: self.cola.put(pesada)
+            except Exception as e:
+                self.error = str(e)
+            finally:
+                cerrar()
+                pesada = self.agrupador.cerrar()
+                if pesada: self.cola.put(pesada)
+            self.esperar_reconexion()
+
+    def detener(self):
+        self.detenido.set()
+
+    def drenar(self):
+        """Todas las pesadas pendientes en la cola."""
+        pesadas = []
+        while True:
+            try:
+                pesadas.append(self.cola.get_nowait())
+            except queue.Empty:
+                return pesadas
+
+
+class SimuladorBascula(threading.Thread):
+    """Indicador TCP simulado: atiende una conexión y envía las lecturas de los animales indicados.
+
+    Por cada animal manda 'repeticiones' lecturas con pequeñas variaciones, como una báscula que se
+    estabiliza, y pasa al siguiente tras 'intervalo' segundos.
+    """
+
+    def __init__(self, identificadores, puerto=0, intervalo=0.5, repeticiones=3, rango_peso=(180.0, 650.0), semilla=None):
+        super().__init__(daemon=True, name="simulador-bascula")
+        self.identificadores = list(identificadores)
+        self.intervalo, self.repeticiones, self.rango_peso = intervalo, repeticiones, rango_peso
+        self.azar = random.Random(semilla)
+        self.servidor = socket.create_server(("127.0.0.1", puerto))
+        self.puerto = self.servidor.getsockname()[1]
+        self.enviadas = 0
+
+    @property
+    def origen(self):
+        return f"tcp://127.0.0.1:{self.puerto}"
+
+    def run(self):
+        with self.servidor:
+            conexion, _ = self.servidor.accept()
+            with conexion:
+                for identificador in self.identificadores:
+                    peso = self.azar.uniform(*self.rango_peso)
+                    for _ in range(self.repeticiones):
+                        conexion.sendall(f"{identificador},{peso + self.azar.uniform(-1.5, 1.5):.1f}\r\n".encode("ascii"))
+                        time.sleep(self.intervalo / (self.repeticiones + 1))
+                    self.enviadas += 1
+                    time.sleep(self.intervalo / (self.repeticiones + 1))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de indicador de báscula con lector RFID (TCP)")
+    parser.add_argument("--simular", action="store_true", help="levanta el simulador y espera una conexión")
+    parser.add_argument("--puerto", type=int, default=4001)
+    parser.add_argument("--ids", default="", help="chips o aretes separados por coma")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="segundos por animal")
+    argumentos = parser.parse_args()
+    if not argumentos.simular:
+        parser.error("indica --simular")
+    ids = [i for i in argumentos.ids.split(",") if i.strip()] or [f"98200000000{n:04d}" for n in range(1, 11)]
+    simulador = SimuladorBascula(ids, argumentos.puerto, argumentos.intervalo)
+    print(f"Simulador esperando conexión en {simulador.origen} ({len(ids)} animales)")
+    simulador.start()
+    simulador.join()
@@ -2,16 +2,28 @@ import streamlit as st
 import gspread
 from google.oauth2.service_account import Credentials
 import pandas as pd
+import numpy as np
 import altair as alt
 from datetime import date, datetime, timedelta
 import os
 import time
 import requests 
 import io 
-from fpdf import FPDF 
+import reportes_pdf
+import bascula
 import uuid 
+import threading
+import heapq
+import hashlib
+import json
+import logging
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from openpyxl import Workbook
 
 # --- CONFIGURACIÓN ---
+log = logging.getLogger("control_ganadero")
 st.set_page_config(page_title="Sistema Ganadero Élite", page_icon="🐮", layout="wide")
 
 # --- 🔑 TU CLAVE DE IMGBB ---
@@ -216,59 +228,250 @@ def conectar_sheets():
         except gspread.exceptions.WorksheetNotFound:
             ws_cuentas = sh.add_worksheet(title="Cuentas", rows="100", cols="5")
             ws_cuentas.append_row(["ID", "Nombre", "Moneda", "Saldo"])
-            
+
+        try:
+            sh.worksheet("Versiones")
+        except gspread.exceptions.WorksheetNotFound:
+            ws_versiones = sh.add_worksheet(title="Versiones", rows="10", cols="2")
+            ws_versiones.append_rows([["Hoja", "Version"]] + [[nombre, "1"] for nombre in HOJAS_DATOS])
+
         return sh
     except Exception as e:
         st.error(f"⚠️ Error conectando con Google Sheets: {e}")
         return None
 
 # --- CARGA DE DATOS (AHORA BLINDADA) ---
-@st.cache_data(ttl=600) 
-def cargar_datos():
-    sh = conectar_sheets()
-    if not sh:
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
+HOJAS_DATOS = ["Animales", "Historial", "Cuentas"]
+
+# Función auxiliar para leer hojas y evitar el error de las columnas vacías ("")
+def tabla_desde_valores(datos):
+    if not datos or len(datos) < 2:
+        return pd.DataFrame()
     
-    # Función auxiliar para leer hojas y evitar el error de las columnas vacías ("")
-    def leer_hoja_segura(worksheet):
-        datos = worksheet.get_all_values()
-        if not datos or len(datos) < 2:
-            return pd.DataFrame()
-        
-        encabezados = [str(x).strip() for x in datos[0]]
-        df = pd.DataFrame(datos[1:], columns=encabezados)
+    encabezados = [str(x).strip() for x in datos[0]]
+    df = pd.DataFrame(datos[1:], columns=encabezados)
+    
+    # Eliminar cualquier columna que no tenga título (esto soluciona tu error de duplicates: [''])
+    if "" in df.columns:
+        df = df.drop(columns=[""])
         
-        # Eliminar cualquier columna que no tenga título (esto soluciona tu error de duplicates: [''])
-        if "" in df.columns:
-            df = df.drop(columns=[""])
-            
-        return df
-
+    return df
+
+def descargar_hoja(sh, nombre):
+    """Descarga una hoja completa. Devuelve (DataFrame, revisión del contenido)."""
+    hoja = sh.get_worksheet(0) if nombre == "Animales" else sh.worksheet(nombre)
+    valores = hoja.get_all_values()
+    df = tabla_desde_valores(valores)
+    if nombre == "Animales" and not df.empty:
+        df.columns = df.columns.astype(str).str.strip()
+        df["ID"] = df["ID"].astype(str)
+    return df, revision_contenido(valores)
+
+# --- VERSIONES POR HOJA ---
+# La hoja "Versiones" guarda un número por hoja de datos que se cambia en cada escritura.
+# Cada sesión compara esas versiones (una lectura mínima) y solo recarga las hojas que cambiaron.
+SEGUNDOS_CHEQUEO_VERSION = 5
+
+def nueva_version():
+    return str(time.time_ns())
+
+@st.cache_data(ttl=SEGUNDOS_CHEQUEO_VERSION)
+def leer_versiones():
+    """Versión de cada hoja según la hoja Versiones, o None si no se pudo leer."""
+    sh = conectar_sheets()
+    if not sh:
+        return None
     try:
-        hoja_animales = sh.get_worksheet(0)
-        df = leer_hoja_segura(hoja_animales)
-        if not df.empty:
-            df.columns = df.columns.astype(str).str.strip()
-            df["ID"] = df["ID"].astype(str)
+        filas = sh.worksheet("Versiones").get_all_values()
+        return {fila[0]: fila[1] for fila in filas[1:] if len(fila) > 1 and fila[1]}
     except Exception as e:
-        st.error(f"🚨 Error leyendo la pestaña de Animales: {e}")
-        df = pd.DataFrame()
+        log.warning("No se pudo leer la hoja Versiones: %s", e)
+        return None
+
+def marcar_version(sh, nombre):
+    """Cambia la versión de una hoja (su fila se busca por nombre en la columna A). Devuelve si se pudo.
 
+    Si falla, las demás sesiones no se enteran del cambio; al menos este proceso descarta su caché y su
+    snapshot de la hoja para no seguir sirviendo datos anteriores a su propia escritura.
+    """
     try:
-        hoja_historial = sh.worksheet("Historial")
-        df_hist = leer_hoja_segura(hoja_historial)
+        hoja = sh.worksheet("Versiones")
+        nombres = hoja.col_values(1)
+        if nombre in nombres:
+            hoja.update_cell(nombres.index(nombre) + 1, 2, nueva_version())
+        else:
+            hoja.append_row([nombre, nueva_version()])
+        marcada = True
     except Exception as e:
-        st.error(f"🚨 Error leyendo el Historial: {e}")
-        df_hist = pd.DataFrame()
-        
+        log.warning("No se pudo cambiar la versión de %s: %s", nombre, e)
+        marcada = False
+    leer_versiones.clear()
+    if not marcada:
+        descartar_snapshot(nombre)
+        cargar_hoja.clear()
+    return marcada
+
+# --- SNAPSHOT LOCAL (ARRANQUE EN FRÍO) ---
+# Cada hoja ya cargada se guarda en disco como Feather junto a su versión, para pintar al instante
+# tras un reinicio. Un hilo en segundo plano detecta ediciones hechas directamente en Google Sheets.
+DIR_SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot")
+RUTA_META_SNAPSHOT = os.path.join(DIR_SNAPSHOT, "meta.json")
+SEGUNDOS_RECONCILIACION = 600
+
+def revision_contenido(valores):
+    """Huella del contenido crudo de una hoja, usada como marcador de revisión."""
+    return hashlib.sha1(json.dumps(valores, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def ruta_snapshot(nombre):
+    return os.path.join(DIR_SNAPSHOT, f"{nombre.lower()}.feather")
+
+def leer_meta_snapshot():
+    try:
+        with open(RUTA_META_SNAPSHOT, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+@st.cache_resource
+def estado_cache():
+    return {"lock_snapshot": threading.Lock(), "lock_reconciliacion": threading.Lock(), "ultima_reconciliacion": 0.0,
+            "pendientes": set()}
+
+def guardar_snapshot_hoja(nombre, df, version, revision):
     try:
-        hoja_cuentas = sh.worksheet("Cuentas")
-        df_cuentas = leer_hoja_segura(hoja_cuentas)
+        os.makedirs(DIR_SNAPSHOT, exist_ok=True)
+        with estado_cache()["lock_snapshot"]:
+            tmp = ruta_snapshot(nombre) + ".tmp"
+            df.reset_index(drop=True).to_feather(tmp)
+            os.replace(tmp, ruta_snapshot(nombre))
+            meta = leer_meta_snapshot()
+            meta[nombre] = {"version": version, "revision": revision}
+            tmp_meta = RUTA_META_SNAPSHOT + ".tmp"
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_meta, RUTA_META_SNAPSHOT)
+    except Exception:
+        pass
+
+def descartar_snapshot(nombre):
+    """Quita la hoja del meta del snapshot para que la próxima carga la descargue de Sheets."""
+    try:
+        with estado_cache()["lock_snapshot"]:
+            meta = leer_meta_snapshot()
+            if meta.pop(nombre, None) is not None:
+                tmp_meta = RUTA_META_SNAPSHOT + ".tmp"
+                with open(tmp_meta, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+                os.replace(tmp_meta, RUTA_META_SNAPSHOT)
     except Exception as e:
-        st.error(f"🚨 Error leyendo las Cuentas: {e}")
-        df_cuentas = pd.DataFrame()
-        
-    return df, df_hist, df_cuentas
+        log.warning("No se pudo descartar el snapshot de %s: %s", nombre, e)
+
+def leer_snapshot_hoja(nombre, version):
+    if leer_meta_snapshot().get(nombre, {}).get("version") != version:
+        return None
+    try:
+        return feather.read_table(ruta_snapshot(nombre), memory_map=True).to_pandas()
+    except Exception:
+        return None
+
+def reconciliar_snapshot(sh):
+    """Compara en segundo plano el snapshot con Sheets y anota en 'pendientes' las hojas editadas a mano.
+
+    El hilo corre fuera de la ejecución del script: recibe la conexión ya abierta y no llama a st.* (ni a
+    marcar_version, que limpia cachés); el cambio de versión lo hace aplicar_reconciliacion en la próxima carga.
+    """
+    estado = estado_cache()
+    if not estado["lock_reconciliacion"].acquire(blocking=False):
+        return
+    estado["ultima_reconciliacion"] = time.time()
+
+    def tarea():
+        try:
+            filas = sh.worksheet("Versiones").get_all_values()
+            versiones = {fila[0]: fila[1] for fila in filas[1:] if len(fila) > 1}
+            meta = leer_meta_snapshot()
+            for nombre in HOJAS_DATOS:
+                info = meta.get(nombre)
+                if not info or info.get("version") != versiones.get(nombre):
+                    continue
+                _, revision = descargar_hoja(sh, nombre)
+                if revision != info.get("revision"):
+                    with estado["lock_snapshot"]:
+                        estado["pendientes"].add(nombre)
+        except Exception as e:
+            log.warning("Reconciliación del snapshot interrumpida: %s", e)
+        finally:
+            estado["lock_reconciliacion"].release()
+
+    threading.Thread(target=tarea, daemon=True).start()
+
+@st.cache_data(max_entries=len(HOJAS_DATOS) * 2)
+def cargar_hoja(nombre, version):
+    """Carga una hoja; la caché se indexa por versión, así que solo se recarga la hoja que cambió."""
+    df = leer_snapshot_hoja(nombre, version)
+    if df is not None:
+        return df
+    sh = conectar_sheets()
+    if not sh:
+        return pd.DataFrame()
+    df, revision = descargar_hoja(sh, nombre)
+    guardar_snapshot_hoja(nombre, df, version, revision)
+    return df
+
+def aplicar_reconciliacion():
+    """Cambia, ya en el hilo del script, la versión de las hojas que la reconciliación encontró editadas a mano."""
+    estado = estado_cache()
+    with estado["lock_snapshot"]:
+        pendientes = list(estado["pendientes"])
+        estado["pendientes"].clear()
+    if not pendientes:
+        return
+    sh = conectar_sheets()
+    for nombre in pendientes:
+        if not sh:
+            descartar_snapshot(nombre)
+            cargar_hoja.clear()
+        else:
+            marcar_version(sh, nombre)
+
+def versiones_datos():
+    """Versión vigente de cada hoja; sirve de llave de caché para todo lo que se calcula sobre ella."""
+    aplicar_reconciliacion()
+    versiones = leer_versiones()
+    if versiones is None:
+        # Si no se pudo leer (p. ej. Sheets no responde al arrancar) se sirven las versiones del snapshot;
+        # el hilo de reconciliación las compara con Sheets cuando vuelva a responder
+        versiones = {nombre: info.get("version") for nombre, info in leer_meta_snapshot().items()}
+    # Sin versión para una hoja se cae a una caché por ventanas de 10 minutos, como antes
+    respaldo = f"ttl-{int(time.time() // SEGUNDOS_RECONCILIACION)}"
+    return {nombre: versiones.get(nombre) or respaldo for nombre in HOJAS_DATOS}
+
+def cargar_datos(versiones=None):
+    if versiones is None:
+        versiones = versiones_datos()
+    if time.time() - estado_cache()["ultima_reconciliacion"] > SEGUNDOS_RECONCILIACION:
+        sh = conectar_sheets()
+        if sh:
+            reconciliar_snapshot(sh)
+
+    tablas = []
+    for nombre in HOJAS_DATOS:
+        try:
+            tablas.append(cargar_hoja(nombre, versiones[nombre]))
+        except Exception as e:
+            st.error(f"🚨 Error leyendo la pestaña de {nombre}: {e}")
+            tablas.append(pd.DataFrame())
+    return tuple(tablas)
+
+def invalidar_datos(nombre):
+    """Tras una escritura: cambia la versión de esa hoja para que todas las sesiones la recarguen."""
+    sh = conectar_sheets()
+    if sh and marcar_version(sh, nombre):
+        return
+    if not sh:
+        descartar_snapshot(nombre)
+        cargar_hoja.clear()
+    st.warning(f"⚠️ No se pudo avisar del cambio en {nombre} a las demás sesiones; podrían ver datos anteriores hasta recargar.")
 
 # --- FUNCIÓN: SUBIR A IMGBB ---
 def subir_foto_imgbb(archivo):
@@ -304,13 +507,51 @@ def calcular_edad(fecha_nac_str):
 # --- CRUD BASE DE DATOS ---
 def guardar_animal(sheet, datos, rerun=True):
     sheet.append_row(datos)
-    cargar_datos.clear() 
+    invalidar_datos("Animales") 
     st.toast("✅ Animal registrado")
     if rerun:
         st.balloons()
         time.sleep(1)
         st.rerun()
 
+# --- IDs DE EVENTO ---
+# Formato ULID: 48 bits de milisegundos + 80 bits aleatorios en base32 de Crockford (26 caracteres),
+# de modo que ordenar los IDs como texto es ordenarlos por momento de creación.
+# Los IDs antiguos de 8 caracteres siguen siendo válidos; clave_orden_id los ubica antes que los nuevos.
+ALFABETO_ULID = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+@st.cache_resource
+def estado_ids():
+    return {"lock": threading.Lock(), "ms": -1, "azar": 0}
+
+def nuevo_id_evento(momento_ms=None):
+    """ID ordenable por tiempo. Sin momento explícito usa el reloj actual y, dentro de un mismo
+    milisegundo, incrementa la parte aleatoria para que los IDs del proceso sean estrictamente crecientes.
+    Un momento anterior a 1970 no cabe en los 48 bits de tiempo y se rechaza."""
+    if momento_ms is not None:
+        if int(momento_ms) < 0:
+            raise ValueError(f"Momento anterior a 1970: {momento_ms} ms")
+        ms, azar = int(momento_ms), uuid.uuid4().int >> 48
+    else:
+        estado = estado_ids()
+        with estado["lock"]:
+            ms = time.time_ns() // 1_000_000
+            if ms <= estado["ms"]:
+                ms, azar = estado["ms"], estado["azar"] + 1
+                if azar >> 80:
+                    ms, azar = ms + 1, 0
+            else:
+                azar = uuid.uuid4().int >> 48
+            estado["ms"], estado["azar"] = ms, azar
+    valor = (ms << 80) | azar
+    return "".join(ALFABETO_ULID[(valor >> (5 * i)) & 31] for i in range(25, -1, -1))
+
+def clave_orden_id(serie):
+    """Clave de orden para una serie de IDs: los ULID tal cual y los antiguos de 8 caracteres con
+    marca de tiempo cero, así quedan antes que cualquier ID nuevo."""
+    ids = serie.astype(str).str.strip().str.upper()
+    return ids.where(ids.str.len() == 26, "0" * 10 + ids.str.rjust(16, "0"))
+
 def guardar_evento(sh, datos, tipo_evento):
     try:
         worksheet = sh.worksheet("Historial")
@@ -319,11 +560,12 @@ def guardar_evento(sh, datos, tipo_evento):
         worksheet.append_row(["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"])
     
     if len(datos) == 6:
-        id_evento = str(uuid.uuid4())[:8]
+        id_evento = nuevo_id_evento()
         datos.append(id_evento)
         
     worksheet.append_row(datos)
-    cargar_datos.clear()
+    invalidar_datos("Historial")
+    anotar_retiro(datos)
     st.toast(f"✅ {tipo_evento} guardado")
 
 def encontrar_fila_por_id(sheet, id_animal):
@@ -338,7 +580,7 @@ def actualizar_animal_completo(sheet, id_animal, nuevos_datos):
     if fila:
         rango = f"A{fila}:J{fila}"
         sheet.update(rango, [nuevos_datos])
-        cargar_datos.clear() 
+        invalidar_datos("Animales") 
         st.success("✅ Datos actualizados correctamente")
         time.sleep(1)
         st.rerun()
@@ -347,13 +589,38 @@ def cambiar_estado_animal(sheet, id_animal, nuevo_estado):
     fila = encontrar_fila_por_id(sheet, id_animal)
     if fila:
         sheet.update_cell(fila, 9, nuevo_estado)
-        cargar_datos.clear() 
+        invalidar_datos("Animales") 
+
+def actualizar_peso_animal(sheet, id_animal, peso):
+    fila = encontrar_fila_por_id(sheet, id_animal)
+    if fila:
+        sheet.update_cell(fila, 7, str(peso))
+        invalidar_datos("Animales")
+
+def sincronizar_columnas(sheet, valores_por_columna):
+    """Escribe en un solo batch_update los valores de varias columnas: {letra de la hoja: {ID: valor}}."""
+    filas = {str(valor): i + 1 for i, valor in enumerate(sheet.col_values(1))}
+    lista_updates = [{'range': f'{columna}{filas[id_animal]}', 'values': [[str(valor)]]}
+                     for columna, valores_por_id in valores_por_columna.items()
+                     for id_animal, valor in valores_por_id.items() if id_animal in filas]
+    if lista_updates:
+        sheet.batch_update(lista_updates)
+        invalidar_datos("Animales")
+    return len(lista_updates)
+
+def sincronizar_columna(sheet, columna, valores_por_id):
+    """Un valor por animal en la columna indicada (letra de la hoja), en un solo batch_update."""
+    return sincronizar_columnas(sheet, {columna: valores_por_id})
+
+def sincronizar_pesos(sheet, pesos_por_id):
+    """Último peso de cada animal en la columna Peso (G)."""
+    return sincronizar_columna(sheet, "G", pesos_por_id)
 
 def eliminar_animal_db(sheet, id_animal):
     fila = encontrar_fila_por_id(sheet, id_animal)
     if fila:
         sheet.delete_rows(fila)
-        cargar_datos.clear() 
+        invalidar_datos("Animales") 
         st.warning("🗑️ Animal eliminado")
         time.sleep(1)
         st.rerun()
@@ -362,105 +629,2069 @@ def cambiar_estado_vendido(sheet, id_animal):
     fila = encontrar_fila_por_id(sheet, id_animal)
     if fila:
         sheet.update_cell(fila, 9, "VENDIDO") 
-        cargar_datos.clear() 
+        invalidar_datos("Animales") 
 
 # --- FUNCIONES FINANZAS ---
 def crear_cuenta(sh, nombre, moneda, saldo_inicial):
     hoja = sh.worksheet("Cuentas")
     nuevo_id = str(len(hoja.get_all_values())) 
     hoja.append_row([nuevo_id, nombre, moneda, str(saldo_inicial)])
-    cargar_datos.clear()
+    invalidar_datos("Cuentas")
     st.success(f"✅ Cuenta '{nombre}' creada exitosamente.")
 
-def actualizar_saldo_cuenta(sh, nombre_cuenta, variacion_monto):
+def ajustar_saldos(sh, variaciones):
+    """Aplica varias variaciones de saldo {cuenta: monto} con una lectura y un solo batch_update."""
     hoja = sh.worksheet("Cuentas")
-    nombres = hoja.col_values(2) 
-    if nombre_cuenta in nombres:
-        fila = nombres.index(nombre_cuenta) + 1
-        saldo_actual = float(str(hoja.cell(fila, 4).value).replace(",", "")) 
-        nuevo_saldo = saldo_actual + float(variacion_monto)
-        hoja.update_cell(fila, 4, str(nuevo_saldo))
-        cargar_datos.clear()
-
-def eliminar_evento_finanzas_por_id(sh, id_evento):
-    hoja = sh.worksheet("Historial")
-    registros = hoja.get_all_values()
-    fila_a_borrar = None
-    fila_datos = None
-    
-    for i, fila in enumerate(registros):
-        if len(fila) > 6 and str(fila[6]).strip() == str(id_evento).strip():
-            fila_a_borrar = i + 1
-            fila_datos = fila
-            break
-            
-    if fila_a_borrar:
-        tipo = fila_datos[1]
-        det1 = str(fila_datos[3])
-        det2 = str(fila_datos[4])
-        notas = str(fila_datos[5])
-        
-        monto_reversion = 0.0
-        cuenta_reversion = ""
-        
-        try:
-            if tipo == "VENTA":
-                monto_reversion = float(det1.split()[0])
-                if "Ingresa a:" in notas: cuenta_reversion = notas.split("Ingresa a:")[1].split("|")[0].strip()
-            elif tipo == "COMPRA":
-                if "Monto Total:" in notas: monto_reversion = float(notas.split("Monto Total:")[1].split("|")[0].strip())
-                if "Pagado desde:" in notas: cuenta_reversion = notas.split("Pagado desde:")[1].split("|")[0].strip()
-            elif tipo == "APORTE_CAPITAL":
-                cuenta_reversion = det1.replace("Cuenta:", "").strip()
-                monto_reversion = float(det2.replace("Monto:", "").strip())
-            elif tipo == "GASTO_OPERATIVO" or tipo == "INGRESO_OPERATIVO":
-                monto_reversion = float(det1.split("Monto:")[1].split("(Cuenta:")[0].strip())
-                cuenta_reversion = det1.split("(Cuenta:")[1].replace(")", "").strip()
-        except Exception as e:
-            st.error(f"No se pudo detectar el monto exacto para revertir la caja. Borrado manual sugerido en Google Sheets.")
-            return False
-            
-        if cuenta_reversion and monto_reversion > 0:
-            if tipo in ["GASTO_OPERATIVO", "COMPRA"]:
-                actualizar_saldo_cuenta(sh, cuenta_reversion, monto_reversion) 
-            elif tipo in ["VENTA", "APORTE_CAPITAL", "INGRESO_OPERATIVO"]:
-                actualizar_saldo_cuenta(sh, cuenta_reversion, -monto_reversion) 
-
-        hoja.delete_rows(fila_a_borrar)
-        cargar_datos.clear()
-        st.toast("✅ Registro eliminado y dinero devuelto a la cuenta correctamente.")
-        return True
-    else:
+    pendientes = {str(nombre).strip(): float(monto) for nombre, monto in variaciones.items()}
+    lista_updates = []
+    for i, fila in enumerate(hoja.get_all_values()[1:], start=2):
+        nombre = fila[1].strip() if len(fila) > 1 else ""
+        if nombre in pendientes:
+            saldo_actual = float(str(fila[3] if len(fila) > 3 else 0).replace(",", "") or 0)
+            lista_updates.append({'range': f'D{i}', 'values': [[str(saldo_actual + pendientes.pop(nombre))]]})
+    if lista_updates:
+        hoja.batch_update(lista_updates)
+        invalidar_datos("Cuentas")
+    return len(lista_updates)
+
+def actualizar_saldo_cuenta(sh, nombre_cuenta, variacion_monto):
+    ajustar_saldos(sh, {nombre_cuenta: variacion_monto})
+
+@st.cache_data
+def indice_eventos(version_hist, _df_hist):
+    """ID Evento -> fila de la hoja Historial (la fila 1 son los encabezados).
+
+    El historial solo crece por el final (las anulaciones son asientos nuevos, no borrados), así que
+    las filas ya indexadas no se desplazan. Con IDs repetidos gana la primera aparición. Las claves
+    van en mayúsculas (los IDs antiguos se escribieron en minúsculas), igual que se busca.
+    """
+    if _df_hist.empty or "ID Evento" not in _df_hist.columns:
+        return {}
+    ids = _df_hist["ID Evento"].astype(str).str.strip().str.upper().reset_index(drop=True)
+    filas = pd.Series(range(2, len(ids) + 2))
+    validos = ids != ""
+    return dict(zip(ids[validos][::-1], filas[validos][::-1]))
+
+def anular_evento_finanzas(sh, id_evento, version_hist, df_hist):
+    """Anula un movimiento financiero con un asiento de reverso (ANULACION) y revierte los saldos.
+
+    El evento se ubica con el índice por ID y su monto/cuenta salen del libro mayor ya interpretado,
+    así que la anulación cuesta una lectura de verificación, un append y un batch_update de saldos.
+    """
+    id_evento = str(id_evento).strip().upper()
+    fila = indice_eventos(version_hist, df_hist).get(id_evento)
+    if not fila:
         st.error("❌ ID no encontrado. Verifica que lo escribiste correctamente.")
         return False
+    if id_evento in ids_anulados(df_hist):
+        st.warning("⚠️ Ese movimiento ya fue anulado.")
+        return False
+
+    libro = libro_mayor(version_hist, df_hist)["libro"]
+    asiento = libro[libro["ID Evento"].str.strip().str.upper() == id_evento]
+    if asiento.empty:
+        st.error("❌ Ese ID no corresponde a un movimiento financiero.")
+        return False
+    asiento = asiento.iloc[0]
+    if pd.isna(asiento["Monto"]) or not asiento["Cuenta"]:
+        st.error("No se pudo detectar el monto exacto para revertir la caja. Anulación manual sugerida en Google Sheets.")
+        return False
+
+    hoja = sh.worksheet("Historial")
+    fila_hoja = hoja.row_values(fila)
+    if len(fila_hoja) < 7 or fila_hoja[6].strip().upper() != id_evento:
+        st.error("❌ El Historial cambió desde la última carga. Recarga la página e inténtalo de nuevo.")
+        invalidar_datos("Historial")
+        return False
+
+    monto = float(asiento["Monto"])
+    if asiento["Movimiento"] == "Transferencia":
+        monto_destino = asiento["Monto Destino"] if pd.notna(asiento["Monto Destino"]) else monto
+        variaciones = {asiento["Cuenta"]: monto, asiento["Cuenta Destino"]: -float(monto_destino)}
+    elif asiento["Movimiento"] == "Egreso":
+        variaciones = {asiento["Cuenta"]: monto}
+    else:
+        variaciones = {asiento["Cuenta"]: -monto}
 
-def reparar_ids_historial(sh):
-    """Función de auto-sanación que asigna UUIDs a transacciones viejas sin ID"""
+    datos_anulacion = [str(date.today()), "ANULACION", asiento["ID Animal"], f"Anula: {id_evento}",
+                       f"{asiento['Tipo Evento']} | {asiento['Categoría']}", f"Monto: {monto} | Cuenta: {asiento['Cuenta']}"]
+    guardar_evento(sh, datos_anulacion, "Anulación")
+    ajustar_saldos(sh, variaciones)
+    st.toast("✅ Movimiento anulado y dinero devuelto a la cuenta correctamente.")
+    return True
+
+# --- MIGRACIÓN: ID EVENTO FALTANTES ---
+# Los eventos viejos no tienen ID Evento. Al arrancar se detectan en el historial ya cargado y se
+# completan recorriendo la hoja por bloques, sin lecturas ni escrituras que crezcan con su tamaño.
+FILAS_POR_BLOQUE_MIGRACION = 1000
+CELDAS_POR_BATCH_UPDATE = 500
+
+@st.cache_resource
+def estado_migracion_ids():
+    """Estado compartido por todas las sesiones: solo una corre la migración y, una vez completa, nadie la repite."""
+    return {"lock": threading.Lock(), "hecha": False}
+
+def sin_id_evento(tabla):
+    """Máscara de las filas con datos en sus seis primeras columnas y la séptima (ID Evento) vacía.
+
+    La tabla se lee por posición, así sirve igual para el historial cargado que para un bloque crudo
+    de la hoja: detectar y reparar usan exactamente el mismo criterio.
+    """
+    valores = tabla.set_axis(range(tabla.shape[1]), axis=1).reindex(columns=range(7)).fillna("").astype(str)
+    valores = valores.apply(lambda col: col.str.strip())
+    return (valores.iloc[:, :6] != "").any(axis=1) & (valores.iloc[:, 6] == "")
+
+def filas_sin_id_evento(df_hist):
+    """Filas de la hoja Historial (numeración de Sheets) con datos pero sin ID Evento."""
+    if df_hist.empty:
+        return pd.Series(dtype=int)
+    columnas = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+    filas = pd.Series(range(2, len(df_hist) + 2), index=df_hist.index)
+    return filas[sin_id_evento(df_hist.reindex(columns=columnas)).to_numpy()].reset_index(drop=True)
+
+def reparar_ids_historial(sh, desde_fila=2, al_avanzar=None):
+    """Asigna un ID Evento a cada fila con datos del Historial que no lo tenga.
+
+    Lee la hoja por bloques de filas y escribe cada bloque en batch_update acotados. Cada bloque se
+    relee justo antes de escribirlo, así que repetir la migración tras un fallo no pisa IDs ya
+    asignados: basta con volver a llamarla desde la primera fila pendiente. al_avanzar(fila, total)
+    recibe el progreso. Devuelve la cantidad de IDs asignados.
+    """
+    hoja = sh.worksheet("Historial")
+    encabezado = hoja.row_values(1)
+    if len(encabezado) < 7 or encabezado[6].strip() == "":
+        hoja.update_cell(1, 7, "ID Evento")
+
+    total = hoja.row_count
+    asignados = 0
     try:
-        hoja = sh.worksheet("Historial")
-        registros = hoja.get_all_values()
-        if not registros: return 0
-        
-        header = registros[0]
-        if len(header) < 7:
-            hoja.update_cell(1, 7, "ID Evento")
-        elif header[6].strip() == "":
-            hoja.update_cell(1, 7, "ID Evento")
-        
-        lista_updates = []
-        for i, fila in enumerate(registros):
-            if i == 0: continue
-            if len(fila) < 7 or str(fila[6]).strip() == "":
-                nuevo_id = str(uuid.uuid4())[:8]
-                lista_updates.append({'range': f'G{i+1}', 'values': [[nuevo_id]]})
-        
-        if lista_updates:
-            hoja.batch_update(lista_updates)
-            cargar_datos.clear()
-        return len(lista_updates)
-    except Exception as e:
-        st.error(f"Error reparando IDs: {e}")
+        for inicio in range(max(desde_fila, 2), total + 1, FILAS_POR_BLOQUE_MIGRACION):
+            fin = min(inicio + FILAS_POR_BLOQUE_MIGRACION - 1, total)
+            bloque = hoja.get(f"A{inicio}:G{fin}")
+            # Un bloque vacío puede ser solo un hueco: las filas siguientes aún pueden tener datos
+            pendientes = sin_id_evento(pd.DataFrame(list(bloque))) if bloque else pd.Series(dtype=bool)
+            # IDs del reloj actual, crecientes en el orden de la hoja: el orden cronológico lo da Fecha
+            lista_updates = [{'range': f'G{inicio + i}', 'values': [[nuevo_id_evento()]]}
+                             for i in pendientes[pendientes].index]
+            for j in range(0, len(lista_updates), CELDAS_POR_BATCH_UPDATE):
+                lote = lista_updates[j:j + CELDAS_POR_BATCH_UPDATE]
+                hoja.batch_update(lote)
+                asignados += len(lote)
+            if al_avanzar:
+                al_avanzar(fin, total)
+    finally:
+        if asignados:
+            invalidar_datos("Historial")
+    return asignados
+
+# --- ANALÍTICA DE PRODUCCIÓN ---
+def eventos_de_tipo(df_hist, tipos):
+    """Eventos del historial de los tipos indicados, con la fecha ya convertida en 'Fecha_DT'."""
+    if df_hist.empty or "Tipo Evento" not in df_hist.columns:
+        columnas = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+        vacio = pd.DataFrame({c: pd.Series(dtype=str) for c in columnas})
+        vacio["Fecha_DT"] = pd.Series(dtype="datetime64[ns]")
+        return vacio
+    ev = df_hist[df_hist["Tipo Evento"].isin(tipos)].copy()
+    ev["ID Animal"] = ev["ID Animal"].astype(str)
+    ev["Fecha_DT"] = pd.to_datetime(ev["Fecha"], errors="coerce").astype("datetime64[ns]")
+    return ev.dropna(subset=["Fecha_DT"])
+
+DIAS_LACTANCIA_ESTANDAR = 305
+# La leche de una vaca en retiro se registra igual pero con esta marca en Detalle 2 ("Mañana | Descarte: Retiro")
+MARCA_DESCARTE = "Descarte: Retiro"
+
+def leche_descartada(leche):
+    """Máscara de los registros de leche descartada. Los anteriores a la marca solo la llevaban en la nota."""
+    return (leche["Detalle 2"].astype(str).str.contains("Descarte:", regex=False)
+            | leche["Notas"].astype(str).str.startswith("Descartada (retiro"))
+
+@st.cache_data
+def analitica_leche(version_hist, _df_hist):
+    """Curvas de lactancia de todo el hato en una sola pasada (la caché se indexa por versión del Historial).
+
+    Devuelve un dict con:
+      - diario: litros por vaca y día, con DEL y promedios móviles de 7 y 30 días
+      - por_vaca: resumen de la lactancia actual (DEL, promedios, pico y proyección a 305 días)
+      - hato: total diario de la finca (incluye los totales de LOTE_GENERAL) con promedio de 7 días
+      - curva: litros promedio por semana de lactancia de todo el hato
+    La leche descartada por retiro no cuenta en ninguno.
+    """
+    hoy = pd.Timestamp(date.today())
+    leche = eventos_de_tipo(_df_hist, ["PRODUCCION_LECHE"])
+    leche = leche[~leche_descartada(leche)]
+    leche["Litros"] = pd.to_numeric(leche["Detalle 1"], errors="coerce")
+    leche = leche.dropna(subset=["Litros"])
+
+    hato = leche.groupby("Fecha_DT", as_index=False)["Litros"].sum().sort_values("Fecha_DT")
+    hato["Prom 7d"] = hato.rolling("7D", on="Fecha_DT")["Litros"].mean() if not hato.empty else pd.Series(dtype=float)
+
+    # Mañana y tarde se suman en un solo registro diario por vaca
+    diario = (leche[leche["ID Animal"] != "LOTE_GENERAL"]
+              .groupby(["ID Animal", "Fecha_DT"], as_index=False)["Litros"].sum()
+              .sort_values(["ID Animal", "Fecha_DT"], ignore_index=True))
+    if diario.empty:
+        columnas_vaca = ["ID Animal", "Último Registro", "Pico", "Registros", "Acumulado", "Prom 7d", "Prom 30d",
+                         "DEL Pico", "Último Parto", "DEL", "Proyección 305d"]
+        return {"diario": diario.assign(**{"Prom 7d": 0.0, "Prom 30d": 0.0, "DEL": 0.0}),
+                "por_vaca": pd.DataFrame(columns=columnas_vaca), "hato": hato,
+                "curva": pd.DataFrame(columns=["Semana", "Litros"])}
+    por_dia = diario.set_index("Fecha_DT").groupby("ID Animal")["Litros"]
+    diario["Prom 7d"] = por_dia.rolling("7D").mean().to_numpy()
+    diario["Prom 30d"] = por_dia.rolling("30D").mean().to_numpy()
+
+    # Cada registro se asocia al último parto anterior a su fecha
+    partos = (eventos_de_tipo(_df_hist, ["PARTO"])[["ID Animal", "Fecha_DT"]]
+              .rename(columns={"Fecha_DT": "Fecha Parto"}).sort_values("Fecha Parto"))
+    diario = pd.merge_asof(diario.sort_values("Fecha_DT"), partos, left_on="Fecha_DT", right_on="Fecha Parto",
+                           by="ID Animal", direction="backward").sort_values(["ID Animal", "Fecha_DT"], ignore_index=True)
+    diario["DEL"] = (diario["Fecha_DT"] - diario["Fecha Parto"]).dt.days
+
+    ultimo_parto = partos.groupby("ID Animal")["Fecha Parto"].max()
+    diario = diario.join(ultimo_parto.rename("Último Parto"), on="ID Animal")
+    actual = diario[(diario["Fecha Parto"] == diario["Último Parto"]) | diario["Último Parto"].isna()]
+    en_305 = actual[actual["DEL"].isna() | (actual["DEL"] <= DIAS_LACTANCIA_ESTANDAR)]
+
+    por_vaca = actual.groupby("ID Animal").agg(**{
+        "Último Registro": ("Fecha_DT", "max"), "Pico": ("Litros", "max"), "Registros": ("Litros", "size")})
+    por_vaca["Acumulado"] = en_305.groupby("ID Animal")["Litros"].sum()
+    por_vaca[["Prom 7d", "Prom 30d"]] = diario.groupby("ID Animal")[["Prom 7d", "Prom 30d"]].last()
+    por_vaca["DEL Pico"] = actual.loc[actual.groupby("ID Animal")["Litros"].idxmax()].set_index("ID Animal")["DEL"]
+    por_vaca["Último Parto"] = ultimo_parto
+    por_vaca["DEL"] = (hoy - por_vaca["Último Parto"]).dt.days
+    dias_restantes = (DIAS_LACTANCIA_ESTANDAR - por_vaca["DEL"]).clip(lower=0)
+    por_vaca["Proyección 305d"] = por_vaca["Acumulado"].fillna(0) + por_vaca["Prom 7d"] * dias_restantes
+    por_vaca = por_vaca.reset_index()
+
+    curva = (diario[diario["DEL"].between(0, DIAS_LACTANCIA_ESTANDAR)]
+             .assign(Semana=lambda d: d["DEL"] // 7)
+             .groupby("Semana", as_index=False)["Litros"].mean())
+
+    return {"diario": diario, "por_vaca": por_vaca, "hato": hato, "curva": curva}
+
+@st.cache_data
+def analitica_peso(version_hist, version_animales, _df, _df_hist):
+    """Ganancia diaria de peso (GMD) de cada animal por regresión lineal sobre todos sus PESAJE.
+
+    La pendiente se obtiene de las sumas por grupo (n, Σt, Σp, Σt², Σtp), así que todo el hato se
+    resuelve con un solo groupby. Devuelve un dict con 'pesajes' (eventos ordenados con la ganancia
+    entre pesajes consecutivos) y 'por_animal' (último peso, GMD en kg/día y datos de la ficha).
+    """
+    pesajes = eventos_de_tipo(_df_hist, ["PESAJE"])
+    pesajes["Peso"] = pd.to_numeric(pesajes["Detalle 1"], errors="coerce")
+    pesajes = pesajes[pesajes["Peso"] > 0].sort_values(["ID Animal", "Fecha_DT"], ignore_index=True)
+    pesajes["Ganancia"] = pesajes.groupby("ID Animal")["Peso"].diff()
+
+    # Días desde el primer pesaje de cada animal (centrar mejora la estabilidad numérica)
+    t = (pesajes["Fecha_DT"] - pesajes.groupby("ID Animal")["Fecha_DT"].transform("min")).dt.days.astype(float)
+    sumas = pd.DataFrame({"ID Animal": pesajes["ID Animal"], "t": t, "p": pesajes["Peso"], "tt": t * t, "tp": t * pesajes["Peso"]})
+    g = sumas.groupby("ID Animal").agg(n=("t", "size"), st=("t", "sum"), sp=("p", "sum"), stt=("tt", "sum"), stp=("tp", "sum"))
+    denominador = g["n"] * g["stt"] - g["st"] ** 2
+    gmd = (g["n"] * g["stp"] - g["st"] * g["sp"]) / denominador.where(denominador > 0)
+
+    ultimos = pesajes.groupby("ID Animal").tail(1).set_index("ID Animal")
+    por_animal = pd.DataFrame({
+        "Pesajes": g["n"],
+        "Primer Pesaje": pesajes.groupby("ID Animal")["Fecha_DT"].min(),
+        "Último Pesaje": ultimos["Fecha_DT"],
+        "Último Peso": ultimos["Peso"],
+        "GMD": gmd,
+    })
+
+    if not _df.empty:
+        ficha = _df.set_index("ID")
+        columnas_ficha = [c for c in ["Nombre", "Tipo", "Sexo", "Lote", "Estado", "Peso", "Nacimiento", "PesoNac"] if c in ficha.columns]
+        por_animal = ficha[columnas_ficha].rename(columns={"Peso": "Peso Ficha"}).join(por_animal, how="left")
+        por_animal.index.name = "ID Animal"
+
+        # Sin dos pesajes se usa el peso al nacer registrado (nunca uno supuesto) y la edad
+        if "PesoNac" in por_animal.columns:
+            peso_nac = pd.to_numeric(por_animal["PesoNac"], errors="coerce")
+            peso_actual = por_animal["Último Peso"].fillna(pd.to_numeric(por_animal["Peso Ficha"], errors="coerce"))
+            dias_vida = (pd.Timestamp(date.today()) - pd.to_datetime(por_animal["Nacimiento"], errors="coerce")).dt.days
+            gmd_nacimiento = (peso_actual - peso_nac) / dias_vida.where(dias_vida > 0)
+            por_animal["GMD"] = por_animal["GMD"].fillna(gmd_nacimiento.where(peso_nac > 0))
+
+    return {"pesajes": pesajes, "por_animal": por_animal.reset_index()}
+
+def dias_a_peso_objetivo(por_animal, peso_objetivo):
+    """Días estimados para que cada animal alcance el peso objetivo, en un solo cálculo vectorizado."""
+    peso_actual = por_animal["Último Peso"]
+    if "Peso Ficha" in por_animal.columns:
+        peso_actual = peso_actual.fillna(pd.to_numeric(por_animal["Peso Ficha"], errors="coerce"))
+    faltante = (peso_objetivo - peso_actual).clip(lower=0)
+    dias = (faltante / por_animal["GMD"].where(por_animal["GMD"] > 0)).round()
+    return dias.mask(faltante == 0, 0)
+
+def distribucion_peso(por_animal, columna_grupo=None):
+    """Resumen de GMD y peso del hato completo o por grupo (ej. 'Lote')."""
+    if not columna_grupo or columna_grupo not in por_animal.columns:
+        por_animal = por_animal.assign(Hato="Todo el hato")
+        columna_grupo = "Hato"
+    return por_animal.groupby(columna_grupo, as_index=False).agg(**{
+        "Animales": ("ID Animal", "size"), "Con GMD": ("GMD", "count"),
+        "GMD Promedio": ("GMD", "mean"), "GMD P25": ("GMD", lambda s: s.quantile(0.25)),
+        "GMD Mediana": ("GMD", "median"), "GMD P75": ("GMD", lambda s: s.quantile(0.75)),
+        "Peso Promedio": ("Último Peso", "mean"),
+    })
+
+DIAS_GESTACION = 283
+
+@st.cache_data
+def kpis_reproductivos(version_hist, version_animales, _df, _df_hist):
+    """KPIs reproductivos de cada vaca y del hato en una sola pasada vectorizada.
+
+    La concepción de cada chequeo positivo es el último servicio (FECUNDACION) anterior a él; el ciclo
+    actual de una vaca empieza en su último parto o aborto. Devuelve un dict con 'por_vaca', 'hato'
+    (indicadores globales) y 'calendario' (partos esperados de las vacas preñadas).
+    """
+    hoy = pd.Timestamp(date.today())
+    ev = eventos_de_tipo(_df_hist, ["FECUNDACION", "CHEQUEO_REPRO", "PARTO", "ABORTO"]).sort_values("Fecha_DT")
+    de_tipo = lambda tipo: ev.loc[ev["Tipo Evento"] == tipo, ["ID Animal", "Fecha_DT"]]
+
+    servicios = de_tipo("FECUNDACION").rename(columns={"Fecha_DT": "Fecha Servicio"})
+    partos = de_tipo("PARTO")
+    abortos = de_tipo("ABORTO")
+    positivos = (ev.loc[(ev["Tipo Evento"] == "CHEQUEO_REPRO") & (ev["Detalle 1"] == "Preñada"), ["ID Animal", "Fecha_DT"]]
+                 .rename(columns={"Fecha_DT": "Fecha Chequeo"}))
+
+    concepciones = pd.merge_asof(positivos, servicios, left_on="Fecha Chequeo", right_on="Fecha Servicio", by="ID Animal", direction="backward")
+    concepciones["Fecha Concepción"] = concepciones["Fecha Servicio"].fillna(concepciones["Fecha Chequeo"])
+    concepciones = concepciones.drop_duplicates(["ID Animal", "Fecha Concepción"])
+
+    ids = pd.Index(ev["ID Animal"].unique(), name="ID Animal")
+    if not _df.empty and "Sexo" in _df.columns:
+        ids = ids.union(pd.Index(_df.loc[_df["Sexo"] == "Hembra", "ID"].astype(str), name="ID Animal"))
+    por_vaca = pd.DataFrame(index=ids)
+
+    por_vaca["Partos"] = partos.groupby("ID Animal").size()
+    por_vaca["Abortos"] = abortos.groupby("ID Animal").size()
+    por_vaca["Servicios"] = servicios.groupby("ID Animal").size()
+    por_vaca[["Partos", "Abortos", "Servicios"]] = por_vaca[["Partos", "Abortos", "Servicios"]].fillna(0).astype(int)
+    por_vaca["Concepciones"] = concepciones.groupby("ID Animal").size().reindex(ids, fill_value=0).clip(lower=por_vaca["Partos"] + por_vaca["Abortos"])
+
+    intervalos = partos.groupby("ID Animal")["Fecha_DT"].diff().dt.days
+    por_vaca["IEP Promedio"] = intervalos.groupby(partos["ID Animal"]).mean()
+    por_vaca["Último Parto"] = partos.groupby("ID Animal")["Fecha_DT"].max()
+    cierres = pd.concat([partos, abortos]).groupby("ID Animal")["Fecha_DT"].max()
+    por_vaca["Último Cierre"] = cierres
+
+    # Ciclo actual: servicios y concepciones posteriores al último parto o aborto
+    servicios = servicios.join(cierres.rename("Cierre"), on="ID Animal")
+    en_ciclo = servicios["Cierre"].isna() | (servicios["Fecha Servicio"] > servicios["Cierre"])
+    por_vaca["Servicios Ciclo"] = servicios[en_ciclo].groupby("ID Animal").size().reindex(ids, fill_value=0)
+    concepciones = concepciones.join(cierres.rename("Cierre"), on="ID Animal")
+    vigentes = concepciones[concepciones["Cierre"].isna() | (concepciones["Fecha Concepción"] > concepciones["Cierre"])]
+    por_vaca["Concepción Actual"] = vigentes.groupby("ID Animal")["Fecha Concepción"].max()
+
+    fin_abiertos = por_vaca["Concepción Actual"].fillna(hoy)
+    por_vaca["Días Abiertos"] = (fin_abiertos - por_vaca["Último Parto"]).dt.days
+    # Solo cuentan las concepciones de vacas con servicios registrados
+    por_vaca["Servicios por Concepción"] = (por_vaca["Servicios"] / por_vaca["Concepciones"]).where((por_vaca["Servicios"] > 0) & (por_vaca["Concepciones"] > 0))
+    por_vaca["Fecha Probable Parto"] = por_vaca["Concepción Actual"] + pd.Timedelta(days=DIAS_GESTACION)
+    por_vaca["Días Gestación"] = (hoy - por_vaca["Concepción Actual"]).dt.days
+    por_vaca = por_vaca.reset_index()
+
+    total_partos, total_abortos = por_vaca["Partos"].sum(), por_vaca["Abortos"].sum()
+    con_servicios = por_vaca[por_vaca["Servicios"] > 0]
+    total_servicios, total_concepciones = con_servicios["Servicios"].sum(), con_servicios["Concepciones"].sum()
+    hato = {
+        "IEP Promedio": intervalos.mean(),
+        "Días Abiertos Promedio": por_vaca["Días Abiertos"].mean(),
+        "Servicios por Concepción": total_servicios / total_concepciones if total_concepciones else float("nan"),
+        "Tasa de Concepción": total_concepciones / total_servicios * 100 if total_servicios else float("nan"),
+        "Tasa de Abortos": total_abortos / (total_partos + total_abortos) * 100 if (total_partos + total_abortos) else float("nan"),
+        "Preñadas": int(por_vaca["Concepción Actual"].notna().sum()),
+    }
+
+    calendario = (por_vaca[por_vaca["Fecha Probable Parto"].notna()]
+                  [["ID Animal", "Concepción Actual", "Días Gestación", "Fecha Probable Parto"]]
+                  .sort_values("Fecha Probable Parto", ignore_index=True))
+
+    return {"por_vaca": por_vaca, "hato": hato, "calendario": calendario}
+
+# --- GENEALOGÍA ---
+# Padre y Madre se guardan por ID. Los registros viejos guardaban el nombre: se resuelve al ID del
+# animal con ese nombre y, si no hay ninguno, el progenitor queda como fundador externo ("EXT:nombre"),
+# para que dos hijos del mismo toro externo sigan figurando como medios hermanos.
+VALORES_PROGENITOR_DESCONOCIDO = {"", "desconocido", "desconocida", "no esp.", "nan", "none", "--"}
+UMBRAL_CONSANGUINIDAD = 0.0625  # F de la cría a partir del cual se desaconseja el cruce (primos hermanos)
+
+def resolver_progenitores(valores, df):
+    """ID de cada progenitor a partir de lo guardado (ID, nombre o vacío)."""
+    v = valores.fillna("").astype(str).str.strip()
+    ids = df["ID"].astype(str)
+    nombres = df.assign(_Nombre=df["Nombre"].astype(str).str.strip()).drop_duplicates("_Nombre", keep=False)
+    por_nombre = pd.Series(nombres["ID"].astype(str).to_numpy(), index=nombres["_Nombre"].to_numpy())
+    resuelto = v.where(v.isin(ids)).fillna(v.map(por_nombre)).fillna("EXT:" + v)
+    return resuelto.mask(v.str.lower().isin(VALORES_PROGENITOR_DESCONOCIDO), "")
+
+def generaciones(padres, madres, ids):
+    """Generación de cada animal (0 = fundador), recorriendo el pedigrí por niveles.
+    Los animales en un ciclo (error de carga) quedan con NaN."""
+    gen = pd.Series(0, index=ids, dtype=float)
+    tiene_padres = (padres != "") | (madres != "")
+    gen[tiene_padres.to_numpy()] = float("nan")
+    for _ in range(len(ids)):
+        g_padre = padres.map(gen).where(padres != "", -1)
+        g_madre = madres.map(gen).where(madres != "", -1)
+        nueva = pd.concat([g_padre, g_madre], axis=1).max(axis=1, skipna=False) + 1
+        nueva = pd.Series(nueva.to_numpy(), index=ids).where(tiene_padres.to_numpy(), 0)
+        if nueva.equals(gen):
+            break
+        gen = nueva
+    return gen
+
+@st.cache_data
+def pedigri(version_animales, _df):
+    """Pedigrí del hato completo (incluye vendidos y progenitores externos) con la consanguinidad de Wright.
+
+    F se calcula con el algoritmo de Meuwissen y Luo (1992): por cada animal solo se recorren sus
+    ancestros, sin armar la matriz de parentesco, así escala a decenas de miles de animales.
+    Devuelve un dict con:
+      - tabla: ID, Nombre, Padre, Madre (IDs), Generación y F
+      - orden, padre_idx, madre_idx, d: arrays en orden topológico (índice 0 = desconocido) para parentesco()
+    """
+    if _df.empty:
+        vacia = pd.DataFrame(columns=["ID", "Nombre", "Sexo", "Padre", "Madre", "Generación", "F"])
+        return {"tabla": vacia, "orden": [], "padre_idx": np.zeros(1, int), "madre_idx": np.zeros(1, int), "d": np.zeros(1)}
+
+    animales = _df.drop_duplicates("ID").reset_index(drop=True)
+    padres = resolver_progenitores(animales["Padre"] if "Padre" in animales.columns else pd.Series("", index=animales.index), animales)
+    madres = resolver_progenitores(animales["Madre"] if "Madre" in animales.columns else pd.Series("", index=animales.index), animales)
+    externos = sorted(set(padres[padres.str.startswith("EXT:")]) | set(madres[madres.str.startswith("EXT:")]))
+
+    tabla = pd.concat([
+        pd.DataFrame({"ID": animales["ID"].astype(str), "Nombre": animales["Nombre"].astype(str),
+                      "Sexo": animales["Sexo"].astype(str), "Padre": padres, "Madre": madres}),
+        pd.DataFrame({"ID": externos, "Nombre": [e[4:] for e in externos], "Sexo": "", "Padre": "", "Madre": ""}),
+    ], ignore_index=True)
+    tabla["Generación"] = generaciones(tabla["Padre"], tabla["Madre"], tabla["ID"]).to_numpy()
+    # Un ciclo en el pedigrí se corta dejando a esos animales como fundadores
+    ciclo = tabla["Generación"].isna()
+    tabla.loc[ciclo, ["Padre", "Madre"]] = ""
+    tabla["Generación"] = tabla["Generación"].fillna(0).astype(int)
+    tabla = tabla.sort_values("Generación", kind="stable", ignore_index=True)
+
+    posicion = pd.Series(np.arange(1, len(tabla) + 1), index=tabla["ID"])
+    padre_idx = np.concatenate([[0], tabla["Padre"].map(posicion).fillna(0).astype(int).to_numpy()])
+    madre_idx = np.concatenate([[0], tabla["Madre"].map(posicion).fillna(0).astype(int).to_numpy()])
+
+    # Meuwissen y Luo: F[0] = -1 hace que d valga 1 para fundadores y 0.75 - F/4 con un solo progenitor
+    n = len(tabla)
+    F = np.zeros(n + 1)
+    F[0] = -1.0
+    d = np.zeros(n + 1)
+    for i in range(1, n + 1):
+        s, m = padre_idx[i], madre_idx[i]
+        d[i] = 0.5 - 0.25 * (F[s] + F[m])
+        if s == 0 or m == 0:
+            continue
+        if s == padre_idx[i - 1] and m == madre_idx[i - 1]:
+            F[i] = F[i - 1]
+            continue
+        L = {i: 1.0}
+        pendientes = [-i]
+        f_i = -1.0
+        while pendientes:
+            j = -heapq.heappop(pendientes)
+            if j not in L:
+                continue
+            lj = L.pop(j)
+            for progenitor in (padre_idx[j], madre_idx[j]):
+                if progenitor:
+                    if progenitor not in L:
+                        heapq.heappush(pendientes, -progenitor)
+                        L[progenitor] = 0.0
+                    L[progenitor] += 0.5 * lj
+            f_i += lj * lj * d[j]
+        F[i] = f_i
+    tabla["F"] = F[1:]
+    d[0] = 0.0
+    return {"tabla": tabla, "orden": tabla["ID"].tolist(), "padre_idx": padre_idx, "madre_idx": madre_idx, "d": d}
+
+def parentesco(ped, ids_filas, ids_columnas):
+    """Matriz de parentesco aditivo a(i, j) entre dos listas de animales.
+
+    Usa el método indirecto de Colleau: A·X = (I-P)⁻¹ D (I-P)⁻ᵀ X en dos pasadas sobre el pedigrí,
+    para todas las columnas a la vez, sin construir A. La consanguinidad de la cría de i × j es a/2.
+    """
+    posicion = {id_animal: k + 1 for k, id_animal in enumerate(ped["orden"])}
+    columnas = [posicion.get(str(c), 0) for c in ids_columnas]
+    filas = [posicion.get(str(f), 0) for f in ids_filas]
+    padre_idx, madre_idx, d = ped["padre_idx"], ped["madre_idx"], ped["d"]
+    n = len(padre_idx)
+    X = np.zeros((n, len(columnas)))
+    X[columnas, np.arange(len(columnas))] = 1.0
+    X[0] = 0.0
+    # (I-P)ᵀ w = x: de los más jóvenes a los más viejos, cada hijo aporta la mitad a sus padres
+    for i in range(n - 1, 0, -1):
+        if padre_idx[i]: X[padre_idx[i]] += 0.5 * X[i]
+        if madre_idx[i]: X[madre_idx[i]] += 0.5 * X[i]
+    X *= d[:, None]
+    # (I-P) u = v: de los más viejos a los más jóvenes, cada hijo hereda la mitad de cada padre
+    for i in range(1, n):
+        if padre_idx[i] or madre_idx[i]:
+            X[i] += 0.5 * (X[padre_idx[i]] + X[madre_idx[i]])
+    A = X[filas]
+    A[np.array(filas) == 0] = 0.0
+    A[:, np.array(columnas) == 0] = 0.0
+    return pd.DataFrame(A, index=[str(f) for f in ids_filas], columns=[str(c) for c in ids_columnas])
+
+def coeficiente_relacion(ped, ids_filas, ids_columnas):
+    """Coeficiente de relación de Wright: a(i, j) / sqrt((1 + Fi)(1 + Fj))."""
+    a = parentesco(ped, ids_filas, ids_columnas)
+    f = ped["tabla"].set_index("ID")["F"]
+    fi = f.reindex(a.index).fillna(0).to_numpy()
+    fj = f.reindex(a.columns).fillna(0).to_numpy()
+    return a / np.sqrt(np.outer(1 + fi, 1 + fj))
+
+def reproductores_disponibles(df_activos):
+    """(toros, vientres) activos para planificar cruces."""
+    if df_activos.empty:
+        return df_activos, df_activos
+    toros = df_activos[(df_activos["Tipo"] == "Toro") | ((df_activos["Sexo"] == "Macho") & (df_activos["Tipo"] != "Becerro"))]
+    vientres = df_activos[(df_activos["Sexo"] == "Hembra") & df_activos["Tipo"].isin(["Vaca", "Novilla", "Bovino"])]
+    return toros, vientres
+
+def cruces_sugeridos(ped, toros, vientres):
+    """Para cada vientre, el toro que da la cría menos consanguínea y los toros a evitar."""
+    if toros.empty or vientres.empty:
+        return pd.DataFrame(columns=["ID Vaca", "Vaca", "Toro Sugerido", "F Cría", "Toros a Evitar"])
+    f_cria = parentesco(ped, vientres["ID"], toros["ID"]) / 2
+    nombres_toros = pd.Series(toros["Nombre"].astype(str).to_numpy(), index=toros["ID"].astype(str))
+    mejor = f_cria.idxmin(axis=1)
+    evitar = (f_cria >= UMBRAL_CONSANGUINIDAD).apply(lambda fila: ", ".join(nombres_toros[fila[fila].index]), axis=1)
+    return pd.DataFrame({
+        "ID Vaca": f_cria.index,
+        "Vaca": vientres["Nombre"].astype(str).to_numpy(),
+        "Toro Sugerido": mejor.map(nombres_toros).to_numpy(),
+        "F Cría": f_cria.min(axis=1).to_numpy(),
+        "Toros a Evitar": evitar.to_numpy(),
+    })
+
+# --- PLANIFICADOR DE CRUCES ---
+# Cada componente va de 0 a 1; el puntaje final es su suma ponderada sobre 100
+PESOS_CRUCE = {"Parentesco": 0.40, "Raza": 0.20, "Progenie": 0.25, "Fertilidad": 0.15}
+OBJETIVOS_RAZA = ["Mantener raza", "Cruzamiento"]
+PERIODO_ESPERA_VOLUNTARIO = 45  # días posparto antes del primer servicio
+PREVIA_TASA_CONCEPCION = 5  # servicios "virtuales" con la tasa del hato para no premiar toros con pocos datos
+
+def percentil(serie):
+    """Rango percentil 0-1; los valores faltantes quedan neutros (0.5)."""
+    return serie.rank(pct=True).fillna(0.5) if serie.notna().sum() > 1 else pd.Series(0.5, index=serie.index)
+
+def historial_servicios(df, df_hist):
+    """Cada FECUNDACION con el toro resuelto a ID y si resultó en preñez.
+
+    Un servicio es efectivo si el siguiente chequeo positivo de la vaca llega antes que su siguiente servicio.
+    """
+    servicios = eventos_de_tipo(df_hist, ["FECUNDACION"]).sort_values("Fecha_DT")
+    servicios["Toro"] = resolver_progenitores(extraer(servicios["Detalle 2"], r"Padre:\s*([^|]+)"), df) if not df.empty else ""
+    servicios["Siguiente Servicio"] = servicios.groupby("ID Animal")["Fecha_DT"].shift(-1)
+    chequeos = eventos_de_tipo(df_hist, ["CHEQUEO_REPRO"])
+    positivos = (chequeos.loc[chequeos["Detalle 1"] == "Preñada", ["ID Animal", "Fecha_DT"]]
+                 .rename(columns={"Fecha_DT": "Fecha Chequeo"}).sort_values("Fecha Chequeo"))
+    servicios = pd.merge_asof(servicios, positivos, left_on="Fecha_DT", right_on="Fecha Chequeo", by="ID Animal", direction="forward")
+    servicios["Efectivo"] = servicios["Fecha Chequeo"].notna() & (servicios["Siguiente Servicio"].isna() | (servicios["Fecha Chequeo"] <= servicios["Siguiente Servicio"]))
+    return servicios[["ID Animal", "Fecha_DT", "Toro", "Efectivo"]]
+
+@st.cache_data
+def planificar_cruces(version_hist, version_animales, objetivo_raza, _df, _df_hist):
+    """Puntaje de todos los cruces toro × vaca vacía de la temporada, calculado como matrices.
+
+    Componentes (vacas en filas, toros en columnas):
+      - Parentesco: 1 sin parentesco, 0 cuando la cría llega al doble de UMBRAL_CONSANGUINIDAD
+      - Raza: coincidencia o no de la raza según el objetivo (mantener raza o cruzamiento)
+      - Progenie: percentil de la GMD de las crías del toro y de la vaca (PESAJE)
+      - Fertilidad: tasa de concepción del toro y servicios por concepción, abortos y días abiertos de la vaca
+    Devuelve un dict con 'ranking' (todos los pares, ordenados por vaca y puntaje) y 'vacas' (vientres evaluados).
+    """
+    columnas = ["ID Vaca", "Vaca", "Raza Vaca", "ID Toro", "Toro", "Raza Toro", "F Cría",
+                "Parentesco", "Raza", "Progenie", "Fertilidad", "Puntaje", "Apto", "Rango", "Disponible Desde"]
+    toros, vientres = reproductores_disponibles(_df[_df["Estado"] != "VENDIDO"] if not _df.empty else _df)
+    kpis = kpis_reproductivos(version_hist, version_animales, _df, _df_hist)["por_vaca"].set_index("ID Animal")
+    if not vientres.empty:
+        vientres = vientres[~vientres["ID"].astype(str).map(kpis["Concepción Actual"]).notna() & (vientres["Estado"] != "Preñada")]
+    if toros.empty or vientres.empty:
+        return {"ranking": pd.DataFrame(columns=columnas), "vacas": vientres}
+
+    ped = pedigri(version_animales, _df)
+    id_vacas, id_toros = vientres["ID"].astype(str), toros["ID"].astype(str)
+    f_cria = parentesco(ped, id_vacas, id_toros).to_numpy() / 2
+    s_parentesco = np.clip(1 - f_cria / (2 * UMBRAL_CONSANGUINIDAD), 0, 1)
+
+    canonica = {r.lower(): r for r in LISTA_RAZAS_GLOBAL}
+    raza_vaca = vientres["Raza"].astype(str).str.strip().str.lower().map(canonica).to_numpy()
+    raza_toro = toros["Raza"].astype(str).str.strip().str.lower().map(canonica).to_numpy()
+    misma = raza_vaca[:, None] == raza_toro[None, :]
+    conocida = pd.notna(raza_vaca)[:, None] & pd.notna(raza_toro)[None, :]
+    coincide = misma if objetivo_raza == "Mantener raza" else ~misma
+    s_raza = np.where(conocida, coincide.astype(float), 0.5)
+
+    # GMD promedio de las crías de cada progenitor
+    por_animal = analitica_peso(version_hist, version_animales, _df, _df_hist)["por_animal"].set_index("ID Animal")["GMD"]
+    crias = ped["tabla"].assign(GMD=lambda t: t["ID"].map(por_animal))
+    gmd_toro = percentil(id_toros.map(crias.groupby("Padre")["GMD"].mean()).reset_index(drop=True))
+    gmd_vaca = percentil(id_vacas.map(crias.groupby("Madre")["GMD"].mean()).reset_index(drop=True))
+    s_progenie = 0.7 * gmd_toro.to_numpy()[None, :] + 0.3 * gmd_vaca.to_numpy()[:, None]
+
+    servicios = historial_servicios(_df, _df_hist)
+    tasa_hato = servicios["Efectivo"].mean() if not servicios.empty else 0.5
+    por_toro = servicios.groupby("Toro")["Efectivo"].agg(["sum", "size"])
+    tasa_toro = ((por_toro["sum"] + PREVIA_TASA_CONCEPCION * tasa_hato) / (por_toro["size"] + PREVIA_TASA_CONCEPCION))
+    tasa_toro = id_toros.map(tasa_toro).fillna(tasa_hato).to_numpy()
+    historia = kpis.reindex(id_vacas)
+    # Menos servicios por concepción, menos abortos y menos días abiertos es mejor
+    fertilidad_vaca = (percentil(-historia["Servicios por Concepción"]) + percentil(-historia["Abortos"].astype(float))
+                       + percentil(-historia["Días Abiertos"].astype(float))).to_numpy() / 3
+    s_fertilidad = 0.5 * tasa_toro[None, :] + 0.5 * fertilidad_vaca[:, None]
+
+    componentes = {"Parentesco": s_parentesco, "Raza": s_raza, "Progenie": s_progenie, "Fertilidad": s_fertilidad}
+    puntaje = 100 * sum(PESOS_CRUCE[k] * m for k, m in componentes.items())
+
+    n_vacas, n_toros = f_cria.shape
+    fila, col = np.repeat(np.arange(n_vacas), n_toros), np.tile(np.arange(n_toros), n_vacas)
+    disponible = historia["Último Parto"].to_numpy() + pd.Timedelta(days=PERIODO_ESPERA_VOLUNTARIO)
+    ranking = pd.DataFrame({
+        "ID Vaca": id_vacas.to_numpy()[fila], "Vaca": vientres["Nombre"].astype(str).to_numpy()[fila],
+        "Raza Vaca": vientres["Raza"].astype(str).to_numpy()[fila],
+        "ID Toro": id_toros.to_numpy()[col], "Toro": toros["Nombre"].astype(str).to_numpy()[col],
+        "Raza Toro": toros["Raza"].astype(str).to_numpy()[col],
+        "F Cría": f_cria.ravel(),
+        **{k: m.ravel() for k, m in componentes.items()},
+        "Puntaje": puntaje.ravel(),
+        "Apto": f_cria.ravel() < UMBRAL_CONSANGUINIDAD,
+        "Disponible Desde": pd.to_datetime(disponible)[fila],
+    })
+    ranking = ranking.sort_values(["ID Vaca", "Apto", "Puntaje"], ascending=[True, False, False], ignore_index=True)
+    ranking["Rango"] = ranking.groupby("ID Vaca").cumcount() + 1
+    return {"ranking": ranking[columnas], "vacas": vientres}
+
+def plan_temporada(ranking, cupo_por_toro=None):
+    """Un toro por vaca: el mejor apto, respetando el cupo de vacas por toro si se indica.
+
+    Se asignan primero los pares de mayor puntaje, así las vacas con mejores opciones no se quedan sin toro.
+    """
+    aptos = ranking[ranking["Apto"]].sort_values("Puntaje", ascending=False)
+    if not cupo_por_toro:
+        return aptos.drop_duplicates("ID Vaca").sort_values("Puntaje", ascending=False, ignore_index=True)
+    asignadas, usados, filas = set(), {}, []
+    for i, vaca, toro in zip(aptos.index, aptos["ID Vaca"], aptos["ID Toro"]):
+        if vaca in asignadas or usados.get(toro, 0) >= cupo_por_toro:
+            continue
+        asignadas.add(vaca)
+        usados[toro] = usados.get(toro, 0) + 1
+        filas.append(i)
+    return aptos.loc[filas].reset_index(drop=True)
+
+# --- LIBRO MAYOR (FINANZAS) ---
+TIPOS_FINANCIEROS = ["VENTA", "COMPRA", "TRANSFERENCIA", "APORTE_CAPITAL", "GASTO_OPERATIVO", "INGRESO_OPERATIVO"]
+MOVIMIENTO_POR_TIPO = {
+    "VENTA": "Ingreso", "INGRESO_OPERATIVO": "Ingreso", "COMPRA": "Egreso", "GASTO_OPERATIVO": "Egreso",
+    "APORTE_CAPITAL": "Capital", "TRANSFERENCIA": "Transferencia",
+}
+
+def extraer(serie, patron):
+    """Primer grupo de la expresión regular en cada texto de la serie (vacío si no aparece)."""
+    return serie.astype(str).str.extract(patron, expand=False).str.strip().fillna("")
+
+def ids_anulados(df_hist):
+    """IDs (en mayúsculas) de los eventos que tienen un asiento de ANULACION."""
+    ev = eventos_de_tipo(df_hist, ["ANULACION"])
+    return set(extraer(ev["Detalle 1"], r"Anula:\s*(\S+)").str.upper()) - {""}
+
+def a_numero(serie):
+    return pd.to_numeric(serie.astype(str).str.replace(",", "", regex=False), errors="coerce")
+
+def parsear_libro(ev):
+    """Convierte eventos financieros (ya filtrados por eventos_de_tipo) en movimientos con columnas tipadas."""
+    tipo, det1, det2, notas = ev["Tipo Evento"], ev["Detalle 1"].astype(str), ev["Detalle 2"].astype(str), ev["Notas"].astype(str)
+    es = lambda *tipos: tipo.isin(tipos)
+
+    monto = pd.Series(float("nan"), index=ev.index)
+    monto = monto.mask(es("VENTA"), a_numero(extraer(det1, r"^\s*([\d.,]+)")))
+    monto = monto.mask(es("COMPRA"), a_numero(extraer(notas, r"Monto Total:\s*([^|]+)")))
+    monto = monto.mask(es("APORTE_CAPITAL"), a_numero(extraer(det2, r"Monto:\s*([^|]+)")))
+    monto = monto.mask(es("GASTO_OPERATIVO", "INGRESO_OPERATIVO"), a_numero(extraer(det1, r"Monto:\s*([\d.,]+)")))
+    monto = monto.mask(es("TRANSFERENCIA"), a_numero(extraer(notas, r"Monto Origen:\s*([^|]+)")))
+    # Una venta de varios animales genera un evento por animal con el precio total: se reparte entre ellos
+    animales_venta = ev.groupby("_Clave Venta")["Tipo Evento"].transform("size")
+    monto = monto.mask(es("VENTA"), monto / animales_venta)
+
+    cuenta = pd.Series("", index=ev.index)
+    cuenta = cuenta.mask(es("VENTA"), extraer(notas, r"Ingresa a:\s*([^|]+)"))
+    cuenta = cuenta.mask(es("COMPRA"), extraer(notas, r"Pagado desde:\s*([^|]+)"))
+    cuenta = cuenta.mask(es("APORTE_CAPITAL"), extraer(det1, r"Cuenta:\s*(.+)"))
+    cuenta = cuenta.mask(es("GASTO_OPERATIVO", "INGRESO_OPERATIVO"), extraer(det1, r"\(Cuenta:\s*(.+)\)"))
+    cuenta = cuenta.mask(es("TRANSFERENCIA"), extraer(det1, r"De:\s*(.+)"))
+
+    categoria = pd.Series("", index=ev.index)
+    categoria = categoria.mask(es("VENTA"), "Venta de Ganado").mask(es("COMPRA"), "Compra de Ganado")
+    categoria = categoria.mask(es("GASTO_OPERATIVO", "INGRESO_OPERATIVO"), det2)
+    categoria = categoria.mask(es("APORTE_CAPITAL"), extraer(notas, r"Concepto:\s*([^|]+)"))
+    categoria = categoria.mask(es("TRANSFERENCIA"), "Transferencia")
+
+    moneda = pd.Series("", index=ev.index)
+    moneda = moneda.mask(es("VENTA"), extraer(det1, r"^\s*[\d.,]+\s+([A-Z]{3})"))
+    moneda = moneda.mask(es("COMPRA"), extraer(notas, r"Precio:\s*[\d.,]+\s+([A-Z]{3})"))
+
+    return pd.DataFrame({
+        "Fecha": ev["Fecha_DT"],
+        "Tipo Evento": tipo,
+        "Movimiento": tipo.map(MOVIMIENTO_POR_TIPO),
+        "Categoría": categoria,
+        "Cuenta": cuenta,
+        "Cuenta Destino": extraer(det2, r"A:\s*(.+)").where(es("TRANSFERENCIA"), ""),
+        "Monto": monto,
+        "Monto Destino": a_numero(extraer(notas, r"Monto Recibido:\s*([^|]+)")).where(es("TRANSFERENCIA")),
+        "Moneda": moneda,
+        "ID Animal": ev["ID Animal"],
+        "Detalle": det2.where(es("VENTA", "COMPRA"), ""),
+        "Notas": notas,
+        "ID Evento": ev["ID Evento"].astype(str) if "ID Evento" in ev.columns else "",
+        "_Clave Venta": ev["_Clave Venta"],
+        "_Firma": ev["_Firma"],
+    })
+
+def asientos_de_caja(libro):
+    """Asientos por cuenta con signo: las transferencias salen de una cuenta y entran en otra."""
+    signo = libro["Movimiento"].map({"Ingreso": 1, "Capital": 1, "Egreso": -1, "Transferencia": -1})
+    salidas_entradas = libro.assign(Importe=libro["Monto"] * signo)
+    entradas_transf = libro[libro["Movimiento"] == "Transferencia"].assign(
+        Cuenta=lambda d: d["Cuenta Destino"], Importe=lambda d: d["Monto Destino"].fillna(d["Monto"]))
+    movimientos = pd.concat([salidas_entradas, entradas_transf], ignore_index=True)[
+        ["Fecha", "Tipo Evento", "Movimiento", "Categoría", "Cuenta", "Importe", "Moneda", "ID Animal", "ID Evento"]]
+    movimientos["Mes"] = movimientos["Fecha"].dt.to_period("M").astype(str)
+    return movimientos
+
+@st.cache_resource
+def estado_libro():
+    return {"lock": threading.Lock(), "libro": None}
+
+@st.cache_data
+def libro_mayor(version_hist, _df_hist):
+    """Libro mayor tipado de los eventos financieros, actualizado de forma incremental.
+
+    Cada evento lleva una firma de su contenido; entre versiones solo se vuelven a interpretar los
+    eventos nuevos o modificados (y las ventas de su mismo lote), y se descartan los que ya no están.
+    Devuelve un dict con:
+      - libro: un movimiento por evento vigente (sin los anulados), ordenado por fecha (Monto siempre positivo)
+      - movimientos: los asientos de caja por cuenta, con signo (una transferencia genera dos)
+      - mensual: totales por mes, movimiento, categoría y cuenta
+    """
+    ev = eventos_de_tipo(_df_hist, TIPOS_FINANCIEROS)
+    campos = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+    ev["_Firma"] = pd.util.hash_pandas_object(ev[[c for c in campos if c in ev.columns]].astype(str), index=False).astype(str)
+    # Los animales de una misma venta comparten la marca "Venta: <ID Evento de su primera fila>". Las
+    # ventas anteriores a la marca no tienen otro vínculo que su contenido idéntico.
+    contenido = ev["Fecha"].astype(str) + "|" + ev["Detalle 1"].astype(str) + "|" + ev["Detalle 2"].astype(str) + "|" + ev["Notas"].astype(str)
+    id_venta = extraer(ev["Notas"].astype(str), r"Venta:\s*([0-9A-Z]{26})")
+    ev["_Clave Venta"] = id_venta.where(id_venta != "", contenido)
+
+    estado = estado_libro()
+    with estado["lock"]:
+        previo = estado["libro"]
+        if previo is None or not ev["_Firma"].is_unique:
+            libro = parsear_libro(ev)
+        else:
+            nuevos = ~ev["_Firma"].isin(previo["_Firma"])
+            vigentes = previo[previo["_Firma"].isin(ev["_Firma"])]
+            # Si una venta ganó o perdió animales, todo su lote se vuelve a repartir
+            ventas_tocadas = pd.concat([ev.loc[nuevos & (ev["Tipo Evento"] == "VENTA"), "_Clave Venta"],
+                                        previo.loc[~previo["_Firma"].isin(ev["_Firma"]) & (previo["Tipo Evento"] == "VENTA"), "_Clave Venta"]])
+            a_parsear = nuevos | ((ev["Tipo Evento"] == "VENTA") & ev["_Clave Venta"].isin(ventas_tocadas))
+            vigentes = vigentes[~vigentes["_Firma"].isin(ev.loc[a_parsear, "_Firma"])]
+            libro = pd.concat([vigentes, parsear_libro(ev[a_parsear])], ignore_index=True) if a_parsear.any() else vigentes
+        libro = (libro.assign(_Orden=clave_orden_id(libro["ID Evento"]))
+                 .sort_values(["Fecha", "_Orden"], kind="stable", ignore_index=True)
+                 .drop(columns="_Orden"))
+        estado["libro"] = libro
+
+    # Las anulaciones se descuentan al final: el evento anulado sigue contando para repartir su venta
+    libro = libro[~libro["ID Evento"].str.strip().str.upper().isin(ids_anulados(_df_hist))].drop(columns=["_Clave Venta", "_Firma"]).reset_index(drop=True)
+    movimientos = asientos_de_caja(libro)
+    mensual = (movimientos.groupby(["Mes", "Movimiento", "Categoría", "Cuenta"], as_index=False)
+               .agg(Total=("Importe", "sum"), Registros=("Importe", "size")))
+
+    return {"libro": libro, "movimientos": movimientos, "mensual": mensual}
+
+# --- TIPOS DE CAMBIO ---
+# Las tasas se guardan como unidades de cada moneda por 1 USD (moneda pivote), con su fecha.
+MONEDA_BASE = "USD"
+MONEDAS = ["USD", "VES", "COP", "EUR"]
+
+def codigo_moneda(serie):
+    """'VES (Bs)' -> 'VES' (vacío si el texto no empieza con un código de moneda)."""
+    return extraer(serie, r"^\s*([A-Z]{3})")
+
+def monedas_de_cuentas(df_cuentas):
+    if df_cuentas.empty or "Nombre" not in df_cuentas.columns:
+        return {}
+    return dict(zip(df_cuentas["Nombre"].astype(str).str.strip(), codigo_moneda(df_cuentas["Moneda"])))
+
+@st.cache_data
+def tabla_tasas(version_hist, version_cuentas, _df_hist, _df_cuentas):
+    """Tasas fechadas por moneda: registros manuales (TASA_CAMBIO) más las tasas implícitas en
+    transferencias entre una cuenta en USD y otra en otra moneda. Una tasa por moneda y día;
+    si ese día hay una manual, prevalece sobre la implícita."""
+    moneda_cuenta = monedas_de_cuentas(_df_cuentas)
+    libro = libro_mayor(version_hist, _df_hist)["libro"]
+    transf = libro[libro["Movimiento"] == "Transferencia"]
+    origen, destino = transf["Cuenta"].map(moneda_cuenta), transf["Cuenta Destino"].map(moneda_cuenta)
+    implicita = transf["Monto Destino"] / transf["Monto"]
+    desde_base = (origen == MONEDA_BASE) & destino.notna() & (destino != MONEDA_BASE)
+    hacia_base = (destino == MONEDA_BASE) & origen.notna() & (origen != MONEDA_BASE)
+    implicitas = pd.DataFrame({
+        "Fecha": transf["Fecha"],
+        "Moneda": destino.where(desde_base, origen),
+        "Tasa": implicita.where(desde_base, 1 / implicita),
+        "Origen": "Transferencia " + transf["ID Evento"].astype(str),
+    })[desde_base | hacia_base]
+
+    ev = eventos_de_tipo(_df_hist, ["TASA_CAMBIO"])
+    manuales = pd.DataFrame({
+        "Fecha": ev["Fecha_DT"],
+        "Moneda": extraer(ev["Detalle 1"], r"Moneda:\s*([A-Z]{3})"),
+        "Tasa": a_numero(extraer(ev["Detalle 2"], r"Tasa:\s*([\d.,]+)")),
+        "Origen": "Manual",
+    })
+
+    tasas = pd.concat([implicitas, manuales], ignore_index=True)
+    tasas = tasas[(tasas["Moneda"].fillna("") != "") & (tasas["Tasa"] > 0) & (tasas["Tasa"] < float("inf"))]
+    tasas = (tasas.assign(_Manual=tasas["Origen"] == "Manual")
+             .sort_values(["Moneda", "Fecha", "_Manual"], kind="stable")
+             .drop_duplicates(["Moneda", "Fecha"], keep="last")
+             .drop(columns="_Manual")
+             .sort_values("Fecha", kind="stable", ignore_index=True))
+    tasas["Fecha"] = tasas["Fecha"].astype("datetime64[ns]")
+    tasas["Tasa"] = tasas["Tasa"].astype(float)
+    return tasas
+
+def tasa_vigente(fechas, monedas, tasas):
+    """Tasa de cada (fecha, moneda) por as-of join: la última registrada hasta esa fecha o, antes de
+    la primera, esa primera. USD vale siempre 1; sin ninguna tasa para la moneda queda NaN."""
+    monedas = pd.Series(list(monedas), dtype=object).astype(str)
+    consulta = pd.DataFrame({"Fecha": pd.to_datetime(pd.Series(list(fechas), dtype=object)).astype("datetime64[ns]"),
+                             "Moneda": monedas, "_Fila": range(len(monedas))})
+    consulta = consulta.dropna(subset=["Fecha"]).sort_values("Fecha", kind="stable")
+    referencia = tasas[["Fecha", "Moneda", "Tasa"]].astype({"Moneda": str})
+    previa = pd.merge_asof(consulta, referencia, on="Fecha", by="Moneda", direction="backward")
+    siguiente = pd.merge_asof(consulta, referencia, on="Fecha", by="Moneda", direction="forward")
+    tasa = pd.Series(previa["Tasa"].fillna(siguiente["Tasa"]).to_numpy(), index=consulta["_Fila"].to_numpy())
+    tasa = tasa.reindex(range(len(monedas)))
+    return tasa.mask(monedas.eq(MONEDA_BASE).to_numpy(), 1.0).to_numpy()
+
+def convertir(importes, fechas, monedas, tasas, moneda_reporte):
+    """Convierte cada importe de su moneda a la de reporte con las tasas vigentes a su fecha."""
+    monedas = list(monedas)
+    tasa_origen = tasa_vigente(fechas, monedas, tasas)
+    tasa_reporte = tasa_vigente(fechas, [moneda_reporte] * len(monedas), tasas)
+    return pd.Series(importes).to_numpy(dtype=float) * tasa_reporte / tasa_origen
+
+@st.cache_data
+def movimientos_consolidados(version_hist, version_cuentas, moneda_reporte, _df_hist, _df_cuentas):
+    """Asientos del libro mayor con su moneda resuelta y el importe llevado a la moneda de reporte.
+
+    La moneda es la registrada en el evento (ventas y compras) o, si no la trae, la de la cuenta.
+    """
+    movimientos = libro_mayor(version_hist, _df_hist)["movimientos"].copy()
+    moneda_cuenta = movimientos["Cuenta"].map(monedas_de_cuentas(_df_cuentas)).fillna("")
+    movimientos["Moneda"] = movimientos["Moneda"].where(movimientos["Moneda"] != "", moneda_cuenta)
+    tasas = tabla_tasas(version_hist, version_cuentas, _df_hist, _df_cuentas)
+    movimientos["Importe Reporte"] = convertir(movimientos["Importe"], movimientos["Fecha"], movimientos["Moneda"], tasas, moneda_reporte)
+    return movimientos
+
+def saldos_consolidados(df_cuentas, tasas, moneda_reporte, fecha=None):
+    """Saldo actual de cada cuenta convertido a la moneda de reporte con las tasas vigentes a la fecha."""
+    if df_cuentas.empty:
+        return pd.DataFrame(columns=["Cuenta", "Moneda", "Saldo", "Saldo Reporte"])
+    fecha = pd.Timestamp(fecha or date.today())
+    saldos = pd.DataFrame({
+        "Cuenta": df_cuentas["Nombre"].astype(str),
+        "Moneda": codigo_moneda(df_cuentas["Moneda"]),
+        "Saldo": a_numero(df_cuentas["Saldo"]).fillna(0),
+    }).reset_index(drop=True)
+    saldos["Saldo Reporte"] = convertir(saldos["Saldo"], [fecha] * len(saldos), saldos["Moneda"], tasas, moneda_reporte)
+    return saldos
+
+@st.cache_data
+def reportes_financieros(version_hist, version_animales, version_cuentas, moneda_reporte, _df, _df_hist, _df_cuentas):
+    """Estado de resultados, flujo de caja y costos unitarios por mes, consolidados en la moneda de reporte.
+
+    Aportes de capital y transferencias mueven caja pero no entran al resultado. El costo por animal
+    usa el inventario activo actual y el costo por litro, la producción del hato de cada mes.
+    Los asientos sin tasa para su moneda quedan fuera y se cuentan en 'sin_tasa'.
+    """
+    consolidados = movimientos_consolidados(version_hist, version_cuentas, moneda_reporte, _df_hist, _df_cuentas)
+    sin_tasa = int(consolidados["Importe Reporte"].isna().sum())
+    movimientos = consolidados.assign(Importe=consolidados["Importe Reporte"]).dropna(subset=["Importe"])
+    resultados = movimientos[movimientos["Movimiento"].isin(["Ingreso", "Egreso"])]
+
+    pyg = (resultados.pivot_table(index="Mes", columns="Movimiento", values="Importe", aggfunc="sum", fill_value=0)
+           .reindex(columns=["Ingreso", "Egreso"], fill_value=0)
+           .rename(columns={"Ingreso": "Ingresos", "Egreso": "Egresos"}))
+    pyg["Egresos"] = pyg["Egresos"].abs()
+    pyg.columns.name = None
+    pyg["Resultado"] = pyg["Ingresos"] - pyg["Egresos"]
+    pyg["Margen %"] = (pyg["Resultado"] / pyg["Ingresos"].where(pyg["Ingresos"] > 0) * 100).round(1)
+
+    pyg_categoria = (resultados.pivot_table(index=["Movimiento", "Categoría"], columns="Mes", values="Importe", aggfunc="sum", fill_value=0)
+                     .abs().reset_index())
+    pyg_categoria.columns.name = None
+
+    flujo = (movimientos.assign(Entradas=movimientos["Importe"].clip(lower=0), Salidas=(-movimientos["Importe"]).clip(lower=0))
+             .groupby(["Cuenta", "Mes"], as_index=False)[["Entradas", "Salidas", "Importe"]].sum()
+             .rename(columns={"Importe": "Neto"}))
+    flujo["Neto Acumulado"] = flujo.groupby("Cuenta")["Neto"].cumsum()
+
+    gasto_operativo = -resultados[resultados["Tipo Evento"] == "GASTO_OPERATIVO"].groupby("Mes")["Importe"].sum()
+    hato_leche = analitica_leche(version_hist, _df_hist)["hato"]
+    litros = hato_leche.groupby(hato_leche["Fecha_DT"].dt.to_period("M").astype(str))["Litros"].sum()
+    cabezas = int((_df["Estado"] != "VENDIDO").sum()) if not _df.empty and "Estado" in _df.columns else 0
+
+    costos = pd.DataFrame({"Gasto Operativo": gasto_operativo, "Litros": litros}).fillna(0)
+    costos.index.name = "Mes"
+    costos["Costo por Animal"] = costos["Gasto Operativo"] / cabezas if cabezas else float("nan")
+    costos["Costo por Litro"] = costos["Gasto Operativo"] / costos["Litros"].where(costos["Litros"] > 0)
+
+    return {"pyg": pyg.reset_index(), "pyg_categoria": pyg_categoria, "flujo": flujo, "costos": costos.reset_index(),
+            "cabezas": cabezas, "sin_tasa": sin_tasa}
+
+def filtrar_por_fecha(tabla, f_inicio, f_fin, columna="Fecha"):
+    """Recorte por rango de fechas con búsqueda binaria (la tabla debe venir ordenada por fecha)."""
+    if f_inicio is None or f_fin is None:
+        return tabla
+    fechas = tabla[columna]
+    desde = fechas.searchsorted(pd.Timestamp(f_inicio), side="left")
+    hasta = fechas.searchsorted(pd.Timestamp(f_fin) + pd.Timedelta(days=1), side="left")
+    return tabla.iloc[desde:hasta]
+
+# --- EXPORTACIÓN ---
+FILAS_POR_BLOQUE_EXPORTACION = 20000
+FORMATOS_EXPORTACION = {
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+    "Excel (XLSX)": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+MAX_FILAS_XLSX = 1_048_575
+
+@st.cache_data(max_entries=8)
+def exportar_tabla(nombre, version, columnas, formato, _tabla):
+    """Archivo de exportación en bytes, serializado por bloques de filas.
+
+    Los bloques evitan una segunda copia convertida de toda la tabla, pero el archivo resultante queda
+    completo en memoria: st.download_button necesita los bytes, así que no hay streaming al navegador.
+    Solo se llama cuando alguien pide el archivo; la caché se indexa por tabla, versión de los datos,
+    columnas y formato, así que cada combinación se genera una sola vez por versión.
+    """
+    tabla = _tabla[list(columnas)]
+    inicios = range(0, len(tabla), FILAS_POR_BLOQUE_EXPORTACION)
+    bloques = (tabla.iloc[i:i + FILAS_POR_BLOQUE_EXPORTACION] for i in inicios)
+    salida = io.BytesIO()
+
+    if formato == "CSV":
+        salida.write(tabla.iloc[:0].to_csv(index=False).encode("utf-8"))
+        for bloque in bloques:
+            salida.write(bloque.to_csv(index=False, header=False).encode("utf-8"))
+    elif formato == "Parquet":
+        # Esquema fijo para todo el archivo: las columnas de texto (object, con valores mezclados de la
+        # hoja) van como string, así un primer bloque vacío o con otro tipo no decide su tipo
+        texto = {c: "string" for c, tipo in tabla.dtypes.items() if tipo == object}
+        esquema = pa.Schema.from_pandas(tabla.iloc[:0].astype(texto), preserve_index=False)
+        with pq.ParquetWriter(salida, esquema) as escritor:
+            for bloque in bloques:
+                escritor.write_table(pa.Table.from_pandas(bloque.astype(texto), schema=esquema, preserve_index=False))
+    else:
+        libro = Workbook(write_only=True)
+        hoja = libro.create_sheet(nombre[:31])
+        hoja.append(list(columnas))
+        for bloque in bloques:
+            for fila in bloque.itertuples(index=False, name=None):
+                hoja.append([None if pd.isna(valor) else valor for valor in fila])
+        libro.save(salida)
+    return salida.getvalue()
+
+# --- IMPORTACIÓN MASIVA ---
+# Animales y eventos desde CSV o Excel: se validan todas las filas de una vez contra las listas
+# maestras y los datos ya cargados, se muestra qué se agregará y se escribe con append_rows por bloques.
+COLUMNAS_ANIMAL = ["ID", "Tipo", "Nombre", "Arete", "Raza", "Sexo", "Peso", "Nacimiento", "Estado", "Foto",
+                   "Propósito", "En Finca", "Padre", "Madre", "PesoNac", "PesoDest", "Peso12m", "Notas",
+                   "Propietario", "Lote", "Chip", "Num Raza"]
+VALORES_POR_DEFECTO_ANIMAL = {"Tipo": "Bovino", "Estado": "Sano", "Foto": "Sin Foto", "En Finca": "True", "Padre": "Desconocido",
+                              "Madre": "Desconocida", "Propietario": "Principal", "Lote": "General"}
+CATEGORIAS_ANIMAL = ["Vaca", "Toro", "Novilla", "Becerro"]
+# Tipo de importación -> (Tipo Evento, columna con el valor)
+IMPORTACIONES_EVENTOS = {"Pesajes": ("PESAJE", "Peso"), "Producción de leche": ("PRODUCCION_LECHE", "Litros")}
+FILAS_POR_APPEND = 500
+
+def leer_archivo_importacion(archivo):
+    """CSV (separador detectado) o XLSX como tabla de texto, sin espacios sobrantes."""
+    if archivo.name.lower().endswith(".xlsx"):
+        tabla = pd.read_excel(archivo, dtype=str)
+    else:
+        tabla = pd.read_csv(archivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    tabla.columns = tabla.columns.astype(str).str.strip()
+    return tabla.fillna("").astype(str).apply(lambda col: col.str.strip())
+
+def normalizar_columnas(tabla, columnas):
+    """Renombra los encabezados a su forma canónica sin importar mayúsculas y completa los que falten."""
+    canonicas = {c.lower(): c for c in columnas}
+    tabla = tabla.rename(columns=lambda c: canonicas.get(c.lower(), c))
+    return tabla.reindex(columns=columnas, fill_value="").reset_index(drop=True)
+
+def acumular_errores(errores, mascara, texto):
+    return errores.mask(mascara.fillna(False).astype(bool), errores + texto + "; ")
+
+def resultado_importacion(errores, omitir, motivo):
+    return pd.Series("Nuevo", index=errores.index).mask(omitir, motivo).mask(errores != "", "Error")
+
+def validar_importacion_animales(tabla, df_existente):
+    """Valida una tabla de animales. Agrega Resultado (Nuevo / Existente / Error), Errores y Cambios
+    (campos que difieren de la ficha actual, para los IDs que ya existen y no se vuelven a crear)."""
+    t = normalizar_columnas(tabla, COLUMNAS_ANIMAL)
+    errores = pd.Series("", index=t.index)
+
+    errores = acumular_errores(errores, t["ID"] == "", "Falta ID")
+    errores = acumular_errores(errores, t["ID"].duplicated(keep=False) & (t["ID"] != ""), "ID repetido en el archivo")
+
+    raza = t["Raza"].str.lower().map({r.lower(): r for r in LISTA_RAZAS_GLOBAL})
+    errores = acumular_errores(errores, raza.isna(), "Raza no reconocida")
+    t["Raza"] = raza.fillna(t["Raza"])
+
+    sexo = t["Sexo"].str.lower().str[:1].map({"h": "Hembra", "f": "Hembra", "m": "Macho"})
+    errores = acumular_errores(errores, sexo.isna(), "Sexo inválido (Hembra/Macho)")
+    t["Sexo"] = sexo.fillna(t["Sexo"])
+
+    tipo = t["Tipo"].str.lower().map({c.lower(): c for c in CATEGORIAS_ANIMAL + LISTA_ESPECIES})
+    errores = acumular_errores(errores, tipo.isna() & (t["Tipo"] != ""), "Tipo no reconocido")
+    t["Tipo"] = tipo.fillna(t["Tipo"])
+
+    nacimiento = pd.to_datetime(t["Nacimiento"], errors="coerce")
+    errores = acumular_errores(errores, nacimiento.isna() & (t["Nacimiento"] != ""), "Nacimiento inválido")
+    errores = acumular_errores(errores, nacimiento > pd.Timestamp(date.today()), "Nacimiento en el futuro")
+    t["Nacimiento"] = nacimiento.dt.strftime("%Y-%m-%d").fillna(t["Nacimiento"])
+
+    pesos = {}
+    for columna in ["Peso", "PesoNac", "PesoDest", "Peso12m"]:
+        pesos[columna] = a_numero(t[columna].mask(t[columna] == "", "0"))
+        errores = acumular_errores(errores, pesos[columna].isna() | (pesos[columna] < 0), f"{columna} inválido")
+        t[columna] = pesos[columna].fillna(0).astype(str)
+    # Sin peso actual se toma el más reciente de la ficha, como en el registro completo
+    peso_actual = pesos["Peso"].where(pesos["Peso"] > 0, pesos["Peso12m"].where(pesos["Peso12m"] > 0, pesos["PesoDest"].where(pesos["PesoDest"] > 0, pesos["PesoNac"])))
+    t["Peso"] = peso_actual.fillna(0).astype(str)
+
+    for columna, valor in VALORES_POR_DEFECTO_ANIMAL.items():
+        t[columna] = t[columna].mask(t[columna] == "", valor)
+
+    existe = t["ID"].isin(df_existente["ID"].astype(str)) if not df_existente.empty else pd.Series(False, index=t.index)
+    cambios = pd.Series("", index=t.index)
+    if existe.any():
+        actual = t[["ID"]].merge(df_existente.drop_duplicates("ID").astype(str), on="ID", how="left")
+        for columna in [c for c in COLUMNAS_ANIMAL[1:] if c in actual.columns and c != "Foto"]:
+            difiere = existe & (t[columna] != actual[columna].fillna(""))
+            cambios = cambios.mask(difiere, cambios + columna + ", ")
+
+    t["Resultado"] = resultado_importacion(errores, existe, "Existente (se omite)")
+    t["Errores"] = errores.str.rstrip("; ")
+    t["Cambios"] = cambios.str.rstrip(", ")
+    return t
+
+def validar_importacion_eventos(tabla, tipo_importacion, df, df_hist):
+    """Valida pesajes o litros por animal. El animal puede venir por ID o por Arete.
+    Las filas con la misma fecha y animal que un evento ya registrado se marcan como duplicadas; en la
+    leche cuenta además el turno de ordeño (columna Periodo, que va a Detalle 2), como en la planilla."""
+    tipo_evento, columna_valor = IMPORTACIONES_EVENTOS[tipo_importacion]
+    t = normalizar_columnas(tabla, ["Fecha", "ID Animal", "Arete", columna_valor, "Notas", "Periodo"])
+    errores = pd.Series("", index=t.index)
+
+    ids_existentes = df["ID"].astype(str) if not df.empty else pd.Series(dtype=str)
+    if not df.empty and "Arete" in df.columns:
+        aretes = df[df["Arete"].astype(str).str.strip() != ""].drop_duplicates("Arete")
+        por_arete = pd.Series(aretes["ID"].astype(str).to_numpy(), index=aretes["Arete"].astype(str).str.strip())
+        t["ID Animal"] = t["ID Animal"].mask(t["ID Animal"] == "", t["Arete"].map(por_arete).fillna(""))
+    errores = acumular_errores(errores, t["ID Animal"] == "", "Falta ID o arete")
+    errores = acumular_errores(errores, (t["ID Animal"] != "") & ~t["ID Animal"].isin(ids_existentes), "Animal no registrado")
+
+    fecha = pd.to_datetime(t["Fecha"], errors="coerce")
+    errores = acumular_errores(errores, fecha.isna(), "Fecha inválida")
+    errores = acumular_errores(errores, fecha > pd.Timestamp(date.today()), "Fecha en el futuro")
+    t["Fecha"] = fecha.dt.strftime("%Y-%m-%d").fillna(t["Fecha"])
+
+    valor = a_numero(t[columna_valor])
+    errores = acumular_errores(errores, valor.isna() | (valor <= 0), f"{columna_valor} inválido")
+    t[columna_valor] = valor.fillna(0).astype(str)
+
+    previos = eventos_de_tipo(df_hist, [tipo_evento])
+    clave = t["Fecha"] + "|" + t["ID Animal"]
+    claves_previas = previos["Fecha_DT"].dt.strftime("%Y-%m-%d") + "|" + previos["ID Animal"]
+    if tipo_evento == "PRODUCCION_LECHE":
+        t["Periodo"] = t["Periodo"].astype(str).str.strip()
+        errores = acumular_errores(errores, ~t["Periodo"].isin(PERIODOS_ORDENO + [""]), "Periodo inválido")
+        clave = clave + "|" + t["Periodo"]
+        claves_previas = claves_previas + "|" + previos["Detalle 2"].astype(str).str.split("|").str[0].str.strip()
+    else:
+        t = t.drop(columns="Periodo")
+    errores = acumular_errores(errores, clave.duplicated(keep=False), "Repetido en el archivo")
+
+    t["Resultado"] = resultado_importacion(errores, clave.isin(claves_previas), "Duplicado (se omite)")
+    t["Errores"] = errores.str.rstrip("; ")
+    return t
+
+def filas_importacion(validada, tipo_importacion):
+    """Filas listas para la hoja, solo de los registros nuevos."""
+    nuevos = validada[validada["Resultado"] == "Nuevo"]
+    if tipo_importacion == "Animales":
+        return nuevos[COLUMNAS_ANIMAL].values.tolist()
+    tipo_evento, columna_valor = IMPORTACIONES_EVENTOS[tipo_importacion]
+    notas = nuevos["Notas"].mask(nuevos["Notas"] == "", "Importación")
+    detalle_2 = nuevos["Periodo"] if "Periodo" in nuevos.columns else pd.Series("", index=nuevos.index)
+    return [[fecha, tipo_evento, id_animal, valor, periodo, nota, nuevo_id_evento()]
+            for fecha, id_animal, valor, periodo, nota in zip(nuevos["Fecha"], nuevos["ID Animal"], nuevos[columna_valor], detalle_2, notas)]
+
+def agregar_filas_en_bloques(hoja, filas, nombre_hoja, al_avanzar=None):
+    """append_rows por bloques de FILAS_POR_APPEND filas; una sola invalidación al final (o al fallar)."""
+    escritas = 0
+    try:
+        for inicio in range(0, len(filas), FILAS_POR_APPEND):
+            bloque = filas[inicio:inicio + FILAS_POR_APPEND]
+            hoja.append_rows(bloque)
+            escritas += len(bloque)
+            if al_avanzar: al_avanzar(escritas, len(filas))
+    finally:
+        if escritas:
+            invalidar_datos(nombre_hoja)
+    return escritas
+
+def pesos_a_sincronizar(validada, df_hist):
+    """Último peso importado de cada animal, solo si es igual o más reciente que su último pesaje registrado."""
+    nuevos = validada[validada["Resultado"] == "Nuevo"].assign(_Fecha=lambda d: pd.to_datetime(d["Fecha"]))
+    ultimos = nuevos.sort_values("_Fecha").groupby("ID Animal").last()
+    previos = eventos_de_tipo(df_hist, ["PESAJE"]).groupby("ID Animal")["Fecha_DT"].max()
+    vigentes = ultimos[~(ultimos["_Fecha"] < previos.reindex(ultimos.index))]
+    return vigentes["Peso"].to_dict()
+
+# --- BÁSCULA / RFID ---
+# El simulador de indicador solo aparece en la interfaz si se arranca con SIMULADOR_BASCULA=1
+SIMULADOR_BASCULA = os.environ.get("SIMULADOR_BASCULA") == "1"
+
+@st.cache_data
+def indice_identificadores(version_animales, _df):
+    """Chip, arete e ID normalizados -> ID del animal. Ante repetidos gana el chip, luego el arete."""
+    if _df.empty:
+        return pd.Series(dtype=str)
+    ids = _df["ID"].astype(str)
+    claves = [(_df[c].astype(str), ids) for c in ["Chip", "Arete"] if c in _df.columns] + [(ids, ids)]
+    indice = pd.concat([pd.Series(v.to_numpy(), index=k.map(bascula.normalizar_identificador).to_numpy()) for k, v in claves])
+    indice = indice[~indice.index.isin(["", "NAN", "NONE", "0"])]
+    return indice[~indice.index.duplicated(keep="first")]
+
+def estado_bascula():
+    """Lector activo y pesadas recibidas de esta sesión. Vive en session_state: sobrevive a los reruns
+    sin mezclar las lecturas de una manga con las de otro usuario conectado a la vez."""
+    if "bascula" not in st.session_state:
+        st.session_state.bascula = {"lector": None, "simulador": None, "pesadas": [], "lock": threading.Lock()}
+    return st.session_state.bascula
+
+def recoger_pesadas(estado):
+    """Pasa lo que dejó el lector en la cola al buffer de la sesión de manga."""
+    with estado["lock"]:
+        if estado["lector"] is not None:
+            estado["pesadas"].extend(estado["lector"].drenar())
+        return list(estado["pesadas"])
+
+def resolver_pesadas(pesadas, indice, fecha):
+    """Tabla de pesadas con su animal, en el formato de validar_importacion_eventos para reutilizar el guardado.
+
+    Si un animal pasó dos veces por la báscula vale la última pesada.
+    """
+    t = pd.DataFrame([(p.identificador, p.peso, p.muestras, p.momento) for p in pesadas],
+                     columns=["Identificador", "Peso", "Muestras", "Momento"])
+    t["ID Animal"] = t["Identificador"].map(indice).fillna("")
+    t["Hora"] = t["Momento"].map(lambda s: datetime.fromtimestamp(s).strftime("%H:%M:%S"))
+    t["Fecha"] = str(fecha)
+    t["Notas"] = "Báscula"
+    registrado = t["ID Animal"] != ""
+    t["Resultado"] = "Nuevo"
+    t.loc[registrado & t["ID Animal"].where(registrado).duplicated(keep="last"), "Resultado"] = "Repetido (vale la última)"
+    t.loc[~registrado, "Resultado"] = "No registrado"
+    t["Peso"] = t["Peso"].astype(str)
+    return t.drop(columns="Momento")
+
+# --- PLANILLAS DE SESIÓN (ORDEÑO Y PESAJE) ---
+# Valores fuera de estos rangos se rechazan como error de tipeo
+RANGOS_PLANILLA = {"Pesajes": (1.0, 1500.0), "Producción de leche": (0.1, 80.0)}
+PERIODOS_ORDENO = ["Mañana", "Tarde", "Todo el día"]
+
+def planilla_sesion(tipo_importacion, animales, referencia, notas=None):
+    """Planilla con una fila por animal y la columna del valor vacía; 'referencia' (ID -> valor) orienta al que carga
+    y 'notas' (ID -> texto) precarga la nota de algunos animales."""
+    columna_valor = IMPORTACIONES_EVENTOS[tipo_importacion][1]
+    columna = lambda c: animales[c].astype(str).to_numpy() if c in animales.columns else ""
+    return pd.DataFrame({
+        "ID Animal": columna("ID"), "Nombre": columna("Nombre"), "Arete": columna("Arete"), "Lote": columna("Lote"),
+        "Referencia": animales["ID"].astype(str).map(referencia).to_numpy() if not animales.empty else [],
+        columna_valor: pd.Series([float("nan")] * len(animales), dtype=float),
+        "Notas": animales["ID"].astype(str).map(notas or {}).fillna("").to_numpy() if not animales.empty else "",
+    })
+
+def validar_planilla(editada, tipo_importacion, fecha, df, df_hist, periodo=None):
+    """Valida solo las filas con valor, con las mismas reglas que la importación masiva.
+
+    Para el ordeño por turnos, un registro previo solo es duplicado si es del mismo turno.
+    """
+    columna_valor = IMPORTACIONES_EVENTOS[tipo_importacion][1]
+    cargadas = editada[editada[columna_valor].notna()].assign(Fecha=str(fecha), Periodo=periodo or "")
+    cargadas["Notas"] = cargadas["Notas"].fillna("").astype(str).str.strip().replace("", "Planilla")
+    validada = validar_importacion_eventos(cargadas[["Fecha", "ID Animal", columna_valor, "Notas", "Periodo"]].astype(str),
+                                           tipo_importacion, df, df_hist)
+    minimo, maximo = RANGOS_PLANILLA[tipo_importacion]
+    valor = a_numero(validada[columna_valor])
+    fuera = (valor > 0) & ~valor.between(minimo, maximo)
+    validada["Errores"] = acumular_errores(validada["Errores"] + "; ", fuera, f"{columna_valor} fuera de rango ({minimo:g}-{maximo:g})").str.strip("; ")
+    validada["Resultado"] = validada["Resultado"].mask(fuera, "Error")
+    validada["Nombre"] = cargadas["Nombre"].to_numpy()
+    return validada
+
+def guardar_eventos_sesion(sh, hoja_animales, validada, tipo_importacion, df_hist, detalle_2="", descartadas=()):
+    """Todos los eventos nuevos de la sesión en appends por bloque y, si son pesajes, el peso de la ficha en un solo batch_update.
+    Los animales en 'descartadas' (leche en retiro) llevan MARCA_DESCARTE en Detalle 2."""
+    filas = filas_importacion(validada, tipo_importacion)
+    if not filas:
+        return 0
+    for fila in filas:
+        fila[4] = f"{detalle_2} | {MARCA_DESCARTE}" if fila[2] in descartadas else detalle_2
+    agregar_filas_en_bloques(sh.worksheet("Historial"), filas, "Historial")
+    if tipo_importacion == "Pesajes":
+        sincronizar_pesos(hoja_animales, pesos_a_sincronizar(validada, df_hist))
+    return len(filas)
+
+def editor_planilla(tipo_importacion, animales, referencia, fecha, sh, hoja_animales, df, df_hist, periodo=None, notas=None, descartadas=()):
+    """Planilla editable de la sesión: se valida completa al guardar y se escribe en un solo lote.
+    La marca de descarte de 'descartadas' no depende de la nota, que el usuario puede borrar."""
+    columna_valor = IMPORTACIONES_EVENTOS[tipo_importacion][1]
+    if animales.empty:
+        st.info("No hay animales para esta planilla.")
+        return
+    clave = f"planilla_{tipo_importacion}_{fecha}_{periodo}_{st.session_state.get('planillas_guardadas', 0)}"
+    editada = st.data_editor(
+        planilla_sesion(tipo_importacion, animales, referencia, notas), key=clave, hide_index=True, use_container_width=True, num_rows="fixed",
+        disabled=["ID Animal", "Nombre", "Arete", "Lote", "Referencia"],
+        column_config={"Referencia": st.column_config.NumberColumn("Referencia", help="Último peso o promedio de 7 días", format="%.1f"),
+                       columna_valor: st.column_config.NumberColumn(columna_valor, min_value=0.0, step=0.1, format="%.1f")})
+    cargadas = int(editada[columna_valor].notna().sum())
+    st.caption(f"{cargadas} de {len(editada)} animales con {columna_valor.lower()} cargado.")
+    if st.button(f"💾 Guardar sesión ({cargadas})", type="primary", disabled=cargadas == 0, key=f"guardar_{clave}"):
+        validada = validar_planilla(editada, tipo_importacion, fecha, df, df_hist, periodo)
+        con_error = validada[validada["Resultado"] != "Nuevo"]
+        if not con_error.empty:
+            st.error(f"Hay {len(con_error)} fila(s) con problemas; corrígelas y vuelve a guardar. No se guardó nada.")
+            st.dataframe(con_error[["ID Animal", "Nombre", columna_valor, "Resultado", "Errores"]], hide_index=True, use_container_width=True)
+            return
+        guardados = guardar_eventos_sesion(sh, hoja_animales, validada, tipo_importacion, df_hist, periodo or "", descartadas)
+        st.session_state.planillas_guardadas = st.session_state.get("planillas_guardadas", 0) + 1
+        st.toast(f"✅ {guardados} registros guardados")
+        st.rerun()
+
+# --- LOTES Y POTREROS ---
+# La ficha guarda el lote actual (columna T); cada cambio queda además como evento MOVIMIENTO_LOTE
+# ("De: X" / "A: Y"), que da la fecha de entrada. Cada lote se configura con un LOTE_CONFIG
+# (área y días de ocupación y descanso); vale el último registrado.
+LOTES_POR_DEFECTO = ["General", "Lote 1", "Lote 2", "Enfermería"]
+COLUMNA_LOTE = "T"
+PESO_UNIDAD_ANIMAL = 450.0  # kg de una unidad animal (UA)
+# Peso de referencia por categoría para estimar la UA de un animal sin peso en su ficha
+PESO_REFERENCIA_CATEGORIA = {"Vaca": 450.0, "Toro": 600.0, "Novilla": 320.0, "Becerro": 150.0}
+DIAS_OCUPACION_POR_DEFECTO = 7
+DIAS_DESCANSO_POR_DEFECTO = 30
+
+@st.cache_data
+def catalogo_lotes(version_hist, _df_hist):
+    """Lotes configurados con su Área (ha) y días objetivo de ocupación y descanso."""
+    ev = eventos_de_tipo(_df_hist, ["LOTE_CONFIG"]).sort_values("Fecha_DT")
+    catalogo = pd.DataFrame({
+        "Lote": extraer(ev["Detalle 1"], r"Lote:\s*(.+)"),
+        "Área": a_numero(extraer(ev["Detalle 2"], r"Área:\s*([\d.,]+)")),
+        "Días Ocupación": a_numero(extraer(ev["Detalle 2"], r"Ocupación:\s*(\d+)")),
+        "Días Descanso": a_numero(extraer(ev["Detalle 2"], r"Descanso:\s*(\d+)")),
+    })
+    catalogo = catalogo[catalogo["Lote"] != ""].drop_duplicates("Lote", keep="last")
+    catalogo["Días Ocupación"] = catalogo["Días Ocupación"].fillna(DIAS_OCUPACION_POR_DEFECTO)
+    catalogo["Días Descanso"] = catalogo["Días Descanso"].fillna(DIAS_DESCANSO_POR_DEFECTO)
+    return catalogo.reset_index(drop=True)
+
+def nombres_lotes(df, catalogo):
+    """Lotes para los selectores: los por defecto, los configurados y los que ya usa alguna ficha."""
+    en_fichas = df["Lote"].dropna().astype(str).str.strip().tolist() if not df.empty and "Lote" in df.columns else []
+    return list(dict.fromkeys(LOTES_POR_DEFECTO + catalogo["Lote"].tolist() + [l for l in en_fichas if l]))
+
+@st.cache_data
+def ubicaciones(version_hist, version_animales, _df, _df_hist):
+    """Índice de ubicación actual del hato activo, calculado una vez por versión de datos.
+
+    Devuelve un dict con:
+      - por_animal: ID, Lote, Desde (fecha de entrada) y UA de cada animal activo. Sin peso en la
+        ficha la UA sale del peso de referencia de su categoría (Peso Estimado); si tampoco hay
+        categoría queda vacía
+      - por_lote: {lote: [IDs]} para responder quién está en un lote sin recorrer el hato
+      - resumen: Animales, Peso, UA, Sin Peso (animales con UA estimada o sin UA), Área, UA/ha y
+        Días en Lote por lote (un solo groupby)
+      - salidas: última salida de cada lote, para el descanso de los lotes vacíos
+    """
+    hoy = pd.Timestamp(date.today())
+    movimientos = eventos_de_tipo(_df_hist, ["MOVIMIENTO_LOTE"]).sort_values("Fecha_DT")
+    movimientos["Desde Lote"] = extraer(movimientos["Detalle 1"], r"De:\s*(.+)")
+    movimientos["Hacia Lote"] = extraer(movimientos["Detalle 2"], r"A:\s*(.+)")
+    ultimo = movimientos.drop_duplicates("ID Animal", keep="last").set_index("ID Animal")
+
+    activos = _df[_df["Estado"] != "VENDIDO"] if not _df.empty else pd.DataFrame(columns=["ID", "Lote", "Peso", "Tipo"])
+    activos = activos.reindex(columns=list(dict.fromkeys(list(activos.columns) + ["Lote", "Peso", "Tipo"])))
+    por_animal = pd.DataFrame({
+        "ID": activos["ID"].astype(str).to_numpy(dtype=object),
+        "Lote": activos["Lote"].fillna("").astype(str).str.strip().replace("", "General").to_numpy(dtype=object),
+        "Peso": a_numero(activos["Peso"].fillna("")).to_numpy(dtype=float),
+        "Referencia": activos["Tipo"].astype(str).str.strip().map(PESO_REFERENCIA_CATEGORIA).to_numpy(dtype=float),
+    })
+    # La fecha de entrada es la del último movimiento hacia el lote en que está hoy
+    llegada = ultimo.reindex(por_animal["ID"])
+    por_animal["Desde"] = llegada["Fecha_DT"].where(llegada["Hacia Lote"] == por_animal["Lote"].to_numpy()).to_numpy()
+    sin_peso = ~(por_animal["Peso"] > 0)
+    por_animal["Peso Estimado"] = sin_peso & por_animal["Referencia"].notna()
+    por_animal["UA"] = por_animal["Peso"].where(~sin_peso, por_animal["Referencia"]) / PESO_UNIDAD_ANIMAL
+    por_animal = por_animal.drop(columns="Referencia")
+
+    catalogo = catalogo_lotes(version_hist, _df_hist).set_index("Lote")
+    resumen = por_animal.groupby("Lote").agg(Animales=("ID", "size"), Peso=("Peso", "sum"), UA=("UA", "sum"), Entrada=("Desde", "min"))
+    resumen["Sin Peso"] = sin_peso.groupby(por_animal["Lote"]).sum()
+    resumen = resumen.join(catalogo, how="outer")
+    resumen[["Animales", "Peso", "UA", "Sin Peso"]] = resumen[["Animales", "Peso", "UA", "Sin Peso"]].fillna(0)
+    resumen[["Animales", "Sin Peso"]] = resumen[["Animales", "Sin Peso"]].astype(int)
+    resumen["UA/ha"] = resumen["UA"] / resumen["Área"].where(resumen["Área"] > 0)
+    resumen["Días en Lote"] = (hoy - resumen["Entrada"]).dt.days
+    salidas = movimientos.groupby("Desde Lote")["Fecha_DT"].max()
+    resumen["Última Salida"] = salidas.reindex(resumen.index)
+    resumen.index.name = "Lote"
+
+    por_lote = {lote: ids.tolist() for lote, ids in por_animal.groupby("Lote")["ID"]}
+    return {"por_animal": por_animal, "por_lote": por_lote, "resumen": resumen.reset_index()}
+
+def plan_rotacion(resumen):
+    """Lotes ocupados que cumplieron sus días de ocupación y el lote vacío sugerido para recibirlos.
+
+    El destino es el lote vacío con más días de descanso que ya cumplió su descanso objetivo; la carga
+    estimada es la UA del grupo sobre el área del destino.
+    """
+    hoy = pd.Timestamp(date.today())
+    r = resumen.assign(**{
+        "Días Ocupación": resumen["Días Ocupación"].fillna(DIAS_OCUPACION_POR_DEFECTO),
+        "Días Descanso": resumen["Días Descanso"].fillna(DIAS_DESCANSO_POR_DEFECTO),
+        "Descanso Actual": (hoy - resumen["Última Salida"]).dt.days,
+    })
+    vacios = r[(r["Animales"] == 0) & (r["Área"] > 0) & ~(r["Descanso Actual"] < r["Días Descanso"])]
+    vacios = vacios.sort_values("Descanso Actual", ascending=False, na_position="first")
+    a_mover = r[(r["Animales"] > 0) & (r["Días en Lote"] >= r["Días Ocupación"])].sort_values("Días en Lote", ascending=False)
+    destinos = vacios.head(len(a_mover))
+    plan = a_mover[["Lote", "Animales", "UA", "Días en Lote", "Días Ocupación"]].head(len(destinos)).reset_index(drop=True)
+    plan["Destino"] = destinos["Lote"].to_numpy()
+    plan["Descanso del Destino"] = destinos["Descanso Actual"].to_numpy()
+    plan["UA/ha en Destino"] = plan["UA"] / destinos["Área"].to_numpy()
+    sin_destino = a_mover.iloc[len(destinos):][["Lote", "Animales", "UA", "Días en Lote", "Días Ocupación"]].assign(Destino="Sin lote disponible")
+    return pd.concat([plan, sin_destino], ignore_index=True)
+
+def mover_animales(sh, hoja_animales, ids, destino, fecha, lote_actual, notas=""):
+    """Un MOVIMIENTO_LOTE por animal en un solo append y el lote de las fichas en un solo batch_update."""
+    filas = [[str(fecha), "MOVIMIENTO_LOTE", id_animal, f"De: {lote_actual.get(id_animal, '')}", f"A: {destino}", notas, nuevo_id_evento()]
+             for id_animal in ids if lote_actual.get(id_animal) != destino]
+    if not filas:
+        return 0
+    agregar_filas_en_bloques(sh.worksheet("Historial"), filas, "Historial")
+    sincronizar_columna(hoja_animales, COLUMNA_LOTE, {fila[2]: destino for fila in filas})
+    return len(filas)
+
+def lote_en_fecha(ev, _df, _df_hist):
+    """Lote en que estaba cada animal en la fecha de cada evento (as-of join con MOVIMIENTO_LOTE).
+
+    Antes de su primer movimiento el animal estaba en el lote de origen de ese movimiento; sin
+    movimientos, en el lote de su ficha.
+    """
+    movimientos = eventos_de_tipo(_df_hist, ["MOVIMIENTO_LOTE"]).sort_values("Fecha_DT")
+    movimientos = pd.DataFrame({"ID Animal": movimientos["ID Animal"], "Fecha Mov": movimientos["Fecha_DT"],
+                                "Hacia": extraer(movimientos["Detalle 2"], r"A:\s*(.+)"),
+                                "De": extraer(movimientos["Detalle 1"], r"De:\s*(.+)")})
+    consulta = ev[["ID Animal", "Fecha_DT"]].astype({"ID Animal": object, "Fecha_DT": "datetime64[ns]"}).reset_index().sort_values("Fecha_DT")
+    lote = pd.merge_asof(consulta, movimientos[["ID Animal", "Fecha Mov", "Hacia"]].astype({"ID Animal": object}), left_on="Fecha_DT", right_on="Fecha Mov",
+                         by="ID Animal", direction="backward").set_index("index")["Hacia"].reindex(ev.index)
+    primer_origen = movimientos.drop_duplicates("ID Animal").set_index("ID Animal")["De"]
+    ficha = pd.Series(dtype=str)
+    if not _df.empty and "Lote" in _df.columns:
+        animales = _df.drop_duplicates("ID")
+        ficha = pd.Series(animales["Lote"].astype(str).to_numpy(), index=animales["ID"].astype(str))
+    lote = lote.fillna(ev["ID Animal"].map(primer_origen)).fillna(ev["ID Animal"].map(ficha))
+    return lote.fillna("").str.strip().replace("", "General")
+
+# --- ALIMENTACIÓN (INVENTARIO, RACIONES Y COSTOS) ---
+# ALIMENTO_ENTRADA: "Alimento: X" / "Cantidad: 500 kg | Costo: 250 | Moneda: USD"
+# ALIMENTO_SALIDA:  "Alimento: X | Lote: L" / "Cantidad: 120 kg"  (consumo de un lote)
+# RACION:           "Lote: L | Alimento: X" / "Kg por animal/día: 3.5"  (0 suspende la ración)
+CATEGORIA_GASTO_ALIMENTACION = "Alimentación (Concentrado/Pasto)"
+
+def movimientos_alimento(df_hist):
+    """Entradas y salidas de alimento con cantidad (kg), costo y moneda tipados."""
+    ev = eventos_de_tipo(df_hist, ["ALIMENTO_ENTRADA", "ALIMENTO_SALIDA"])
+    return pd.DataFrame({
+        "Fecha": ev["Fecha_DT"], "Tipo": ev["Tipo Evento"],
+        "Alimento": extraer(ev["Detalle 1"], r"Alimento:\s*([^|]+)"),
+        "Lote": extraer(ev["Detalle 1"], r"Lote:\s*([^|]+)"),
+        "Kg": a_numero(extraer(ev["Detalle 2"], r"Cantidad:\s*([\d.,]+)")),
+        "Costo": a_numero(extraer(ev["Detalle 2"], r"Costo:\s*([\d.,]+)")),
+        "Moneda": extraer(ev["Detalle 2"], r"Moneda:\s*([A-Z]{3})").replace("", MONEDA_BASE),
+    }).dropna(subset=["Kg"]).query("Alimento != ''").sort_values("Fecha", kind="stable", ignore_index=True)
+
+@st.cache_data
+def inventario_alimentos(version_hist, version_cuentas, moneda_reporte, _df_hist, _df_cuentas):
+    """Stock de cada alimento y costo de cada salida, en la moneda de reporte.
+
+    Promedio ponderado móvil: los movimientos de cada alimento se recorren en orden (el mismo día las
+    entradas van antes que las salidas); cada entrada suma sus kg y su costo al stock valorado y cada
+    salida se valora al costo promedio de ese momento y descuenta sus kg y su valor. Una salida
+    anterior a la primera entrada toma el costo de esa primera entrada; los kg que salen sin stock
+    se cuestan al último promedio y la entrada siguiente los repone antes de sumar al stock valorado.
+    """
+    mov = movimientos_alimento(_df_hist)
+    tasas = tabla_tasas(version_hist, version_cuentas, _df_hist, _df_cuentas)
+    es_entrada = mov["Tipo"] == "ALIMENTO_ENTRADA"
+    mov["Costo Reporte"] = pd.Series(convertir(mov["Costo"].fillna(0), mov["Fecha"], mov["Moneda"], tasas, moneda_reporte), index=mov.index).where(es_entrada)
+    mov = mov.assign(_Salida=~es_entrada).sort_values(["Alimento", "Fecha", "_Salida"], kind="stable")
+
+    unitario, saldos = [], {}
+    alimento_actual, kg_stock, valor, promedio = None, 0.0, 0.0, float("nan")
+    for alimento, salida, kg, costo in zip(mov["Alimento"], mov["_Salida"], mov["Kg"], mov["Costo Reporte"]):
+        if alimento != alimento_actual:
+            alimento_actual, kg_stock, valor, promedio = alimento, 0.0, 0.0, float("nan")
+        if not salida:
+            # Si el stock estaba en negativo, la parte de la entrada que lo cubre ya salió (y ya se costeó)
+            cubre = min(max(-kg_stock, 0.0), kg)
+            valor += costo * (kg - cubre) / kg if kg > 0 else costo
+            kg_stock += kg
+            if kg_stock > 0:
+                promedio = valor / kg_stock
+            elif kg > 0:
+                promedio = costo / kg
+        else:
+            if kg_stock > 0:
+                valor -= min(kg, kg_stock) * promedio
+            kg_stock -= kg
+            if kg_stock <= 0:
+                valor = 0.0
+        unitario.append(promedio)
+        saldos[alimento] = (valor, promedio)
+    mov["Costo Unitario"] = unitario
+    mov["Costo Unitario"] = mov.groupby("Alimento")["Costo Unitario"].bfill()
+    mov = mov.drop(columns="_Salida").sort_index()
+
+    entradas = mov[es_entrada]
+    salidas = mov[~es_entrada].reset_index(drop=True)
+    salidas["Costo Reporte"] = salidas["Kg"] * salidas["Costo Unitario"]
+
+    saldos = pd.DataFrame.from_dict(saldos, orient="index", columns=["Valor Stock", "Costo Promedio"])
+    stock = pd.DataFrame({
+        "Entradas (kg)": entradas.groupby("Alimento")["Kg"].sum(),
+        "Salidas (kg)": salidas.groupby("Alimento")["Kg"].sum(),
+    }).fillna(0).join(saldos)
+    stock["Stock (kg)"] = stock["Entradas (kg)"] - stock["Salidas (kg)"]
+    stock = stock[["Entradas (kg)", "Salidas (kg)", "Costo Promedio", "Stock (kg)", "Valor Stock"]]
+    stock.index.name = "Alimento"
+    return {"entradas": entradas, "salidas": salidas, "stock": stock.reset_index()}
+
+def raciones_vigentes(df_hist):
+    """Última ración registrada por lote y alimento (las de 0 kg se dan por suspendidas)."""
+    ev = eventos_de_tipo(df_hist, ["RACION"]).sort_values("Fecha_DT")
+    raciones = pd.DataFrame({
+        "Lote": extraer(ev["Detalle 1"], r"Lote:\s*([^|]+)"),
+        "Alimento": extraer(ev["Detalle 1"], r"Alimento:\s*([^|]+)"),
+        "Kg por Animal": a_numero(extraer(ev["Detalle 2"], r"día:\s*([\d.,]+)")),
+        "Desde": ev["Fecha_DT"],
+    }).drop_duplicates(["Lote", "Alimento"], keep="last")
+    return raciones[raciones["Kg por Animal"] > 0].reset_index(drop=True)
+
+def consumo_por_raciones(raciones, por_lote, dias):
+    """Consumo estimado de cada ración para 'dias' días con los animales que hoy tiene cada lote."""
+    animales = raciones["Lote"].map({lote: len(ids) for lote, ids in por_lote.items()}).fillna(0).astype(int)
+    return raciones.assign(Animales=animales, Días=dias, Kg=raciones["Kg por Animal"] * animales * dias)[lambda t: t["Kg"] > 0]
+
+def registrar_consumo(sh, consumo, fecha, notas="Según ración"):
+    """Las salidas de alimento de todos los lotes en un solo append."""
+    filas = [[str(fecha), "ALIMENTO_SALIDA", "FINCA", f"Alimento: {alimento} | Lote: {lote}", f"Cantidad: {kg:.2f} kg", notas, nuevo_id_evento()]
+             for alimento, lote, kg in zip(consumo["Alimento"], consumo["Lote"], consumo["Kg"])]
+    if filas:
+        agregar_filas_en_bloques(sh.worksheet("Historial"), filas, "Historial")
+    return len(filas)
+
+@st.cache_data
+def costos_alimentacion(version_hist, version_animales, version_cuentas, moneda_reporte, _df, _df_hist, _df_cuentas):
+    """Costo de alimentación por lote y mes frente a los kg ganados (PESAJE) y litros producidos.
+
+    Las ganancias y los litros se asignan al lote en que estaba el animal ese día. El costo completo del
+    lote se compara con cada producto: en lotes con leche y engorde a la vez ambos indicadores lo comparten.
+    """
+    salidas = inventario_alimentos(version_hist, version_cuentas, moneda_reporte, _df_hist, _df_cuentas)["salidas"]
+    costo = salidas.assign(Mes=salidas["Fecha"].dt.strftime("%Y-%m")).groupby(["Lote", "Mes"])[["Kg", "Costo Reporte"]].sum()
+
+    pesajes = analitica_peso(version_hist, version_animales, _df, _df_hist)["pesajes"].dropna(subset=["Ganancia"])
+    pesajes = pesajes.assign(Lote=lote_en_fecha(pesajes, _df, _df_hist), Mes=pesajes["Fecha_DT"].dt.strftime("%Y-%m"))
+    ganancia = pesajes.groupby(["Lote", "Mes"])["Ganancia"].sum()
+
+    leche = eventos_de_tipo(_df_hist, ["PRODUCCION_LECHE"])
+    leche = leche[(leche["ID Animal"] != "LOTE_GENERAL") & ~leche_descartada(leche)]
+    leche = leche.assign(Litros=a_numero(leche["Detalle 1"]), Lote=lote_en_fecha(leche, _df, _df_hist), Mes=leche["Fecha_DT"].dt.strftime("%Y-%m"))
+    litros = leche.groupby(["Lote", "Mes"])["Litros"].sum()
+
+    tabla = pd.concat([costo.rename(columns={"Kg": "Alimento (kg)", "Costo Reporte": "Costo Alimento"}),
+                       ganancia.rename("Kg Ganados"), litros.rename("Litros")], axis=1)
+    tabla = tabla.reindex(columns=["Alimento (kg)", "Costo Alimento", "Kg Ganados", "Litros"]).fillna(0)
+    tabla["Costo por Kg Ganado"] = tabla["Costo Alimento"] / tabla["Kg Ganados"].where(tabla["Kg Ganados"] > 0)
+    tabla["Costo por Litro"] = tabla["Costo Alimento"] / tabla["Litros"].where(tabla["Litros"] > 0)
+    tabla.index.names = ["Lote", "Mes"]
+    return tabla.reset_index().sort_values(["Mes", "Lote"], ignore_index=True)
+
+# --- RETIROS DE MEDICAMENTOS ---
+# Días de retiro (carne, leche) de referencia; siempre prevalece lo que indique la etiqueta del producto,
+# que se registra como MEDICAMENTO_CONFIG ("Medicamento: X" / "Retiro carne: 28 d | Retiro leche: 7 d").
+CATALOGO_MEDICAMENTOS_BASE = {
+    "Oxitetraciclina LA": (28, 7),
+    "Penicilina procaínica": (10, 3),
+    "Enrofloxacina": (14, 4),
+    "Ivermectina 1%": (35, 28),
+    "Albendazol": (14, 3),
+    "Flunixin meglumine": (4, 2),
+    "Dexametasona": (8, 3),
+    "Cefquinoma intramamaria": (2, 5),
+}
+
+@st.cache_data
+def catalogo_medicamentos(version_hist, _df_hist):
+    """Catálogo de medicamentos con días de retiro de carne y leche (los registrados reemplazan a los de referencia)."""
+    ev = eventos_de_tipo(_df_hist, ["MEDICAMENTO_CONFIG"]).sort_values("Fecha_DT")
+    base = pd.DataFrame([(m, c, l) for m, (c, l) in CATALOGO_MEDICAMENTOS_BASE.items()], columns=["Medicamento", "Retiro Carne", "Retiro Leche"])
+    registrados = pd.DataFrame({
+        "Medicamento": extraer(ev["Detalle 1"], r"Medicamento:\s*(.+)"),
+        "Retiro Carne": a_numero(extraer(ev["Detalle 2"], r"carne:\s*(\d+)")),
+        "Retiro Leche": a_numero(extraer(ev["Detalle 2"], r"leche:\s*(\d+)")),
+    })
+    catalogo = pd.concat([base, registrados[registrados["Medicamento"] != ""]], ignore_index=True)
+    catalogo = catalogo.assign(_Clave=catalogo["Medicamento"].str.strip().str.lower()).drop_duplicates("_Clave", keep="last")
+    return catalogo.drop(columns="_Clave").fillna({"Retiro Carne": 0, "Retiro Leche": 0}).reset_index(drop=True)
+
+def retiros_de_eventos(ev, catalogo):
+    """Fechas desde las que cada TRATAMIENTO o VACUNACION deja libre la carne y la leche.
+
+    El retiro corre desde la última dosis (inicio + días de tratamiento - 1). Los medicamentos que no
+    están en el catálogo no generan retiro.
+    """
+    es_tratamiento = ev["Tipo Evento"] == "TRATAMIENTO"
+    medicamento = extraer(ev["Detalle 2"], r"^([^|]+)").where(es_tratamiento, ev["Detalle 1"].astype(str).str.strip())
+    dias_tratamiento = a_numero(extraer(ev["Detalle 2"], r"(\d+)\s*días")).where(es_tratamiento).fillna(1).clip(lower=1)
+    ultima_dosis = ev["Fecha_DT"] + pd.to_timedelta(dias_tratamiento - 1, unit="D")
+    por_clave = catalogo.set_index(catalogo["Medicamento"].str.strip().str.lower())
+    clave = medicamento.str.lower()
+    return pd.DataFrame({
+        "ID Animal": ev["ID Animal"].astype(str),
+        "Medicamento": medicamento,
+        "Carne": ultima_dosis + pd.to_timedelta(clave.map(por_clave["Retiro Carne"]), unit="D"),
+        "Leche": ultima_dosis + pd.to_timedelta(clave.map(por_clave["Retiro Leche"]), unit="D"),
+    }).dropna(subset=["Carne", "Leche"], how="all")
+
+@st.cache_data
+def retiros_historial(version_hist, _df_hist):
+    """Índice ID -> fecha de liberación de carne y de leche, armado sobre todo el Historial una vez por versión.
+
+    Cada animal guarda su liberación más tardía en un dict por producto, así que consultar un animal es una
+    búsqueda directa. Al recalcularse con cada versión, las ediciones y los borrados del Historial cuentan.
+    """
+    catalogo = catalogo_medicamentos(version_hist, _df_hist)
+    retiros = retiros_de_eventos(eventos_de_tipo(_df_hist, ["TRATAMIENTO", "VACUNACION"]), catalogo)
+    return {producto: retiros.groupby("ID Animal")[producto].max().dropna().to_dict() for producto in ["Carne", "Leche"]}
+
+def retiros_sesion(version_hist, df_hist):
+    """Retiros que esta sesión guardó y el Historial cargado todavía no trae (ver anotar_retiro).
+
+    Vive en session_state y se vacía cuando cambia la versión del Historial: la recarga ya los incluye.
+    """
+    sesion = st.session_state.get("retiros_sesion")
+    if sesion is None or sesion["version"] != version_hist:
+        st.session_state.retiros_sesion = sesion = {"version": version_hist, "catalogo": catalogo_medicamentos(version_hist, df_hist),
+                                                    "Carne": {}, "Leche": {}}
+    return sesion
+
+def indice_retiros(version_hist, df_hist):
+    """Índice de retiros del Historial cargado con los de esta sesión encima (gana la liberación más tardía)."""
+    indice = retiros_historial(version_hist, df_hist)
+    sesion = retiros_sesion(version_hist, df_hist)
+    if not (sesion["Carne"] or sesion["Leche"]):
+        return indice
+    return {producto: {**indice[producto], **{id_animal: max(fecha, indice[producto].get(id_animal, fecha))
+                                              for id_animal, fecha in sesion[producto].items()}}
+            for producto in ["Carne", "Leche"]}
+
+def anotar_retiro(datos):
+    """Suma a los retiros de la sesión un tratamiento o vacuna recién guardado, sin esperar a recargar el Historial."""
+    sesion = st.session_state.get("retiros_sesion")
+    if sesion is None or datos[1] not in ("TRATAMIENTO", "VACUNACION"):
+        return
+    ev = pd.DataFrame([datos[:6]], columns=["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas"])
+    ev["Fecha_DT"] = pd.to_datetime(ev["Fecha"], errors="coerce")
+    retiros = retiros_de_eventos(ev.dropna(subset=["Fecha_DT"]), sesion["catalogo"])
+    for producto in ["Carne", "Leche"]:
+        for id_animal, fecha in retiros.groupby("ID Animal")[producto].max().dropna().items():
+            sesion[producto][id_animal] = max(fecha, sesion[producto].get(id_animal, fecha))
+
+def liberacion(estado, id_animal, producto, fecha=None):
+    """Fecha de liberación si el animal sigue en retiro de 'Carne' o 'Leche' en esa fecha; si no, None."""
+    libre_desde = estado[producto].get(str(id_animal))
+    fecha = pd.Timestamp(fecha or date.today())
+    return libre_desde if libre_desde is not None and libre_desde > fecha else None
+
+# --- CALENDARIO DE VACUNACIÓN ---
+# Protocolo por vacuna: edad de la primera dosis (y edad máxima, si la vacuna solo se aplica en un rango),
+# refuerzo tras la primera dosis, intervalo de revacunación (0 = dosis única), sexo y especies a las que aplica.
+# Son valores de referencia; el plan sanitario de la finca se registra como PROTOCOLO_VACUNA
+# ("Vacuna: X" / "Edad: 90-240 d | Refuerzo: 30 d | Intervalo: 365 d | Sexo: Hembra | Especie: Bovino, Bufalino")
+# y reemplaza al de referencia. Sin especies el protocolo aplica a todas.
+PROTOCOLOS_VACUNACION_BASE = {
+    # vacuna: (edad mínima, edad máxima, refuerzo, intervalo, sexo, especies)
+    "Fiebre Aftosa": (90, None, 0, 180, None, "Bovino, Bufalino, Porcino, Ovino, Caprino"),
+    "Brucelosis": (90, 240, 0, 0, "Hembra", "Bovino, Bufalino"),
+    "Rabia": (90, None, 0, 365, None, "Bovino, Bufalino, Equino"),
+    "Complejo Clostridial": (60, None, 30, 365, None, "Bovino, Bufalino, Ovino, Caprino"),
+    "Leptospirosis": (120, None, 30, 180, None, "Bovino, Bufalino, Porcino"),
+    "Complejo Respiratorio": (90, None, 21, 365, None, "Bovino, Bufalino"),
+    "Complejo Reproductivo": (365, None, 30, 365, "Hembra", "Bovino, Bufalino"),
+    "Antiparasitario": (60, None, 0, 90, None, ""),
+}
+COLUMNAS_PROTOCOLO = ["Vacuna", "Edad Mínima", "Edad Máxima", "Refuerzo", "Intervalo", "Sexo", "Especies"]
+DIAS_AVISO_VACUNA = 15  # una dosis que vence dentro de estos días aparece como "Próxima"
+
+@st.cache_data
+def protocolos_vacunacion(version_hist, _df_hist):
+    """Protocolo de cada vacuna (los registrados reemplazan a los de referencia). Edades e intervalos en días."""
+    ev = eventos_de_tipo(_df_hist, ["PROTOCOLO_VACUNA"]).sort_values("Fecha_DT")
+    base = pd.DataFrame([(v, *regla) for v, regla in PROTOCOLOS_VACUNACION_BASE.items()], columns=COLUMNAS_PROTOCOLO)
+    registrados = pd.DataFrame({
+        "Vacuna": extraer(ev["Detalle 1"], r"Vacuna:\s*(.+)"),
+        "Edad Mínima": a_numero(extraer(ev["Detalle 2"], r"Edad:\s*(\d+)")),
+        "Edad Máxima": a_numero(extraer(ev["Detalle 2"], r"Edad:\s*\d+\s*-\s*(\d+)")),
+        "Refuerzo": a_numero(extraer(ev["Detalle 2"], r"Refuerzo:\s*(\d+)")),
+        "Intervalo": a_numero(extraer(ev["Detalle 2"], r"Intervalo:\s*(\d+)")),
+        "Sexo": extraer(ev["Detalle 2"], r"Sexo:\s*(Macho|Hembra)"),
+        "Especies": extraer(ev["Detalle 2"], r"Especie:\s*([^|]+)"),
+    })
+    protocolos = pd.concat([base, registrados[registrados["Vacuna"] != ""]], ignore_index=True)
+    protocolos = protocolos.assign(_Clave=protocolos["Vacuna"].str.strip().str.lower()).drop_duplicates("_Clave", keep="last")
+    protocolos["Sexo"] = protocolos["Sexo"].where(protocolos["Sexo"].isin(["Macho", "Hembra"]))
+    protocolos = protocolos.fillna({"Edad Mínima": 0, "Refuerzo": 0, "Intervalo": 0})
+    protocolos["Edad Máxima"] = pd.to_numeric(protocolos["Edad Máxima"], errors="coerce")
+    protocolos["Especies"] = protocolos["Especies"].fillna("").astype(str).str.strip()
+    return protocolos.drop(columns="_Clave").reset_index(drop=True)
+
+def especie_animal(tipo):
+    """Especie de cada animal: el Tipo si es una especie; las categorías (Vaca, Toro...) y el vacío son bovinos."""
+    tipo = tipo.fillna("").astype(str).str.strip()
+    return tipo.where(tipo.isin(LISTA_ESPECIES), "Bovino")
+
+@st.cache_data
+def calendario_vacunacion(version_hist, version_animales, fecha, _df, _df_hist):
+    """Próxima dosis de cada animal activo para cada vacuna de su protocolo, en una sola pasada vectorizada.
+
+    'fecha' (texto AAAA-MM-DD) forma parte de la clave: el calendario se recalcula una vez por día o
+    cuando cambian los datos. Cada animal solo cruza con los protocolos de su sexo y su especie. La
+    próxima dosis es el refuerzo (si solo hay una dosis y el protocolo lo pide), la última dosis más el
+    intervalo, o la edad mínima si el animal nunca se vacunó. Un animal sin ninguna dosis registrada que
+    ya pasó esa edad (o sin fecha de nacimiento) queda como "Sin registro": puede estar vacunado fuera
+    del sistema, así que no cuenta como dosis vencida. Las vacunas de dosis única ya aplicadas y las que
+    el animal ya no puede recibir por edad no figuran.
+    """
+    columnas = ["ID Animal", "Nombre", "Tipo", "Sexo", "Lote", "Vacuna", "Dosis", "Última Dosis", "Próxima Dosis", "Días", "Estado"]
+    protocolos = protocolos_vacunacion(version_hist, _df_hist)
+    if _df.empty:
+        return pd.DataFrame(columns=columnas)
+    hoy = pd.Timestamp(fecha)
+    activos = _df[_df["Estado"] != "VENDIDO"]
+    animales = pd.DataFrame({
+        "ID Animal": activos["ID"].astype(str),
+        "Nombre": activos["Nombre"].astype(str),
+        "Tipo": activos["Tipo"].astype(str),
+        "Sexo": activos["Sexo"].astype(str),
+        "Lote": activos["Lote"].astype(str) if "Lote" in activos.columns else "",
+        "Nacimiento": pd.to_datetime(activos["Nacimiento"], errors="coerce").astype("datetime64[ns]"),
+        "Especie": especie_animal(activos["Tipo"]),
+    })
+    cruce = animales.merge(protocolos.assign(_Clave=protocolos["Vacuna"].str.strip().str.lower()), how="cross")
+    cruce = cruce[cruce["Sexo_y"].isna() | (cruce["Sexo_x"] == cruce["Sexo_y"])].rename(columns={"Sexo_x": "Sexo"})
+    especies = cruce["Especies"].str.lower().str.split(r"\s*,\s*")
+    de_su_especie = pd.Series([e in lista for e, lista in zip(cruce["Especie"].str.lower(), especies)], index=cruce.index, dtype=bool)
+    cruce = cruce[(cruce["Especies"] == "") | de_su_especie]
+
+    ev = eventos_de_tipo(_df_hist, ["VACUNACION"])
+    aplicadas = (ev.assign(_Clave=ev["Detalle 1"].astype(str).str.strip().str.lower())
+                 .groupby(["ID Animal", "_Clave"])["Fecha_DT"].agg(["max", "size"])
+                 .rename(columns={"max": "Última Dosis", "size": "Dosis"}).reset_index())
+    cruce = cruce.astype({"ID Animal": object, "_Clave": object}).merge(
+        aplicadas.astype({"ID Animal": object, "_Clave": object}), on=["ID Animal", "_Clave"], how="left")
+    cruce["Dosis"] = cruce["Dosis"].fillna(0).astype(int)
+
+    dias = lambda columna: pd.to_timedelta(cruce[columna], unit="D")
+    primera = cruce["Nacimiento"] + dias("Edad Mínima")
+    refuerzo = cruce["Última Dosis"] + dias("Refuerzo")
+    revacunacion = cruce["Última Dosis"] + dias("Intervalo")
+    proxima = np.select(
+        [cruce["Dosis"] == 0, (cruce["Dosis"] == 1) & (cruce["Refuerzo"] > 0), cruce["Intervalo"] > 0],
+        [primera.fillna(hoy), refuerzo, revacunacion], default=np.datetime64("NaT"))
+    cruce["Próxima Dosis"] = proxima
+    # Con edad máxima la primera dosis solo vale dentro del rango (sin nacimiento no se puede saber)
+    fuera_de_edad = (cruce["Dosis"] == 0) & cruce["Edad Máxima"].notna() & ~(hoy <= cruce["Nacimiento"] + dias("Edad Máxima"))
+    cruce = cruce[cruce["Próxima Dosis"].notna() & ~fuera_de_edad]
+
+    cruce["Días"] = (cruce["Próxima Dosis"] - hoy).dt.days
+    sin_registro = (cruce["Dosis"] == 0) & ((cruce["Días"] < 0) | cruce["Nacimiento"].isna())
+    cruce["Estado"] = np.select([sin_registro, cruce["Días"] < 0, cruce["Días"] <= DIAS_AVISO_VACUNA],
+                                ["Sin registro", "Vencida", "Próxima"], default="Al día")
+    return cruce[columnas].sort_values(["Días", "Vacuna", "ID Animal"]).reset_index(drop=True)
+
+def nombres_vacunas(protocolos):
+    """Vacunas para los selectores: la lista general más las que tienen protocolo propio."""
+    return list(dict.fromkeys(LISTA_VACUNAS + protocolos["Vacuna"].tolist()))
+
+def pendientes_vacunacion(calendario, vacuna, dias=DIAS_AVISO_VACUNA):
+    """IDs que deben recibir la vacuna: vencidos y los que vencen dentro de 'dias'."""
+    return calendario.loc[(calendario["Vacuna"] == vacuna) & (calendario["Días"] <= dias), "ID Animal"].tolist()
+
+def registrar_vacunacion(sh, ids, vacuna, fecha, notas=""):
+    """Una VACUNACION por animal escrita por bloques de append_rows (no una llamada por animal)."""
+    filas = [[str(fecha), "VACUNACION", str(id_animal), vacuna, "", notas, nuevo_id_evento()] for id_animal in ids]
+    escritas = agregar_filas_en_bloques(sh.worksheet("Historial"), filas, "Historial")
+    for fila in filas[:escritas]:
+        anotar_retiro(fila)
+    return escritas
+
+# --- SALUD DEL HATO ---
+# Un caso es un episodio: los TRATAMIENTO (Detalle 1 "tipo | enfermedad") y MASTITIS de un mismo animal y
+# enfermedad separados por menos de DIAS_EPISODIO días cuentan una sola vez. La incidencia es casos por
+# cada 100 animales presentes en el mes; la población de cada mes sale de nacimientos, ventas y muertes.
+DIAS_EPISODIO = 14
+MESES_ANALISIS_SALUD = 36
+VENTANA_MESES_SALUD = 3
+CATEGORIA_GASTO_SANIDAD = "Medicinas / Veterinaria"
+
+def casos_sanitarios(df_hist):
+    """TRATAMIENTO y MASTITIS con la enfermedad llevada a LISTA_ENFERMEDADES y los días de tratamiento."""
+    ev = eventos_de_tipo(df_hist, ["TRATAMIENTO", "MASTITIS"])
+    es_mastitis = ev["Tipo Evento"] == "MASTITIS"
+    nombre = extraer(ev["Detalle 1"], r"\|\s*(.+)$").where(~es_mastitis, "Mastitis")
+    enfermedad = nombre.str.lower().map({e.lower(): e for e in LISTA_ENFERMEDADES}).fillna("Otra Enfermedad")
+    return pd.DataFrame({
+        "ID Animal": ev["ID Animal"],
+        "Fecha_DT": ev["Fecha_DT"],
+        "Enfermedad": enfermedad.astype(object),
+        "Días Tratamiento": a_numero(extraer(ev["Detalle 2"], r"(\d+)\s*días")).where(~es_mastitis).fillna(1).clip(lower=1),
+    })
+
+def episodios_sanitarios(casos):
+    """Agrupa los eventos en episodios por animal y enfermedad; 'Número' > 1 es una recaída."""
+    columnas = ["ID Animal", "Enfermedad", "Inicio", "Fin", "Eventos", "Días Tratamiento", "Número"]
+    if casos.empty:
+        return pd.DataFrame({c: pd.Series(dtype="datetime64[ns]" if c in ("Inicio", "Fin") else object) for c in columnas})
+    casos = casos.sort_values(["ID Animal", "Enfermedad", "Fecha_DT"])
+    brecha = casos.groupby(["ID Animal", "Enfermedad"])["Fecha_DT"].diff().dt.days
+    episodio = (brecha.isna() | (brecha > DIAS_EPISODIO)).cumsum()
+    episodios = casos.groupby(episodio).agg(**{
+        "ID Animal": ("ID Animal", "first"), "Enfermedad": ("Enfermedad", "first"), "Inicio": ("Fecha_DT", "min"),
+        "Fin": ("Fecha_DT", "max"), "Eventos": ("Fecha_DT", "size"), "Días Tratamiento": ("Días Tratamiento", "sum")})
+    episodios["Número"] = episodios.groupby(["ID Animal", "Enfermedad"]).cumcount() + 1
+    return episodios.reset_index(drop=True)
+
+def poblacion_mensual(meses, _df, _df_hist):
+    """Una fila por animal y mes en que estuvo en la finca, con el lote en que estaba a fin de mes.
+
+    Entra al nacer (o en su primer evento si no tiene fecha de nacimiento) y sale con su VENTA o MUERTE;
+    se cuenta en el mes de salida porque estuvo en riesgo parte de él.
+    """
+    if _df.empty or meses.empty:
+        return pd.DataFrame({"ID Animal": pd.Series(dtype=object), "Mes": pd.Series(dtype=object), "Lote": pd.Series(dtype=object)})
+    ids = _df["ID"].astype(str).drop_duplicates()
+    con_fecha = _df_hist.assign(_DT=pd.to_datetime(_df_hist["Fecha"], errors="coerce")) if not _df_hist.empty else pd.DataFrame(columns=["ID Animal", "Tipo Evento", "_DT"])
+    con_fecha = con_fecha.assign(**{"ID Animal": con_fecha["ID Animal"].astype(str)})
+    primer_evento = con_fecha.groupby("ID Animal")["_DT"].min()
+    salida = con_fecha[con_fecha["Tipo Evento"].isin(["VENTA", "MUERTE"])].groupby("ID Animal")["_DT"].min()
+    nacimiento = pd.Series(pd.to_datetime(_df.drop_duplicates("ID")["Nacimiento"], errors="coerce").to_numpy(), index=ids)
+    animales = pd.DataFrame({"ID Animal": ids.to_numpy(),
+                             "Entrada": nacimiento.fillna(primer_evento.reindex(ids)).to_numpy(),
+                             "Salida": salida.reindex(ids).to_numpy()})
+    periodos = pd.DataFrame({"Mes": meses.strftime("%Y-%m"), "Inicio Mes": meses.to_timestamp(how="start"),
+                             "Fecha_DT": meses.to_timestamp(how="end").normalize()})
+    cruce = animales.merge(periodos, how="cross")
+    presentes = cruce[~(cruce["Entrada"] > cruce["Fecha_DT"]) & ~(cruce["Salida"] < cruce["Inicio Mes"])].reset_index(drop=True)
+    presentes["Lote"] = lote_en_fecha(presentes, _df, _df_hist)
+    return presentes[["ID Animal", "Mes", "Lote"]]
+
+@st.cache_data
+def salud_hato(version_hist, version_animales, version_cuentas, moneda_reporte, _df, _df_hist, _df_cuentas):
+    """Indicadores sanitarios de los últimos MESES_ANALISIS_SALUD meses, ya agregados para tablas y gráficos.
+
+    Devuelve un dict con:
+      - episodios: un caso por fila con su lote y mes de inicio
+      - incidencia: casos por mes y enfermedad, población, incidencia y su media móvil de VENTANA_MESES_SALUD meses
+      - por_lote: casos, animales-mes e incidencia por lote y enfermedad en todo el periodo
+      - recurrencia: animales con alguna recaída ('Número' > 1 de la misma enfermedad), cuántas fueron de mastitis
+        y sus episodios en el periodo
+      - mortalidad: muertes, población y tasa por mes, con la tasa acumulada de 12 meses; causas: muertes por causa
+      - costos: gasto de CATEGORIA_GASTO_SANIDAD por mes repartido entre enfermedades según los días de tratamiento;
+        costo_enfermedad: total y costo por episodio
+    """
+    hoy = pd.Timestamp(date.today())
+    meses = pd.period_range(end=hoy.to_period("M"), periods=MESES_ANALISIS_SALUD, freq="M")
+    desde = meses[0].to_timestamp()
+    mes = lambda fechas: fechas.dt.strftime("%Y-%m")
+
+    episodios = episodios_sanitarios(casos_sanitarios(_df_hist))
+    episodios = episodios[episodios["Inicio"] >= desde].reset_index(drop=True)
+    episodios["Fecha_DT"] = episodios["Inicio"]
+    episodios["Lote"] = lote_en_fecha(episodios, _df, _df_hist) if not episodios.empty else pd.Series(dtype=object)
+    episodios["Mes"] = mes(episodios["Inicio"])
+    episodios = episodios.drop(columns="Fecha_DT")
+
+    poblacion = poblacion_mensual(meses, _df, _df_hist)
+    por_mes = poblacion.groupby("Mes").size().reindex(meses.strftime("%Y-%m"), fill_value=0).rename("Población").rename_axis("Mes")
+
+    enfermedades = episodios["Enfermedad"].unique().tolist()
+    indice = pd.MultiIndex.from_product([enfermedades, por_mes.index], names=["Enfermedad", "Mes"])
+    incidencia = episodios.groupby(["Enfermedad", "Mes"]).size().reindex(indice, fill_value=0).rename("Casos").reset_index()
+    incidencia = incidencia.merge(por_mes.reset_index(), on="Mes", how="left")
+    incidencia["Incidencia"] = incidencia["Casos"] / incidencia["Población"].where(incidencia["Población"] > 0) * 100
+    ventana = incidencia.groupby("Enfermedad")[["Casos", "Población"]].rolling(VENTANA_MESES_SALUD, min_periods=1)
+    movil = ventana.sum().reset_index(level=0, drop=True)
+    incidencia["Incidencia Móvil"] = movil["Casos"] / movil["Población"].where(movil["Población"] > 0) * 100
+
+    animales_mes = poblacion.groupby("Lote").size().rename("Animales-Mes")
+    por_lote = episodios.groupby(["Lote", "Enfermedad"]).size().rename("Casos").reset_index()
+    por_lote = por_lote.merge(animales_mes.reset_index(), on="Lote", how="left")
+    por_lote["Incidencia"] = por_lote["Casos"] / por_lote["Animales-Mes"].where(por_lote["Animales-Mes"] > 0) * 100
+
+    # 'Número' se cuenta sobre todo el Historial: la recaída de un caso anterior al periodo también cuenta
+    recaidas = episodios[episodios["Número"] > 1]
+    recurrencia = recaidas.assign(_Mastitis=recaidas["Enfermedad"] == "Mastitis").groupby("ID Animal").agg(
+        Recaídas=("Enfermedad", "size"), Mastitis=("_Mastitis", "sum"), Último=("Inicio", "max"))
+    recurrencia.insert(0, "Episodios", episodios.groupby("ID Animal").size().reindex(recurrencia.index).astype(int))
+    recurrencia["Enfermedades"] = (recaidas.drop_duplicates(["ID Animal", "Enfermedad"]).sort_values("Enfermedad")
+                                   .groupby("ID Animal")["Enfermedad"].agg(", ".join))
+    recurrencia = recurrencia.sort_values(["Recaídas", "Último"], ascending=False).reset_index()
+    nombres = pd.Series(_df["Nombre"].astype(str).to_numpy(), index=_df["ID"].astype(str)) if not _df.empty else pd.Series(dtype=object)
+    recurrencia.insert(1, "Nombre", nombres[~nombres.index.duplicated()].reindex(recurrencia["ID Animal"]).fillna("").to_numpy())
+
+    muertes = eventos_de_tipo(_df_hist, ["MUERTE"])
+    muertes = muertes[muertes["Fecha_DT"] >= desde]
+    mortalidad = pd.concat([muertes.groupby(mes(muertes["Fecha_DT"])).size().rename("Muertes"), por_mes], axis=1)
+    mortalidad = mortalidad.reindex(por_mes.index).fillna({"Muertes": 0}).astype({"Muertes": int})
+    mortalidad["Mortalidad"] = mortalidad["Muertes"] / mortalidad["Población"].where(mortalidad["Población"] > 0) * 100
+    anual = mortalidad[["Muertes", "Población"]].rolling(12, min_periods=1)
+    mortalidad["Mortalidad 12 Meses"] = anual.sum()["Muertes"] / anual.mean()["Población"].where(lambda p: p > 0) * 100
+    mortalidad.index.name = "Mes"
+    causas = muertes["Detalle 1"].astype(str).str.strip().replace("", "Sin causa").value_counts().rename_axis("Causa").rename("Muertes").reset_index()
+
+    movimientos = movimientos_consolidados(version_hist, version_cuentas, moneda_reporte, _df_hist, _df_cuentas)
+    gasto = movimientos[(movimientos["Tipo Evento"] == "GASTO_OPERATIVO") & (movimientos["Categoría"] == CATEGORIA_GASTO_SANIDAD)
+                        & (movimientos["Fecha"] >= desde)]
+    gasto_mes = -gasto.groupby("Mes")["Importe Reporte"].sum()
+    dias = episodios.groupby(["Mes", "Enfermedad"])["Días Tratamiento"].sum()
+    participacion = dias / dias.groupby(level="Mes").transform("sum")
+    costos = (participacion * gasto_mes.reindex(participacion.index.get_level_values("Mes")).to_numpy()).rename("Costo").reset_index()
+    sin_caso = gasto_mes[~gasto_mes.index.isin(participacion.index.get_level_values("Mes"))]
+    costos = pd.concat([costos, pd.DataFrame({"Mes": sin_caso.index, "Enfermedad": "Sin caso asociado", "Costo": sin_caso.to_numpy()})], ignore_index=True)
+    costos = costos.dropna(subset=["Costo"]).sort_values(["Mes", "Enfermedad"], ignore_index=True)
+    costo_enfermedad = pd.concat([costos.groupby("Enfermedad")["Costo"].sum(), episodios.groupby("Enfermedad").size().rename("Episodios")], axis=1)
+    costo_enfermedad = costo_enfermedad.fillna({"Costo": 0, "Episodios": 0})
+    costo_enfermedad["Costo por Episodio"] = costo_enfermedad["Costo"] / costo_enfermedad["Episodios"].where(costo_enfermedad["Episodios"] > 0)
+    costo_enfermedad.index.name = "Enfermedad"
+
+    return {"episodios": episodios, "incidencia": incidencia, "por_lote": por_lote, "recurrencia": recurrencia,
+            "mortalidad": mortalidad.reset_index(), "causas": causas, "costos": costos,
+            "costo_enfermedad": costo_enfermedad.reset_index().sort_values("Costo", ascending=False, ignore_index=True)}
+
+# --- CICLO DE VIDA (CATEGORÍAS Y ESTADOS) ---
+# La categoría (Tipo) sale de la edad, el sexo y los partos; el estado reproductivo (Estado), de chequeos,
+# partos y abortos. Solo se aplican las transiciones hacia adelante de TRANSICIONES_CATEGORIA y
+# TRANSICIONES_ESTADO ("Enfermo" y "VENDIDO" no los toca el motor). Cada cambio se escribe en la ficha y
+# queda como CAMBIO_CATEGORIA o CAMBIO_ESTADO ("De: X" / "A: Y", con el motivo en Notas).
+# Solo se clasifican por edad las fichas bovinas sin categoría (Tipo vacío, "Bovino" o "Bufalino"); esa
+# clasificación inicial queda pendiente hasta que alguien la aprueba, no se aplica en la corrida diaria.
+EDAD_DESTETE = 210
+EDAD_TORO = 540  # días: un becerro macho pasa a Toro al llegar a la edad reproductiva
+COLUMNA_TIPO, COLUMNA_ESTADO = "B", "I"
+TRANSICIONES_CATEGORIA = {"Becerro": {"Novilla", "Toro", "Vaca"}, "Novilla": {"Vaca"}}
+TRANSICIONES_ESTADO = {"Sano": {"Preñada", "Lactancia"}, "Lactancia": {"Preñada", "Sano"}, "Preñada": {"Lactancia", "Sano"}}
+EVENTO_TRANSICION = {"Tipo": "CAMBIO_CATEGORIA", "Estado": "CAMBIO_ESTADO"}
+TIPOS_SIN_CATEGORIA = ["", "Bovino", "Bufalino"]
+MOTIVO_CLASIFICACION_INICIAL = "Clasificación inicial"
+COLUMNAS_TRANSICION = ["ID Animal", "Nombre", "Campo", "Actual", "Nuevo", "Motivo"]
+
+def transiciones_validas(actual, nuevo, permitidas, libre=None):
+    """Máscara de los pares actual -> nuevo permitidos; desde un valor en 'libre' vale cualquier destino."""
+    pares = {f"{origen}>{destino}" for origen, destinos in permitidas.items() for destino in destinos}
+    validas = (actual + ">" + nuevo).isin(pares)
+    if libre is not None:
+        validas |= actual.isin(libre)
+    return validas & (nuevo != "") & (nuevo != actual)
+
+@st.cache_data
+def transiciones_pendientes(version_hist, version_animales, fecha, _df, _df_hist):
+    """Cambios de categoría y estado que corresponden a cada animal activo en 'fecha', en una pasada vectorizada.
+
+    'fecha' (texto AAAA-MM-DD) forma parte de la clave: se recalcula una vez por día o cuando cambian los
+    datos. Los animales de TIPOS_SIN_CATEGORIA (p. ej. "Bovino" de una importación) se clasifican por edad;
+    las demás especies no cambian de categoría.
+    """
+    if _df.empty:
+        return pd.DataFrame(columns=COLUMNAS_TRANSICION)
+    hoy = pd.Timestamp(fecha)
+    activos = _df[_df["Estado"] != "VENDIDO"].drop_duplicates("ID").reset_index(drop=True)
+    ids = activos["ID"].astype(str)
+    repro = kpis_reproductivos(version_hist, version_animales, _df, _df_hist)["por_vaca"].set_index("ID Animal").reindex(ids).reset_index(drop=True)
+    tipo, estado = activos["Tipo"].astype(str).str.strip(), activos["Estado"].astype(str).str.strip()
+    hembra, macho = activos["Sexo"] == "Hembra", activos["Sexo"] == "Macho"
+    edad = (hoy - pd.to_datetime(activos["Nacimiento"], errors="coerce")).dt.days
+    con_partos = repro["Partos"].fillna(0) > 0
+
+    reglas_categoria = [hembra & con_partos, hembra & (edad >= EDAD_DESTETE), macho & (edad >= EDAD_TORO), edad.notna()]
+    categoria = pd.Series(np.select(reglas_categoria, ["Vaca", "Novilla", "Toro", "Becerro"], default=""), index=activos.index)
+    motivo_categoria = np.select(reglas_categoria, ["Primer parto", f"Destete ({EDAD_DESTETE} días)", f"Edad reproductiva ({EDAD_TORO} días)", "Clasificación por edad"], default="")
+    sin_categoria = tipo.isin(TIPOS_SIN_CATEGORIA)
+    motivo_categoria = np.where(sin_categoria, MOTIVO_CLASIFICACION_INICIAL, motivo_categoria)
+    cambia_categoria = transiciones_validas(tipo, categoria, TRANSICIONES_CATEGORIA, tipo[sin_categoria])
+
+    preñada = repro["Concepción Actual"].notna()
+    cierre_parto = repro["Último Cierre"].notna() & (repro["Último Cierre"] == repro["Último Parto"])
+    cierre_aborto = repro["Último Cierre"].notna() & ~cierre_parto
+    lactando = cierre_parto & ((hoy - repro["Último Parto"]).dt.days < DIAS_LACTANCIA_ESTANDAR)
+    reglas_estado = [preñada, lactando, cierre_aborto & (estado == "Preñada"), cierre_parto & (estado == "Lactancia")]
+    nuevo_estado = pd.Series(np.select(reglas_estado, ["Preñada", "Lactancia", "Sano", "Sano"], default=""), index=activos.index)
+    motivo_estado = np.select(reglas_estado, ["Chequeo positivo", "Parto", "Aborto", f"Fin de lactancia ({DIAS_LACTANCIA_ESTANDAR} días)"], default="")
+    # Un cambio de estado registrado después del hecho que dispara la regla (p. ej. un secado anticipado) prevalece.
+    # La preñez se conoce en el chequeo, no en la concepción (que es el servicio, anterior a él)
+    chequeos = eventos_de_tipo(_df_hist, ["CHEQUEO_REPRO"])
+    ultimo_positivo = chequeos[chequeos["Detalle 1"] == "Preñada"].groupby("ID Animal")["Fecha_DT"].max().reindex(ids).reset_index(drop=True)
+    disparo = pd.Series(np.select(reglas_estado, [ultimo_positivo, repro["Último Cierre"], repro["Último Cierre"],
+                                                  repro["Último Parto"] + pd.Timedelta(days=DIAS_LACTANCIA_ESTANDAR)], default=np.datetime64("NaT")))
+    ultimo_cambio = eventos_de_tipo(_df_hist, ["CAMBIO_ESTADO"]).groupby("ID Animal")["Fecha_DT"].max().reindex(ids).reset_index(drop=True)
+    cambia_estado = transiciones_validas(estado, nuevo_estado, TRANSICIONES_ESTADO) & hembra & ~(ultimo_cambio >= disparo)
+
+    base = pd.DataFrame({"ID Animal": ids, "Nombre": activos["Nombre"].astype(str)})
+    transiciones = pd.concat([
+        base.assign(Campo="Tipo", Actual=tipo, Nuevo=categoria, Motivo=motivo_categoria)[cambia_categoria],
+        base.assign(Campo="Estado", Actual=estado, Nuevo=nuevo_estado, Motivo=motivo_estado)[cambia_estado],
+    ], ignore_index=True)
+    return transiciones[COLUMNAS_TRANSICION]
+
+def aplicar_transiciones(sh, hoja_animales, transiciones, fecha):
+    """Registra cada cambio como evento y escribe Tipo y Estado de todos los animales en un solo batch_update.
+
+    Los eventos van primero: si falla la ficha queda el registro del cambio (y el motor lo vuelve a
+    proponer), nunca una ficha cambiada sin su evento.
+    """
+    if transiciones.empty:
+        return 0
+    filas = [[str(fecha), EVENTO_TRANSICION[campo], str(id_animal), f"De: {actual}", f"A: {nuevo}", motivo, nuevo_id_evento()]
+             for id_animal, campo, actual, nuevo, motivo in transiciones[["ID Animal", "Campo", "Actual", "Nuevo", "Motivo"]].itertuples(index=False)]
+    agregar_filas_en_bloques(sh.worksheet("Historial"), filas, "Historial")
+    columnas = {"Tipo": COLUMNA_TIPO, "Estado": COLUMNA_ESTADO}
+    sincronizar_columnas(hoja_animales, {columnas[campo]: dict(zip(grupo["ID Animal"], grupo["Nuevo"]))
+                                         for campo, grupo in transiciones.groupby("Campo")})
+    return len(filas)
+
+def registrar_transicion(sh, hoja_animales, datos, cambios, motivo, fecha):
+    """Cambios de un animal pedidos desde un formulario ({campo: nuevo valor}), con el mismo registro que el motor."""
+    transiciones = pd.DataFrame([(str(datos["ID"]), str(datos["Nombre"]), campo, str(datos[campo]), nuevo, motivo)
+                                 for campo, nuevo in cambios.items() if str(datos[campo]) != nuevo], columns=COLUMNAS_TRANSICION)
+    return aplicar_transiciones(sh, hoja_animales, transiciones, fecha)
+
+@st.cache_resource
+def estado_ciclo_vida():
+    return {"fecha": None, "lock": threading.Lock()}
+
+def ciclo_vida_diario(sh, hoja_animales, version_hist, version_animales, df, df_hist):
+    """Aplica las transiciones pendientes en la primera carga de cada día; devuelve cuántas se aplicaron.
+
+    La clasificación inicial no se aplica sola (queda en Alertas para aprobarla). El día se marca como
+    hecho solo cuando se escribieron eventos y fichas: si algo falla, la próxima carga lo reintenta. Otra
+    sesión que llega mientras tanto no espera ni repite el trabajo.
+    """
+    hoy = str(date.today())
+    estado = estado_ciclo_vida()
+    if estado["fecha"] == hoy or not estado["lock"].acquire(blocking=False):
         return 0
+    try:
+        if estado["fecha"] == hoy:
+            return 0
+        transiciones = transiciones_pendientes(version_hist, version_animales, hoy, df, df_hist)
+        aplicadas = aplicar_transiciones(sh, hoja_animales, transiciones[transiciones["Motivo"] != MOTIVO_CLASIFICACION_INICIAL], hoy)
+        estado["fecha"] = hoy
+        return aplicadas
+    finally:
+        estado["lock"].release()
+
+# --- HISTORIALES CLÍNICOS (PDF) ---
+TIPOS_CLINICOS = ["TRATAMIENTO", "VACUNACION", "MASTITIS", "MUERTE"]
+COLUMNAS_FICHA_PDF = ["ID", "Nombre", "Raza", "Sexo", "Nacimiento", "Estado"]
+COLUMNAS_EVENTO_PDF = ["Fecha", "Tipo Evento", "Detalle 1", "Detalle 2", "Notas"]
+MAX_PDFS_EN_CACHE = 2000
+
+@st.cache_data
+def historias_clinicas(version_hist, version_animales, _df, _df_hist):
+    """Ficha y eventos clínicos de cada animal, agrupados en una sola pasada sobre el Historial.
+
+    Devuelve {ID: (ficha, eventos, firma)}; la firma resume el contenido del historial del animal y,
+    junto con su ID, indexa la caché de PDFs (un animal sin cambios no se vuelve a renderizar).
+    """
+    if _df.empty:
+        return {}
+    fichas = _df.drop_duplicates("ID").reindex(columns=COLUMNAS_FICHA_PDF).fillna("").astype(str)
+    eventos = {}
+    if not _df_hist.empty:
+        clinicos = _df_hist[_df_hist["Tipo Evento"].isin(TIPOS_CLINICOS)].reindex(columns=COLUMNAS_EVENTO_PDF + ["ID Animal"]).fillna("").astype(str)
+        eventos = {id_animal: grupo[COLUMNAS_EVENTO_PDF].to_dict("records") for id_animal, grupo in clinicos.groupby("ID Animal", sort=False)}
+
+    historias = {}
+    for ficha in fichas.to_dict("records"):
+        eventos_animal = eventos.get(ficha["ID"], [])
+        firma = hashlib.sha1(json.dumps([ficha, eventos_animal], ensure_ascii=False).encode("utf-8")).hexdigest()
+        historias[ficha["ID"]] = (ficha, eventos_animal, firma)
+    return historias
+
+@st.cache_resource
+def estado_pdfs():
+    return {"lock": threading.Lock(), "pdfs": {}}
+
+def pdfs_clinicos(ids, version_hist, version_animales, df, df_hist, al_avanzar=None):
+    """PDF clínico de cada animal pedido ({ID: bytes}); solo se renderizan, en paralelo, los que no están en caché."""
+    historias = historias_clinicas(version_hist, version_animales, df, df_hist)
+    hoy = str(date.today())
+    claves = {id_animal: (id_animal, historias[id_animal][2], hoy) for id_animal in ids if id_animal in historias}
+
+    estado = estado_pdfs()
+    with estado["lock"]:
+        faltan = [(clave, historias[id_animal][0], historias[id_animal][1], hoy)
+                  for id_animal, clave in claves.items() if clave not in estado["pdfs"]]
+    nuevos = reportes_pdf.generar_pdfs(faltan, al_avanzar)
+
+    with estado["lock"]:
+        estado["pdfs"].update(nuevos)
+        # El resultado se arma antes de recortar la caché: un lote mayor que ella desalojaría sus propios PDFs
+        pdfs = {id_animal: estado["pdfs"][clave] for id_animal, clave in claves.items()}
+        # Se descartan los más antiguos (el dict conserva el orden de inserción)
+        for clave in list(estado["pdfs"])[:max(0, len(estado["pdfs"]) - MAX_PDFS_EN_CACHE)]:
+            del estado["pdfs"][clave]
+    return pdfs
+
+def nombre_pdf_clinico(ficha):
+    return f"Historial_{ficha['Nombre']}_{ficha['ID']}.pdf".replace("/", "-").replace(" ", "_")
 
 # --- GESTIÓN DE ESTADO (NAVEGACIÓN) ---
 if 'nav_gestion' not in st.session_state: st.session_state.nav_gestion = 'lista' 
@@ -490,7 +2721,37 @@ def main():
     
     if sh:
         hoja_animales = sh.get_worksheet(0)
-        df, df_hist, df_cuentas = cargar_datos()
+        versiones = versiones_datos()
+        df, df_hist, df_cuentas = cargar_datos(versiones)
+        ver_hist = versiones["Historial"]
+        ver_anim = versiones["Animales"]
+        ver_cuentas = versiones["Cuentas"]
+
+        # Migración automática: eventos antiguos sin ID Evento (necesario para anularlos).
+        # Una sola sesión del proceso la corre; las demás siguen trabajando mientras tanto.
+        migracion = estado_migracion_ids()
+        if not migracion["hecha"]:
+            filas_sin_id = filas_sin_id_evento(df_hist)
+            if not len(filas_sin_id):
+                migracion["hecha"] = True
+            elif migracion["lock"].acquire(blocking=False):
+                asignados = 0
+                try:
+                    desde = int(filas_sin_id.min())
+                    barra = st.progress(0.0, text=f"Asignando ID a {len(filas_sin_id)} eventos antiguos...")
+                    avance = lambda fila, total: barra.progress(min(1.0, (fila - desde + 1) / max(1, total - desde + 1)), text=f"Asignando IDs... fila {fila}")
+                    asignados = reparar_ids_historial(sh, desde, avance)
+                except Exception as e:
+                    st.warning(f"⚠️ La asignación de IDs se interrumpió ({e}). Se reanudará en la próxima carga.")
+                else:
+                    barra.empty()
+                    migracion["hecha"] = True
+                finally:
+                    migracion["lock"].release()
+                if asignados and migracion["hecha"]:
+                    st.rerun()
+            else:
+                st.info("⏳ Otra sesión está asignando IDs a los eventos antiguos; algunos podrían no poder anularse todavía.")
         
         if not df.empty:
             df_activos = df[df["Estado"] != "VENDIDO"]
@@ -501,9 +2762,19 @@ def main():
             lista_ids_activos = []
             lista_ids_todos = []
 
+        # Ciclo de vida: en la primera carga del día se aplican los cambios de categoría y estado pendientes
+        try:
+            aplicadas = ciclo_vida_diario(sh, hoja_animales, ver_hist, ver_anim, df, df_hist)
+        except Exception as e:
+            st.warning(f"⚠️ No se pudieron aplicar los cambios de ciclo de vida del día ({e}).")
+        else:
+            if aplicadas:
+                st.toast(f"🔄 {aplicadas} cambios de categoría o estado aplicados")
+                st.rerun()
+
         # --- PESTAÑAS (TABS) ---
-        tab_dash, tab_reg, tab_gest, tab_acc, tab_finanzas, tab_alertas, tab_reportes = st.tabs([
-            "📊 DASHBOARD", "📝 REGISTRO", "📱 GESTIÓN", "⚡ RÁPIDO", "🏦 FINANZAS", "🔔 ALERTAS", "📑 REPORTES"
+        tab_dash, tab_reg, tab_gest, tab_acc, tab_finanzas, tab_hato, tab_alertas, tab_reportes = st.tabs([
+            "📊 DASHBOARD", "📝 REGISTRO", "📱 GESTIÓN", "⚡ RÁPIDO", "🏦 FINANZAS", "📈 HATO", "🔔 ALERTAS", "📑 REPORTES"
         ])
 
         # ==========================================
@@ -552,28 +2823,17 @@ def main():
                 try: peso_total = df_activos["Peso"].astype(float).sum()
                 except: peso_total = 0.0
 
-                ganancias_diarias = []
-                for _, row in df_activos.iterrows():
-                    try:
-                        peso_actual = float(row["Peso"]) if pd.notnull(row["Peso"]) and str(row["Peso"]).strip() != "" else 0.0
-                        peso_nac = 35.0 
-                        if "PesoNac" in df_activos.columns and pd.notnull(row["PesoNac"]) and str(row["PesoNac"]).strip() != "":
-                            peso_nac = float(row["PesoNac"])
-                        fecha_nac = pd.to_datetime(row["Nacimiento"], errors='coerce')
-                        if pd.notnull(fecha_nac):
-                            dias_vida = (pd.Timestamp(date.today()) - fecha_nac).days
-                            if dias_vida > 0 and peso_actual > peso_nac:
-                                gmd = ((peso_actual - peso_nac) / dias_vida) * 1000 
-                                ganancias_diarias.append(gmd)
-                    except: pass
-                
-                ganancia_promedio_g = sum(ganancias_diarias) / len(ganancias_diarias) if ganancias_diarias else 0.0
-                leche_total = 0.0
-                if not df_hist.empty and "Tipo Evento" in df_hist.columns:
-                    df_leche = df_hist[df_hist["Tipo Evento"] == "PRODUCCION_LECHE"]
-                    if not df_leche.empty:
-                        try: leche_total = df_leche["Detalle 1"].astype(float).sum()
-                        except: pass
+                pesos = analitica_peso(ver_hist, ver_anim, df, df_hist)["por_animal"]
+                pesos_activos = pesos[pesos["ID Animal"].isin(df_activos["ID"])]
+                ganancia_promedio_g = pesos_activos["GMD"].mean() * 1000 if pesos_activos["GMD"].notna().any() else 0.0
+                lactancia = analitica_leche(ver_hist, df_hist)
+                serie_hato = lactancia["hato"]
+                leche_total = serie_hato["Litros"].sum()
+                mes_actual = pd.Timestamp(date.today()).to_period("M")
+                litros_mes = serie_hato.groupby(serie_hato["Fecha_DT"].dt.to_period("M"))["Litros"].sum()
+                leche_mes, leche_mes_pasado = litros_mes.get(mes_actual, 0.0), litros_mes.get(mes_actual - 1, 0.0)
+                variacion_leche = ((leche_mes - leche_mes_pasado) / leche_mes_pasado * 100) if leche_mes_pasado else 0.0
+                color_variacion = "#2e7d32" if variacion_leche >= 0 else "#d32f2f"
 
                 vacas = len(df_activos[df_activos["Tipo"] == "Vaca"])
 
@@ -596,13 +2856,58 @@ def main():
                     <div class="metric-card"><div class="metric-icon" style="color: #ab47bc;">♀️</div><div class="metric-info"><div class="metric-title">Hembras</div><div class="metric-value">{hembras}</div></div></div>
                     <div class="metric-card"><div class="metric-icon">🥩</div><div class="metric-info"><div class="metric-title" style="text-transform: none;">Promedio de ganancia de peso</div><div class="metric-value">{ganancia_promedio_g:.1f} g</div></div></div>
                     <div class="metric-card"><div class="metric-icon">🥩</div><div class="metric-info"><div class="metric-title" style="text-transform: none;">Total de carne</div><div class="metric-value">{peso_total:.1f} kg</div></div></div>
-                    <div class="metric-card"><div class="metric-icon">🥛</div><div class="metric-info"><div class="metric-title" style="text-transform: none;">Producción total de leche</div><div class="metric-value">{leche_total:.1f} L</div><div style="font-size: 10px; color: #d32f2f;">-100.0% Mes pas...</div></div></div>
+                    <div class="metric-card"><div class="metric-icon">🥛</div><div class="metric-info"><div class="metric-title" style="text-transform: none;">Producción total de leche</div><div class="metric-value">{leche_total:.1f} L</div><div style="font-size: 10px; color: {color_variacion};">{variacion_leche:+.1f}% Mes pas...</div></div></div>
                     <div class="metric-card"><div class="metric-icon">🐄</div><div class="metric-info"><div class="metric-title" style="text-transform: none;">Animales productivos</div><div class="metric-value">{vacas}</div></div></div>
                 </div>
                 <div style="text-align: center; color: #888; font-size: 12px; margin-top: 20px; padding-bottom: 20px;">
                     La información de este panel se actualiza de forma automática en cada registro.
                 </div>
                 """, unsafe_allow_html=True)
+
+                if not serie_hato.empty:
+                    st.markdown('<div class="dash-card"><h4 style="margin-top:0;">Producción de leche del hato</h4>', unsafe_allow_html=True)
+                    base_hato = alt.Chart(serie_hato).encode(x=alt.X("Fecha_DT:T", title="Fecha"))
+                    barras = base_hato.mark_bar(opacity=0.4, color="#4CAF50").encode(y=alt.Y("Litros:Q", title="Litros / día"), tooltip=["Fecha_DT:T", "Litros"])
+                    tendencia = base_hato.mark_line(color="#1976d2").encode(y="Prom 7d:Q")
+                    st.altair_chart((barras + tendencia).properties(height=250), use_container_width=True)
+                    if not lactancia["curva"].empty:
+                        curva = alt.Chart(lactancia["curva"]).mark_line(point=True, color="#9c27b0").encode(
+                            x=alt.X("Semana:Q", title="Semana de lactancia"), y=alt.Y("Litros:Q", title="Litros promedio / día")
+                        ).properties(height=200, title="Curva de lactancia del hato")
+                        st.altair_chart(curva, use_container_width=True)
+                    st.markdown('</div>', unsafe_allow_html=True)
+
+                st.markdown('<div class="dash-card"><h4 style="margin-top:0;">Ganancia de peso del hato</h4>', unsafe_allow_html=True)
+                con_pesaje = pesos_activos[pesos_activos["Último Peso"].notna()]
+                peso_ficha = pd.to_numeric(con_pesaje["Peso Ficha"], errors="coerce")
+                desfasados = con_pesaje[(peso_ficha - con_pesaje["Último Peso"]).abs().fillna(1) > 0.01]
+                if not desfasados.empty:
+                    st.warning(f"⚠️ {len(desfasados)} animales tienen en su ficha un peso distinto a su último pesaje.")
+                    if st.button("⚖️ Sincronizar pesos con el último pesaje"):
+                        with st.spinner("Actualizando pesos..."):
+                            sincronizados = sincronizar_pesos(hoja_animales, dict(zip(desfasados["ID Animal"], desfasados["Último Peso"])))
+                        st.success(f"Se actualizaron {sincronizados} fichas.")
+                        time.sleep(1)
+                        st.rerun()
+
+                if pesos_activos["GMD"].notna().any():
+                    por_lote = distribucion_peso(pesos_activos, "Lote")
+                    if "Lote" in por_lote.columns:
+                        barras_lote = alt.Chart(por_lote).mark_bar(color="#388e3c").encode(
+                            x=alt.X("Lote:N"), y=alt.Y("GMD Promedio:Q", title="GMD promedio (kg/día)"),
+                            tooltip=["Lote", "Animales", alt.Tooltip("GMD Promedio:Q", format=".3f"), alt.Tooltip("Peso Promedio:Q", format=".1f")]
+                        ).properties(height=220)
+                        st.altair_chart(barras_lote, use_container_width=True)
+                    st.dataframe(pd.concat([distribucion_peso(pesos_activos).rename(columns={"Hato": "Lote"}), por_lote]), hide_index=True, use_container_width=True)
+
+                    peso_objetivo = st.number_input("Peso objetivo (kg)", min_value=1.0, value=450.0, step=10.0)
+                    proyeccion = pesos_activos.assign(**{"Días a objetivo": dias_a_peso_objetivo(pesos_activos, peso_objetivo)})
+                    proyeccion["Fecha estimada"] = pd.Timestamp(date.today()) + pd.to_timedelta(proyeccion["Días a objetivo"], unit="D")
+                    columnas_proy = [c for c in ["ID Animal", "Nombre", "Lote", "Último Peso", "GMD", "Días a objetivo", "Fecha estimada"] if c in proyeccion.columns]
+                    st.dataframe(proyeccion[columnas_proy].sort_values("Días a objetivo"), hide_index=True, use_container_width=True)
+                else:
+                    st.caption("Registra al menos dos pesajes por animal para calcular la ganancia diaria.")
+                st.markdown('</div>', unsafe_allow_html=True)
             else:
                 st.info("👋 Registra animales para ver el tablero de la finca.")
 
@@ -680,7 +2985,7 @@ def main():
                     
                     col_bas1, col_bas2 = st.columns(2)
                     with col_bas1: prop_full = st.selectbox("Propietario", ["Principal", "Socio", "Externo"])
-                    with col_bas2: lote_full = st.selectbox("Lote", ["General", "Lote 1", "Lote 2", "Enfermería"])
+                    with col_bas2: lote_full = st.selectbox("Lote", nombres_lotes(df, catalogo_lotes(ver_hist, df_hist)))
                     
                     raza_full = st.selectbox("Raza *", LISTA_RAZAS_GLOBAL, index=None, placeholder="🔍 Escribe para buscar la raza...")
                     
@@ -702,18 +3007,21 @@ def main():
 
                     st.markdown('<div class="seccion-titulo">Origen</div>', unsafe_allow_html=True)
                     
+                    # Los progenitores se guardan por ID e incluyen animales vendidos o muertos
                     lista_padres = ["Desconocido"]
                     lista_madres = ["Desconocida"]
+                    etiquetas_origen = {}
                     
-                    if not df_activos.empty:
-                        machos = df_activos[(df_activos['Sexo'] == 'Macho') | (df_activos['Tipo'] == 'Toro')]
-                        if not machos.empty: lista_padres += machos['Nombre'].tolist()
-                        hembras = df_activos[(df_activos['Sexo'] == 'Hembra') | (df_activos['Tipo'] == 'Vaca') | (df_activos['Tipo'] == 'Novilla')]
-                        if not hembras.empty: lista_madres += hembras['Nombre'].tolist()
+                    if not df.empty:
+                        etiquetas_origen = dict(zip(df['ID'].astype(str), df['Nombre'].astype(str) + " (" + df['ID'].astype(str) + ")"))
+                        machos = df[(df['Sexo'] == 'Macho') | (df['Tipo'] == 'Toro')]
+                        if not machos.empty: lista_padres += machos['ID'].astype(str).tolist()
+                        hembras = df[(df['Sexo'] == 'Hembra') | (df['Tipo'] == 'Vaca') | (df['Tipo'] == 'Novilla')]
+                        if not hembras.empty: lista_madres += hembras['ID'].astype(str).tolist()
 
                     col_orig1, col_orig2 = st.columns(2)
-                    with col_orig1: padre_full = st.selectbox("Padre", lista_padres)
-                    with col_orig2: madre_full = st.selectbox("Madre", lista_madres)
+                    with col_orig1: padre_full = st.selectbox("Padre", lista_padres, format_func=lambda x: etiquetas_origen.get(x, x))
+                    with col_orig2: madre_full = st.selectbox("Madre", lista_madres, format_func=lambda x: etiquetas_origen.get(x, x))
 
                     st.markdown('<div class="seccion-titulo">Otros</div>', unsafe_allow_html=True)
                     notas_full = st.text_area("Notas y observaciones")
@@ -736,6 +3044,64 @@ def main():
                             ]
                             guardar_animal(hoja_animales, datos_extendidos)
 
+            # --- IMPORTACIÓN MASIVA ---
+            st.markdown("---")
+            with st.expander("📥 Importación masiva (CSV / Excel)"):
+                tipo_imp = st.radio("¿Qué vas a importar?", ["Animales"] + list(IMPORTACIONES_EVENTOS), horizontal=True, key="tipo_importacion")
+                if tipo_imp == "Animales":
+                    st.caption(f"Columnas: {', '.join(COLUMNAS_ANIMAL)}. Obligatorias: ID, Raza y Sexo.")
+                else:
+                    st.caption(f"Columnas: Fecha, ID Animal (o Arete), {IMPORTACIONES_EVENTOS[tipo_imp][1]}, Notas (opcional)"
+                               + (f", Periodo (opcional: {', '.join(PERIODOS_ORDENO)})." if tipo_imp == "Producción de leche" else "."))
+                archivo_imp = st.file_uploader("Archivo", type=["csv", "xlsx"], key=f"archivo_importacion_{tipo_imp}")
+
+                if archivo_imp:
+                    try:
+                        tabla_imp = leer_archivo_importacion(archivo_imp)
+                    except Exception as e:
+                        tabla_imp = None
+                        st.error(f"No se pudo leer el archivo: {e}")
+
+                    if tabla_imp is not None and not tabla_imp.empty:
+                        if tipo_imp == "Animales":
+                            validada = validar_importacion_animales(tabla_imp, df)
+                        else:
+                            validada = validar_importacion_eventos(tabla_imp, tipo_imp, df, df_hist)
+                        conteo = validada["Resultado"].value_counts()
+                        c_i1, c_i2, c_i3 = st.columns(3)
+                        c_i1.metric("Nuevos", int(conteo.get("Nuevo", 0)))
+                        c_i2.metric("Se omiten", int(conteo.drop(["Nuevo", "Error"], errors="ignore").sum()))
+                        c_i3.metric("Con error", int(conteo.get("Error", 0)))
+
+                        ver_resultado = st.multiselect("Mostrar", list(conteo.index), default=list(conteo.index), key="filtro_importacion")
+                        st.dataframe(validada[validada["Resultado"].isin(ver_resultado)], hide_index=True, use_container_width=True,
+                                     column_order=["Resultado", "Errores"] + (["Cambios"] if "Cambios" in validada.columns else []) +
+                                                  [c for c in validada.columns if c not in ("Resultado", "Errores", "Cambios")])
+                        if conteo.get("Error", 0):
+                            st.warning("Las filas con error no se importan. Corrige el archivo y vuelve a cargarlo si las necesitas.")
+
+                        filas_nuevas = filas_importacion(validada, tipo_imp)
+                        if filas_nuevas and st.button(f"💾 Importar {len(filas_nuevas)} registros", type="primary", key="btn_importar"):
+                            barra_imp = st.progress(0.0, text="Importando...")
+                            avance_imp = {"filas": 0}
+                            def al_avanzar_imp(hechas, total):
+                                avance_imp["filas"] = hechas
+                                barra_imp.progress(hechas / total, text=f"Importando... {hechas}/{total}")
+                            try:
+                                if tipo_imp == "Animales":
+                                    agregar_filas_en_bloques(hoja_animales, filas_nuevas, "Animales", al_avanzar_imp)
+                                else:
+                                    agregar_filas_en_bloques(sh.worksheet("Historial"), filas_nuevas, "Historial", al_avanzar_imp)
+                                    if tipo_imp == "Pesajes":
+                                        sincronizar_pesos(hoja_animales, pesos_a_sincronizar(validada, df_hist))
+                            except Exception as e:
+                                st.error(f"La importación se interrumpió tras {avance_imp['filas']} filas ({e}). "
+                                         "Vuelve a cargar el archivo: lo ya importado aparecerá como omitido.")
+                            else:
+                                st.success(f"✅ {len(filas_nuevas)} registros importados.")
+                                time.sleep(1)
+                                st.rerun()
+
         if 'sub_accion_sanidad_rapida' not in st.session_state:
             st.session_state.sub_accion_sanidad_rapida = None
 
@@ -865,90 +3231,63 @@ def main():
                             """, unsafe_allow_html=True)
                     else:
                         st.write("")
-                        promedio_leche = 0.0
-                        if not hist_leche.empty:
-                            try: promedio_leche = hist_leche["Detalle 1"].astype(float).mean()
-                            except: pass
+                        lactancia = analitica_leche(ver_hist, df_hist)
+                        resumen_vaca = lactancia["por_vaca"][lactancia["por_vaca"]["ID Animal"] == str(animal_id)]
+                        serie_vaca = lactancia["diario"][lactancia["diario"]["ID Animal"] == str(animal_id)]
 
                         st.markdown("<h3>Producción de leche</h3>", unsafe_allow_html=True)
-                        st.caption(f"Promedio diario: {promedio_leche:.1f} L")
-                        
-                        st.markdown("""
-                        <div style="background-color: #4CAF50; color: white; padding: 10px; border-radius: 10px 10px 0 0; display: flex; justify-content: space-between; font-weight: bold; font-size: 14px;">
-                            <div style="width:33%">Fecha</div>
-                            <div style="width:33%">Concentr...</div>
-                            <div style="width:33%">Total leche</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
+                        if not resumen_vaca.empty:
+                            r_vaca = resumen_vaca.iloc[0]
+                            fmt = lambda v, dec=1: "--" if pd.isna(v) else f"{v:,.{dec}f}"
+                            c_l1, c_l2, c_l3, c_l4, c_l5 = st.columns(5)
+                            c_l1.metric("Días en leche", fmt(r_vaca["DEL"], 0))
+                            c_l2.metric("Prom. 7 días", f"{fmt(r_vaca['Prom 7d'])} L")
+                            c_l3.metric("Prom. 30 días", f"{fmt(r_vaca['Prom 30d'])} L")
+                            c_l4.metric("Pico", f"{fmt(r_vaca['Pico'])} L", help=f"Día {fmt(r_vaca['DEL Pico'], 0)} de lactancia")
+                            c_l5.metric("Proyección 305 d", f"{fmt(r_vaca['Proyección 305d'], 0)} L")
+
+                            serie_larga = serie_vaca.melt(id_vars="Fecha_DT", value_vars=["Litros", "Prom 7d", "Prom 30d"], var_name="Serie", value_name="L")
+                            linea = alt.Chart(serie_larga).mark_line(point=False).encode(
+                                x=alt.X("Fecha_DT:T", title="Fecha"),
+                                y=alt.Y("L:Q", title="Litros / día"),
+                                color=alt.Color("Serie:N"),
+                                tooltip=["Fecha_DT:T", "Serie", alt.Tooltip("L:Q", format=".1f")]
+                            ).properties(height=250)
+                            st.altair_chart(linea, use_container_width=True)
+
                         if not hist_leche.empty:
-                            for idx, row in hist_leche.iloc[::-1].iterrows():
-                                concentrado_txt = "--"
-                                try:
-                                    det2 = str(row["Detalle 2"])
-                                    if "Conc:" in det2: concentrado_txt = det2.split("Conc:")[1].strip()
-                                except: pass
-                                
-                                st.markdown(f"""
-                                <div style="background-color: white; padding: 10px; border-bottom: 1px solid #eee; border-left: 1px solid #eee; border-right: 1px solid #eee; display: flex; justify-content: space-between; font-size: 14px;">
-                                    <div style="width:33%">{row['Fecha']}</div>
-                                    <div style="width:33%">{concentrado_txt}</div>
-                                    <div style="width:33%">{row['Detalle 1']} L</div>
-                                </div>
-                                """, unsafe_allow_html=True)
+                            tabla_leche = pd.DataFrame({
+                                "Fecha": hist_leche["Fecha"],
+                                "Concentrado": hist_leche["Detalle 2"].astype(str).str.extract(r"Conc:\s*(.*)")[0].fillna("--"),
+                                "Total leche (L)": pd.to_numeric(hist_leche["Detalle 1"], errors="coerce"),
+                            }).iloc[::-1]
+                            st.dataframe(tabla_leche, hide_index=True, use_container_width=True)
                         else: st.info("Sin registros de leche.")
 
                         st.write("")
                         peso_actual = datos['Peso']
                         st.markdown(f"<h3>Evolución de peso: <span style='color:#4CAF50'>Actual {peso_actual} kg</span></h3>", unsafe_allow_html=True)
                         
-                        ganancia_diaria_general = "--"
-                        if len(hist_peso) > 1:
-                            try:
-                                hist_peso_ordenado = hist_peso.sort_values(by="Fecha", ascending=True)
-                                p_inicial = float(hist_peso_ordenado.iloc[0]["Detalle 1"])
-                                p_final = float(hist_peso_ordenado.iloc[-1]["Detalle 1"])
-                                f_inicial = pd.to_datetime(hist_peso_ordenado.iloc[0]["Fecha"])
-                                f_final = pd.to_datetime(hist_peso_ordenado.iloc[-1]["Fecha"])
-                                dias = (f_final - f_inicial).days
-                                if dias > 0:
-                                    ganancia_diaria_general = f"{((p_final - p_inicial) / dias):.2f}"
-                            except: pass
+                        pesos_animal = analitica_peso(ver_hist, ver_anim, df, df_hist)
+                        gmd_animal = pesos_animal["por_animal"].loc[pesos_animal["por_animal"]["ID Animal"] == str(animal_id), "GMD"]
+                        ganancia_diaria_general = f"{gmd_animal.iloc[0]:.2f}" if not gmd_animal.empty and pd.notna(gmd_animal.iloc[0]) else "--"
 
-                        st.caption(f"Ganancia diaria: {ganancia_diaria_general} kg")
-
-                        st.markdown("""
-                        <div style="background-color: #4CAF50; color: white; padding: 10px; border-radius: 10px 10px 0 0; display: flex; justify-content: space-between; font-weight: bold; font-size: 14px;">
-                            <div style="width:33%">Fecha</div>
-                            <div style="width:33%">Peso</div>
-                            <div style="width:33%">Ganancia</div>
-                        </div>
-                        """, unsafe_allow_html=True)
+                        st.caption(f"Ganancia diaria (regresión sobre todos los pesajes): {ganancia_diaria_general} kg")
 
                         if not hist_peso.empty:
-                            hist_peso = hist_peso.sort_values(by="Fecha", ascending=True).reset_index(drop=True)
-                            ganancias = ["--"]
-                            for i in range(1, len(hist_peso)):
-                                try:
-                                    peso_act = float(hist_peso.iloc[i]["Detalle 1"])
-                                    peso_ant = float(hist_peso.iloc[i-1]["Detalle 1"])
-                                    diff = peso_act - peso_ant
-                                    ganancia_str = f"+{diff:.1f} kg" if diff > 0 else f"{diff:.1f} kg"
-                                    ganancias.append(ganancia_str)
-                                except:
-                                    ganancias.append("--")
-                            
-                            hist_peso["Ganancia"] = ganancias
-                            hist_peso_rev = hist_peso.iloc[::-1]
-
-                            for i, row in hist_peso_rev.iterrows():
-                                st.markdown(f"""
-                                <div style="background-color: white; padding: 10px; border-bottom: 1px solid #eee; border-left: 1px solid #eee; border-right: 1px solid #eee; display: flex; justify-content: space-between; font-size: 14px;">
-                                    <div style="width:33%">{row['Fecha']}</div>
-                                    <div style="width:33%">{row['Detalle 1']} kg</div>
-                                    <div style="width:33%">{row['Ganancia']}</div>
-                                </div>
-                                """, unsafe_allow_html=True)
+                            serie_peso = pesos_animal["pesajes"][pesos_animal["pesajes"]["ID Animal"] == str(animal_id)]
+                            if len(serie_peso) > 1:
+                                grafico_peso = alt.Chart(serie_peso).mark_line(point=True, color="#4CAF50").encode(
+                                    x=alt.X("Fecha_DT:T", title="Fecha"), y=alt.Y("Peso:Q", title="Peso (kg)", scale=alt.Scale(zero=False)),
+                                    tooltip=["Fecha", "Peso", "Ganancia"]
+                                ).properties(height=220)
+                                st.altair_chart(grafico_peso, use_container_width=True)
+                            tabla_peso = pd.DataFrame({
+                                "Fecha": serie_peso["Fecha"],
+                                "Peso (kg)": serie_peso["Peso"],
+                                "Ganancia (kg)": serie_peso["Ganancia"].map(lambda d: "--" if pd.isna(d) else f"{d:+.1f}"),
+                            }).iloc[::-1]
+                            st.dataframe(tabla_peso, hide_index=True, use_container_width=True)
                         else: st.info("Sin registros de peso.")
 
                     st.markdown("<br>", unsafe_allow_html=True)
@@ -988,6 +3327,8 @@ def main():
 
                 elif st.session_state.sub_accion_produccion == 'add_leche':
                     st.subheader("Registrar Leche")
+                    retiro_leche = liberacion(indice_retiros(ver_hist, df_hist), animal_id, "Leche")
+                    if retiro_leche: st.warning(f"⛔ Vaca en retiro de medicamentos hasta el {retiro_leche:%Y-%m-%d}: la leche se registrará como descartada.")
                     with st.form("form_leche_app"):
                         c_fl1, c_fl2 = st.columns(2)
                         with c_fl1: fl_fecha = st.date_input("Fecha *", date.today())
@@ -1013,6 +3354,8 @@ def main():
                                 if fl_litros >= 0:
                                     det_2 = f"{fl_periodo} | Conc: {fl_conc}kg"
                                     notas_l = f"Hato: {fl_hato} | Potrero: {fl_potrero}"
+                                    if liberacion(indice_retiros(ver_hist, df_hist), animal_id, "Leche", fl_fecha):
+                                        det_2, notas_l = f"{det_2} | {MARCA_DESCARTE}", "Descartada (retiro) | " + notas_l
                                     datos_leche = [str(fl_fecha), "PRODUCCION_LECHE", animal_id, str(fl_litros), det_2, notas_l]
                                     guardar_evento(sh, datos_leche, "Registro Leche")
                                     st.session_state.sub_accion_produccion = None
@@ -1100,7 +3443,11 @@ def main():
                         with c_vt3: ft_tipo = st.selectbox("Tipo de Trat... *", TIPOS_TRATAMIENTO)
                         with c_vt4: ft_enfermedad = st.selectbox("Enfermedad", LISTA_ENFERMEDADES)
                         ft_diagnostico = st.text_input("Diagnóstico")
-                        ft_medicamento = st.text_input("Medicamento *")
+                        nombres_med = catalogo_medicamentos(ver_hist, df_hist)["Medicamento"].tolist()
+                        c_vt5, c_vt6 = st.columns(2)
+                        with c_vt5: ft_med_cat = st.selectbox("Medicamento *", nombres_med + ["Otro"])
+                        with c_vt6: ft_med_otro = st.text_input("Otro medicamento (sin retiro en catálogo)")
+                        ft_medicamento = ft_med_otro.strip() if ft_med_cat == "Otro" else ft_med_cat
                         ft_notas = st.text_area("Notas y observaciones")
                         
                         col_cancel_t, col_save_t = st.columns(2)
@@ -1122,7 +3469,7 @@ def main():
                     st.subheader("Agregar Vacuna")
                     with st.form("form_vacuna_vet"):
                         fv_fecha = st.date_input("Fecha *", date.today())
-                        fv_vacuna = st.selectbox("Vacuna *", LISTA_VACUNAS)
+                        fv_vacuna = st.selectbox("Vacuna *", nombres_vacunas(protocolos_vacunacion(ver_hist, df_hist)))
                         fv_notas = st.text_area("Notas y observaciones")
                         
                         col_cancel_v, col_save_v = st.columns(2)
@@ -1203,25 +3550,30 @@ def main():
                     df_hist["ID Animal"] = df_hist["ID Animal"].astype(str)
                     df_vaca_hist = df_hist[df_hist["ID Animal"] == str(animal_id)]
                 
+                kpis_vaca = kpis_reproductivos(ver_hist, ver_anim, df, df_hist)["por_vaca"]
+                kpis_vaca = kpis_vaca[kpis_vaca["ID Animal"] == str(animal_id)]
                 ultimo_parto_str = "--"
                 dias_abiertos = "--"
-
-                if not df_vaca_hist.empty:
-                    partos = df_vaca_hist[df_vaca_hist["Tipo Evento"] == "PARTO"]
-                    if not partos.empty:
-                        ultimo_parto_str = partos.iloc[-1]["Fecha"]
-                        try:
-                            f_parto = datetime.strptime(ultimo_parto_str, "%Y-%m-%d").date()
-                            if datos['Estado'] != "Preñada":
-                                dias_abiertos = (date.today() - f_parto).days
-                        except: pass
+                iep_str = "--"
+                servicios_ciclo = 0
+                parto_probable_str = "--"
+                if not kpis_vaca.empty:
+                    k_vaca = kpis_vaca.iloc[0]
+                    if pd.notna(k_vaca["Último Parto"]): ultimo_parto_str = k_vaca["Último Parto"].strftime("%Y-%m-%d")
+                    if pd.notna(k_vaca["Días Abiertos"]): dias_abiertos = int(k_vaca["Días Abiertos"])
+                    if pd.notna(k_vaca["IEP Promedio"]): iep_str = f"{k_vaca['IEP Promedio']:.0f} días"
+                    if pd.notna(k_vaca["Fecha Probable Parto"]): parto_probable_str = k_vaca["Fecha Probable Parto"].strftime("%Y-%m-%d")
+                    servicios_ciclo = int(k_vaca["Servicios Ciclo"])
 
                 st.markdown(f"""
                 <div class="repro-stats">
                     <h3>Estado reproductivo</h3>
                     <div class="stat-row"><span>Último parto</span><strong>{ultimo_parto_str}</strong></div>
                     <div class="stat-row"><span>Estado</span><strong>{datos['Estado']}</strong></div>
-                    <div class="stat-row" style="border:none;"><span>Días abiertos</span><strong>{dias_abiertos} día(s)</strong></div>
+                    <div class="stat-row"><span>Días abiertos</span><strong>{dias_abiertos} día(s)</strong></div>
+                    <div class="stat-row"><span>Intervalo entre partos</span><strong>{iep_str}</strong></div>
+                    <div class="stat-row"><span>Servicios en el ciclo actual</span><strong>{servicios_ciclo}</strong></div>
+                    <div class="stat-row" style="border:none;"><span>Parto probable</span><strong>{parto_probable_str}</strong></div>
                 </div>
                 """, unsafe_allow_html=True)
 
@@ -1297,13 +3649,20 @@ def main():
                     c_f1, c_f2 = st.columns(2)
                     with c_f1: ff_fecha = st.date_input("Fecha *", date.today())
                     with c_f2: tipo_seleccionado = st.selectbox("Tipo de Fecundación *", TIPOS_FECUNDACION, index=0)
+                    # Los toros se ofrecen en el orden del planificador de cruces para esta vaca
+                    ranking_vaca = planificar_cruces(ver_hist, ver_anim, OBJETIVOS_RAZA[0], df, df_hist)["ranking"]
+                    ranking_vaca = ranking_vaca[ranking_vaca["ID Vaca"] == str(animal_id)]
+                    orden_toros = {nombre: i for i, nombre in enumerate(ranking_vaca["Toro"])}
+                    if not ranking_vaca.empty:
+                        mejor = ranking_vaca.iloc[0]
+                        st.caption(f"💞 Sugerido: **{mejor['Toro']}** (puntaje {mejor['Puntaje']:.0f}, F cría {mejor['F Cría'] * 100:.1f} %)")
                     with st.form("form_fecundacion_dinamico"):
                         ff_padre_select = ""; ff_padre_manual = ""; ff_pajilla = ""; ff_madre_select = ""
                         if tipo_seleccionado == "Monta":
                             lista_toros = []
                             if not df_activos.empty:
                                 df_machos = df_activos[(df_activos['Sexo'] == 'Macho') | (df_activos['Tipo'] == 'Toro')]
-                                if not df_machos.empty: lista_toros = df_machos['Nombre'].tolist()
+                                if not df_machos.empty: lista_toros = sorted(df_machos['Nombre'].tolist(), key=lambda n: orden_toros.get(n, len(orden_toros)))
                             opciones_padre = lista_toros + ["Otro / Externo"]
                             ff_padre_select = st.selectbox("Padre (Toro)", opciones_padre)
                             if ff_padre_select == "Otro / Externo": ff_padre_manual = st.text_input("Nombre del Toro (si es externo)")
@@ -1311,7 +3670,7 @@ def main():
                             lista_toros = []
                             if not df_activos.empty:
                                 df_machos = df_activos[(df_activos['Sexo'] == 'Macho') | (df_activos['Tipo'] == 'Toro')]
-                                if not df_machos.empty: lista_toros = df_machos['Nombre'].tolist()
+                                if not df_machos.empty: lista_toros = sorted(df_machos['Nombre'].tolist(), key=lambda n: orden_toros.get(n, len(orden_toros)))
                             opciones_padre = lista_toros + ["Otro / Externo"]
                             ff_padre_select = st.selectbox("Padre (Toro)", opciones_padre)
                             if ff_padre_select == "Otro / Externo": ff_padre_manual = st.text_input("Nombre del Toro (si es externo)")
@@ -1320,7 +3679,7 @@ def main():
                             lista_toros = []
                             if not df_activos.empty:
                                 df_machos = df_activos[(df_activos['Sexo'] == 'Macho') | (df_activos['Tipo'] == 'Toro')]
-                                if not df_machos.empty: lista_toros = df_machos['Nombre'].tolist()
+                                if not df_machos.empty: lista_toros = sorted(df_machos['Nombre'].tolist(), key=lambda n: orden_toros.get(n, len(orden_toros)))
                             opciones_padre = lista_toros + ["Otro / Externo"]
                             ff_padre_select = st.selectbox("Padre (Toro)", opciones_padre)
                             if ff_padre_select == "Otro / Externo": ff_padre_manual = st.text_input("Nombre del Toro (si es externo)")
@@ -1340,7 +3699,7 @@ def main():
                                 detalle_info = f"Padre: {padre_final}"
                                 if tipo_seleccionado == "Inseminación artificial": detalle_info += f" | Pajilla: {ff_pajilla}"
                                 elif tipo_seleccionado == "Transferencia de embriones": detalle_info += f" | Donadora: {ff_madre_select}"
-                                datos_fec = [str(date.today()), "FECUNDACION", animal_id, tipo_seleccionado, detalle_info, ff_notas]
+                                datos_fec = [str(ff_fecha), "FECUNDACION", animal_id, tipo_seleccionado, detalle_info, ff_notas]
                                 guardar_evento(sh, datos_fec, "Fecundación")
                                 st.session_state.sub_accion_reproduccion = None
                                 st.rerun()
@@ -1359,7 +3718,7 @@ def main():
                                 datos_cheq = [str(fc_fecha), "CHEQUEO_REPRO", animal_id, fc_res, "", fc_notas]
                                 guardar_evento(sh, datos_cheq, "Chequeo")
                                 if fc_res == "Preñada":
-                                    cambiar_estado_animal(hoja_animales, animal_id, "Preñada")
+                                    registrar_transicion(sh, hoja_animales, datos, {"Estado": "Preñada"}, "Chequeo positivo", fc_fecha)
                                     st.success("¡Estado actualizado a PREÑADA!")
                                     time.sleep(1)
                                 st.session_state.sub_accion_reproduccion = None
@@ -1393,7 +3752,7 @@ def main():
                                         detalle_parto = f"Cría: {fp_nombre} ({fp_sexo})"
                                         datos_evento_parto = [str(fp_nac), "PARTO", animal_id, detalle_parto, f"ID Cría: {fp_id}", "Parto normal"]
                                         guardar_evento(sh, datos_evento_parto, "Parto")
-                                        cambiar_estado_animal(hoja_animales, animal_id, "Lactancia")
+                                        registrar_transicion(sh, hoja_animales, datos, {"Estado": "Lactancia", "Tipo": "Vaca" if datos["Tipo"] in ("Becerro", "Novilla") else datos["Tipo"]}, "Parto", fp_nac)
                                         st.success("¡Nacimiento registrado con éxito!")
                                         time.sleep(2)
                                         st.session_state.sub_accion_reproduccion = None
@@ -1420,7 +3779,7 @@ def main():
                             if st.form_submit_button("Registrar", type="primary"):
                                 datos_aborto = [str(fa_fecha), "ABORTO", animal_id, f"Feto: {fa_sexo}", "Pérdida gestacional", fa_notas]
                                 guardar_evento(sh, datos_aborto, "Aborto")
-                                cambiar_estado_animal(hoja_animales, animal_id, "Sano")
+                                registrar_transicion(sh, hoja_animales, datos, {"Estado": "Sano"}, "Aborto", fa_fecha)
                                 st.error("Aborto registrado. Estado: Vacía (Sano).")
                                 time.sleep(2)
                                 st.session_state.sub_accion_reproduccion = None
@@ -1445,6 +3804,9 @@ def main():
                     
                     padre_txt = datos.get("Padre", "--") if "Padre" in datos else "--"
                     madre_txt = datos.get("Madre", "--") if "Madre" in datos else "--"
+                    nombres_por_id = dict(zip(df['ID'].astype(str), df['Nombre'].astype(str)))
+                    if str(padre_txt) in nombres_por_id: padre_txt = f"{nombres_por_id[str(padre_txt)]} ({padre_txt})"
+                    if str(madre_txt) in nombres_por_id: madre_txt = f"{nombres_por_id[str(madre_txt)]} ({madre_txt})"
                     
                     c_padres1, c_padres2 = st.columns(2)
                     with c_padres1: st.text_input("Padre", value=padre_txt, disabled=True)
@@ -1467,6 +3829,9 @@ def main():
                                 with st.spinner("Subiendo foto..."):
                                     nuevo_link = subir_foto_imgbb(e_foto)
                             datos_upd = [animal_id, datos["Tipo"], e_nombre, e_arete, datos["Raza"], datos["Sexo"], str(e_peso), str(datos["Nacimiento"]), e_estado, nuevo_link]
+                            if e_estado != datos["Estado"]:
+                                # Queda registrado para que el ciclo de vida respete el cambio manual
+                                guardar_evento(sh, [str(date.today()), "CAMBIO_ESTADO", animal_id, f"De: {datos['Estado']}", f"A: {e_estado}", "Edición manual"], "Cambio de estado")
                             actualizar_animal_completo(hoja_animales, animal_id, datos_upd)
                     
                     st.write("")
@@ -1474,34 +3839,6 @@ def main():
                             eliminar_animal_db(hoja_animales, animal_id)
                             ir_a_lista()
                             st.rerun()
-                            # --- FUNCIÓN DE AUTO-REPARACIÓN (Definida aquí para fácil integración) ---
-        def reparar_ids_historial_local(sheet_conn):
-            try:
-                hoja = sheet_conn.worksheet("Historial")
-                registros = hoja.get_all_values()
-                if not registros: return 0
-                
-                header = registros[0]
-                if len(header) < 7:
-                    hoja.update_cell(1, 7, "ID Evento")
-                elif header[6].strip() == "":
-                    hoja.update_cell(1, 7, "ID Evento")
-                
-                lista_updates = []
-                for i, fila in enumerate(registros):
-                    if i == 0: continue # Saltar el encabezado
-                    # Si la fila no tiene 7 columnas, o la columna G está vacía
-                    if len(fila) < 7 or str(fila[6]).strip() == "":
-                        nuevo_id = str(uuid.uuid4())[:8]
-                        lista_updates.append({'range': f'G{i+1}', 'values': [[nuevo_id]]})
-                
-                if lista_updates:
-                    hoja.batch_update(lista_updates)
-                    cargar_datos.clear() # Limpiar caché para forzar recarga
-                return len(lista_updates)
-            except Exception as e:
-                st.error(f"Error reparando IDs: {e}")
-                return 0
 
         # ==========================================
         # 4. ACCIONES RÁPIDAS (INTEGRADO CON FINANZAS)
@@ -1583,6 +3920,7 @@ def main():
             # --- VENTA DE GANADO ---
             elif st.session_state.accion_activa == "venta":
                 st.subheader("🚛 Nueva Venta de Ganado")
+                retiros = indice_retiros(ver_hist, df_hist)
                 with st.form("form_venta_completa"):
                     c_f1, c_f2 = st.columns(2)
                     with c_f1: fecha_venta = st.date_input("Fecha Venta", date.today())
@@ -1602,7 +3940,8 @@ def main():
                             
                     st.markdown('<div class="seccion-titulo">💰 Datos Económicos y Cobro</div>', unsafe_allow_html=True)
                     pre_select = [st.session_state.animal_seleccionado] if st.session_state.animal_seleccionado and st.session_state.animal_seleccionado in lista_ids_activos else None
-                    ids_seleccionados = st.multiselect("Animales (Activos)*", lista_ids_activos, default=pre_select)
+                    etiqueta_venta = lambda x: f"{x} ⛔ retiro hasta {liberacion(retiros, x, 'Carne'):%Y-%m-%d}" if liberacion(retiros, x, "Carne") else x
+                    ids_seleccionados = st.multiselect("Animales (Activos)*", lista_ids_activos, default=pre_select, format_func=etiqueta_venta)
                     
                     c_m1, c_m2, c_m3 = st.columns([1,1,2])
                     with c_m1: moneda = st.selectbox("Moneda", ["USD", "VES", "COP"])
@@ -1616,13 +3955,18 @@ def main():
                     traslado = st.toggle("¿Trasladar a otro usuario de Control Ganadero?")
                     
                     if st.form_submit_button("✅ CONFIRMAR VENTA", type="primary"):
+                        en_retiro = [x for x in ids_seleccionados if liberacion(retiros, x, "Carne", fecha_venta)]
                         if not ids_seleccionados: st.error("Selecciona un animal")
+                        elif en_retiro: st.error(f"⛔ En periodo de retiro de medicamentos (carne): {', '.join(en_retiro)}. No se pueden vender todavía.")
                         else:
                             precio_str = f"{monto_manual} {moneda} ({tipo_precio})"
+                            id_venta = nuevo_id_evento()
                             for animal_id in ids_seleccionados:
                                 detalle = f"Comp: {comp_nombre} | Dest: {dest_ciudad}"
-                                notas_full = f"Ingresa a: {cuenta_destino} | Guia: {trans_guia} | {notas_venta}"
+                                notas_full = f"Ingresa a: {cuenta_destino} | Guia: {trans_guia} | Venta: {id_venta} | {notas_venta}"
                                 datos_venta = [str(fecha_venta), "VENTA", animal_id, precio_str, detalle, notas_full]
+                                if animal_id == ids_seleccionados[0]:
+                                    datos_venta.append(id_venta)
                                 guardar_evento(sh, datos_venta, "Venta")
                                 cambiar_estado_vendido(hoja_animales, animal_id)
                             
@@ -1636,27 +3980,121 @@ def main():
 
             elif st.session_state.accion_activa == "leche":
                 st.subheader("🥛 Registro Diario de Leche")
-                with st.form("form_leche"):
-                    f_fecha = st.date_input("Fecha", date.today())
-                    c_l1, c_l2 = st.columns(2)
-                    with c_l1: f_litros = st.number_input("Total Litros (L)", min_value=0.0)
-                    with c_l2: f_vacas = st.number_input("Vacas Ordeñadas", min_value=1, step=1)
-                    if st.form_submit_button("Guardar"):
-                        datos_leche = [str(f_fecha), "PRODUCCION_LECHE", "LOTE_GENERAL", str(f_litros), str(f_vacas), ""]
-                        guardar_evento(sh, datos_leche, "Registro de Leche")
-                        st.rerun()
+                modo_leche = st.radio("Modo", ["Total del hato", "Planilla por vaca"], horizontal=True, label_visibility="collapsed")
+                if modo_leche == "Planilla por vaca":
+                    c_l3, c_l4, c_l5 = st.columns(3)
+                    pl_fecha = c_l3.date_input("Fecha", date.today(), key="fecha_planilla_leche")
+                    pl_periodo = c_l4.selectbox("Periodo del día", PERIODOS_ORDENO, key="periodo_planilla_leche")
+                    vacas = df_activos[(df_activos["Sexo"] == "Hembra") & (df_activos["Tipo"] == "Vaca")] if not df_activos.empty else df_activos
+                    lotes_leche = sorted(vacas["Lote"].dropna().astype(str).unique()) if "Lote" in vacas.columns else []
+                    pl_lote = c_l5.selectbox("Lote", ["Todos"] + lotes_leche, key="lote_planilla_leche")
+                    if pl_lote != "Todos": vacas = vacas[vacas["Lote"].astype(str) == pl_lote]
+                    referencia_leche = analitica_leche(ver_hist, df_hist)["por_vaca"].set_index("ID Animal")["Prom 7d"]
+                    retiros = indice_retiros(ver_hist, df_hist)
+                    en_retiro = {x: f"Descartada (retiro hasta {liberacion(retiros, x, 'Leche', pl_fecha):%Y-%m-%d})"
+                                 for x in vacas["ID"].astype(str) if liberacion(retiros, x, "Leche", pl_fecha)} if not vacas.empty else {}
+                    if en_retiro: st.warning(f"⛔ {len(en_retiro)} vaca(s) en retiro de medicamentos: su leche queda marcada como descartada.")
+                    editor_planilla("Producción de leche", vacas, referencia_leche, pl_fecha, sh, hoja_animales, df, df_hist, pl_periodo, en_retiro, set(en_retiro))
+                else:
+                    with st.form("form_leche"):
+                        f_fecha = st.date_input("Fecha", date.today())
+                        c_l1, c_l2 = st.columns(2)
+                        with c_l1: f_litros = st.number_input("Total Litros (L)", min_value=0.0)
+                        with c_l2: f_vacas = st.number_input("Vacas Ordeñadas", min_value=1, step=1)
+                        if st.form_submit_button("Guardar"):
+                            datos_leche = [str(f_fecha), "PRODUCCION_LECHE", "LOTE_GENERAL", str(f_litros), str(f_vacas), ""]
+                            guardar_evento(sh, datos_leche, "Registro de Leche")
+                            st.rerun()
 
             elif st.session_state.accion_activa == "peso":
                 st.subheader("⚖️ Nuevo Pesaje")
-                with st.form("form_peso"):
-                    p_animal = st.selectbox("Animal", lista_ids_activos)
-                    c_p1, c_p2 = st.columns(2)
-                    with c_p1: p_fecha = st.date_input("Fecha", date.today())
-                    with c_p2: p_kilos = st.number_input("Peso (kg)", min_value=0.0)
-                    if st.form_submit_button("Registrar"):
-                        datos_peso = [str(p_fecha), "PESAJE", p_animal, str(p_kilos), "", "Control"]
-                        guardar_evento(sh, datos_peso, "Pesaje")
-                        st.rerun()
+                modo_pesaje = st.radio("Modo", ["Manual", "Planilla", "Báscula / RFID"], horizontal=True, label_visibility="collapsed")
+                if modo_pesaje == "Planilla":
+                    c_p3, c_p4 = st.columns(2)
+                    pl_fecha_peso = c_p3.date_input("Fecha", date.today(), key="fecha_planilla_peso")
+                    lotes_peso = sorted(df_activos["Lote"].dropna().astype(str).unique()) if not df_activos.empty and "Lote" in df_activos.columns else []
+                    pl_lote_peso = c_p4.selectbox("Lote", ["Todos"] + lotes_peso, key="lote_planilla_peso")
+                    animales_peso = df_activos if pl_lote_peso == "Todos" else df_activos[df_activos["Lote"].astype(str) == pl_lote_peso]
+                    referencia_peso = analitica_peso(ver_hist, ver_anim, df, df_hist)["por_animal"].set_index("ID Animal")["Último Peso"]
+                    editor_planilla("Pesajes", animales_peso, referencia_peso, pl_fecha_peso, sh, hoja_animales, df, df_hist)
+                elif modo_pesaje == "Báscula / RFID":
+                    est_bascula = estado_bascula()
+                    lector = est_bascula["lector"]
+                    c_b1, c_b2 = st.columns([3, 1])
+                    origen_bascula = c_b1.text_input("Indicador", value=lector.origen if lector else "tcp://localhost:4001",
+                                                     help="tcp://host:puerto o puerto serie (/dev/ttyUSB0, COM3)")
+                    with c_b2:
+                        st.write("")
+                        if lector and lector.is_alive():
+                            if st.button("⏹️ Detener", use_container_width=True):
+                                lector.detener()
+                                st.rerun()
+                        elif st.button("▶️ Conectar", type="primary", use_container_width=True):
+                            est_bascula["lector"] = bascula.LectorBascula(origen_bascula)
+                            est_bascula["lector"].start()
+                            st.rerun()
+                    if SIMULADOR_BASCULA and st.button("🧪 Simular báscula con animales activos"):
+                        if not df_activos.empty:
+                            chips = df_activos["Chip"].astype(str).str.strip() if "Chip" in df_activos.columns else pd.Series("", index=df_activos.index)
+                            aretes = df_activos["Arete"].astype(str).str.strip() if "Arete" in df_activos.columns else pd.Series("", index=df_activos.index)
+                            identificadores = chips.mask(chips == "", aretes).mask(lambda x: x == "", df_activos["ID"].astype(str))
+                            if lector: lector.detener()
+                            est_bascula["simulador"] = bascula.SimuladorBascula(identificadores.tolist(), intervalo=0.5)
+                            est_bascula["simulador"].start()
+                            est_bascula["lector"] = bascula.LectorBascula(est_bascula["simulador"].origen)
+                            est_bascula["lector"].start()
+                            st.rerun()
+                    lector = est_bascula["lector"]
+                    if lector:
+                        estado_txt = "🟢 Conectado" if lector.is_alive() and not lector.error else ("🔴 " + (lector.error or "Detenido"))
+                        st.caption(f"{estado_txt} · {lector.lecturas} lecturas recibidas")
+
+                    c_b3, c_b4 = st.columns(2)
+                    b_fecha = c_b3.date_input("Fecha de la sesión", date.today(), key="fecha_bascula")
+                    with c_b4:
+                        st.write("")
+                        st.button("🔄 Actualizar lecturas", use_container_width=True)
+                    pesadas = recoger_pesadas(est_bascula)
+                    if pesadas:
+                        resueltas = resolver_pesadas(pesadas, indice_identificadores(ver_anim, df), b_fecha)
+                        nombres = df.set_index("ID")["Nombre"] if not df.empty else pd.Series(dtype=str)
+                        resueltas["Nombre"] = resueltas["ID Animal"].map(nombres).fillna("")
+                        conteo = resueltas["Resultado"].value_counts()
+                        c_b5, c_b6, c_b7 = st.columns(3)
+                        c_b5.metric("Pesadas", len(resueltas))
+                        c_b6.metric("A guardar", int(conteo.get("Nuevo", 0)))
+                        c_b7.metric("Sin animal", int(conteo.get("No registrado", 0)))
+                        st.dataframe(resueltas[["Hora", "Identificador", "ID Animal", "Nombre", "Peso", "Muestras", "Resultado"]].iloc[::-1],
+                                     hide_index=True, use_container_width=True)
+                        c_b8, c_b9 = st.columns(2)
+                        if c_b8.button(f"💾 Guardar {int(conteo.get('Nuevo', 0))} pesajes", type="primary", use_container_width=True):
+                            guardados = guardar_eventos_sesion(sh, hoja_animales, resueltas, "Pesajes", df_hist)
+                            with est_bascula["lock"]:
+                                del est_bascula["pesadas"][:len(pesadas)]
+                            st.toast(f"✅ {guardados} pesajes guardados")
+                            st.rerun()
+                        if c_b9.button("🗑️ Descartar lecturas", use_container_width=True):
+                            with est_bascula["lock"]:
+                                del est_bascula["pesadas"][:len(pesadas)]
+                            st.rerun()
+                    else:
+                        st.info("Sin pesadas todavía. Pasa los animales por la báscula y actualiza.")
+
+                else:
+                    with st.form("form_peso"):
+                        p_animal = st.selectbox("Animal", lista_ids_activos)
+                        c_p1, c_p2 = st.columns(2)
+                        with c_p1: p_fecha = st.date_input("Fecha", date.today())
+                        with c_p2: p_kilos = st.number_input("Peso (kg)", min_value=0.0)
+                        if st.form_submit_button("Registrar"):
+                            datos_peso = [str(p_fecha), "PESAJE", p_animal, str(p_kilos), "", "Control"]
+                            guardar_evento(sh, datos_peso, "Pesaje")
+                            # Solo un pesaje igual o más reciente que el último actualiza el peso de la ficha
+                            previos = analitica_peso(ver_hist, ver_anim, df, df_hist)["por_animal"]
+                            ultimo_previo = previos.loc[previos["ID Animal"] == str(p_animal), "Último Pesaje"]
+                            if p_kilos > 0 and (ultimo_previo.empty or pd.isna(ultimo_previo.iloc[0]) or pd.Timestamp(p_fecha) >= ultimo_previo.iloc[0]):
+                                actualizar_peso_animal(hoja_animales, p_animal, p_kilos)
+                            st.rerun()
 
             elif st.session_state.accion_activa == "sanidad":
                 if st.session_state.sub_accion_sanidad_rapida is None:
@@ -1670,6 +4108,70 @@ def main():
                         if st.button("💉\nVacunación masiva", use_container_width=True):
                             st.session_state.sub_accion_sanidad_rapida = "vacunacion_masiva"
                             st.rerun()
+
+                    retiros = indice_retiros(ver_hist, df_hist)
+                    hoy_ts = pd.Timestamp(date.today())
+                    vigentes = pd.DataFrame({"Carne": pd.Series(retiros["Carne"], dtype="datetime64[ns]"), "Leche": pd.Series(retiros["Leche"], dtype="datetime64[ns]")})
+                    vigentes = vigentes[(vigentes["Carne"] > hoy_ts) | (vigentes["Leche"] > hoy_ts)]
+                    vigentes = vigentes[vigentes.index.isin(lista_ids_activos)].where(lambda t: t > hoy_ts)
+                    with st.expander(f"⛔ Animales en periodo de retiro ({len(vigentes)})", expanded=not vigentes.empty):
+                        if vigentes.empty: st.caption("Ningún animal activo está en retiro.")
+                        else:
+                            st.dataframe(vigentes.rename(columns={"Carne": "Carne libre desde", "Leche": "Leche libre desde"}).rename_axis("ID").reset_index(),
+                                         hide_index=True, use_container_width=True,
+                                         column_config={c: st.column_config.DateColumn(c, format="YYYY-MM-DD") for c in ["Carne libre desde", "Leche libre desde"]})
+                    with st.expander("💊 Catálogo de medicamentos y retiros"):
+                        st.caption("Valores de referencia: confirma siempre los días de retiro en la etiqueta del producto.")
+                        st.dataframe(catalogo_medicamentos(ver_hist, df_hist), hide_index=True, use_container_width=True)
+                        with st.form("form_catalogo_medicamento"):
+                            c_md1, c_md2, c_md3 = st.columns([2, 1, 1])
+                            md_nombre = c_md1.text_input("Medicamento o vacuna")
+                            md_carne = c_md2.number_input("Retiro carne (días)", min_value=0, step=1)
+                            md_leche = c_md3.number_input("Retiro leche (días)", min_value=0, step=1)
+                            if st.form_submit_button("Guardar en catálogo"):
+                                if md_nombre.strip():
+                                    datos_med = [str(date.today()), "MEDICAMENTO_CONFIG", "FINCA", f"Medicamento: {md_nombre.strip()}",
+                                                 f"Retiro carne: {md_carne} d | Retiro leche: {md_leche} d", ""]
+                                    guardar_evento(sh, datos_med, "Medicamento")
+                                    st.rerun()
+                                else: st.error("Indica el nombre.")
+                    calendario = calendario_vacunacion(ver_hist, ver_anim, str(date.today()), df, df_hist)
+                    por_estado = calendario.groupby(["Vacuna", "Estado"]).size().unstack(fill_value=0).reindex(columns=["Vencida", "Sin registro", "Próxima", "Al día"], fill_value=0)
+                    with st.expander(f"📅 Calendario de vacunación ({int(por_estado['Vencida'].sum())} dosis vencidas)"):
+                        if calendario.empty: st.caption("No hay animales activos con vacunas en su protocolo.")
+                        else:
+                            st.dataframe(por_estado.reset_index(), hide_index=True, use_container_width=True)
+                            cal_vacuna = st.selectbox("Ver vacuna", ["Todas"] + por_estado.index.tolist(), key="cal_vacuna")
+                            cal_dias = st.slider("Vencidas y por vencer en los próximos (días)", 0, 180, DIAS_AVISO_VACUNA, key="cal_dias")
+                            vista_cal = calendario[calendario["Días"] <= cal_dias]
+                            if cal_vacuna != "Todas": vista_cal = vista_cal[vista_cal["Vacuna"] == cal_vacuna]
+                            st.dataframe(vista_cal, hide_index=True, use_container_width=True,
+                                         column_config={c: st.column_config.DateColumn(c, format="YYYY-MM-DD") for c in ["Última Dosis", "Próxima Dosis"]})
+                            st.caption("*Sin registro*: el animal ya pasó la edad de la primera dosis y no tiene ninguna registrada. "
+                                       "Para aplicarlas usa *Vacunación masiva* con la opción *Pendientes según calendario*.")
+                    with st.expander("🧾 Protocolos de vacunación"):
+                        st.caption("Edades, refuerzo e intervalo en días. Intervalo 0 = dosis única. Ajusta los valores de referencia al plan sanitario de tu zona.")
+                        st.dataframe(protocolos_vacunacion(ver_hist, df_hist)[COLUMNAS_PROTOCOLO], hide_index=True, use_container_width=True)
+                        with st.form("form_protocolo_vacuna"):
+                            c_pv1, c_pv2 = st.columns([2, 1])
+                            pv_vacuna = c_pv1.selectbox("Vacuna", LISTA_VACUNAS)
+                            pv_sexo = c_pv2.selectbox("Aplica a", ["Todos", "Hembra", "Macho"])
+                            pv_especies = st.multiselect("Especies (vacío = todas)", LISTA_ESPECIES, default=["Bovino"])
+                            c_pv3, c_pv4, c_pv5, c_pv6 = st.columns(4)
+                            pv_edad_min = c_pv3.number_input("Edad 1ª dosis (días)", min_value=0, step=1)
+                            pv_edad_max = c_pv4.number_input("Edad máxima (0 = sin límite)", min_value=0, step=1)
+                            pv_refuerzo = c_pv5.number_input("Refuerzo (días)", min_value=0, step=1)
+                            pv_intervalo = c_pv6.number_input("Revacunar cada (días)", min_value=0, step=1)
+                            if st.form_submit_button("Guardar protocolo"):
+                                if pv_edad_max and pv_edad_max < pv_edad_min: st.error("La edad máxima debe ser mayor que la de la primera dosis.")
+                                else:
+                                    edad_pv = f"{pv_edad_min}-{pv_edad_max}" if pv_edad_max else f"{pv_edad_min}"
+                                    sexo_pv = f" | Sexo: {pv_sexo}" if pv_sexo != "Todos" else ""
+                                    especie_pv = f" | Especie: {', '.join(pv_especies)}" if pv_especies else ""
+                                    datos_pv = [str(date.today()), "PROTOCOLO_VACUNA", "FINCA", f"Vacuna: {pv_vacuna}",
+                                                f"Edad: {edad_pv} d | Refuerzo: {pv_refuerzo} d | Intervalo: {pv_intervalo} d{sexo_pv}{especie_pv}", ""]
+                                    guardar_evento(sh, datos_pv, "Protocolo")
+                                    st.rerun()
                 
                 elif st.session_state.sub_accion_sanidad_rapida == "tratamiento_masivo":
                     st.markdown("""
@@ -1711,7 +4213,11 @@ def main():
                         with c_t2: ftm_enfermedad = st.selectbox("Enfermedad *", LISTA_ENFERMEDADES)
                         
                         ftm_diag = st.text_input("Diagnóstico")
-                        ftm_med = st.text_input("Medicamento *")
+                        nombres_med = catalogo_medicamentos(ver_hist, df_hist)["Medicamento"].tolist()
+                        c_t3, c_t4 = st.columns(2)
+                        with c_t3: ftm_med_cat = st.selectbox("Medicamento *", nombres_med + ["Otro"])
+                        with c_t4: ftm_med_otro = st.text_input("Otro medicamento (sin retiro en catálogo)")
+                        ftm_med = ftm_med_otro.strip() if ftm_med_cat == "Otro" else ftm_med_cat
                         ftm_notas = st.text_area("Notas y observaciones")
                         
                         st.markdown("<br>", unsafe_allow_html=True)
@@ -1746,14 +4252,32 @@ def main():
                     st.markdown('<br>', unsafe_allow_html=True)
                     c_vm1, c_vm2 = st.columns(2)
                     with c_vm1: f_tipo_animal_vm = st.selectbox("Tipo de animal *", LISTA_ESPECIES, index=0, key="tipo_anim_vac")
-                    with c_vm2: f_filtro_vm = st.selectbox("Seleccionar animales", ["Todos los animales", "Todos los machos", "Todas las hembras", "Selección manual"], key="filtro_vac")
+                    with c_vm2: f_filtro_vm = st.selectbox("Seleccionar animales", ["Todos los animales", "Todos los machos", "Todas las hembras", "Selección manual", "Pendientes según calendario"], key="filtro_vac")
                     
                     ids_afectados_vac = []
+                    vacunas_vm = nombres_vacunas(protocolos_vacunacion(ver_hist, df_hist))
+                    vacuna_calendario = None
                     if not df_activos.empty:
                         if f_filtro_vm == "Todos los animales": ids_afectados_vac = df_activos['ID'].tolist()
                         elif f_filtro_vm == "Todos los machos": ids_afectados_vac = df_activos[df_activos['Sexo'] == 'Macho']['ID'].tolist()
                         elif f_filtro_vm == "Todas las hembras": ids_afectados_vac = df_activos[df_activos['Sexo'] == 'Hembra']['ID'].tolist()
                         elif f_filtro_vm == "Selección manual": ids_afectados_vac = st.multiselect("Elige los animales", df_activos['ID'].tolist(), key="multi_vac")
+                        elif f_filtro_vm == "Pendientes según calendario":
+                            calendario_vm = calendario_vacunacion(ver_hist, ver_anim, str(date.today()), df, df_hist)
+                            por_vacuna_vm = calendario_vm[calendario_vm["Días"] <= DIAS_AVISO_VACUNA]["Vacuna"].value_counts()
+                            if por_vacuna_vm.empty:
+                                st.info(f"Ningún animal tiene vacunas vencidas ni por vencer en los próximos {DIAS_AVISO_VACUNA} días.")
+                            else:
+                                vacuna_calendario = st.selectbox("Vacuna del calendario", por_vacuna_vm.index.tolist(), key="vacuna_calendario",
+                                                                 format_func=lambda v: f"{v} ({por_vacuna_vm[v]} animales)")
+                                ids_pendientes = pendientes_vacunacion(calendario_vm, vacuna_calendario)
+                                lista_vm = calendario_vm[(calendario_vm["Vacuna"] == vacuna_calendario) & calendario_vm["ID Animal"].isin(ids_pendientes)]
+                                lista_vm = lista_vm[["ID Animal", "Nombre", "Tipo", "Lote", "Dosis", "Próxima Dosis", "Estado"]].assign(Vacunar=True)
+                                editada_vm = st.data_editor(lista_vm, hide_index=True, use_container_width=True, num_rows="fixed",
+                                                            disabled=[c for c in lista_vm.columns if c != "Vacunar"], key=f"lista_vac_{vacuna_calendario}",
+                                                            column_config={"Próxima Dosis": st.column_config.DateColumn("Próxima Dosis", format="YYYY-MM-DD")})
+                                ids_afectados_vac = editada_vm.loc[editada_vm["Vacunar"], "ID Animal"].tolist()
+                                if vacuna_calendario not in vacunas_vm: vacunas_vm.append(vacuna_calendario)
                     
                     st.markdown(f"""
                     <div style='background-color: #e0e0e0; padding: 10px; font-weight: bold; text-align: right; border-radius: 0 0 5px 5px; margin-bottom: 15px;'>
@@ -1763,7 +4287,7 @@ def main():
 
                     with st.form("form_vacunacion_masiva_full"):
                         fvm_fecha = st.date_input("Fecha *", date.today())
-                        fvm_vacuna = st.selectbox("Vacuna *", LISTA_VACUNAS)
+                        fvm_vacuna = st.selectbox("Vacuna *", vacunas_vm, index=vacunas_vm.index(vacuna_calendario) if vacuna_calendario else 0)
                         fvm_notas = st.text_area("Notas y observaciones")
                         
                         st.markdown("<br>", unsafe_allow_html=True)
@@ -1772,9 +4296,7 @@ def main():
                             if not ids_afectados_vac: st.error("Debe seleccionar al menos un animal.")
                             else:
                                 with st.spinner(f"Registrando vacunación para {len(ids_afectados_vac)} animales..."):
-                                    for animal_id in ids_afectados_vac:
-                                        datos_vac = [str(fvm_fecha), "VACUNACION", str(animal_id), fvm_vacuna, "", f"Masiva | {fvm_notas}"]
-                                        guardar_evento(sh, datos_vac, "Vacunación")
+                                    registrar_vacunacion(sh, ids_afectados_vac, fvm_vacuna, fvm_fecha, f"Masiva | {fvm_notas}")
                                 st.success(f"¡Vacunación masiva registrada con éxito!")
                                 time.sleep(2)
                                 st.session_state.sub_accion_sanidad_rapida = None
@@ -1793,9 +4315,12 @@ def main():
                 <p style='color:#666;'>Control de Flujo de Caja, Cuentas Bancarias y Aportes</p>
             </div>
             """, unsafe_allow_html=True)
+
+            moneda_reporte = st.selectbox("💱 Moneda de reporte", MONEDAS, help="Moneda en la que se consolidan saldos y resultados")
+            tasas = tabla_tasas(ver_hist, ver_cuentas, df_hist, df_cuentas)
             
-            sub_bal, sub_hist, sub_ingresos, sub_gastos, sub_transf, sub_capital, sub_config = st.tabs([
-                "📊 Balance", "📜 Historial", "💰 Ingresos", "💸 Gastos", "🔄 Transferencias", "📥 Capital", "⚙️ Configurar"
+            sub_bal, sub_hist, sub_rep_fin, sub_ingresos, sub_gastos, sub_alimento, sub_transf, sub_capital, sub_config = st.tabs([
+                "📊 Balance", "📜 Historial", "📈 Resultados", "💰 Ingresos", "💸 Gastos", "🌾 Alimentación", "🔄 Transferencias", "📥 Capital", "⚙️ Configurar"
             ])
             
             # --- 5.1 BALANCE ---
@@ -1812,6 +4337,12 @@ def main():
                                 <div class="cuenta-saldo">{float(row['Saldo']):,.2f} <span class="cuenta-moneda">{row['Moneda']}</span></div>
                             </div>
                             """, unsafe_allow_html=True)
+
+                    saldos = saldos_consolidados(df_cuentas, tasas, moneda_reporte)
+                    st.metric(f"Patrimonio en caja ({moneda_reporte})", f"{saldos['Saldo Reporte'].sum():,.2f}")
+                    sin_tasa = saldos.loc[saldos["Saldo Reporte"].isna(), "Cuenta"].tolist()
+                    if sin_tasa:
+                        st.warning(f"Sin tasa de cambio para: {', '.join(sin_tasa)}. Regístrala en '⚙️ Configurar'.")
                 else:
                     st.info("No hay cuentas creadas. Ve a '⚙️ Configurar Cuentas' para empezar.")
 
@@ -1819,37 +4350,16 @@ def main():
             with sub_hist:
                 st.markdown("### 📜 Historial de Movimientos")
                 
-                # --- DETECCIÓN DE IDs FALTANTES PARA AUTO-REPARACIÓN ---
-                if not df_hist.empty:
-                    faltan_id = 0
-                    if "ID Evento" not in df_hist.columns:
-                        faltan_id = len(df_hist)
-                    else:
-                        faltan_id = len(df_hist[df_hist["ID Evento"].astype(str).str.strip() == ""])
-                        
-                    if faltan_id > 0:
-                        st.warning(f"⚠️ Se detectaron **{faltan_id}** registros antiguos sin 'ID Evento'. Para poder anularlos, el sistema debe asignarles un código único.")
-                        if st.button("🛠️ Generar IDs Faltantes Automáticamente", type="primary"):
-                            with st.spinner("Inyectando IDs en tu base de datos... esto puede tardar unos segundos..."):
-                                arreglados = reparar_ids_historial_local(sh)
-                                if arreglados > 0:
-                                    st.success(f"¡Se asignaron {arreglados} IDs con éxito!")
-                                    time.sleep(2)
-                                    st.rerun()
-                                else:
-                                    st.error("Hubo un problema. Verifica tu conexión a Google Sheets.")
-                        st.markdown("---")
-
                 st.markdown("#### 🗑️ Anular transacción")
-                st.write("Copia el 'ID Evento' que aparece en las tarjetas de abajo y pégalo aquí para eliminar el movimiento y revertir el saldo de tu cuenta bancaria.")
+                st.write("Copia el 'ID Evento' que aparece en la tabla de abajo y pégalo aquí para anular el movimiento: se registra un asiento de reverso y se revierte el saldo de tu cuenta bancaria.")
                 c_del1, c_del2 = st.columns([3, 1])
                 with c_del1:
-                    id_a_eliminar = st.text_input("Ingrese el ID del Evento a eliminar:", placeholder="Ej: a1b2c3d4")
+                    id_a_eliminar = st.text_input("Ingrese el ID del Evento a anular:", placeholder="Ej: 01JAB3C4D5E6F7G8H9J0KMNPQR")
                 with c_del2:
                     st.write("") 
                     if st.button("Anular Transacción", type="primary", use_container_width=True):
                         if id_a_eliminar:
-                            if eliminar_evento_finanzas_por_id(sh, id_a_eliminar):
+                            if anular_evento_finanzas(sh, id_a_eliminar, ver_hist, df_hist):
                                 st.rerun()
                         else:
                             st.warning("Ingrese un ID válido primero.")
@@ -1882,77 +4392,102 @@ def main():
                         if len(fechas) == 2:
                             f_inicio, f_fin = fechas
                 
-                if not df_hist.empty and "Tipo Evento" in df_hist.columns:
-                    tipos_financieros = ["VENTA", "COMPRA", "TRANSFERENCIA", "APORTE_CAPITAL", "GASTO_OPERATIVO", "INGRESO_OPERATIVO"]
-                    df_finanzas = df_hist[df_hist["Tipo Evento"].isin(tipos_financieros)].copy()
-                    
-                    if f_inicio and f_fin:
-                        df_finanzas["Fecha_DT"] = pd.to_datetime(df_finanzas["Fecha"], errors='coerce').dt.date
-                        df_finanzas = df_finanzas[(df_finanzas["Fecha_DT"] >= f_inicio) & (df_finanzas["Fecha_DT"] <= f_fin)]
-                    
+                libro = libro_mayor(ver_hist, df_hist)["libro"]
+                if not libro.empty:
+                    with c_filtro2:
+                        f_movimientos = st.multiselect("Movimiento", ["Ingreso", "Egreso", "Transferencia", "Capital"])
+                    df_finanzas = filtrar_por_fecha(libro, f_inicio, f_fin)
+                    if f_movimientos: df_finanzas = df_finanzas[df_finanzas["Movimiento"].isin(f_movimientos)]
+
                     if not df_finanzas.empty:
-                        df_finanzas_rev = df_finanzas.iloc[::-1]
-                        
-                        for _, row in df_finanzas_rev.iterrows():
-                            tipo = row["Tipo Evento"]
-                            fecha = row["Fecha"]
-                            
-                            id_evento = str(row.get("ID Evento", ""))
-                            if not id_evento.strip(): id_evento = "N/A"
-                            
-                            icon = "📄"
-                            css_class = "fin-neu"
-                            titulo = tipo
-                            sub = f"ID Evento: **{id_evento}** | {row['Detalle 1']}"
-                            notas = str(row['Notas'])
-                            
-                            if tipo == "VENTA":
-                                icon = "📈"
-                                css_class = "fin-pos"
-                                titulo = "Ingreso por Venta de Ganado"
-                                sub = f"ID Evento: **{id_evento}** | Animal: {row['ID Animal']} | {row['Detalle 2']}"
-                            elif tipo == "COMPRA":
-                                icon = "📉"
-                                css_class = "fin-neg"
-                                titulo = "Egreso por Compra de Ganado"
-                                sub = f"ID Evento: **{id_evento}** | {row['Detalle 1']}"
-                            elif tipo == "APORTE_CAPITAL":
-                                icon = "📥"
-                                css_class = "fin-pos"
-                                titulo = "Aporte de Capital / Préstamo"
-                                sub = f"ID Evento: **{id_evento}** | {row['Detalle 1']}"
-                            elif tipo == "GASTO_OPERATIVO":
-                                icon = "💸"
-                                css_class = "fin-neg"
-                                titulo = "Gasto Operativo"
-                                sub = f"ID Evento: **{id_evento}** | {row['Detalle 2']} | {row['Detalle 1']}"
-                            elif tipo == "INGRESO_OPERATIVO":
-                                icon = "💰"
-                                css_class = "fin-pos"
-                                titulo = "Ingreso Operativo (Subproductos)"
-                                sub = f"ID Evento: **{id_evento}** | {row['Detalle 2']} | {row['Detalle 1']}"
-                            elif tipo == "TRANSFERENCIA":
-                                icon = "🔄"
-                                css_class = "fin-neu"
-                                titulo = "Transferencia entre cuentas"
-                                sub = f"ID Evento: **{id_evento}** | {row['Detalle 1']} ➔ {row['Detalle 2']}"
+                        c_pag1, c_pag2, c_pag3 = st.columns([1, 1, 2])
+                        with c_pag1: por_pagina = st.selectbox("Filas por página", [25, 50, 100, 250], index=1)
+                        total_paginas = max(1, -(-len(df_finanzas) // por_pagina))
+                        with c_pag2: pagina = st.number_input("Página", min_value=1, max_value=total_paginas, value=1, step=1)
+                        with c_pag3: st.caption(f"{len(df_finanzas)} movimientos | página {pagina} de {total_paginas}")
+
+                        # Lo más reciente primero; solo la página visible viaja al navegador
+                        fin = len(df_finanzas) - (pagina - 1) * por_pagina
+                        pagina_libro = df_finanzas.iloc[max(0, fin - por_pagina):fin].iloc[::-1]
+                        st.dataframe(
+                            pagina_libro,
+                            hide_index=True,
+                            use_container_width=True,
+                            column_order=["Fecha", "ID Evento", "Movimiento", "Categoría", "Cuenta", "Cuenta Destino", "Monto", "Monto Destino", "Moneda", "ID Animal", "Detalle", "Notas"],
+                            column_config={
+                                "Fecha": st.column_config.DateColumn("Fecha", format="YYYY-MM-DD"),
+                                "Monto": st.column_config.NumberColumn("Monto", format="%.2f"),
+                                "Monto Destino": st.column_config.NumberColumn("Monto Destino", format="%.2f"),
+                            },
+                        )
 
-                            st.markdown(f"""
-                            <div class="fin-row {css_class}">
-                                <div class="fin-icon">{icon}</div>
-                                <div class="fin-details">
-                                    <div class="fin-title">{titulo}</div>
-                                    <div class="fin-subtitle">{sub}</div>
-                                    <div class="fin-notas">{notas}</div>
-                                </div>
-                                <div class="fin-date">{fecha}</div>
-                            </div>
-                            """, unsafe_allow_html=True)
+                        st.markdown("#### 📊 Resumen mensual")
+                        mensual = libro_mayor(ver_hist, df_hist)["mensual"]
+                        if f_inicio and f_fin:
+                            mensual = mensual[(mensual["Mes"] >= f_inicio.strftime("%Y-%m")) & (mensual["Mes"] <= f_fin.strftime("%Y-%m"))]
+                        agrupar_por = st.radio("Agrupar por", ["Categoría", "Cuenta"], horizontal=True)
+                        resumen = mensual.pivot_table(index=["Mes", "Movimiento", agrupar_por], values="Total", aggfunc="sum").reset_index()
+                        st.dataframe(resumen.sort_values(["Mes", "Movimiento"], ascending=[False, True]), hide_index=True, use_container_width=True,
+                                     column_config={"Total": st.column_config.NumberColumn("Total", format="%.2f")})
                     else:
                         st.info(f"No hay movimientos financieros para el filtro de fecha actual.")
                 else:
                     st.info("El historial está vacío.")
 
+            # --- 5.2b ESTADO DE RESULTADOS Y FLUJO DE CAJA ---
+            with sub_rep_fin:
+                st.markdown("### 📈 Estado de Resultados y Flujo de Caja")
+                reportes = reportes_financieros(ver_hist, ver_anim, ver_cuentas, moneda_reporte, df, df_hist, df_cuentas)
+                pyg = reportes["pyg"]
+                if not pyg.empty:
+                    meses = pyg["Mes"].tolist()
+                    c_m1, c_m2 = st.columns(2)
+                    with c_m1: mes_desde = st.selectbox("Desde", meses, index=max(0, len(meses) - 12))
+                    with c_m2: mes_hasta = st.selectbox("Hasta", meses, index=len(meses) - 1)
+                    en_rango = (pyg["Mes"] >= mes_desde) & (pyg["Mes"] <= mes_hasta)
+                    pyg_rango = pyg[en_rango]
+
+                    k1, k2, k3 = st.columns(3)
+                    k1.metric("Ingresos", f"{pyg_rango['Ingresos'].sum():,.2f}")
+                    k2.metric("Egresos", f"{pyg_rango['Egresos'].sum():,.2f}")
+                    k3.metric("Resultado", f"{pyg_rango['Resultado'].sum():,.2f}")
+                    st.caption(f"Montos convertidos a {moneda_reporte} con la tasa vigente a la fecha de cada movimiento. Aportes y transferencias no afectan el resultado.")
+                    if reportes["sin_tasa"]:
+                        st.warning(f"{reportes['sin_tasa']} movimientos quedaron fuera por no tener tasa de cambio para su moneda.")
+
+                    barras_pyg = alt.Chart(pyg_rango.melt(id_vars="Mes", value_vars=["Ingresos", "Egresos"], var_name="Tipo", value_name="Monto")).mark_bar().encode(
+                        x=alt.X("Mes:N", title="Mes"), xOffset="Tipo:N", y=alt.Y("Monto:Q", title="Monto"),
+                        color=alt.Color("Tipo:N", scale=alt.Scale(domain=["Ingresos", "Egresos"], range=["#2e7d32", "#c62828"])),
+                        tooltip=["Mes", "Tipo", alt.Tooltip("Monto:Q", format=",.2f")]
+                    )
+                    linea_resultado = alt.Chart(pyg_rango).mark_line(point=True, color="#1976d2").encode(x="Mes:N", y="Resultado:Q")
+                    st.altair_chart(barras_pyg + linea_resultado, use_container_width=True)
+
+                    st.markdown("#### Resultado mensual")
+                    formato_monto = {c: st.column_config.NumberColumn(c, format="%.2f") for c in ["Ingresos", "Egresos", "Resultado"]}
+                    st.dataframe(pyg_rango, hide_index=True, use_container_width=True, column_config=formato_monto)
+
+                    st.markdown("#### Por categoría")
+                    columnas_mes = [m for m in meses if mes_desde <= m <= mes_hasta]
+                    st.dataframe(reportes["pyg_categoria"][["Movimiento", "Categoría"] + columnas_mes], hide_index=True, use_container_width=True)
+
+                    st.markdown("#### 💵 Flujo de caja por cuenta")
+                    flujo = reportes["flujo"]
+                    st.dataframe(flujo[(flujo["Mes"] >= mes_desde) & (flujo["Mes"] <= mes_hasta)], hide_index=True, use_container_width=True,
+                                 column_config={c: st.column_config.NumberColumn(c, format="%.2f") for c in ["Entradas", "Salidas", "Neto", "Neto Acumulado"]})
+
+                    st.markdown("#### 🐄 Costos unitarios")
+                    costos = reportes["costos"]
+                    st.caption(f"Gasto operativo mensual entre {reportes['cabezas']} animales activos y entre los litros producidos en el mes.")
+                    st.dataframe(costos[(costos["Mes"] >= mes_desde) & (costos["Mes"] <= mes_hasta)], hide_index=True, use_container_width=True,
+                                 column_config={
+                                     "Gasto Operativo": st.column_config.NumberColumn("Gasto Operativo", format="%.2f"),
+                                     "Costo por Animal": st.column_config.NumberColumn("Costo por Animal", format="%.2f"),
+                                     "Costo por Litro": st.column_config.NumberColumn("Costo por Litro", format="%.3f"),
+                                 })
+                else:
+                    st.info("Aún no hay ingresos ni egresos registrados.")
+
             # --- 5.3 INGRESOS OPERATIVOS ---
             with sub_ingresos:
                 st.markdown("### 💰 Registro de Ingresos Operativos")
@@ -1985,7 +4520,7 @@ def main():
                 if not df_cuentas.empty:
                     with st.form("form_gastos"):
                         c_g1, c_g2 = st.columns(2)
-                        with c_g1: categoria_gasto = st.selectbox("Categoría", ["Alimentación (Concentrado/Pasto)", "Medicinas / Veterinaria", "Nómina / Personal", "Mantenimiento / Equipos", "Servicios", "Otros Gastos"])
+                        with c_g1: categoria_gasto = st.selectbox("Categoría", ["Alimentación (Concentrado/Pasto)", CATEGORIA_GASTO_SANIDAD, "Nómina / Personal", "Mantenimiento / Equipos", "Servicios", "Otros Gastos"])
                         with c_g2: cta_pago = st.selectbox("Pagado desde (Cuenta)", df_cuentas['Nombre'].tolist())
                         
                         monto_gasto = st.number_input("Monto del Gasto", min_value=0.0)
@@ -2000,6 +4535,88 @@ def main():
                             else: st.error("Monto inválido.")
                 else: st.info("Crea una cuenta para poder registrar gastos.")
 
+            # --- 5.4b ALIMENTACIÓN ---
+            with sub_alimento:
+                st.markdown("### 🌾 Inventario de Alimento y Costos por Lote")
+                inventario = inventario_alimentos(ver_hist, ver_cuentas, moneda_reporte, df_hist, df_cuentas)
+                stock = inventario["stock"]
+                if not stock.empty:
+                    st.dataframe(stock, hide_index=True, use_container_width=True,
+                                 column_config={"Costo Promedio": st.column_config.NumberColumn(f"Costo Promedio ({moneda_reporte}/kg)", format="%.4f"),
+                                                "Valor Stock": st.column_config.NumberColumn(f"Valor Stock ({moneda_reporte})", format="%,.2f")})
+                    negativos = stock[stock["Stock (kg)"] < 0]
+                    if not negativos.empty: st.warning(f"Stock negativo en: {', '.join(negativos['Alimento'])}. Falta registrar entradas.")
+                else: st.info("Todavía no hay movimientos de alimento.")
+
+                alimentos_conocidos = stock["Alimento"].tolist()
+                lista_lotes_alim = nombres_lotes(df, catalogo_lotes(ver_hist, df_hist))
+                c_al1, c_al2 = st.columns(2)
+                with c_al1:
+                    with st.form("form_entrada_alimento"):
+                        st.markdown("**📦 Entrada de alimento**")
+                        al_existente = st.selectbox("Alimento", ["Nuevo..."] + alimentos_conocidos)
+                        al_nuevo = st.text_input("Nombre (si es nuevo)", placeholder="Ej: Concentrado 18%")
+                        c_al3, c_al4 = st.columns(2)
+                        al_kg = c_al3.number_input("Cantidad (kg)", min_value=0.0, step=50.0)
+                        al_costo = c_al4.number_input("Costo total", min_value=0.0)
+                        al_cuenta = st.selectbox("Pagado desde", ["Sin registrar pago"] + (df_cuentas["Nombre"].tolist() if not df_cuentas.empty else []))
+                        al_moneda = st.selectbox("Moneda (si no se paga desde una cuenta)", MONEDAS)
+                        al_fecha = st.date_input("Fecha", date.today(), key="fecha_entrada_alimento")
+                        if st.form_submit_button("Registrar entrada", type="primary"):
+                            alimento = al_nuevo.strip() if al_existente == "Nuevo..." else al_existente
+                            if not alimento or al_kg <= 0: st.error("Indica el alimento y la cantidad.")
+                            else:
+                                moneda_alim = monedas_de_cuentas(df_cuentas).get(al_cuenta) or al_moneda
+                                if al_cuenta != "Sin registrar pago" and al_costo > 0:
+                                    actualizar_saldo_cuenta(sh, al_cuenta, -al_costo)
+                                    datos_gasto = [str(al_fecha), "GASTO_OPERATIVO", "FINANZAS", f"Monto: {al_costo} (Cuenta: {al_cuenta})", CATEGORIA_GASTO_ALIMENTACION, f"{al_kg:g} kg de {alimento}"]
+                                    guardar_evento(sh, datos_gasto, "Gasto registrado")
+                                datos_alim = [str(al_fecha), "ALIMENTO_ENTRADA", "FINCA", f"Alimento: {alimento}", f"Cantidad: {al_kg} kg | Costo: {al_costo} | Moneda: {moneda_alim}", ""]
+                                guardar_evento(sh, datos_alim, "Entrada de alimento")
+                                st.rerun()
+                with c_al2:
+                    with st.form("form_racion"):
+                        st.markdown("**🥣 Ración por lote**")
+                        ra_lote = st.selectbox("Lote", lista_lotes_alim)
+                        ra_alimento = st.selectbox("Alimento ", alimentos_conocidos) if alimentos_conocidos else st.text_input("Alimento ")
+                        ra_kg = st.number_input("Kg por animal por día (0 suspende)", min_value=0.0, step=0.5)
+                        if st.form_submit_button("Guardar ración"):
+                            if ra_alimento:
+                                datos_racion = [str(date.today()), "RACION", "FINCA", f"Lote: {ra_lote} | Alimento: {ra_alimento}", f"Kg por animal/día: {ra_kg}", ""]
+                                guardar_evento(sh, datos_racion, "Ración")
+                                st.rerun()
+
+                raciones = raciones_vigentes(df_hist)
+                if not raciones.empty:
+                    st.markdown("#### 🥣 Raciones vigentes")
+                    c_al5, c_al6 = st.columns(2)
+                    dias_consumo = c_al5.number_input("Días a registrar", min_value=1, value=7)
+                    fecha_consumo = c_al6.date_input("Fecha del registro", date.today(), key="fecha_consumo_alimento")
+                    consumo = consumo_por_raciones(raciones, ubicaciones(ver_hist, ver_anim, df, df_hist)["por_lote"], dias_consumo)
+                    st.dataframe(raciones.merge(consumo[["Lote", "Alimento", "Animales", "Kg"]], on=["Lote", "Alimento"], how="left"),
+                                 hide_index=True, use_container_width=True,
+                                 column_config={"Kg": st.column_config.NumberColumn(f"Consumo {dias_consumo} d (kg)", format="%.1f"),
+                                                "Desde": st.column_config.DateColumn("Desde", format="YYYY-MM-DD")})
+                    if st.button(f"📤 Registrar consumo de {dias_consumo} días según raciones", disabled=consumo.empty):
+                        registrados = registrar_consumo(sh, consumo, fecha_consumo)
+                        st.toast(f"✅ {registrados} salidas de alimento registradas")
+                        st.rerun()
+
+                st.markdown(f"#### 💲 Costo de alimentación por lote y mes ({moneda_reporte})")
+                costos_alim = costos_alimentacion(ver_hist, ver_anim, ver_cuentas, moneda_reporte, df, df_hist, df_cuentas)
+                costos_alim = costos_alim[costos_alim["Costo Alimento"] > 0]
+                if costos_alim.empty: st.info("Registra consumos de alimento para calcular costos por lote.")
+                else:
+                    grafico_alim = alt.Chart(costos_alim.dropna(subset=["Costo por Kg Ganado"])).mark_line(point=True).encode(
+                        x=alt.X("Mes:N"), y=alt.Y("Costo por Kg Ganado:Q", title=f"{moneda_reporte} por kg ganado"), color="Lote:N",
+                        tooltip=["Lote", "Mes", alt.Tooltip("Costo por Kg Ganado:Q", format=",.2f"), alt.Tooltip("Costo por Litro:Q", format=",.2f")]
+                    ).properties(height=250)
+                    st.altair_chart(grafico_alim, use_container_width=True)
+                    st.dataframe(costos_alim, hide_index=True, use_container_width=True,
+                                 column_config={c: st.column_config.NumberColumn(c, format="%,.2f") for c in ["Costo Alimento", "Costo por Kg Ganado", "Costo por Litro"]})
+                    st.caption("Las ganancias de peso y los litros se asignan al lote donde estaba el animal ese día. "
+                               "En lotes con leche y engorde ambos indicadores usan el costo completo del lote.")
+
             # --- 5.5 TRANSFERENCIAS / CANJE ---
             with sub_transf:
                 st.markdown("### 🔄 Transferencias y Cambio de Divisas")
@@ -2020,8 +4637,7 @@ def main():
                             if cta_origen == cta_destino: st.error("❌ La cuenta origen y destino no pueden ser la misma.")
                             elif monto_transferir <= 0: st.error("❌ El monto debe ser mayor a 0.")
                             else:
-                                actualizar_saldo_cuenta(sh, cta_origen, -monto_transferir)
-                                actualizar_saldo_cuenta(sh, cta_destino, monto_recibir)
+                                ajustar_saldos(sh, {cta_origen: -monto_transferir, cta_destino: monto_recibir})
                                 datos_transf = [str(date.today()), "TRANSFERENCIA", "FINANZAS", f"De: {cta_origen}", f"A: {cta_destino}", f"Monto Origen: {monto_transferir} | Monto Recibido: {monto_recibir}"]
                                 guardar_evento(sh, datos_transf, "Transferencia completada")
                                 st.rerun()
@@ -2063,8 +4679,288 @@ def main():
                             st.rerun()
                         else: st.error("El nombre es obligatorio.")
 
+                st.markdown("### 💱 Tasas de Cambio")
+                st.caption(f"Unidades de cada moneda por 1 {MONEDA_BASE}. Las transferencias entre una cuenta en {MONEDA_BASE} y otra en otra moneda aportan su tasa automáticamente.")
+                with st.form("form_tasa_cambio"):
+                    c_tc1, c_tc2, c_tc3 = st.columns(3)
+                    with c_tc1: fecha_tasa = st.date_input("Fecha", date.today())
+                    with c_tc2: moneda_tasa = st.selectbox("Moneda", [m for m in MONEDAS if m != MONEDA_BASE])
+                    with c_tc3: valor_tasa = st.number_input(f"Unidades por 1 {MONEDA_BASE}", min_value=0.0, format="%.4f")
+                    if st.form_submit_button("Registrar Tasa"):
+                        if valor_tasa > 0:
+                            datos_tasa = [str(fecha_tasa), "TASA_CAMBIO", "FINANZAS", f"Moneda: {moneda_tasa}", f"Tasa: {valor_tasa}", f"Unidades por 1 {MONEDA_BASE}"]
+                            guardar_evento(sh, datos_tasa, "Tasa de cambio")
+                            st.rerun()
+                        else: st.error("La tasa debe ser mayor a 0.")
+                if not tasas.empty:
+                    st.dataframe(tasas.iloc[::-1], hide_index=True, use_container_width=True,
+                                 column_config={"Fecha": st.column_config.DateColumn("Fecha", format="YYYY-MM-DD"),
+                                                "Tasa": st.column_config.NumberColumn("Tasa", format="%.4f")})
+
         # ==========================================
-        # 6. ALERTAS AUTOMÁTICAS
+        # 6. INDICADORES DEL HATO
+        # ==========================================
+        with tab_hato:
+            st.header("📈 Indicadores del Hato")
+            sub_repro, sub_genealogia, sub_cruces, sub_lotes, sub_salud = st.tabs(["🧬 Reproducción", "🌳 Genealogía", "💞 Planificador de Cruces", "🌱 Lotes y Potreros", "🩺 Salud del Hato"])
+
+            # --- 6.1 REPRODUCCIÓN ---
+            with sub_repro:
+                kpis = kpis_reproductivos(ver_hist, ver_anim, df, df_hist)
+                k_hato = kpis["hato"]
+                fmt = lambda v, sufijo="", dec=1: "--" if pd.isna(v) else f"{v:,.{dec}f}{sufijo}"
+                c_k1, c_k2, c_k3 = st.columns(3)
+                c_k1.metric("Intervalo entre partos", fmt(k_hato["IEP Promedio"], " d", 0))
+                c_k2.metric("Días abiertos (prom.)", fmt(k_hato["Días Abiertos Promedio"], " d", 0))
+                c_k3.metric("Servicios por concepción", fmt(k_hato["Servicios por Concepción"], "", 2))
+                c_k4, c_k5, c_k6 = st.columns(3)
+                c_k4.metric("Tasa de concepción", fmt(k_hato["Tasa de Concepción"], " %"))
+                c_k5.metric("Tasa de abortos", fmt(k_hato["Tasa de Abortos"], " %"))
+                c_k6.metric("Vacas preñadas", k_hato["Preñadas"])
+
+                st.markdown("#### 📅 Calendario de partos esperados")
+                calendario = kpis["calendario"]
+                if not df.empty:
+                    calendario = calendario.merge(df[["ID", "Nombre"]], left_on="ID Animal", right_on="ID", how="left").drop(columns="ID")
+                if not calendario.empty:
+                    calendario_mes = calendario.groupby(calendario["Fecha Probable Parto"].dt.strftime("%Y-%m")).size().reset_index(name="Partos")
+                    barras_cal = alt.Chart(calendario_mes).mark_bar(color="#1565c0").encode(
+                        x=alt.X("Fecha Probable Parto:N", title="Mes"), y=alt.Y("Partos:Q"), tooltip=["Fecha Probable Parto", "Partos"]
+                    ).properties(height=200)
+                    st.altair_chart(barras_cal, use_container_width=True)
+                    st.dataframe(calendario, hide_index=True, use_container_width=True)
+                else:
+                    st.info("No hay vacas con preñez confirmada.")
+
+                st.markdown("#### 🐄 Indicadores por vaca")
+                tabla_repro = kpis["por_vaca"]
+                if not df_activos.empty:
+                    tabla_repro = tabla_repro[tabla_repro["ID Animal"].isin(df_activos["ID"])]
+                    tabla_repro = tabla_repro.merge(df_activos[["ID", "Nombre", "Estado"]], left_on="ID Animal", right_on="ID", how="left").drop(columns="ID")
+                columnas_repro = [c for c in ["ID Animal", "Nombre", "Estado", "Partos", "Abortos", "Servicios", "IEP Promedio", "Último Parto",
+                                              "Días Abiertos", "Servicios Ciclo", "Servicios por Concepción", "Fecha Probable Parto"] if c in tabla_repro.columns]
+                st.dataframe(tabla_repro[columnas_repro], hide_index=True, use_container_width=True)
+
+            # --- 6.2 GENEALOGÍA ---
+            with sub_genealogia:
+                ped = pedigri(ver_anim, df)
+                tabla_ped = ped["tabla"]
+                if tabla_ped.empty:
+                    st.info("No hay animales registrados.")
+                else:
+                    etiqueta_animal = dict(zip(tabla_ped["ID"], tabla_ped["Nombre"] + " (" + tabla_ped["ID"] + ")"))
+                    ped_activos = tabla_ped[tabla_ped["ID"].isin(df_activos["ID"].astype(str))] if not df_activos.empty else tabla_ped.iloc[0:0]
+                    c_g1, c_g2, c_g3 = st.columns(3)
+                    c_g1.metric("Animales con padre y madre", f"{((tabla_ped['Padre'] != '') & (tabla_ped['Madre'] != '')).sum()} / {len(tabla_ped)}")
+                    c_g2.metric("Consanguinidad media (activos)", f"{ped_activos['F'].mean() * 100:.2f} %" if not ped_activos.empty else "--")
+                    c_g3.metric("Activos con F ≥ 6.25 %", int((ped_activos["F"] >= UMBRAL_CONSANGUINIDAD).sum()))
+
+                    st.markdown("#### 🧾 Pedigrí de un animal")
+                    id_ped = st.selectbox("Animal", tabla_ped["ID"].tolist(), format_func=lambda x: etiqueta_animal.get(x, x), key="ped_animal")
+                    progenitores = tabla_ped.set_index("ID")[["Padre", "Madre"]]
+                    ancestros, nivel = [], [id_ped]
+                    for generacion in ["Padres", "Abuelos", "Bisabuelos"]:
+                        nivel = [p for a in nivel if a in progenitores.index for p in progenitores.loc[a] if p]
+                        ancestros += [{"Generación": generacion, "Ancestro": etiqueta_animal.get(p, p)} for p in nivel]
+                    c_p1, c_p2 = st.columns([1, 2])
+                    c_p1.metric("Consanguinidad (F)", f"{tabla_ped.set_index('ID').loc[id_ped, 'F'] * 100:.2f} %")
+                    with c_p2:
+                        if ancestros: st.dataframe(pd.DataFrame(ancestros), hide_index=True, use_container_width=True)
+                        else: st.caption("Sin progenitores registrados.")
+
+                    st.markdown("#### 🔗 Parentesco entre dos animales")
+                    c_r1, c_r2 = st.columns(2)
+                    id_rel_a = c_r1.selectbox("Animal A", tabla_ped["ID"].tolist(), format_func=lambda x: etiqueta_animal.get(x, x), key="rel_a")
+                    id_rel_b = c_r2.selectbox("Animal B", tabla_ped["ID"].tolist(), format_func=lambda x: etiqueta_animal.get(x, x), key="rel_b")
+                    a_ab = parentesco(ped, [id_rel_a], [id_rel_b]).iloc[0, 0]
+                    c_r3, c_r4 = st.columns(2)
+                    c_r3.metric("Coeficiente de relación", f"{coeficiente_relacion(ped, [id_rel_a], [id_rel_b]).iloc[0, 0] * 100:.2f} %")
+                    c_r4.metric("F de una cría entre ambos", f"{a_ab / 2 * 100:.2f} %")
+
+                    st.markdown("#### 💞 Cruces sugeridos")
+                    toros, vientres = reproductores_disponibles(df_activos)
+                    sugeridos = cruces_sugeridos(ped, toros, vientres)
+                    if sugeridos.empty:
+                        st.info("Se necesitan toros y vientres activos para sugerir cruces.")
+                    else:
+                        st.caption(f"Para cada vientre, el toro que produce la cría menos consanguínea. Se listan los toros con F de cría ≥ {UMBRAL_CONSANGUINIDAD * 100:.2f} %.")
+                        st.dataframe(sugeridos, hide_index=True, use_container_width=True,
+                                     column_config={"F Cría": st.column_config.NumberColumn("F Cría", format="%.4f")})
+
+                    with st.expander("Consanguinidad de todo el hato"):
+                        st.dataframe(tabla_ped.assign(Padre=tabla_ped["Padre"].map(etiqueta_animal).fillna(""),
+                                                      Madre=tabla_ped["Madre"].map(etiqueta_animal).fillna(""))
+                                     .sort_values("F", ascending=False), hide_index=True, use_container_width=True,
+                                     column_config={"F": st.column_config.NumberColumn("F", format="%.4f")})
+
+            # --- 6.3 PLANIFICADOR DE CRUCES ---
+            with sub_cruces:
+                st.caption("Puntúa todos los cruces entre toros activos y vacas vacías según parentesco, raza, "
+                           "ganancia de peso de la progenie e historial reproductivo.")
+                c_pc1, c_pc2 = st.columns(2)
+                objetivo_raza = c_pc1.radio("Objetivo racial", OBJETIVOS_RAZA, horizontal=True)
+                cupo_toro = c_pc2.number_input("Máximo de vacas por toro (0 = sin límite)", min_value=0, value=0, step=5)
+                plan = planificar_cruces(ver_hist, ver_anim, objetivo_raza, df, df_hist)
+                ranking_cruces = plan["ranking"]
+                if ranking_cruces.empty:
+                    st.info("Se necesitan toros activos y vacas vacías para planificar la temporada.")
+                else:
+                    temporada = plan_temporada(ranking_cruces, int(cupo_toro))
+                    c_pc3, c_pc4, c_pc5 = st.columns(3)
+                    c_pc3.metric("Vacas vacías", ranking_cruces["ID Vaca"].nunique())
+                    c_pc4.metric("Con toro asignado", len(temporada))
+                    c_pc5.metric("Puntaje promedio", f"{temporada['Puntaje'].mean():.1f}" if not temporada.empty else "--")
+                    formato_cruces = {"F Cría": st.column_config.NumberColumn("F Cría", format="%.4f"),
+                                      "Puntaje": st.column_config.ProgressColumn("Puntaje", min_value=0, max_value=100, format="%.1f"),
+                                      "Disponible Desde": st.column_config.DateColumn("Disponible Desde", format="YYYY-MM-DD")}
+                    st.markdown("#### 📋 Plan de la temporada")
+                    st.dataframe(temporada[["Vaca", "ID Vaca", "Raza Vaca", "Toro", "Raza Toro", "F Cría", "Puntaje", "Disponible Desde"]],
+                                 hide_index=True, use_container_width=True, column_config=formato_cruces)
+                    sin_toro = sorted(set(ranking_cruces["ID Vaca"]) - set(temporada["ID Vaca"]))
+                    if sin_toro: st.warning(f"{len(sin_toro)} vaca(s) sin toro apto disponible: {', '.join(sin_toro)}")
+
+                    st.markdown("#### 🔎 Opciones por vaca")
+                    etiquetas_vacas = ranking_cruces.drop_duplicates("ID Vaca").set_index("ID Vaca")["Vaca"]
+                    id_vaca_plan = st.selectbox("Vaca", etiquetas_vacas.index.tolist(), format_func=lambda x: f"{etiquetas_vacas[x]} ({x})")
+                    st.dataframe(ranking_cruces[ranking_cruces["ID Vaca"] == id_vaca_plan]
+                                 [["Rango", "Toro", "Raza Toro", "F Cría", "Parentesco", "Raza", "Progenie", "Fertilidad", "Puntaje", "Apto"]],
+                                 hide_index=True, use_container_width=True, column_config=formato_cruces)
+
+            # --- 6.4 LOTES Y POTREROS ---
+            with sub_lotes:
+                ubic = ubicaciones(ver_hist, ver_anim, df, df_hist)
+                resumen_lotes = ubic["resumen"]
+                ocupados = resumen_lotes[resumen_lotes["Animales"] > 0]
+                area_total = resumen_lotes["Área"].sum()
+                c_lt1, c_lt2, c_lt3 = st.columns(3)
+                c_lt1.metric("Lotes ocupados", f"{len(ocupados)} / {len(resumen_lotes)}")
+                c_lt2.metric("Unidades animales", f"{resumen_lotes['UA'].sum():,.1f} UA")
+                c_lt3.metric("Carga global", f"{resumen_lotes['UA'].sum() / area_total:,.2f} UA/ha" if area_total > 0 else "--")
+                st.caption(f"1 UA = {PESO_UNIDAD_ANIMAL:.0f} kg de peso vivo. Días en lote cuenta desde el primer animal que entró con un movimiento registrado.")
+                if resumen_lotes["Sin Peso"].sum():
+                    st.caption(f"⚠️ {resumen_lotes['Sin Peso'].sum()} animales sin peso en su ficha: su UA se estima con el peso de referencia de su categoría "
+                               f"({', '.join(f'{c} {p:.0f} kg' for c, p in PESO_REFERENCIA_CATEGORIA.items())}) y, sin categoría, no suma.")
+                st.dataframe(resumen_lotes[["Lote", "Animales", "Sin Peso", "UA", "Área", "UA/ha", "Días en Lote", "Días Ocupación", "Días Descanso", "Última Salida"]],
+                             hide_index=True, use_container_width=True,
+                             column_config={"UA": st.column_config.NumberColumn("UA", format="%.1f"),
+                                            "Área": st.column_config.NumberColumn("Área (ha)", format="%.2f"),
+                                            "UA/ha": st.column_config.NumberColumn("UA/ha", format="%.2f"),
+                                            "Última Salida": st.column_config.DateColumn("Última Salida", format="YYYY-MM-DD")})
+
+                st.markdown("#### 🔄 Plan de rotación")
+                rotacion = plan_rotacion(resumen_lotes)
+                if rotacion.empty: st.success("Ningún lote superó sus días de ocupación.")
+                else: st.dataframe(rotacion, hide_index=True, use_container_width=True,
+                                   column_config={"UA": st.column_config.NumberColumn("UA", format="%.1f"),
+                                                  "UA/ha en Destino": st.column_config.NumberColumn("UA/ha en Destino", format="%.2f")})
+
+                lista_lotes = nombres_lotes(df, catalogo_lotes(ver_hist, df_hist))
+                nombres_animales = dict(zip(df["ID"].astype(str), df["Nombre"].astype(str))) if not df.empty else {}
+                lote_de = dict(zip(ubic["por_animal"]["ID"], ubic["por_animal"]["Lote"]))
+                st.markdown("#### 📍 ¿Quién está en el lote?")
+                lote_consulta = st.selectbox("Lote", sorted(ubic["por_lote"]) or lista_lotes, key="lote_consulta")
+                en_lote = ubic["por_lote"].get(lote_consulta, [])
+                if en_lote:
+                    st.dataframe(ubic["por_animal"].set_index("ID").loc[en_lote].reset_index().assign(Nombre=lambda t: t["ID"].map(nombres_animales))
+                                 [["ID", "Nombre", "Peso", "UA", "Peso Estimado", "Desde"]], hide_index=True, use_container_width=True,
+                                 column_config={"Desde": st.column_config.DateColumn("Desde", format="YYYY-MM-DD")})
+                else: st.info("No hay animales en este lote.")
+
+                c_lt4, c_lt5 = st.columns(2)
+                with c_lt4:
+                    with st.form("form_movimiento_lote"):
+                        st.markdown("**🚚 Mover animales**")
+                        mv_ids = st.multiselect("Animales", list(lote_de), format_func=lambda x: f"{nombres_animales.get(x, x)} ({x}) · {lote_de.get(x, '')}")
+                        mv_destino = st.selectbox("Lote destino", lista_lotes)
+                        mv_fecha = st.date_input("Fecha", date.today())
+                        mv_notas = st.text_input("Notas")
+                        if st.form_submit_button("Mover", type="primary"):
+                            movidos = mover_animales(sh, hoja_animales, mv_ids, mv_destino, mv_fecha, lote_de, mv_notas)
+                            if movidos: st.toast(f"✅ {movidos} animales movidos a {mv_destino}"); st.rerun()
+                            else: st.warning("Los animales seleccionados ya están en ese lote.")
+                with c_lt5:
+                    with st.form("form_config_lote"):
+                        st.markdown("**⚙️ Configurar lote**")
+                        cf_lote = st.text_input("Nombre del lote")
+                        cf_area = st.number_input("Área (ha)", min_value=0.0, step=0.5)
+                        c_lt6, c_lt7 = st.columns(2)
+                        cf_ocupacion = c_lt6.number_input("Días de ocupación", min_value=1, value=DIAS_OCUPACION_POR_DEFECTO)
+                        cf_descanso = c_lt7.number_input("Días de descanso", min_value=0, value=DIAS_DESCANSO_POR_DEFECTO)
+                        if st.form_submit_button("Guardar lote"):
+                            if cf_lote.strip():
+                                datos_lote = [str(date.today()), "LOTE_CONFIG", "FINCA", f"Lote: {cf_lote.strip()}",
+                                              f"Área: {cf_area} ha | Ocupación: {cf_ocupacion} d | Descanso: {cf_descanso} d", ""]
+                                guardar_evento(sh, datos_lote, "Lote")
+                                st.rerun()
+                            else: st.error("Indica el nombre del lote.")
+
+            with sub_salud:
+                moneda_salud = st.selectbox("💱 Moneda de los costos", MONEDAS, key="moneda_salud")
+                salud = salud_hato(ver_hist, ver_anim, ver_cuentas, moneda_salud, df, df_hist, df_cuentas)
+                episodios_salud, mortalidad_salud = salud["episodios"], salud["mortalidad"]
+                ultimos_12 = mortalidad_salud.tail(12)
+                c_sa1, c_sa2, c_sa3, c_sa4 = st.columns(4)
+                c_sa1.metric("Casos (12 meses)", int(episodios_salud["Mes"].isin(ultimos_12["Mes"]).sum()))
+                c_sa2.metric("Animales con recaídas", len(salud["recurrencia"]))
+                mortalidad_anual = ultimos_12["Mortalidad 12 Meses"].iloc[-1] if not ultimos_12.empty else float("nan")
+                c_sa3.metric("Mortalidad 12 meses", f"{mortalidad_anual:.1f}%" if pd.notna(mortalidad_anual) else "--")
+                c_sa4.metric(f"Gasto sanitario ({moneda_salud})", f"{salud['costos']['Costo'].sum():,.2f}")
+                st.caption(f"Últimos {MESES_ANALISIS_SALUD} meses. Un caso agrupa los eventos de la misma enfermedad en el mismo animal separados por menos de "
+                           f"{DIAS_EPISODIO} días. Incidencia = casos por cada 100 animales presentes en el mes.")
+
+                if episodios_salud.empty: st.info("No hay tratamientos ni mastitis registrados en el periodo.")
+                else:
+                    incidencia_salud = salud["incidencia"]
+                    enf_salud = st.multiselect("Enfermedades", sorted(incidencia_salud["Enfermedad"].unique()),
+                                               default=sorted(incidencia_salud["Enfermedad"].unique()), key="salud_enfermedades")
+                    st.markdown(f"#### 📈 Incidencia mensual (media móvil de {VENTANA_MESES_SALUD} meses)")
+                    grafico_inc = alt.Chart(incidencia_salud[incidencia_salud["Enfermedad"].isin(enf_salud)]).mark_line(point=True).encode(
+                        x=alt.X("Mes:N"), y=alt.Y("Incidencia Móvil:Q", title="Casos por 100 animales"), color="Enfermedad:N",
+                        tooltip=["Enfermedad", "Mes", "Casos", "Población", alt.Tooltip("Incidencia:Q", format=".2f"), alt.Tooltip("Incidencia Móvil:Q", format=".2f")]
+                    ).properties(height=280)
+                    st.altair_chart(grafico_inc, use_container_width=True)
+
+                    st.markdown("#### 🌱 Incidencia por lote")
+                    por_lote_salud = salud["por_lote"][salud["por_lote"]["Enfermedad"].isin(enf_salud)]
+                    barras_salud = alt.Chart(por_lote_salud).mark_bar().encode(
+                        x=alt.X("Lote:N"), y=alt.Y("Incidencia:Q", title="Casos por 100 animales-mes"), color="Enfermedad:N",
+                        xOffset="Enfermedad:N", tooltip=["Lote", "Enfermedad", "Casos", "Animales-Mes", alt.Tooltip("Incidencia:Q", format=".2f")]
+                    ).properties(height=250)
+                    st.altair_chart(barras_salud, use_container_width=True)
+
+                    st.markdown("#### 🔁 Recaídas por animal")
+                    if salud["recurrencia"].empty: st.caption("Ningún animal recayó en la misma enfermedad en el periodo.")
+                    else: st.dataframe(salud["recurrencia"], hide_index=True, use_container_width=True,
+                                       column_config={"Último": st.column_config.DateColumn("Última recaída", format="YYYY-MM-DD"),
+                                                      "Mastitis": st.column_config.NumberColumn("Recaídas de mastitis"),
+                                                      "Enfermedades": st.column_config.TextColumn("Enfermedades con recaída")})
+
+                st.markdown("#### 💀 Mortalidad")
+                c_sa5, c_sa6 = st.columns([2, 1])
+                with c_sa5:
+                    grafico_mort = alt.Chart(mortalidad_salud).mark_line(point=True, color="#d32f2f").encode(
+                        x=alt.X("Mes:N"), y=alt.Y("Mortalidad 12 Meses:Q", title="% en 12 meses"),
+                        tooltip=["Mes", "Muertes", "Población", alt.Tooltip("Mortalidad:Q", format=".2f"), alt.Tooltip("Mortalidad 12 Meses:Q", format=".2f")]
+                    ).properties(height=220)
+                    st.altair_chart(grafico_mort, use_container_width=True)
+                with c_sa6:
+                    if salud["causas"].empty: st.caption("Sin muertes en el periodo.")
+                    else: st.dataframe(salud["causas"], hide_index=True, use_container_width=True)
+
+                st.markdown(f"#### 💊 Costo de tratamientos ({moneda_salud})")
+                if salud["costos"].empty: st.info(f"Registra los gastos de sanidad con la categoría '{CATEGORIA_GASTO_SANIDAD}' para calcular costos.")
+                else:
+                    barras_costo = alt.Chart(salud["costos"]).mark_bar().encode(
+                        x=alt.X("Mes:N"), y=alt.Y("Costo:Q", title=moneda_salud), color="Enfermedad:N",
+                        tooltip=["Mes", "Enfermedad", alt.Tooltip("Costo:Q", format=",.2f")]
+                    ).properties(height=250)
+                    st.altair_chart(barras_costo, use_container_width=True)
+                    st.dataframe(salud["costo_enfermedad"], hide_index=True, use_container_width=True,
+                                 column_config={c: st.column_config.NumberColumn(c, format="%,.2f") for c in ["Costo", "Costo por Episodio"]})
+                    st.caption("El gasto de cada mes se reparte entre las enfermedades según los días de tratamiento de sus casos.")
+
+        # ==========================================
+        # 7. ALERTAS AUTOMÁTICAS
         # ==========================================
         with tab_alertas:
             st.header("🔔 Centro de Alertas")
@@ -2072,14 +4968,31 @@ def main():
 
             alertas_generadas = []
 
-            # 1. Alertas de Destete (Becerros >= 210 días)
+            # 0. Ciclo de vida: cambios de categoría y estado pendientes (se aplican solos una vez al día, salvo la clasificación inicial)
+            pendientes_ciclo = transiciones_pendientes(ver_hist, ver_anim, str(date.today()), df, df_hist)
+            with st.expander(f"🔄 Cambios de categoría y estado pendientes ({len(pendientes_ciclo)})", expanded=not pendientes_ciclo.empty):
+                if pendientes_ciclo.empty: st.caption("Todas las categorías y estados están al día.")
+                else:
+                    st.dataframe(pendientes_ciclo, hide_index=True, use_container_width=True)
+                    if st.button(f"✅ Aplicar {len(pendientes_ciclo)} cambios ahora", type="primary"):
+                        aplicar_transiciones(sh, hoja_animales, pendientes_ciclo, date.today())
+                        st.rerun()
+                st.caption(f"Becerras pasan a Novilla a los {EDAD_DESTETE} días, becerros machos a Toro a los {EDAD_TORO} días y "
+                           f"las hembras a Vaca con su primer parto. El estado sigue a chequeos, partos, abortos y el fin de la lactancia. "
+                           f"La *{MOTIVO_CLASIFICACION_INICIAL}* (fichas bovinas sin categoría) solo se aplica con este botón.")
+                cambios_ciclo = eventos_de_tipo(df_hist, list(EVENTO_TRANSICION.values())).sort_values("Fecha_DT", ascending=False)
+                if not cambios_ciclo.empty:
+                    st.markdown("**Últimos cambios registrados**")
+                    st.dataframe(cambios_ciclo[["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas"]].head(20), hide_index=True, use_container_width=True)
+
+            # 1. Alertas de Destete (Becerros >= 210 días que el ciclo de vida no cambia de categoría)
             if not df_activos.empty:
-                becerros = df_activos[df_activos['Tipo'] == 'Becerro']
+                becerros = df_activos[(df_activos['Tipo'] == 'Becerro') & ~df_activos['ID'].astype(str).isin(pendientes_ciclo["ID Animal"])]
                 for _, row in becerros.iterrows():
                     try:
                         nac = pd.to_datetime(row['Nacimiento'])
                         dias_vida = (pd.Timestamp(date.today()) - nac).days
-                        if dias_vida >= 210:
+                        if dias_vida >= EDAD_DESTETE:
                             alertas_generadas.append({
                                 "tipo": "Destete", "animal": f"{row['Nombre']} (ID: {row['ID']})",
                                 "msg": f"Alcanzó la edad de destete ({dias_vida} días).",
@@ -2131,6 +5044,15 @@ def main():
                                     })
                     except: pass
 
+            # 4. Alertas de Vacunación (dosis vencidas según protocolo, una por vacuna)
+            calendario_alertas = calendario_vacunacion(ver_hist, ver_anim, str(date.today()), df, df_hist)
+            for vacuna, vencidas in calendario_alertas[calendario_alertas["Estado"] == "Vencida"]["Vacuna"].value_counts().items():
+                alertas_generadas.append({
+                    "tipo": "Vacunación Vencida", "animal": vacuna,
+                    "msg": f"{vencidas} animal(es) con la dosis vencida. Aplícala desde Vacunación masiva › Pendientes según calendario.",
+                    "icon": "💉", "color": "#7b1fa2"
+                })
+
             # Renderizar Alertas
             if alertas_generadas:
                 for alerta in alertas_generadas:
@@ -2147,49 +5069,54 @@ def main():
                 st.info("✅ Todo al día. No hay alertas pendientes de parto, destete o sanidad.")
 
         # ==========================================
-        # 7. MÓDULO DE REPORTES Y EXPORTACIÓN
+        # 8. MÓDULO DE REPORTES Y EXPORTACIÓN
         # ==========================================
         with tab_reportes:
             st.header("📑 Reportes y Exportación")
-            st.write("Genera y descarga informes de la finca en formato compatible con Excel (.csv) o PDF clínico.")
+            st.write("Genera y descarga informes de la finca en CSV, Parquet, Excel o PDF clínico.")
             
             col_rep1, col_rep2 = st.columns(2)
             
             with col_rep1:
                 st.markdown('<div class="dash-card">', unsafe_allow_html=True)
-                st.subheader("1. Inventario Activo")
-                st.write("Descarga la lista completa de todos los animales actualmente en la finca.")
-                if not df_activos.empty:
-                    csv_inventario = df_activos.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Descargar Inventario (CSV)",
-                        data=csv_inventario,
-                        file_name=f"Inventario_Finca_{date.today()}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
-                else:
-                    st.warning("No hay animales activos para exportar.")
-                st.markdown('</div>', unsafe_allow_html=True)
-
-                st.markdown('<div class="dash-card">', unsafe_allow_html=True)
-                st.subheader("3. Producción Consolidada")
-                st.write("Exporta todos los registros de pesajes y producción de leche.")
-                if not df_hist.empty:
-                    df_prod = df_hist[df_hist['Tipo Evento'].isin(['PESAJE', 'PRODUCCION_LECHE'])]
-                    if not df_prod.empty:
-                        csv_prod = df_prod.to_csv(index=False).encode('utf-8')
+                st.subheader("1. Exportar Datos")
+                st.write("Elige la tabla, las columnas y el formato. El archivo se prepara solo cuando lo pides.")
+                # Cada fuente: (versión de los datos, función que devuelve la tabla)
+                fuentes_exportacion = {
+                    "Inventario Activo": (ver_anim, lambda: df_activos),
+                    "Inventario Completo": (ver_anim, lambda: df),
+                    "Producción (Pesajes y Leche)": (ver_hist, lambda: df_hist[df_hist["Tipo Evento"].isin(["PESAJE", "PRODUCCION_LECHE"])] if not df_hist.empty else df_hist),
+                    "Historial Completo": (ver_hist, lambda: df_hist),
+                    "Libro Mayor": (ver_hist, lambda: libro_mayor(ver_hist, df_hist)["libro"]),
+                }
+                c_exp1, c_exp2 = st.columns(2)
+                with c_exp1: nombre_exp = st.selectbox("Tabla", list(fuentes_exportacion))
+                with c_exp2: formato_exp = st.selectbox("Formato", list(FORMATOS_EXPORTACION))
+                version_exp, obtener_tabla = fuentes_exportacion[nombre_exp]
+                tabla_exp = obtener_tabla()
+
+                if not tabla_exp.empty:
+                    columnas_exp = st.multiselect("Columnas", list(tabla_exp.columns), default=list(tabla_exp.columns))
+                    st.caption(f"{len(tabla_exp):,} filas")
+                    pedido_exp = (nombre_exp, version_exp, tuple(columnas_exp), formato_exp)
+                    if formato_exp == "Excel (XLSX)" and len(tabla_exp) > MAX_FILAS_XLSX:
+                        st.warning("La tabla supera el límite de filas de Excel. Usa CSV o Parquet.")
+                    elif columnas_exp and st.button("⚙️ Preparar archivo", use_container_width=True):
+                        st.session_state.exportacion = pedido_exp
+
+                    if st.session_state.get("exportacion") == pedido_exp:
+                        with st.spinner("Generando archivo..."):
+                            archivo_exp = exportar_tabla(*pedido_exp, tabla_exp)
+                        extension, mime = FORMATOS_EXPORTACION[formato_exp]
                         st.download_button(
-                            label="📥 Descargar Producción (CSV)",
-                            data=csv_prod,
-                            file_name=f"Produccion_Total_{date.today()}.csv",
-                            mime="text/csv",
+                            label=f"📥 Descargar {nombre_exp} ({extension.upper()})",
+                            data=archivo_exp,
+                            file_name=f"{nombre_exp.split(' (')[0].replace(' ', '_')}_{date.today()}.{extension}",
+                            mime=mime,
                             use_container_width=True
                         )
-                    else:
-                        st.warning("No hay registros de producción.")
                 else:
-                    st.info("No hay historial disponible.")
+                    st.warning("No hay datos para exportar en esta tabla.")
                 st.markdown('</div>', unsafe_allow_html=True)
 
             with col_rep2:
@@ -2199,51 +5126,17 @@ def main():
                 
                 animal_reporte = st.selectbox("Seleccione el animal:", lista_ids_todos, key="sel_rep_animal")
                 
-                if animal_reporte and not df.empty and not df_hist.empty:
+                if animal_reporte and not df.empty:
                     try:
-                        info_animal = df[df['ID'] == animal_reporte].iloc[0]
-                        hist_animal = df_hist[df_hist['ID Animal'] == str(animal_reporte)]
-                        hist_medico = hist_animal[hist_animal['Tipo Evento'].isin(['TRATAMIENTO', 'VACUNACION', 'MASTITIS', 'MUERTE'])]
-                        
                         if st.button("📄 Generar PDF Clínico", type="primary", use_container_width=True):
-                            pdf = FPDF()
-                            pdf.add_page()
-                            
-                            pdf.set_font("Arial", 'B', 16)
-                            pdf.cell(200, 10, txt="HISTORIAL CLINICO VETERINARIO", ln=True, align='C')
-                            pdf.ln(5)
-                            
-                            pdf.set_font("Arial", 'B', 12)
-                            pdf.cell(200, 8, txt=f"FECHA DE REPORTE: {date.today()}", ln=True)
-                            pdf.set_font("Arial", '', 12)
-                            pdf.cell(200, 8, txt=f"ANIMAL: {info_animal['Nombre']} (ID: {info_animal['ID']})", ln=True)
-                            pdf.cell(200, 8, txt=f"RAZA: {info_animal['Raza']} | SEXO: {info_animal['Sexo']} | NAC: {info_animal['Nacimiento']}", ln=True)
-                            pdf.cell(200, 8, txt=f"ESTADO ACTUAL: {info_animal['Estado']}", ln=True)
-                            pdf.ln(5)
-                            
-                            pdf.set_font("Arial", 'B', 14)
-                            pdf.cell(200, 10, txt="REGISTROS MEDICOS:", ln=True)
-                            
-                            if hist_medico.empty:
-                                pdf.set_font("Arial", '', 12)
-                                pdf.cell(200, 8, txt="No se encontraron registros medicos para este animal.", ln=True)
-                            else:
-                                for _, ev in hist_medico.iterrows():
-                                    pdf.set_font("Arial", 'B', 12)
-                                    pdf.cell(200, 8, txt=f"[{ev['Fecha']}] {ev['Tipo Evento']}", ln=True)
-                                    pdf.set_font("Arial", '', 12)
-                                    pdf.multi_cell(0, 8, txt=f"Detalle: {ev['Detalle 1']} | {ev['Detalle 2']}")
-                                    if str(ev['Notas']).strip():
-                                        pdf.multi_cell(0, 8, txt=f"Notas: {ev['Notas']}")
-                                    pdf.ln(2)
-                            
-                            pdf_bytes = pdf.output(dest='S').encode('latin-1')
+                            pdf_bytes = pdfs_clinicos([animal_reporte], ver_hist, ver_anim, df, df_hist)[animal_reporte]
+                            ficha_pdf = historias_clinicas(ver_hist, ver_anim, df, df_hist)[animal_reporte][0]
                             
                             st.success("✅ PDF Generado con éxito.")
                             st.download_button(
                                 label="⬇️ Haz clic aquí para descargar el PDF",
                                 data=pdf_bytes,
-                                file_name=f"Historial_{info_animal['Nombre']}_{info_animal['ID']}.pdf",
+                                file_name=nombre_pdf_clinico(ficha_pdf),
                                 mime="application/pdf",
                                 use_container_width=True
                             )
@@ -2251,5 +5144,57 @@ def main():
                         st.error(f"Error al generar PDF: {e}")
                 st.markdown('</div>', unsafe_allow_html=True)
 
+                st.markdown('<div class="dash-card">', unsafe_allow_html=True)
+                st.subheader("3. Historiales Clínicos por Grupo")
+                st.write("Genera los historiales de varios animales a la vez (ej. para una auditoría veterinaria).")
+                if not df.empty:
+                    c_gr1, c_gr2 = st.columns(2)
+                    with c_gr1: criterio_grupo = st.selectbox("Agrupar por", ["Todos", "Lote", "Categoría"], key="pdf_criterio")
+                    columna_grupo = {"Lote": "Lote", "Categoría": "Tipo"}.get(criterio_grupo)
+                    with c_gr2:
+                        if columna_grupo and columna_grupo in df.columns:
+                            valor_grupo = st.selectbox(criterio_grupo, sorted(df[columna_grupo].astype(str).unique()), key="pdf_valor_grupo")
+                        else:
+                            valor_grupo = None
+                            if columna_grupo: st.caption(f"*({criterio_grupo} no disponible en BD)*")
+                    incluir_vendidos = st.checkbox("Incluir animales vendidos", key="pdf_vendidos")
+                    salida_grupo = st.radio("Salida", ["ZIP (un PDF por animal)", "PDF único"], horizontal=True, key="pdf_salida")
+
+                    grupo = df if incluir_vendidos else df_activos
+                    if columna_grupo and valor_grupo is not None and not grupo.empty:
+                        grupo = grupo[grupo[columna_grupo].astype(str) == valor_grupo]
+                    ids_grupo = grupo["ID"].astype(str).tolist() if not grupo.empty else []
+                    st.caption(f"{len(ids_grupo)} animales en el grupo")
+
+                    pedido_pdf = (tuple(ids_grupo), salida_grupo, ver_hist, ver_anim, str(date.today()))
+                    if ids_grupo and st.button("📚 Generar Historiales", type="primary", use_container_width=True):
+                        barra_pdf = st.progress(0.0, text="Generando historiales...")
+                        try:
+                            pdfs = pdfs_clinicos(ids_grupo, ver_hist, ver_anim, df, df_hist,
+                                                 lambda hechos, total: barra_pdf.progress(hechos / total, text=f"Generando historiales... {hechos}/{total}"))
+                            historias = historias_clinicas(ver_hist, ver_anim, df, df_hist)
+                            if salida_grupo == "PDF único":
+                                archivo_pdf = reportes_pdf.unir_pdfs([pdfs[i] for i in ids_grupo if i in pdfs])
+                            else:
+                                archivo_pdf = reportes_pdf.comprimir_zip({nombre_pdf_clinico(historias[i][0]): pdfs[i] for i in ids_grupo if i in pdfs})
+                            st.session_state.pdf_grupo = (pedido_pdf, archivo_pdf)
+                        except Exception as e:
+                            st.error(f"Error al generar los historiales: {e}")
+                        barra_pdf.empty()
+
+                    pdf_listo = st.session_state.get("pdf_grupo")
+                    if pdf_listo and pdf_listo[0] == pedido_pdf:
+                        es_zip = salida_grupo.startswith("ZIP")
+                        st.download_button(
+                            label=f"⬇️ Descargar {'ZIP' if es_zip else 'PDF'} ({len(ids_grupo)} animales)",
+                            data=pdf_listo[1],
+                            file_name=f"Historiales_{(valor_grupo or 'Hato').replace(' ', '_')}_{date.today()}.{'zip' if es_zip else 'pdf'}",
+                            mime="application/zip" if es_zip else "application/pdf",
+                            use_container_width=True
+                        )
+                else:
+                    st.info("No hay animales registrados.")
+                st.markdown('</div>', unsafe_allow_html=True)
+
 if __name__ == "__main__":
     main()
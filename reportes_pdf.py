@@ -0,0 +1,241 @@
+"""Historiales clínicos en PDF.
+
+Vive en su propio módulo para que los procesos del pool de generación masiva puedan importar
+la función de renderizado (el script que ejecuta Streamlit no es importable desde otro proceso).
+
+El texto se escribe con una fuente TrueType Unicode incrustada en el PDF (DejaVu Sans), así
+nombres con tildes, ñ o símbolos en las notas no rompen el reporte. La fuente se busca una sola
+vez por proceso; si no hay ninguna instalada se usa Helvetica y se reemplazan los caracteres
+que no puede representar.
+
+fpdf2 vuelve a leer la fuente completa en cada documento (al guardarlo la recorta en el sitio, así
+que no se puede compartir entre PDFs). Para abaratarlo, cada proceso prepara una sola vez una copia
+reducida a los alfabetos y símbolos que usan los registros, y los documentos cargan esa copia.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+
+from fontTools import subset
+from fpdf import FPDF
+from fpdf.fonts import FontFace
+from pypdf import PdfWriter
+
+log = logging.getLogger("control_ganadero")
+
+# Por debajo de este número de animales no compensa levantar procesos
+MIN_PDFS_PARA_POOL = 4
+
+FAMILIA_UNICODE = "DejaVu"
+# Pares (regular, negrita) candidatos, en orden de preferencia
+ARCHIVOS_FUENTE = [("DejaVuSans.ttf", "DejaVuSans-Bold.ttf"), ("arial.ttf", "arialbd.ttf")]
+DIRECTORIOS_FUENTE = [
+    os.environ.get("FUENTES_PDF", ""),
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fuentes"),
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/TTF",
+    "/usr/share/fonts/dejavu",
+    "/Library/Fonts",
+    "C:/Windows/Fonts",
+]
+
+# Latín (con extendidos), griego, cirílico, puntuación, monedas, flechas, operadores, formas y símbolos varios
+RANGOS_UNICODE = ("U+0020-024F, U+0300-036F, U+0370-03FF, U+0400-04FF, U+2000-206F, U+20A0-20CF, U+2100-214F, "
+                  "U+2190-21FF, U+2200-22FF, U+2500-25FF, U+2600-27BF")
+DIRECTORIO_FUENTES_REDUCIDAS = os.path.join(tempfile.gettempdir(), "fuentes_pdf")
+
+COLOR_ENCABEZADO = (25, 118, 210)
+COLUMNAS_EVENTOS = [("Fecha", 24), ("Evento", 30), ("Detalle", 76), ("Notas", 60)]
+
+
+@lru_cache(maxsize=1)
+def fuente_unicode():
+    """Rutas (regular, negrita) de la primera fuente Unicode disponible, o None. Se resuelve una vez por proceso."""
+    for directorio in filter(None, DIRECTORIOS_FUENTE):
+        for regular, negrita in ARCHIVOS_FUENTE:
+            ruta_regular, ruta_negrita = os.path.join(directorio, regular), os.path.join(directorio, negrita)
+            if os.path.isfile(ruta_regular):
+                return ruta_regular, ruta_negrita if os.path.isfile(ruta_negrita) else ruta_regular
+    return None
+
+
+def reducir_fuente(ruta):
+    """Copia de la fuente limitada a RANGOS_UNICODE, guardada junto a las de otros procesos.
+
+    El nombre lleva una huella de la ruta, su fecha de modificación y los rangos, así que se genera
+    una vez por máquina y se rehace sola si cambia la fuente. Se escribe a un temporal y se renombra
+    para que dos procesos que la preparan a la vez no lean un archivo a medias.
+    """
+    huella = hashlib.sha1(f"{ruta}|{os.path.getmtime(ruta)}|{RANGOS_UNICODE}".encode("utf-8")).hexdigest()[:12]
+    destino = os.path.join(DIRECTORIO_FUENTES_REDUCIDAS, f"{huella}-{os.path.basename(ruta)}")
+    if os.path.isfile(destino):
+        return destino
+    opciones = subset.Options()
+    opciones.layout_features = ["*"]
+    opciones.name_IDs = ["*"]
+    opciones.glyph_names = True
+    opciones.notdef_outline = True
+    opciones.drop_tables += ["FFTM"]
+    fuente = subset.load_font(ruta, opciones)
+    recorte = subset.Subsetter(opciones)
+    recorte.populate(unicodes=subset.parse_unicodes(RANGOS_UNICODE))
+    recorte.subset(fuente)
+    os.makedirs(DIRECTORIO_FUENTES_REDUCIDAS, exist_ok=True)
+    temporal = f"{destino}.{os.getpid()}.tmp"
+    subset.save_font(fuente, temporal, opciones)
+    os.replace(temporal, destino)
+    return destino
+
+
+@lru_cache(maxsize=1)
+def fuente_documentos():
+    """Rutas (regular, negrita) que cargan los documentos: la fuente Unicode reducida, o la completa si
+    no se pudo reducir. Se resuelve una vez por proceso (es el inicializador del pool)."""
+    fuente = fuente_unicode()
+    if not fuente:
+        return None
+    try:
+        return tuple(reducir_fuente(ruta) for ruta in fuente)
+    except Exception as e:
+        log.warning("No se pudo reducir la fuente %s, se usa completa: %s", fuente[0], e)
+        return fuente
+
+
+class PlantillaClinica(FPDF):
+    """Página base de los reportes: encabezado con el animal en cada página y pie con numeración."""
+
+    def __init__(self, titulo, subtitulo, fecha_reporte):
+        super().__init__(format="A4")
+        self.titulo, self.subtitulo, self.fecha_reporte = titulo, subtitulo, fecha_reporte
+        fuente = fuente_documentos()
+        if fuente:
+            self.add_font(FAMILIA_UNICODE, "", fuente[0])
+            self.add_font(FAMILIA_UNICODE, "B", fuente[1])
+            self.familia = FAMILIA_UNICODE
+        else:
+            self.familia = "Helvetica"
+        self.set_auto_page_break(auto=True, margin=15)
+        self.set_title(titulo)
+
+    def texto(self, valor):
+        """Con la fuente Unicode el texto va tal cual; con Helvetica se reemplaza lo que no es latin-1."""
+        valor = "" if valor is None else str(valor)
+        if self.familia == FAMILIA_UNICODE:
+            return valor
+        return valor.encode("latin-1", "replace").decode("latin-1")
+
+    def header(self):
+        self.set_font(self.familia, "B", 14)
+        self.set_text_color(*COLOR_ENCABEZADO)
+        self.cell(0, 8, self.texto(self.titulo), new_x="LMARGIN", new_y="NEXT", align="C")
+        self.set_font(self.familia, "", 9)
+        self.set_text_color(100, 100, 100)
+        self.cell(0, 5, self.texto(f"{self.subtitulo}  |  Fecha de reporte: {self.fecha_reporte}"), new_x="LMARGIN", new_y="NEXT", align="C")
+        self.set_text_color(0, 0, 0)
+        self.ln(3)
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font(self.familia, "", 8)
+        self.set_text_color(130, 130, 130)
+        self.cell(0, 8, f"Página {self.page_no()}/{{nb}}", align="C")
+
+    def ficha(self, filas):
+        """Bloque de datos del animal: lista de (etiqueta, valor)."""
+        for etiqueta, valor in filas:
+            self.set_font(self.familia, "B", 10)
+            self.cell(35, 6, self.texto(etiqueta))
+            self.set_font(self.familia, "", 10)
+            self.cell(0, 6, self.texto(valor), new_x="LMARGIN", new_y="NEXT")
+        self.ln(3)
+
+    def tabla_eventos(self, titulo, eventos):
+        """Lista de eventos como tabla; los encabezados se repiten en cada página."""
+        self.set_font(self.familia, "B", 12)
+        self.cell(0, 8, self.texto(titulo), new_x="LMARGIN", new_y="NEXT")
+        if not eventos:
+            self.set_font(self.familia, "", 10)
+            self.cell(0, 7, "No se encontraron registros médicos para este animal.", new_x="LMARGIN", new_y="NEXT")
+            return
+        self.set_font(self.familia, "", 9)
+        with self.table(
+            col_widths=[ancho for _, ancho in COLUMNAS_EVENTOS],
+            text_align="LEFT",
+            line_height=5,
+            repeat_headings=1,
+            headings_style=FontFace(emphasis="BOLD", color=(255, 255, 255), fill_color=COLOR_ENCABEZADO),
+            cell_fill_color=(245, 245, 245),
+            cell_fill_mode="ROWS",
+        ) as tabla:
+            tabla.row([nombre for nombre, _ in COLUMNAS_EVENTOS])
+            for ev in eventos:
+                detalle = " | ".join(p for p in (str(ev.get("Detalle 1", "")).strip(), str(ev.get("Detalle 2", "")).strip()) if p)
+                tabla.row([self.texto(ev.get("Fecha", "")), self.texto(ev.get("Tipo Evento", "")),
+                           self.texto(detalle), self.texto(str(ev.get("Notas", "")).strip())])
+
+
+def pdf_historial_clinico(info, eventos, fecha_reporte):
+    """PDF de un animal. info: dict con su ficha; eventos: lista de dicts del Historial."""
+    pdf = PlantillaClinica("HISTORIAL CLÍNICO VETERINARIO", f"{info.get('Nombre', '')} (ID: {info.get('ID', '')})", fecha_reporte)
+    pdf.add_page()
+    pdf.ficha([
+        ("Animal", f"{info.get('Nombre', '')} (ID: {info.get('ID', '')})"),
+        ("Raza", info.get("Raza", "")),
+        ("Sexo", info.get("Sexo", "")),
+        ("Nacimiento", info.get("Nacimiento", "")),
+        ("Estado actual", info.get("Estado", "")),
+    ])
+    pdf.tabla_eventos(f"Registros médicos ({len(eventos)})", eventos)
+    return bytes(pdf.output())
+
+
+def _renderizar(trabajo):
+    clave, info, eventos, fecha_reporte = trabajo
+    return clave, pdf_historial_clinico(info, eventos, fecha_reporte)
+
+
+def generar_pdfs(trabajos, al_avanzar=None, procesos=None):
+    """Renderiza varios historiales en un pool de procesos.
+
+    trabajos: lista de (clave, info, eventos, fecha_reporte). al_avanzar(hechos, total) recibe el
+    progreso. Devuelve {clave: bytes}.
+    """
+    resultados = {}
+    if len(trabajos) < MIN_PDFS_PARA_POOL:
+        for i, trabajo in enumerate(trabajos, 1):
+            clave, pdf = _renderizar(trabajo)
+            resultados[clave] = pdf
+            if al_avanzar: al_avanzar(i, len(trabajos))
+        return resultados
+
+    with ProcessPoolExecutor(max_workers=procesos or min(len(trabajos), os.cpu_count() or 1), initializer=fuente_documentos) as pool:
+        futuros = [pool.submit(_renderizar, trabajo) for trabajo in trabajos]
+        for i, futuro in enumerate(as_completed(futuros), 1):
+            clave, pdf = futuro.result()
+            resultados[clave] = pdf
+            if al_avanzar: al_avanzar(i, len(trabajos))
+    return resultados
+
+
+def unir_pdfs(lista_pdfs):
+    """Une varios PDF (bytes) en uno solo, en el orden recibido."""
+    escritor = PdfWriter()
+    for pdf in lista_pdfs:
+        escritor.append(io.BytesIO(pdf))
+    salida = io.BytesIO()
+    escritor.write(salida)
+    return salida.getvalue()
+
+
+def comprimir_zip(archivos):
+    """ZIP en memoria a partir de {nombre de archivo: bytes}."""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nombre, contenido in archivos.items():
+            zf.writestr(nombre, contenido)
+    return salida.getvalue()
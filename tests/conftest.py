@@ -0,0 +1,16 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+@pytest.fixture(autouse=True)
+def caches_limpias():
+    """Cada prueba arranca sin lo que dejaron en st.cache_data / st.cache_resource las anteriores."""
+    yield
+    main = sys.modules.get("main")
+    if main is not None:
+        main.st.cache_data.clear()
+        main.st.cache_resource.clear()
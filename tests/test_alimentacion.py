@@ -0,0 +1,121 @@
+"""Pruebas del inventario de alimentos, las raciones y el costo de alimentación por lote."""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def entrada(fecha, alimento, kg, costo):
+    return [fecha, "ALIMENTO_ENTRADA", "FINCA", f"Alimento: {alimento}", f"Cantidad: {kg} kg | Costo: {costo} | Moneda: USD"]
+
+
+def salida(fecha, alimento, lote, kg):
+    return [fecha, "ALIMENTO_SALIDA", "FINCA", f"Alimento: {alimento} | Lote: {lote}", f"Cantidad: {kg} kg"]
+
+
+@pytest.fixture
+def cuentas():
+    return pd.DataFrame({"Nombre": ["Caja"], "Moneda": ["USD ($)"], "Saldo": ["1000"]})
+
+
+@pytest.fixture
+def hato():
+    return pd.DataFrame({"ID": ["1", "2", "3"], "Lote": ["Lote 1", "Lote 1", "General"], "Estado": "Sano",
+                         "Peso": ["230", "400", "150"], "Nacimiento": "", "PesoNac": ""})
+
+
+@pytest.fixture
+def hist_alimento():
+    return historial([
+        entrada("2025-01-01", "Maíz", 1000, 500),
+        salida("2025-01-15", "Maíz", "Lote 1", 800),
+        entrada("2025-02-01", "Maíz", 1000, 700),
+        salida("2025-02-15", "Maíz", "Lote 1", 400),
+        # Una salida anterior a la primera entrada toma el costo de esa entrada
+        salida("2024-12-20", "Heno", "General", 50),
+        entrada("2025-01-05", "Heno", 100, 30),
+        ["2025-01-01", "PESAJE", "1", "200"],
+        ["2025-01-31", "PESAJE", "1", "230"],
+        ["2025-01-10", "PRODUCCION_LECHE", "2", "100", "Mañana"],
+        ["2025-01-10", "PRODUCCION_LECHE", "LOTE_GENERAL", "500", "Total"],
+    ])
+
+
+def test_inventario_valora_las_salidas_al_promedio_movil(hist_alimento, cuentas):
+    inv = main.inventario_alimentos("v1", "c1", "USD", hist_alimento, cuentas)
+    salidas = inv["salidas"]
+    # Tras la primera salida quedan 200 kg a 0.5; la segunda entrada se promedia con ellos: 800 / 1200
+    assert salidas["Costo Unitario"].tolist() == pytest.approx([0.3, 0.5, 800 / 1200])
+    assert salidas["Costo Reporte"].tolist() == pytest.approx([15, 400, 400 * 800 / 1200])
+    stock = inv["stock"].set_index("Alimento")
+    assert stock["Stock (kg)"].to_dict() == {"Heno": 50, "Maíz": 800}
+    assert stock["Valor Stock"].to_dict() == pytest.approx({"Heno": 15, "Maíz": 800 * 800 / 1200})
+    assert stock.loc["Maíz", "Costo Promedio"] == pytest.approx(800 / 1200)
+
+
+def test_salida_sin_stock_la_repone_la_entrada_siguiente(cuentas):
+    hist = historial([
+        entrada("2025-01-01", "Sorgo", 100, 100),
+        salida("2025-01-10", "Sorgo", "Lote 1", 150),
+        entrada("2025-01-20", "Sorgo", 100, 200),
+        salida("2025-01-25", "Sorgo", "Lote 1", 50),
+    ])
+    inv = main.inventario_alimentos("v1", "c1", "USD", hist, cuentas)
+    # Los 50 kg que faltaron se costearon a 1.0; la entrada a 2.0 los cubre y el resto queda a 2.0
+    assert inv["salidas"]["Costo Reporte"].tolist() == pytest.approx([150, 100])
+    stock = inv["stock"].set_index("Alimento")
+    assert stock.loc["Sorgo", "Stock (kg)"] == 0 and stock.loc["Sorgo", "Valor Stock"] == 0
+
+
+def test_inventario_sin_movimientos(cuentas):
+    inv = main.inventario_alimentos("v0", "c1", "USD", historial([]), cuentas)
+    assert inv["salidas"].empty and inv["stock"].empty
+
+
+def test_raciones_vigentes_y_consumo():
+    hist = historial([
+        ["2025-01-01", "RACION", "", "Lote: Lote 1 | Alimento: Maíz", "Kg por animal/día: 3.5"],
+        ["2025-02-01", "RACION", "", "Lote: Lote 1 | Alimento: Maíz", "Kg por animal/día: 4"],
+        ["2025-01-01", "RACION", "", "Lote: Lote 2 | Alimento: Maíz", "Kg por animal/día: 2"],
+        ["2025-02-01", "RACION", "", "Lote: Lote 2 | Alimento: Maíz", "Kg por animal/día: 0"],
+        ["2025-01-01", "RACION", "", "Lote: General | Alimento: Heno", "Kg por animal/día: 1.5"],
+    ])
+    raciones = main.raciones_vigentes(hist)
+    assert sorted(zip(raciones["Lote"], raciones["Kg por Animal"])) == [("General", 1.5), ("Lote 1", 4.0)]
+
+    consumo = main.consumo_por_raciones(raciones, {"Lote 1": ["1", "2"], "General": ["3"], "Lote 2": ["4"]}, dias=7)
+    assert dict(zip(consumo["Lote"], consumo["Kg"])) == {"Lote 1": 56.0, "General": 10.5}
+
+
+def test_registrar_consumo_en_un_solo_append(monkeypatch):
+    monkeypatch.setattr(main, "invalidar_datos", lambda *hojas: None)
+    filas = []
+    hoja = type("Hoja", (), {"append_rows": lambda self, bloque: filas.extend(bloque)})()
+    libro = type("Libro", (), {"worksheet": lambda self, nombre: hoja})()
+    consumo = pd.DataFrame({"Alimento": ["Maíz", "Heno"], "Lote": ["Lote 1", "General"], "Kg": [56.0, 10.5]})
+
+    assert main.registrar_consumo(libro, consumo, date(2025, 3, 1)) == 2
+    assert [fila[:6] for fila in filas] == [
+        ["2025-03-01", "ALIMENTO_SALIDA", "FINCA", "Alimento: Maíz | Lote: Lote 1", "Cantidad: 56.00 kg", "Según ración"],
+        ["2025-03-01", "ALIMENTO_SALIDA", "FINCA", "Alimento: Heno | Lote: General", "Cantidad: 10.50 kg", "Según ración"],
+    ]
+
+
+def test_costos_por_lote_y_mes(hato, hist_alimento, cuentas):
+    tabla = main.costos_alimentacion("v1", "a1", "c1", "USD", hato, hist_alimento, cuentas).set_index(["Lote", "Mes"])
+    enero = tabla.loc[("Lote 1", "2025-01")]
+    assert (enero["Costo Alimento"], enero["Kg Ganados"], enero["Litros"]) == pytest.approx((400, 30, 100))
+    assert enero["Costo por Kg Ganado"] == pytest.approx(400 / 30) and enero["Costo por Litro"] == pytest.approx(4)
+    assert tabla.loc[("Lote 1", "2025-02"), "Costo Alimento"] == pytest.approx(400 * 800 / 1200)
+    assert pd.isna(tabla.loc[("Lote 1", "2025-02"), "Costo por Litro"])
@@ -0,0 +1,110 @@
+"""Pruebas de la lectura de básculas: parseo, agrupación de lecturas y el simulador TCP."""
+import socket
+import time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import bascula
+
+
+@pytest.mark.parametrize("linea, esperado", [
+    ("982000123456789,452.5", ("982000123456789", 452.5)),
+    ("982 000123456789 452.5 kg", ("982000123456789", 452.5)),
+    ("  a-12;300,5KG  ", ("A12", 300.5)),
+    ("982000123456789\t87", ("982000123456789", 87.0)),
+])
+def test_parsear_lectura(linea, esperado):
+    assert bascula.parsear_lectura(linea) == esperado
+
+
+@pytest.mark.parametrize("linea", ["", "ST,GS,+000452.5kg", "982000123456789", "982000123456789,0", ", 300"])
+def test_lecturas_invalidas(linea):
+    assert bascula.parsear_lectura(linea) is None
+
+
+def test_normalizar_identificador():
+    assert bascula.normalizar_identificador(" 982 000-123 ab ") == "982000123AB"
+
+
+def test_agrupador_emite_la_mediana_al_cambiar_de_animal():
+    agrupador = bascula.AgrupadorLecturas(segundos_estable=2)
+    assert agrupador.agregar("A", 450.0, momento=0) is None
+    assert agrupador.agregar("A", 470.0, momento=0.5) is None
+    assert agrupador.agregar("A", 452.0, momento=1) is None
+    pesada = agrupador.agregar("B", 300.0, momento=1.5)
+    assert (pesada.identificador, pesada.peso, pesada.muestras, pesada.momento) == ("A", 452.0, 3, 1)
+    # Sin lecturas nuevas durante el tiempo de estabilidad la pesada en curso se cierra sola
+    assert agrupador.vencida(momento=3) is None
+    pesada = agrupador.vencida(momento=3.5)
+    assert (pesada.identificador, pesada.peso, pesada.muestras) == ("B", 300.0, 1)
+    assert agrupador.vencida(momento=10) is None and agrupador.cerrar() is None
+
+
+def test_ida_y_vuelta_con_el_simulador():
+    ids = ["982000000000001", "982000000000002", "982000000000003"]
+    simulador = bascula.SimuladorBascula(ids, intervalo=0.08, repeticiones=3, rango_peso=(300.0, 400.0), semilla=7)
+    simulador.start()
+    lector = bascula.LectorBascula(simulador.origen, segundos_estable=0.5)
+    lector.start()
+    pesadas = []
+    limite = time.time() + 10
+    while len(pesadas) < len(ids) and time.time() < limite:
+        pesadas.extend(lector.drenar())
+        time.sleep(0.05)
+    lector.detener()
+
+    assert [p.identificador for p in pesadas] == ids
+    assert all(p.muestras == 3 and 298.5 <= p.peso <= 401.5 for p in pesadas)
+    assert simulador.enviadas == len(ids) and lector.lecturas == 3 * len(ids)
+
+
+def puerto_cerrado():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_esperas_de_reconexion_se_duplican_hasta_el_maximo(monkeypatch):
+    monkeypatch.setattr(bascula, "SEGUNDOS_RECONEXION", 3.0)
+    monkeypatch.setattr(bascula, "SEGUNDOS_RECONEXION_MAX", 20.0)
+    lector = bascula.LectorBascula("tcp://127.0.0.1:1")
+    esperas = []
+    monkeypatch.setattr(lector.detenido, "wait", esperas.append)
+    for fallos in range(5):
+        lector.fallos = fallos
+        lector.esperar_reconexion()
+    assert esperas == [3.0, 3.0, 6.0, 12.0, 20.0]
+
+
+def test_se_rinde_tras_los_intentos_seguidos(monkeypatch):
+    monkeypatch.setattr(bascula, "SEGUNDOS_RECONEXION", 0.01)
+    monkeypatch.setattr(bascula, "INTENTOS_RECONEXION", 3)
+    lector = bascula.LectorBascula(f"tcp://127.0.0.1:{puerto_cerrado()}")
+    lector.start()
+    lector.join(timeout=5)
+    assert not lector.is_alive()
+    assert lector.fallos == 3 and lector.error.startswith("Sin conexión tras 3 intentos")
+
+
+@pytest.fixture
+def main():
+    pytest.importorskip("streamlit")
+    pytest.importorskip("gspread")
+    import main
+    return main
+
+
+def test_pesadas_resueltas_por_chip_arete_o_id(main):
+    hato = pd.DataFrame({"ID": ["1", "2", "3"], "Chip": ["982 000 000 000 001", "", ""], "Arete": ["A-1", "b-2", ""]})
+    indice = main.indice_identificadores("v1", hato)
+    assert indice.to_dict() == {"982000000000001": "1", "A1": "1", "B2": "2", "1": "1", "2": "2", "3": "3"}
+
+    pesadas = [bascula.Pesada("982000000000001", 450.5, 3, 1000.0), bascula.Pesada("B2", 300.0, 2, 1010.0),
+               bascula.Pesada("X9", 280.0, 1, 1020.0), bascula.Pesada("A1", 452.0, 4, 1030.0)]
+    t = main.resolver_pesadas(pesadas, indice, date(2025, 3, 1))
+    assert t["ID Animal"].tolist() == ["1", "2", "", "1"]
+    assert t["Resultado"].tolist() == ["Repetido (vale la última)", "Nuevo", "No registrado", "Nuevo"]
+    assert t["Peso"].tolist() == ["450.5", "300.0", "280.0", "452.0"]
+    assert (t["Fecha"] == "2025-03-01").all() and (t["Notas"] == "Báscula").all()
@@ -0,0 +1,129 @@
+"""Pruebas del ciclo de vida: transiciones automáticas de categoría y estado."""
+import threading
+from datetime import date
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+HOY = "2026-10-19"
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+class HojaFalsa:
+    """Hoja con la interfaz de gspread que usan las escrituras; guarda las llamadas en orden."""
+
+    def __init__(self, ids=(), llamadas=None, falla=False):
+        self.ids, self.falla = list(ids), falla
+        self.llamadas = [] if llamadas is None else llamadas
+
+    def col_values(self, columna):
+        return ["ID"] + self.ids
+
+    def batch_update(self, cambios):
+        if self.falla:
+            raise RuntimeError("API caída")
+        self.llamadas.append(("batch_update", cambios))
+
+    def append_rows(self, filas):
+        self.llamadas.append(("append_rows", filas))
+
+
+class LibroFalso:
+    def __init__(self, hoja):
+        self.hoja = hoja
+
+    def worksheet(self, nombre):
+        return self.hoja
+
+
+@pytest.fixture
+def sin_versiones(monkeypatch):
+    monkeypatch.setattr(main, "invalidar_datos", lambda nombre: None)
+
+
+@pytest.fixture
+def hato_ciclo():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3", "4", "5", "6", "7", "8"],
+        "Tipo": ["Becerro", "Becerro", "Novilla", "Vaca", "Bovino", "Vaca", "Equino", "Porcino"],
+        "Nombre": list("abcdefgh"),
+        "Sexo": ["Hembra", "Macho", "Hembra", "Hembra", "Hembra", "Hembra", "Hembra", "Macho"],
+        "Nacimiento": ["2026-01-01", "2024-01-01", "2023-01-01", "2019-01-01", "2020-01-01", "2019-01-01", "2020-01-01", "2020-01-01"],
+        "Estado": ["Sano", "Sano", "Lactancia", "Sano", "Sano", "VENDIDO", "Sano", "Sano"],
+    })
+
+
+@pytest.fixture
+def hist_ciclo():
+    return historial([
+        ["2026-09-01", "PARTO", "3"],
+        ["2026-06-01", "FECUNDACION", "4"],
+        # Cambio de estado entre el servicio y el chequeo: no debe tapar la preñez
+        ["2026-07-01", "CAMBIO_ESTADO", "4", "De: Lactancia", "A: Sano"],
+        ["2026-08-01", "CHEQUEO_REPRO", "4", "Preñada"],
+    ])
+
+
+def test_transiciones_pendientes(hato_ciclo, hist_ciclo):
+    pendientes = main.transiciones_pendientes("v1", "a1", HOY, hato_ciclo, hist_ciclo)
+    cambios = {(fila["ID Animal"], fila["Campo"]): (fila["Nuevo"], fila["Motivo"]) for _, fila in pendientes.iterrows()}
+    assert cambios == {
+        ("1", "Tipo"): ("Novilla", f"Destete ({main.EDAD_DESTETE} días)"),
+        ("2", "Tipo"): ("Toro", f"Edad reproductiva ({main.EDAD_TORO} días)"),
+        ("3", "Tipo"): ("Vaca", "Primer parto"),
+        ("4", "Estado"): ("Preñada", "Chequeo positivo"),
+        ("5", "Tipo"): ("Novilla", main.MOTIVO_CLASIFICACION_INICIAL),
+    }
+    # Las otras especies no se clasifican como bovinos
+    assert not pendientes["ID Animal"].isin(["7", "8"]).any()
+    assert pendientes.set_index("ID Animal").loc["4", "Actual"] == "Sano"
+
+
+def test_transiciones_sin_datos(hato_ciclo):
+    assert main.transiciones_pendientes("v0", "a0", HOY, pd.DataFrame(), pd.DataFrame()).empty
+    # Sin historial solo queda lo que sale de la edad
+    solo_edad = main.transiciones_pendientes("v0", "a1", HOY, hato_ciclo, pd.DataFrame())
+    assert set(solo_edad["Campo"]) == {"Tipo"}
+
+
+def test_aplicar_transiciones_registra_eventos_antes_que_la_ficha(hato_ciclo, hist_ciclo, sin_versiones):
+    pendientes = main.transiciones_pendientes("v1", "a1", HOY, hato_ciclo, hist_ciclo)
+    llamadas = []
+    historial_hoja, animales = HojaFalsa(llamadas=llamadas), HojaFalsa(hato_ciclo["ID"], llamadas)
+    assert main.aplicar_transiciones(LibroFalso(historial_hoja), animales, pendientes, HOY) == len(pendientes)
+    assert [llamada for llamada, _ in llamadas] == ["append_rows", "batch_update"]
+    escrituras = dict(llamadas)
+    assert {c["range"]: c["values"][0][0] for c in escrituras["batch_update"]} == {
+        "B2": "Novilla", "B3": "Toro", "B4": "Vaca", "I5": "Preñada", "B6": "Novilla"}
+    eventos = escrituras["append_rows"]
+    assert {fila[1] for fila in eventos} == {"CAMBIO_CATEGORIA", "CAMBIO_ESTADO"}
+    assert ["2026-10-19", "CAMBIO_ESTADO", "4", "De: Sano", "A: Preñada", "Chequeo positivo"] in [fila[:6] for fila in eventos]
+    assert main.aplicar_transiciones(LibroFalso(historial_hoja), animales, pendientes.iloc[:0], HOY) == 0
+
+
+def test_ciclo_vida_diario_no_aplica_la_clasificacion_inicial(hato_ciclo, hist_ciclo, sin_versiones, monkeypatch):
+    estado = {"fecha": None, "lock": threading.Lock()}
+    monkeypatch.setattr(main, "estado_ciclo_vida", lambda: estado)
+    llamadas = []
+    libro = LibroFalso(HojaFalsa(llamadas=llamadas))
+
+    # Si falla la escritura el día no queda marcado y el lock se libera
+    with pytest.raises(RuntimeError):
+        main.ciclo_vida_diario(libro, HojaFalsa(hato_ciclo["ID"], falla=True), "v1", "a1", hato_ciclo, hist_ciclo)
+    assert estado["fecha"] is None and not estado["lock"].locked()
+
+    llamadas.clear()
+    assert main.ciclo_vida_diario(libro, HojaFalsa(hato_ciclo["ID"], llamadas), "v1", "a1", hato_ciclo, hist_ciclo) == 4
+    assert main.MOTIVO_CLASIFICACION_INICIAL not in {fila[5] for fila in llamadas[0][1]}
+    assert estado["fecha"] == str(date.today())
+    # Segunda carga del día: no hace nada
+    assert main.ciclo_vida_diario(libro, HojaFalsa(hato_ciclo["ID"]), "v1", "a1", hato_ciclo, hist_ciclo) == 0
@@ -0,0 +1,69 @@
+"""Pruebas del planificador de cruces toro × vaca."""
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+@pytest.fixture
+def hato_cruces():
+    return pd.DataFrame({
+        "ID": ["10", "11", "12", "20", "21", "22", "23", "24"],
+        "Nombre": ["Toro A", "Toro B", "Toro C", "Hija C", "Vaca B", "Preñada", "Vendida", "Servida"],
+        "Tipo": ["Toro", "Toro", "Toro", "Vaca", "Vaca", "Vaca", "Vaca", "Novilla"],
+        "Sexo": ["Macho", "Macho", "Macho", "Hembra", "Hembra", "Hembra", "Hembra", "Hembra"],
+        "Raza": ["Angus", "Aubrac", "Angus", "angus", "Aubrac", "Angus", "Angus", "Angus"],
+        "Estado": ["Sano", "Sano", "Sano", "Sano", "Sano", "Preñada", "VENDIDO", "Sano"],
+        "Padre": ["", "", "", "12", "", "", "", ""],
+        "Madre": "",
+        "Nacimiento": "2020-01-01",
+    })
+
+
+@pytest.fixture
+def hist_cruces():
+    return historial([
+        ["2026-09-01", "PARTO", "21"],
+        ["2026-06-01", "FECUNDACION", "24"],
+        ["2026-07-15", "CHEQUEO_REPRO", "24", "Preñada"],
+    ])
+
+
+def test_todos_los_pares_con_los_vientres_disponibles(hato_cruces, hist_cruces):
+    plan = main.planificar_cruces("v1", "a1", "Mantener raza", hato_cruces, hist_cruces)
+    ranking = plan["ranking"]
+    # Quedan fuera las preñadas (por estado o por chequeo) y las vendidas
+    assert sorted(plan["vacas"]["ID"]) == ["20", "21"]
+    assert len(ranking) == 2 * 3
+    assert ranking["Puntaje"].between(0, 100).all()
+
+    hija = ranking[ranking["ID Vaca"] == "20"].set_index("ID Toro")
+    # Cruzarla con su padre da una cría con F = 0.25: no es apto y va al final
+    assert hija.loc["12", "F Cría"] == pytest.approx(0.25)
+    assert not hija.loc["12", "Apto"] and hija.loc["12", "Rango"] == 3
+    assert hija["Rango"].idxmin() == "10"
+
+
+def test_objetivo_de_raza(hato_cruces, hist_cruces):
+    mantener = main.planificar_cruces("v1", "a1", "Mantener raza", hato_cruces, hist_cruces)["ranking"]
+    cruzar = main.planificar_cruces("v1", "a1", "Cruzamiento", hato_cruces, hist_cruces)["ranking"]
+    primero = lambda ranking, vaca: ranking[(ranking["ID Vaca"] == vaca) & (ranking["Rango"] == 1)]["ID Toro"].item()
+    assert (primero(mantener, "21"), primero(cruzar, "21")) == ("11", "10")
+    assert (primero(mantener, "20"), primero(cruzar, "20")) == ("10", "11")
+    disponible = mantener.loc[mantener["ID Vaca"] == "21", "Disponible Desde"].iloc[0]
+    assert disponible == pd.Timestamp("2026-09-01") + pd.Timedelta(days=main.PERIODO_ESPERA_VOLUNTARIO)
+
+
+def test_sin_toros_o_sin_vientres(hato_cruces):
+    solo_vacas = hato_cruces[hato_cruces["Sexo"] == "Hembra"]
+    assert main.planificar_cruces("v1", "a1", "Mantener raza", solo_vacas, pd.DataFrame())["ranking"].empty
+    assert main.planificar_cruces("v0", "a0", "Mantener raza", pd.DataFrame(), pd.DataFrame())["ranking"].empty
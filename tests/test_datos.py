@@ -0,0 +1,158 @@
+"""Pruebas de la carga por versión y del snapshot local de las hojas (sin Google Sheets)."""
+import threading
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+
+class HojaFalsa:
+    def __init__(self, valores):
+        self.valores = valores
+        self.lecturas = 0
+
+    def get_all_values(self):
+        self.lecturas += 1
+        return self.valores
+
+
+class HojaVersiones:
+    def __init__(self, filas, falla=False):
+        self.filas, self.falla = [list(fila) for fila in filas], falla
+
+    def get_all_values(self):
+        if self.falla:
+            raise RuntimeError("API caída")
+        return [list(fila) for fila in self.filas]
+
+    def col_values(self, columna):
+        if self.falla:
+            raise RuntimeError("API caída")
+        return [fila[columna - 1] for fila in self.filas]
+
+    def update_cell(self, fila, columna, valor):
+        self.filas[fila - 1][columna - 1] = valor
+
+    def append_row(self, fila):
+        self.filas.append(list(fila))
+
+
+class LibroFalso:
+    def __init__(self, hojas):
+        self.hojas = hojas
+
+    def get_worksheet(self, indice):
+        return self.hojas["Animales"]
+
+    def worksheet(self, nombre):
+        return self.hojas[nombre]
+
+
+@pytest.fixture
+def snapshot_temporal(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DIR_SNAPSHOT", str(tmp_path))
+    monkeypatch.setattr(main, "RUTA_META_SNAPSHOT", str(tmp_path / "meta.json"))
+    return tmp_path
+
+
+@pytest.fixture
+def estado_compartido(monkeypatch):
+    estado = {"lock_snapshot": threading.Lock(), "lock_reconciliacion": threading.Lock(), "ultima_reconciliacion": 0.0,
+              "pendientes": set()}
+    monkeypatch.setattr(main, "estado_cache", lambda: estado)
+    return estado
+
+
+@pytest.fixture
+def libro(monkeypatch):
+    libro = LibroFalso({"Animales": HojaFalsa([["ID", "Nombre", ""], ["1", "Lucera", ""], ["2", "Ñata", ""]])})
+    monkeypatch.setattr(main, "conectar_sheets", lambda: libro)
+    return libro
+
+
+def test_revision_cambia_con_el_contenido():
+    valores = [["ID", "Nombre"], ["1", "Lucera"]]
+    assert main.revision_contenido(valores) == main.revision_contenido([list(fila) for fila in valores])
+    assert main.revision_contenido(valores) != main.revision_contenido(valores + [["2", "Ñata"]])
+
+
+def test_snapshot_por_hoja_y_version(snapshot_temporal):
+    animales = pd.DataFrame({"ID": ["1", "2"], "Nombre": ["Lucera", "Ñata"]})
+    main.guardar_snapshot_hoja("Animales", animales, "v1", "r1")
+    main.guardar_snapshot_hoja("Cuentas", pd.DataFrame(), "v7", "r7")
+    pd.testing.assert_frame_equal(main.leer_snapshot_hoja("Animales", "v1"), animales)
+    assert main.leer_snapshot_hoja("Animales", "v2") is None
+    assert main.leer_snapshot_hoja("Historial", "v1") is None
+    assert main.leer_meta_snapshot()["Cuentas"] == {"version": "v7", "revision": "r7"}
+
+
+def test_cargar_hoja_descarga_una_vez_y_luego_usa_el_snapshot(snapshot_temporal, libro):
+    hoja = libro.hojas["Animales"]
+    df = main.cargar_hoja("Animales", "v1")
+    assert df.columns.tolist() == ["ID", "Nombre"]
+    assert hoja.lecturas == 1
+    pd.testing.assert_frame_equal(main.cargar_hoja("Animales", "v1"), df)
+    assert hoja.lecturas == 1
+    # Otra versión: la hoja cambió y hay que bajarla de nuevo
+    main.cargar_hoja("Animales", "v2")
+    assert hoja.lecturas == 2
+    assert main.leer_meta_snapshot()["Animales"]["version"] == "v2"
+
+
+def test_marcar_version_busca_la_fila_por_nombre():
+    # Las filas no siguen el orden de HOJAS_DATOS
+    versiones = HojaVersiones([["Hoja", "Version"], ["Cuentas", "c1"], ["Animales", "a1"]])
+    assert main.marcar_version(LibroFalso({"Versiones": versiones}), "Animales")
+    assert versiones.filas[1] == ["Cuentas", "c1"]
+    assert versiones.filas[2][0] == "Animales" and versiones.filas[2][1] != "a1"
+    # Una hoja que aún no tiene fila se agrega al final
+    assert main.marcar_version(LibroFalso({"Versiones": versiones}), "Historial")
+    assert [fila[0] for fila in versiones.filas] == ["Hoja", "Cuentas", "Animales", "Historial"]
+
+
+def test_marcar_version_fallida_descarta_el_snapshot(snapshot_temporal):
+    main.guardar_snapshot_hoja("Animales", pd.DataFrame({"ID": ["1"]}), "v1", "r1")
+    main.guardar_snapshot_hoja("Cuentas", pd.DataFrame(), "v1", "r1")
+    assert not main.marcar_version(LibroFalso({"Versiones": HojaVersiones([], falla=True)}), "Animales")
+    assert main.leer_snapshot_hoja("Animales", "v1") is None
+    assert main.leer_meta_snapshot().keys() == {"Cuentas"}
+
+
+def test_reconciliacion_anota_y_el_script_cambia_la_version(snapshot_temporal, estado_compartido, monkeypatch):
+    animales = HojaFalsa([["ID", "Nombre"], ["1", "Lucera"], ["2", "Editada a mano"]])
+    versiones = HojaVersiones([["Hoja", "Version"], ["Animales", "a1"]])
+    libro = LibroFalso({"Animales": animales, "Versiones": versiones})
+    monkeypatch.setattr(main, "conectar_sheets", lambda: libro)
+    main.guardar_snapshot_hoja("Animales", pd.DataFrame({"ID": ["1"], "Nombre": ["Lucera"]}), "a1", "revision anterior")
+    marcadas = []
+    monkeypatch.setattr(main, "marcar_version", lambda sh, nombre: marcadas.append(nombre) or True)
+
+    main.reconciliar_snapshot(libro)
+    assert estado_compartido["lock_reconciliacion"].acquire(timeout=5)
+    estado_compartido["lock_reconciliacion"].release()
+    # El hilo solo anota la hoja; no toca versiones ni cachés
+    assert estado_compartido["pendientes"] == {"Animales"} and marcadas == []
+
+    main.aplicar_reconciliacion()
+    assert marcadas == ["Animales"] and estado_compartido["pendientes"] == set()
+    main.aplicar_reconciliacion()
+    assert marcadas == ["Animales"]
+
+
+def test_arranque_en_frio_sin_versiones_sirve_el_snapshot(snapshot_temporal, estado_compartido, monkeypatch):
+    animales = HojaFalsa([["ID", "Nombre"], ["1", "Lucera"]])
+    libro = LibroFalso({"Animales": animales, "Versiones": HojaVersiones([], falla=True)})
+    monkeypatch.setattr(main, "conectar_sheets", lambda: libro)
+    guardado = pd.DataFrame({"ID": ["1"], "Nombre": ["Lucera"]})
+    main.guardar_snapshot_hoja("Animales", guardado, "a1", "r1")
+
+    versiones = main.versiones_datos()
+    assert versiones["Animales"] == "a1"
+    # Las hojas sin snapshot caen a la ventana de tiempo
+    assert versiones["Historial"].startswith("ttl-")
+    pd.testing.assert_frame_equal(main.cargar_hoja("Animales", versiones["Animales"]), guardado)
+    assert animales.lecturas == 0
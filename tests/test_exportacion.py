@@ -0,0 +1,68 @@
+"""Pruebas de la exportación por bloques a CSV, Parquet y XLSX."""
+import io
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+from openpyxl import load_workbook  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def bloques_pequenos(monkeypatch):
+    monkeypatch.setattr(main, "FILAS_POR_BLOQUE_EXPORTACION", 2)
+
+
+@pytest.fixture
+def tabla():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3", "4", "5"],
+        "Nombre": ["Lucera", "Ñata", "Café, con leche", 'Comillas "dobles"', "Última"],
+        "Peso": [300.5, None, 280.0, 410.25, 90.0],
+        "Partos": [2, 0, 1, 3, 0],
+    })
+
+
+def test_csv_por_bloques(tabla):
+    datos = main.exportar_tabla("Animales", "v1", ("Nombre", "ID", "Peso"), "CSV", tabla)
+    leida = pd.read_csv(io.BytesIO(datos), dtype={"ID": str})
+    # Un solo encabezado aunque se escriba en tres bloques, y las columnas en el orden pedido
+    assert leida.columns.tolist() == ["Nombre", "ID", "Peso"]
+    pd.testing.assert_frame_equal(leida, tabla[["Nombre", "ID", "Peso"]])
+
+
+def test_parquet_por_bloques(tabla):
+    datos = main.exportar_tabla("Animales", "v1", tuple(tabla.columns), "Parquet", tabla)
+    pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(datos)), tabla)
+
+
+def test_xlsx_por_bloques(tabla):
+    datos = main.exportar_tabla("Una hoja con un nombre de más de 31 caracteres", "v1", ("ID", "Nombre", "Peso"), "Excel (XLSX)", tabla)
+    hoja = load_workbook(io.BytesIO(datos)).active
+    filas = list(hoja.values)
+    assert hoja.title == "Una hoja con un nombre de más d"
+    assert filas[0] == ("ID", "Nombre", "Peso")
+    assert filas[2] == ("2", "Ñata", None)
+    assert len(filas) == len(tabla) + 1
+
+
+@pytest.mark.parametrize("formato", list(main.FORMATOS_EXPORTACION))
+def test_tabla_vacia(tabla, formato):
+    datos = main.exportar_tabla("Animales", "v0", ("ID", "Nombre"), formato, tabla.iloc[:0])
+    assert datos
+    if formato == "CSV":
+        assert datos.decode("utf-8").strip() == "ID,Nombre"
+    elif formato == "Parquet":
+        assert pd.read_parquet(io.BytesIO(datos)).columns.tolist() == ["ID", "Nombre"]
+
+
+def test_parquet_con_un_tipo_por_columna_en_todos_los_bloques():
+    # El primer bloque solo trae vacíos y números en columnas de texto; el esquema no sale de él
+    tabla = pd.DataFrame({"Notas": [None, None, "ok", "bien"], "Detalle": [1, 2, "x", None], "Litros": [1.0, 2.0, 3.0, 4.0]})
+    leida = pd.read_parquet(io.BytesIO(main.exportar_tabla("Historial", "v1", tuple(tabla.columns), "Parquet", tabla)))
+    assert leida["Notas"].tolist()[2:] == ["ok", "bien"]
+    assert leida["Detalle"].tolist()[:3] == ["1", "2", "x"]
+    assert leida["Litros"].tolist() == [1.0, 2.0, 3.0, 4.0]
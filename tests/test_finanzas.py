@@ -0,0 +1,195 @@
+"""Pruebas del libro mayor y de los reportes financieros armados a partir del Historial."""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+class HojaHistorial:
+    def __init__(self, filas):
+        self.filas = filas
+
+    def row_values(self, fila):
+        return self.filas[fila - 2]
+
+
+class LibroFalso:
+    def __init__(self, hoja):
+        self.hoja = hoja
+
+    def worksheet(self, nombre):
+        return self.hoja
+
+
+@pytest.fixture
+def hist_finanzas():
+    return historial([
+        ["2026-01-05", "APORTE_CAPITAL", "FINANZAS", "Cuenta: Caja", "Monto: 1000.0", "Concepto: Aporte de socios", "E01"],
+        # Una venta de dos animales: cada fila lleva el precio total del lote
+        ["2026-01-12", "VENTA", "A4", "500.0 USD (Lote)", "Comp: Ana", "Ingresa a: Caja | Guia:  | ", "E05"],
+        ["2026-01-12", "VENTA", "A5", "500.0 USD (Lote)", "Comp: Ana", "Ingresa a: Caja | Guia:  | ", "E06"],
+        ["2026-02-03", "GASTO_OPERATIVO", "FINANZAS", "Monto: 50.0 (Cuenta: Caja)", "Alimentación (Concentrado/Pasto)", "sacos", "E07"],
+        ["2026-02-04", "GASTO_OPERATIVO", "FINANZAS", "Monto: 70.0 (Cuenta: Caja)", "Servicios", "luz", "E08"],
+        ["2026-02-05", "TRANSFERENCIA", "FINANZAS", "De: Caja", "A: Banco", "Monto Origen: 100.0 | Monto Recibido: 3600.0", "E09"],
+        ["2026-01-20", "PESAJE", "A1", "300", "", "", "E11"],
+    ])
+
+
+@pytest.fixture
+def cuentas():
+    return pd.DataFrame({"Nombre": ["Caja", "Banco"], "Moneda": ["USD ($)", "VES (Bs)"], "Saldo": ["1280", "3600"]})
+
+
+def test_libro_mayor_reparte_las_ventas_de_varios_animales(hist_finanzas):
+    libro = main.libro_mayor("v1", hist_finanzas)["libro"]
+    ventas = libro[libro["Tipo Evento"] == "VENTA"].set_index("ID Animal")
+    assert ventas["Monto"].to_dict() == pytest.approx({"A4": 250, "A5": 250})
+    assert set(ventas["Cuenta"]) == {"Caja"} and set(ventas["Moneda"]) == {"USD"}
+    assert "PESAJE" not in set(libro["Tipo Evento"])
+    assert libro["Fecha"].is_monotonic_increasing
+    assert libro.loc[libro["ID Evento"] == "E01", "Categoría"].item() == "Aporte de socios"
+
+
+def test_libro_mayor_asientos_de_transferencia(hist_finanzas):
+    movimientos = main.libro_mayor("v1", hist_finanzas)["movimientos"]
+    transferencia = movimientos[movimientos["Tipo Evento"] == "TRANSFERENCIA"].set_index("Cuenta")["Importe"]
+    assert transferencia.to_dict() == pytest.approx({"Caja": -100.0, "Banco": 3600.0})
+
+
+def test_libro_mayor_totales_mensuales(hist_finanzas):
+    mensual = main.libro_mayor("v1", hist_finanzas)["mensual"].set_index(["Mes", "Movimiento", "Categoría", "Cuenta"])
+    assert mensual.loc[("2026-01", "Ingreso", "Venta de Ganado", "Caja"), ["Total", "Registros"]].tolist() == [500, 2]
+    assert mensual.loc[("2026-02", "Egreso", "Servicios", "Caja"), "Total"] == -70
+
+
+def test_libro_mayor_sin_los_movimientos_anulados(hist_finanzas):
+    anulado = pd.concat([hist_finanzas, historial([["2026-02-06", "ANULACION", "FINANZAS", "Anula: E08", "Monto: 70.0", "", "E10"]])], ignore_index=True)
+    libro = main.libro_mayor("v2", anulado)["libro"]
+    assert "E08" not in set(libro["ID Evento"])
+    assert "ANULACION" not in set(libro["Tipo Evento"])
+    assert main.ids_anulados(anulado) == {"E08"}
+
+
+def test_indice_eventos():
+    hist = historial([["2026-01-01", "PESAJE", "1", "", "", "", "E1"], ["2026-01-02", "PESAJE", "1"],
+                      ["2026-01-03", "PESAJE", "1", "", "", "", " E3 "], ["2026-01-04", "PESAJE", "1", "", "", "", "E1"]])
+    # La fila 1 de la hoja son los encabezados; con IDs repetidos gana el primero
+    assert main.indice_eventos("v1", hist) == {"E1": 2, "E3": 4}
+    assert main.indice_eventos("v0", pd.DataFrame()) == {}
+
+
+@pytest.fixture
+def anulacion(hist_finanzas, monkeypatch):
+    escrito = {"eventos": [], "saldos": []}
+    monkeypatch.setattr(main, "guardar_evento", lambda sh, datos, tipo: escrito["eventos"].append(datos))
+    monkeypatch.setattr(main, "ajustar_saldos", lambda sh, variaciones: escrito["saldos"].append(variaciones))
+    monkeypatch.setattr(main, "invalidar_datos", lambda nombre: None)
+    escrito["libro"] = LibroFalso(HojaHistorial(hist_finanzas.values.tolist()))
+    return escrito
+
+
+def test_anular_revierte_los_saldos(hist_finanzas, anulacion):
+    assert main.anular_evento_finanzas(anulacion["libro"], "E08", "v1", hist_finanzas)
+    assert anulacion["saldos"] == [{"Caja": 70.0}]
+    evento = anulacion["eventos"][0]
+    assert evento[1:4] == ["ANULACION", "FINANZAS", "Anula: E08"]
+
+    assert main.anular_evento_finanzas(anulacion["libro"], " E09 ", "v1", hist_finanzas)
+    assert anulacion["saldos"][1] == {"Caja": 100.0, "Banco": -3600.0}
+
+
+def test_anular_rechaza_ids_invalidos_o_ya_anulados(hist_finanzas, anulacion):
+    assert not main.anular_evento_finanzas(anulacion["libro"], "NO-EXISTE", "v1", hist_finanzas)
+    # Un pesaje no es un movimiento financiero
+    assert not main.anular_evento_finanzas(anulacion["libro"], "E11", "v1", hist_finanzas)
+    anulado = pd.concat([hist_finanzas, historial([["2026-02-06", "ANULACION", "FINANZAS", "Anula: E08"]])], ignore_index=True)
+    assert not main.anular_evento_finanzas(anulacion["libro"], "E08", "v2", anulado)
+    # Si el Historial cambió desde la carga, la fila ya no corresponde al ID
+    anulacion["libro"].hoja.filas = anulacion["libro"].hoja.filas[1:]
+    assert not main.anular_evento_finanzas(anulacion["libro"], "E07", "v1", hist_finanzas)
+    assert anulacion["eventos"] == [] and anulacion["saldos"] == []
+
+
+def test_ids_antiguos_en_minusculas(hist_finanzas, anulacion):
+    hist = hist_finanzas.replace({"ID Evento": {"E07": "ab12cd34"}})
+    anulacion["libro"].hoja.filas = hist.values.tolist()
+    assert main.indice_eventos("v1", hist)["AB12CD34"] == 5
+    assert main.anular_evento_finanzas(anulacion["libro"], "AB12cd34", "v1", hist)
+    assert anulacion["saldos"] == [{"Caja": 50.0}]
+    # La anulación registrada con el ID tecleado en mayúsculas descuenta el evento igual
+    anulado = pd.concat([hist, historial([["2026-02-07", "ANULACION", "FINANZAS", "Anula: AB12CD34"]])], ignore_index=True)
+    assert "ab12cd34" not in set(main.libro_mayor("v2", anulado)["libro"]["ID Evento"])
+
+
+def test_libro_mayor_vacio():
+    resultado = main.libro_mayor("v0", pd.DataFrame())
+    assert all(tabla.empty for tabla in resultado.values())
+
+
+def test_resultados_flujo_y_costos_por_mes(hist_finanzas, cuentas):
+    hato = pd.DataFrame({"ID": ["A1", "A2", "A4"], "Estado": ["Sano", "Lactancia", "VENDIDO"]})
+    hist = pd.concat([hist_finanzas, historial([["2026-02-10", "PRODUCCION_LECHE", "LOTE_GENERAL", "100", "Total"]])], ignore_index=True)
+    reportes = main.reportes_financieros("v1", "a1", "c1", "USD", hato, hist, cuentas)
+
+    # El aporte y la transferencia mueven caja pero no son resultado
+    pyg = reportes["pyg"].set_index("Mes")
+    assert pyg.loc["2026-01", ["Ingresos", "Egresos", "Resultado"]].tolist() == [500, 0, 500]
+    assert pyg.loc["2026-02", ["Ingresos", "Egresos", "Resultado"]].tolist() == [0, 120, -120]
+
+    flujo = reportes["flujo"].set_index(["Cuenta", "Mes"])
+    assert flujo.loc[("Caja", "2026-01"), ["Entradas", "Salidas"]].tolist() == [1500, 0]
+    assert flujo.loc[("Caja", "2026-02"), ["Salidas", "Neto Acumulado"]].tolist() == [220, 1280]
+
+    costos = reportes["costos"].set_index("Mes")
+    assert reportes["cabezas"] == 2
+    assert costos.loc["2026-02", ["Costo por Animal", "Costo por Litro"]].tolist() == pytest.approx([60.0, 1.2])
+
+
+def test_tasas_implicitas_y_manuales(hist_finanzas, cuentas):
+    # La transferencia de 100 USD que llegó como 3600 VES deja una tasa implícita de 36
+    tasas = main.tabla_tasas("v1", "c1", hist_finanzas, cuentas)
+    assert tasas[["Moneda", "Tasa"]].values.tolist() == [["VES", 36.0]]
+
+    # Una tasa manual del mismo día prevalece sobre la implícita
+    con_manual = pd.concat([hist_finanzas, historial([["2026-02-05", "TASA_CAMBIO", "FINANZAS", "Moneda: VES", "Tasa: 40"]])], ignore_index=True)
+    tasas = main.tabla_tasas("v2", "c1", con_manual, cuentas)
+    assert tasas[["Moneda", "Tasa", "Origen"]].values.tolist() == [["VES", 40.0, "Manual"]]
+
+
+def test_convertir_con_la_tasa_vigente():
+    tasas = pd.DataFrame({"Fecha": pd.to_datetime(["2026-01-01", "2026-03-01"]).astype("datetime64[ns]"), "Moneda": ["VES", "VES"],
+                          "Tasa": [40.0, 50.0], "Origen": "Manual"})
+    fechas = ["2025-12-01", "2026-02-15", "2026-03-01", "2026-02-15", "2026-02-15"]
+    monedas = ["VES", "VES", "VES", "USD", "COP"]
+    convertidos = main.convertir([400, 400, 400, 10, 10], fechas, monedas, tasas, "USD")
+    # Antes de la primera tasa vale la primera; USD no se convierte; sin tasa queda NaN
+    assert convertidos[:4] == pytest.approx([10.0, 10.0, 8.0, 10.0])
+    assert np.isnan(convertidos[4])
+    assert main.convertir([10], ["2026-02-15"], ["USD"], tasas, "VES") == pytest.approx([400.0])
+
+
+def test_reportes_consolidados_en_la_moneda_de_reporte(hist_finanzas, cuentas):
+    tasas = main.tabla_tasas("v1", "c1", hist_finanzas, cuentas)
+    saldos = main.saldos_consolidados(cuentas, tasas, "USD", "2026-03-01").set_index("Cuenta")
+    assert saldos["Saldo Reporte"].to_dict() == pytest.approx({"Caja": 1280.0, "Banco": 100.0})
+
+    reportes = main.reportes_financieros("v1", "a1", "c1", "VES", pd.DataFrame(), hist_finanzas, cuentas)
+    pyg = reportes["pyg"].set_index("Mes")
+    assert pyg.loc["2026-01", "Ingresos"] == pytest.approx(500 * 36)
+    assert reportes["sin_tasa"] == 0
+
+
+def test_tasas_sin_datos():
+    tasas = main.tabla_tasas("v0", "c0", pd.DataFrame(), pd.DataFrame())
+    assert tasas.empty
+    assert main.convertir([], [], [], tasas, "USD").size == 0
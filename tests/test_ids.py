@@ -0,0 +1,98 @@
+"""Pruebas de los ID Evento con formato ULID."""
+import threading
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+
+def milisegundos(id_evento):
+    """Los 10 primeros caracteres de un ULID son los milisegundos en base32 de Crockford."""
+    valor = 0
+    for caracter in id_evento[:10]:
+        valor = valor * 32 + main.ALFABETO_ULID.index(caracter)
+    return valor
+
+
+@pytest.fixture
+def estado_compartido(monkeypatch):
+    # st.cache_resource comparte este estado entre sesiones; aquí se comparte entre llamadas
+    estado = {"lock": threading.Lock(), "ms": -1, "azar": 0}
+    monkeypatch.setattr(main, "estado_ids", lambda: estado)
+    return estado
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    ahora = {"ns": 1_767_225_600_000 * 1_000_000}
+    monkeypatch.setattr(main.time, "time_ns", lambda: ahora["ns"])
+    return ahora
+
+
+def test_formato_y_marca_de_tiempo(estado_compartido, reloj):
+    id_evento = main.nuevo_id_evento()
+    assert len(id_evento) == 26 and set(id_evento) <= set(main.ALFABETO_ULID)
+    assert milisegundos(id_evento) == 1_767_225_600_000
+    assert milisegundos(main.nuevo_id_evento(0)) == 0
+    assert milisegundos(main.nuevo_id_evento(1_700_000_000_123)) == 1_700_000_000_123
+
+
+def test_crecientes_dentro_del_mismo_milisegundo(estado_compartido, reloj):
+    ids = [main.nuevo_id_evento() for _ in range(2000)]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert {milisegundos(i) for i in ids} == {1_767_225_600_000}
+
+
+def test_crecientes_aunque_el_reloj_retroceda(estado_compartido, reloj):
+    antes = main.nuevo_id_evento()
+    reloj["ns"] -= 5_000 * 1_000_000
+    despues = main.nuevo_id_evento()
+    assert despues > antes
+    reloj["ns"] += 10_000 * 1_000_000
+    assert main.nuevo_id_evento() > despues
+
+
+def test_desborde_de_la_parte_aleatoria_pasa_al_milisegundo_siguiente(estado_compartido, reloj):
+    main.nuevo_id_evento()
+    estado_compartido["azar"] = (1 << 80) - 1
+    id_evento = main.nuevo_id_evento()
+    assert milisegundos(id_evento) == 1_767_225_600_001
+    assert id_evento.endswith("0" * 16)
+
+
+def test_sin_colisiones_entre_hilos(estado_compartido):
+    por_hilo = [[] for _ in range(4)]
+
+    def generar(lista):
+        lista.extend(main.nuevo_id_evento() for _ in range(1000))
+
+    hilos = [threading.Thread(target=generar, args=(lista,)) for lista in por_hilo]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    todos = [i for lista in por_hilo for i in lista]
+    assert len(set(todos)) == len(todos)
+    assert all(lista == sorted(lista) for lista in por_hilo)
+
+
+def test_ids_con_momento_explicito_no_colisionan():
+    ids = {main.nuevo_id_evento(1_767_225_600_000) for _ in range(5000)}
+    assert len(ids) == 5000
+
+
+def test_clave_de_orden_con_ids_antiguos():
+    nuevos = [main.nuevo_id_evento(ms) for ms in (1_600_000_000_000, 1_700_000_000_000)]
+    serie = pd.Series([nuevos[1], "ffe0a1b2", nuevos[0], " 0a1b2c3d "])
+    orden = serie.iloc[main.clave_orden_id(serie).argsort()].str.strip().tolist()
+    # Los IDs antiguos de 8 caracteres van antes que cualquier ULID, y entre sí sin distinguir mayúsculas
+    assert orden == ["0a1b2c3d", "ffe0a1b2", nuevos[0], nuevos[1]]
+
+
+def test_momento_anterior_a_1970():
+    with pytest.raises(ValueError):
+        main.nuevo_id_evento(-1)
@@ -0,0 +1,167 @@
+"""Pruebas de la importación masiva de animales y eventos desde CSV o Excel."""
+import io
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+MANANA = str(date.today() + timedelta(days=1))
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def archivo(nombre, contenido):
+    datos = io.BytesIO(contenido)
+    datos.name = nombre
+    return datos
+
+
+@pytest.fixture
+def hato():
+    return pd.DataFrame({"ID": ["1", "2"], "Nombre": ["Lucera", "Canela"], "Arete": ["A-100", ""], "Raza": ["Angus", "Angus"],
+                         "Sexo": ["Hembra", "Hembra"], "Estado": ["Sano", "Sano"]})
+
+
+def test_leer_csv_con_punto_y_coma_y_bom():
+    tabla = main.leer_archivo_importacion(archivo("animales.CSV", "﻿ID; Nombre ;Raza\n 7 ;Ñata; angus \n".encode("utf-8")))
+    assert tabla.columns.tolist() == ["ID", "Nombre", "Raza"]
+    assert tabla.iloc[0].tolist() == ["7", "Ñata", "angus"]
+
+
+def test_leer_xlsx():
+    salida = io.BytesIO()
+    pd.DataFrame({"ID": [7, 8], "Nombre": ["Ñata", None]}).to_excel(salida, index=False)
+    tabla = main.leer_archivo_importacion(archivo("animales.xlsx", salida.getvalue()))
+    assert tabla.values.tolist() == [["7", "Ñata"], ["8", ""]]
+
+
+def test_validar_animales(hato):
+    tabla = pd.DataFrame({
+        "id": ["10", "11", "11", "", "1", "12", "13"],
+        "RAZA": ["angus", "Angus", "Angus", "Angus", "Angus", "Raza Inventada", "Angus"],
+        "Sexo": ["h", "Macho", "Macho", "Hembra", "Hembra", "Hembra", "Hembra"],
+        "Nacimiento": ["2024-01-03", "", "", "", "", "", MANANA],
+        "PesoNac": ["32", "", "", "", "", "", "-5"],
+        "Nombre": ["Nueva", "", "", "", "Lucera Cambiada", "", ""],
+    })
+    validada = main.validar_importacion_animales(tabla, hato).set_index(pd.RangeIndex(7))
+    assert validada["Resultado"].tolist() == ["Nuevo", "Error", "Error", "Error", "Existente (se omite)", "Error", "Error"]
+    errores = validada["Errores"]
+    assert "ID repetido en el archivo" in errores[1] and "ID repetido en el archivo" in errores[2]
+    assert errores[3] == "Falta ID"
+    assert errores[5] == "Raza no reconocida"
+    assert "Nacimiento en el futuro" in errores[6] and "PesoNac inválido" in errores[6]
+    # Valores normalizados y por defecto, y el peso actual sale del más reciente registrado
+    nueva = validada.iloc[0]
+    assert (nueva["Raza"], nueva["Sexo"], nueva["Nacimiento"], nueva["Peso"]) == ("Angus", "Hembra", "2024-01-03", "32")
+    assert (nueva["Estado"], nueva["Lote"], nueva["Padre"]) == ("Sano", "General", "Desconocido")
+    assert "Nombre" in validada.iloc[4]["Cambios"]
+
+    filas = main.filas_importacion(validada, "Animales")
+    assert len(filas) == 1 and len(filas[0]) == len(main.COLUMNAS_ANIMAL)
+
+
+def test_validar_eventos(hato):
+    hist = historial([["2026-01-10", "PESAJE", "1", "300"]])
+    tabla = pd.DataFrame({
+        "Fecha": ["2026-01-10", "2026-01-11", "2026-01-12", "2026-01-12", "no", MANANA, "2026-01-13"],
+        "ID Animal": ["1", "", "2", "2", "1", "1", "99"],
+        "Arete": ["", "A-100", "", "", "", "", ""],
+        "Peso": ["310", "305", "0", "250", "300", "300", "200"],
+    })
+    validada = main.validar_importacion_eventos(tabla, "Pesajes", hato, hist)
+    assert validada["Resultado"].tolist() == ["Duplicado (se omite)", "Nuevo", "Error", "Error", "Error", "Error", "Error"]
+    # El arete se resuelve al ID del animal
+    assert validada.loc[1, "ID Animal"] == "1"
+    assert "Peso inválido" in validada.loc[2, "Errores"] and "Repetido en el archivo" in validada.loc[3, "Errores"]
+    assert validada.loc[4, "Errores"] == "Fecha inválida"
+    assert validada.loc[5, "Errores"] == "Fecha en el futuro"
+    assert validada.loc[6, "Errores"] == "Animal no registrado"
+
+    filas = main.filas_importacion(validada, "Pesajes")
+    assert [fila[:4] for fila in filas] == [["2026-01-11", "PESAJE", "1", "305"]]
+    assert filas[0][5] == "Importación" and len(filas[0][6]) == 26
+
+
+def test_leche_con_periodo_de_ordeno(hato):
+    hist = historial([["2026-01-10", "PRODUCCION_LECHE", "1", "10", "Mañana | Descarte: Retiro"]])
+    tabla = pd.DataFrame({
+        "Fecha": ["2026-01-10", "2026-01-10", "2026-01-10", "2026-01-11", "2026-01-11"],
+        "ID Animal": ["1", "1", "2", "2", "2"],
+        "Litros": ["9", "8", "7", "6", "5"],
+        "periodo": ["Mañana", "Tarde", "Noche", "Mañana", "Tarde"],
+    })
+    validada = main.validar_importacion_eventos(tabla, "Producción de leche", hato, hist)
+    # Mañana y tarde del mismo día son registros distintos; el de la mañana ya estaba cargado
+    assert validada["Resultado"].tolist() == ["Duplicado (se omite)", "Nuevo", "Error", "Nuevo", "Nuevo"]
+    assert validada.loc[2, "Errores"] == "Periodo inválido"
+    filas = main.filas_importacion(validada, "Producción de leche")
+    assert [fila[4] for fila in filas] == ["Tarde", "Mañana", "Tarde"]
+    # Los pesajes no llevan periodo
+    assert "Periodo" not in main.validar_importacion_eventos(tabla.drop(columns="periodo"), "Pesajes", hato, hist).columns
+
+
+def test_pesos_a_sincronizar(hato):
+    hist = historial([["2026-02-01", "PESAJE", "1", "300"]])
+    tabla = pd.DataFrame({"Fecha": ["2026-01-20", "2026-01-25", "2026-01-25"], "ID Animal": ["1", "2", "2"], "Peso": ["290", "200", "210"]})
+    validada = main.validar_importacion_eventos(tabla.iloc[:2], "Pesajes", hato, hist)
+    # El pesaje importado del animal 1 es anterior al registrado: no cambia su ficha
+    assert main.pesos_a_sincronizar(validada, hist) == {"2": "200"}
+
+
+def test_agregar_filas_en_bloques(monkeypatch):
+    invalidadas = []
+    monkeypatch.setattr(main, "invalidar_datos", invalidadas.append)
+    monkeypatch.setattr(main, "FILAS_POR_APPEND", 2)
+
+    class Hoja:
+        def __init__(self, falla_en=None):
+            self.bloques, self.falla_en = [], falla_en
+
+        def append_rows(self, bloque):
+            if len(self.bloques) == self.falla_en:
+                raise RuntimeError("API caída")
+            self.bloques.append(bloque)
+
+    hoja = Hoja()
+    avances = []
+    assert main.agregar_filas_en_bloques(hoja, [[i] for i in range(5)], "Historial", lambda n, total: avances.append(n)) == 5
+    assert [len(b) for b in hoja.bloques] == [2, 2, 1] and avances == [2, 4, 5]
+    assert invalidadas == ["Historial"]
+
+    # Si un bloque falla, lo ya escrito se invalida igual
+    with pytest.raises(RuntimeError):
+        main.agregar_filas_en_bloques(Hoja(falla_en=1), [[i] for i in range(5)], "Historial")
+    assert invalidadas == ["Historial", "Historial"]
+
+
+# --- PLANILLAS DE SESIÓN ---
+def test_planilla_de_ordeno_por_turno(hato):
+    planilla = main.planilla_sesion("Producción de leche", hato, {"1": 12.5})
+    assert planilla.columns.tolist() == ["ID Animal", "Nombre", "Arete", "Lote", "Referencia", "Litros", "Notas"]
+    assert planilla["Referencia"].tolist()[0] == 12.5 and planilla["Litros"].isna().all()
+
+    hist = historial([["2026-01-10", "PRODUCCION_LECHE", "1", "10", "Mañana"]])
+    editada = planilla.assign(Litros=[11.0, 95.0])
+    # El registro de la mañana no choca con el ordeño de la tarde del mismo día
+    tarde = main.validar_planilla(editada, "Producción de leche", "2026-01-10", hato, hist, "Tarde")
+    assert tarde["Resultado"].tolist() == ["Nuevo", "Error"]
+    assert tarde.loc[1, "Errores"] == "Litros fuera de rango (0.1-80)"
+    assert tarde["Nombre"].tolist() == ["Lucera", "Canela"]
+    manana = main.validar_planilla(editada.iloc[:1], "Producción de leche", "2026-01-10", hato, hist, "Mañana")
+    assert manana["Resultado"].tolist() == ["Duplicado (se omite)"]
+
+
+def test_planilla_solo_valida_las_filas_cargadas(hato):
+    editada = main.planilla_sesion("Pesajes", hato, {}).assign(Peso=[None, 310.0])
+    validada = main.validar_planilla(editada, "Pesajes", "2026-01-10", hato, pd.DataFrame())
+    assert validada["ID Animal"].tolist() == ["2"] and validada["Resultado"].tolist() == ["Nuevo"]
+    assert validada["Notas"].tolist() == ["Planilla"]
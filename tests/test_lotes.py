@@ -0,0 +1,113 @@
+"""Pruebas de los lotes: ubicación del hato, carga animal, plan de rotación y movimientos."""
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def hace(dias):
+    return str(date.today() - timedelta(days=dias))
+
+
+@pytest.fixture
+def hato():
+    return pd.DataFrame({"ID": ["1", "2", "3", "4"], "Lote": ["Lote 1", "Lote 1", "", "Lote 2"],
+                         "Peso": ["450", "900", "225", "500"], "Estado": ["Sano", "Sano", "Sano", "VENDIDO"]})
+
+
+@pytest.fixture
+def hist_lotes():
+    return historial([
+        [hace(60), "LOTE_CONFIG", "", "Lote: Lote 1", "Área: 3 | Ocupación: 7 | Descanso: 30"],
+        [hace(60), "LOTE_CONFIG", "", "Lote: Lote 2", "Área: 4 | Descanso: 20"],
+        [hace(60), "LOTE_CONFIG", "", "Lote: Lote 3", "Área: 5"],
+        [hace(40), "MOVIMIENTO_LOTE", "3", "De: Lote 3", "A: General"],
+        [hace(30), "MOVIMIENTO_LOTE", "1", "De: General", "A: Lote 2"],
+        [hace(10), "MOVIMIENTO_LOTE", "1", "De: Lote 2", "A: Lote 1"],
+        [hace(8), "MOVIMIENTO_LOTE", "2", "De: Lote 2", "A: Lote 1"],
+    ])
+
+
+def test_catalogo_con_valores_por_defecto(hist_lotes):
+    catalogo = main.catalogo_lotes("v1", hist_lotes).set_index("Lote")
+    assert catalogo["Área"].to_dict() == {"Lote 1": 3, "Lote 2": 4, "Lote 3": 5}
+    assert catalogo["Días Ocupación"].to_dict() == {"Lote 1": 7, "Lote 2": main.DIAS_OCUPACION_POR_DEFECTO, "Lote 3": main.DIAS_OCUPACION_POR_DEFECTO}
+    assert catalogo["Días Descanso"].to_dict() == {"Lote 1": 30, "Lote 2": 20, "Lote 3": main.DIAS_DESCANSO_POR_DEFECTO}
+
+
+def test_ubicaciones_y_carga_por_lote(hato, hist_lotes):
+    ubic = main.ubicaciones("v1", "a1", hato, hist_lotes)
+    por_animal = ubic["por_animal"].set_index("ID")
+    assert por_animal["Lote"].to_dict() == {"1": "Lote 1", "2": "Lote 1", "3": "General"}
+    assert por_animal["UA"].to_dict() == {"1": 1.0, "2": 2.0, "3": 0.5}
+    assert por_animal["Desde"].dt.strftime("%Y-%m-%d").to_dict() == {"1": hace(10), "2": hace(8), "3": hace(40)}
+    assert ubic["por_lote"] == {"General": ["3"], "Lote 1": ["1", "2"]}
+
+    resumen = ubic["resumen"].set_index("Lote")
+    assert resumen["Animales"].to_dict() == {"General": 1, "Lote 1": 2, "Lote 2": 0, "Lote 3": 0}
+    assert resumen.loc["Lote 1", "UA/ha"] == 1.0 and pd.isna(resumen.loc["General", "UA/ha"])
+    assert resumen["Días en Lote"].dropna().to_dict() == {"General": 40, "Lote 1": 10}
+    assert resumen["Última Salida"].dt.strftime("%Y-%m-%d").dropna().to_dict() == {"General": hace(30), "Lote 2": hace(8), "Lote 3": hace(40)}
+
+
+def test_plan_rotacion_respeta_el_descanso(hato, hist_lotes):
+    plan = main.plan_rotacion(main.ubicaciones("v1", "a1", hato, hist_lotes)["resumen"])
+    # Lote 2 lleva 8 de sus 20 días de descanso: el único destino posible es Lote 3
+    assert plan["Lote"].tolist() == ["General", "Lote 1"]
+    assert plan["Destino"].tolist() == ["Lote 3", "Sin lote disponible"]
+    assert plan.loc[0, "UA/ha en Destino"] == pytest.approx(0.1)
+
+
+def test_ua_estimada_para_animales_sin_peso(hist_lotes):
+    hato = pd.DataFrame({"ID": ["1", "2", "3"], "Lote": ["Lote 1"] * 3, "Peso": ["450", "", "0"],
+                         "Tipo": ["Vaca", "Becerro", ""], "Estado": ["Sano"] * 3})
+    ubic = main.ubicaciones("v1", "a1", hato, hist_lotes)
+    por_animal = ubic["por_animal"].set_index("ID")
+    assert por_animal["UA"].round(4).to_dict() == pytest.approx({"1": 1.0, "2": round(150 / 450, 4), "3": float("nan")}, nan_ok=True)
+    assert por_animal["Peso Estimado"].to_dict() == {"1": False, "2": True, "3": False}
+    resumen = ubic["resumen"].set_index("Lote")
+    assert resumen.loc["Lote 1", "Sin Peso"] == 2 and resumen.loc["Lote 2", "Sin Peso"] == 0
+    assert resumen.loc["Lote 1", "UA"] == pytest.approx(1 + 150 / 450)
+
+
+def test_ubicaciones_sin_datos():
+    ubic = main.ubicaciones("v0", "a0", pd.DataFrame(), historial([]))
+    assert ubic["por_animal"].empty and ubic["por_lote"] == {} and ubic["resumen"].empty
+    assert main.plan_rotacion(ubic["resumen"]).empty
+
+
+class HojaFalsa:
+    def __init__(self, ids=()):
+        self.ids, self.filas, self.updates = ["ID", *ids], [], []
+
+    def append_rows(self, filas):
+        self.filas.extend(filas)
+
+    def col_values(self, columna):
+        return self.ids
+
+    def batch_update(self, updates):
+        self.updates.extend(updates)
+
+
+def test_mover_animales_solo_mueve_los_que_cambian_de_lote(monkeypatch):
+    monkeypatch.setattr(main, "invalidar_datos", lambda *hojas: None)
+    historial_hoja, animales = HojaFalsa(), HojaFalsa(["1", "2", "3"])
+    libro = type("Libro", (), {"worksheet": lambda self, nombre: historial_hoja})()
+    lote_actual = {"1": "Lote 1", "2": "Lote 1", "3": "General"}
+
+    assert main.mover_animales(libro, animales, ["1", "2", "3"], "Lote 1", date(2025, 5, 1), lote_actual, "rotación") == 1
+    assert [fila[:6] for fila in historial_hoja.filas] == [["2025-05-01", "MOVIMIENTO_LOTE", "3", "De: General", "A: Lote 1", "rotación"]]
+    assert animales.updates == [{"range": "T4", "values": [["Lote 1"]]}]
+    assert main.mover_animales(libro, animales, ["1"], "Lote 1", date(2025, 5, 1), lote_actual) == 0
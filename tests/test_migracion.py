@@ -0,0 +1,129 @@
+"""Pruebas de la migración que completa los ID Evento faltantes del Historial."""
+import re
+import threading
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+class HojaHistorial:
+    """Hoja Historial en memoria que responde como gspread (recorta las celdas y filas vacías del final)."""
+
+    def __init__(self, filas):
+        self.filas = [list(fila) + [""] * (7 - len(fila)) for fila in filas]
+        self.lecturas, self.escrituras = [], []
+
+    @property
+    def row_count(self):
+        return len(self.filas) + 1
+
+    def row_values(self, fila):
+        return COLUMNAS_HISTORIAL if fila == 1 else self.filas[fila - 2]
+
+    def update_cell(self, fila, columna, valor):
+        pass
+
+    def get(self, rango):
+        inicio, fin = map(int, re.match(r"A(\d+):G(\d+)", rango).groups())
+        self.lecturas.append(rango)
+        bloque = []
+        for fila in self.filas[inicio - 2:fin - 1]:
+            while fila and fila[-1] == "":
+                fila = fila[:-1]
+            bloque.append(fila)
+        while bloque and not bloque[-1]:
+            bloque.pop()
+        return bloque
+
+    def batch_update(self, cambios):
+        self.escrituras.append(len(cambios))
+        for cambio in cambios:
+            fila = int(cambio["range"][1:])
+            self.filas[fila - 2][6] = cambio["values"][0][0]
+
+
+class LibroFalso:
+    def __init__(self, hoja):
+        self.hoja = hoja
+
+    def worksheet(self, nombre):
+        return self.hoja
+
+
+@pytest.fixture
+def migracion_pequena(monkeypatch):
+    monkeypatch.setattr(main, "FILAS_POR_BLOQUE_MIGRACION", 3)
+    monkeypatch.setattr(main, "CELDAS_POR_BATCH_UPDATE", 2)
+    monkeypatch.setattr(main, "invalidar_datos", lambda nombre: None)
+
+
+def filas_historial():
+    return [
+        ["2026-01-01", "PESAJE", "1", "300"],
+        ["2026-01-02", "PESAJE", "2", "310", "", "", "E-EXISTENTE"],
+        ["2026-01-03", "VACUNACION", "1", "Rabia"],
+        [],
+        ["2026-01-05", "PESAJE", "3", "280"],
+        ["2026-01-06", "PESAJE", "3", "285"],
+        ["2026-01-07", "PESAJE", "4", "150"],
+    ]
+
+
+def test_filas_sin_id_evento():
+    hist = pd.DataFrame([fila + [""] * (7 - len(fila)) for fila in filas_historial()], columns=COLUMNAS_HISTORIAL)
+    assert main.filas_sin_id_evento(hist).tolist() == [2, 4, 6, 7, 8]
+    assert main.filas_sin_id_evento(pd.DataFrame()).empty
+
+
+def test_reparar_ids_por_bloques(migracion_pequena):
+    hoja = HojaHistorial(filas_historial())
+    avances = []
+    assert main.reparar_ids_historial(LibroFalso(hoja), al_avanzar=lambda fila, total: avances.append(fila)) == 5
+    assert hoja.lecturas == ["A2:G4", "A5:G7", "A8:G8"]
+    # Nunca más celdas por llamada que CELDAS_POR_BATCH_UPDATE
+    assert max(hoja.escrituras) <= 2
+    assert avances == [4, 7, 8]
+    ids = [fila[6] for fila in hoja.filas]
+    assert ids[1] == "E-EXISTENTE" and ids[3] == ""
+    assert all(ids[i] for i in (0, 2, 4, 5, 6))
+    assert len(set(ids) - {""}) == 6
+
+    # Repetir la migración no pisa los IDs ya asignados
+    assert main.reparar_ids_historial(LibroFalso(hoja)) == 0
+    assert [fila[6] for fila in hoja.filas] == ids
+
+
+def test_reparar_ids_retoma_desde_una_fila(migracion_pequena):
+    hoja = HojaHistorial(filas_historial())
+    assert main.reparar_ids_historial(LibroFalso(hoja), desde_fila=6) == 3
+    assert [bool(fila[6]) for fila in hoja.filas] == [False, True, False, False, True, True, True]
+
+
+def test_un_bloque_vacio_no_corta_la_migracion(migracion_pequena):
+    hoja = HojaHistorial(filas_historial()[:3] + [[], [], []] + [["2026-02-01", "PESAJE", "5", "90"]])
+    assert main.reparar_ids_historial(LibroFalso(hoja)) == 3
+    assert hoja.filas[-1][6] != ""
+
+
+def test_deteccion_y_reparacion_usan_el_mismo_criterio():
+    # Un dato solo en la columna G (el ID) no es una fila pendiente; una columna extra tampoco cuenta
+    bloque = pd.DataFrame([["2026-01-01", "PESAJE"], ["", "", "", "", "", "", "E1"], ["", "", "", "", "", "", "", "extra"]])
+    assert main.sin_id_evento(bloque).tolist() == [True, False, False]
+
+
+def test_ids_migrados_crecen_en_el_orden_de_la_hoja(migracion_pequena, monkeypatch):
+    estado = {"lock": threading.Lock(), "ms": -1, "azar": 0}
+    monkeypatch.setattr(main, "estado_ids", lambda: estado)
+    # Las fechas desordenadas no importan: el orden cronológico lo da la columna Fecha
+    hoja = HojaHistorial([["2026-03-01", "PESAJE", "1"], ["2020-01-01", "PESAJE", "2"], ["fecha rota", "PESAJE", "3"]])
+    main.reparar_ids_historial(LibroFalso(hoja))
+    ids = [fila[6] for fila in hoja.filas]
+    assert all(len(i) == 26 for i in ids)
+    assert ids == sorted(ids)
@@ -0,0 +1,96 @@
+"""Pruebas de los historiales clínicos en PDF y de su caché por animal."""
+import io
+import threading
+import zipfile
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+@pytest.fixture
+def hato():
+    return pd.DataFrame({"ID": ["1", "2", "3"], "Nombre": ["Lucera", "Ñata", "Canela"], "Raza": "Carora", "Sexo": "Hembra",
+                         "Nacimiento": "2020-01-01", "Estado": "Sano", "Lote": "General"})
+
+
+@pytest.fixture
+def hist_clinico():
+    return historial([
+        ["2026-01-10", "VACUNACION", "1", "Fiebre Aftosa"],
+        ["2026-02-01", "TRATAMIENTO", "1", "Curativo | Mastitis", "Penicilina | 3 días", "cuarto posterior"],
+        ["2026-02-02", "PESAJE", "1", "300"],
+        ["2026-03-01", "MASTITIS", "2"],
+    ])
+
+
+@pytest.fixture
+def render_falso(monkeypatch):
+    """Sustituye el renderizado por bytes reconocibles y anota qué claves se pidieron."""
+    estado = {"lock": threading.Lock(), "pdfs": {}}
+    renderizados = []
+    monkeypatch.setattr(main, "estado_pdfs", lambda: estado)
+
+    def generar(faltan, al_avanzar=None):
+        renderizados.extend(clave for clave, *_ in faltan)
+        return {clave: b"%PDF-" + clave[0].encode() for clave, *_ in faltan}
+
+    monkeypatch.setattr(main.reportes_pdf, "generar_pdfs", generar)
+    return renderizados
+
+
+def test_historias_clinicas(hato, hist_clinico):
+    historias = main.historias_clinicas("v1", "a1", hato, hist_clinico)
+    ficha, eventos, _ = historias["1"]
+    assert ficha["Nombre"] == "Lucera"
+    # Solo los eventos clínicos, con las columnas del reporte
+    assert [ev["Tipo Evento"] for ev in eventos] == ["VACUNACION", "TRATAMIENTO"]
+    assert set(eventos[0]) == set(main.COLUMNAS_EVENTO_PDF)
+    assert historias["3"][1] == []
+
+    # La firma solo cambia para el animal cuyo historial cambió
+    otra = main.historias_clinicas("v2", "a1", hato, pd.concat([hist_clinico, historial([["2026-03-05", "MASTITIS", "2"]])]))
+    assert otra["1"][2] == historias["1"][2]
+    assert otra["2"][2] != historias["2"][2]
+
+
+def test_pdfs_clinicos_solo_renderiza_lo_que_cambio(hato, hist_clinico, render_falso):
+    pdfs = main.pdfs_clinicos(["1", "2", "3", "99"], "v1", "a1", hato, hist_clinico)
+    assert pdfs == {"1": b"%PDF-1", "2": b"%PDF-2", "3": b"%PDF-3"}
+    assert len(render_falso) == 3
+
+    render_falso.clear()
+    cambiado = pd.concat([hist_clinico, historial([["2026-03-05", "MASTITIS", "2"]])], ignore_index=True)
+    main.pdfs_clinicos(["1", "2", "3"], "v2", "a1", hato, cambiado)
+    assert [clave[0] for clave in render_falso] == ["2"]
+
+
+def test_nombre_y_zip():
+    ficha = {"ID": "7/B", "Nombre": "La Negra"}
+    nombre = main.nombre_pdf_clinico(ficha)
+    assert nombre == "Historial_La_Negra_7-B.pdf"
+    datos = main.reportes_pdf.comprimir_zip({nombre: b"%PDF-1", "otro.pdf": b"%PDF-2"})
+    with zipfile.ZipFile(io.BytesIO(datos)) as zf:
+        assert zf.read(nombre) == b"%PDF-1" and zf.namelist() == [nombre, "otro.pdf"]
+
+
+def test_lote_de_pdfs_mayor_que_la_cache(render_falso):
+    n = main.MAX_PDFS_EN_CACHE + 5
+    hato = pd.DataFrame({"ID": [str(i) for i in range(n)], "Nombre": "x", "Raza": "Brahman", "Sexo": "Hembra",
+                         "Nacimiento": "2020-01-01", "Estado": "Sano"})
+    # Los primeros ya estaban en caché: son los más antiguos y el propio lote los desaloja
+    main.pdfs_clinicos(hato["ID"].tolist()[:10], "v1", "a1", hato, pd.DataFrame())
+    pdfs = main.pdfs_clinicos(hato["ID"].tolist(), "v1", "a1", hato, pd.DataFrame())
+    assert len(pdfs) == n
+    assert pdfs["0"] == b"%PDF-0"
+    assert len(main.estado_pdfs()["pdfs"]) == main.MAX_PDFS_EN_CACHE
@@ -0,0 +1,69 @@
+"""Pruebas del pedigrí: consanguinidad y parentesco por el método tabular."""
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+# Ejemplo de Mrode (Linear Models for the Prediction of Animal Breeding Values, ej. 2.1)
+MATRIZ_MRODE = [
+    [1.000, 0.000, 0.500, 0.500, 0.500, 0.250],
+    [0.000, 1.000, 0.500, 0.000, 0.250, 0.625],
+    [0.500, 0.500, 1.000, 0.250, 0.625, 0.5625],
+    [0.500, 0.000, 0.250, 1.000, 0.625, 0.3125],
+    [0.500, 0.250, 0.625, 0.625, 1.125, 0.6875],
+    [0.250, 0.625, 0.5625, 0.3125, 0.6875, 1.125],
+]
+
+
+@pytest.fixture
+def hato_mrode():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3", "4", "5", "6"],
+        "Nombre": ["Toro 1", "Vaca 2", "Vaca 3", "Toro 4", "Toro 5", "Cría 6"],
+        "Sexo": ["Macho", "Hembra", "Hembra", "Macho", "Macho", "Hembra"],
+        "Estado": ["VENDIDO", "Sano", "Sano", "Sano", "Sano", "Sano"],
+        "Padre": ["", "", "1", "1", "4", "5"],
+        "Madre": ["", "Desconocido", "2", "", "3", "2"],
+    })
+
+
+def test_pedigri_consanguinidad_de_mrode(hato_mrode):
+    ped = main.pedigri("v1", hato_mrode)
+    f = ped["tabla"].set_index("ID")["F"]
+    assert f.to_dict() == pytest.approx({"1": 0, "2": 0, "3": 0, "4": 0, "5": 0.125, "6": 0.125})
+
+
+def test_parentesco_reproduce_la_matriz_de_mrode(hato_mrode):
+    ped = main.pedigri("v1", hato_mrode)
+    ids = hato_mrode["ID"].tolist()
+    assert main.parentesco(ped, ids, ids).to_numpy() == pytest.approx(np.array(MATRIZ_MRODE))
+    relacion = main.coeficiente_relacion(ped, ids, ids)
+    assert np.diag(relacion.to_numpy()) == pytest.approx(np.ones(6))
+
+
+def test_pedigri_resuelve_nombres_y_progenitores_externos(hato_mrode):
+    hato = hato_mrode.assign(Padre=["", "", "Toro 1", "Toro 1", "Toro 4", "Semen Importado"])
+    tabla = main.pedigri("v2", hato)["tabla"].set_index("ID")
+    assert tabla.loc["3", "Padre"] == "1"
+    assert tabla.loc["6", "Padre"] == "EXT:Semen Importado"
+    assert tabla.loc["EXT:Semen Importado", "Generación"] == 0
+
+
+def test_pedigri_vacio():
+    ped = main.pedigri("v0", pd.DataFrame())
+    assert ped["tabla"].empty
+    assert main.parentesco(ped, ["1"], ["2"]).to_numpy().tolist() == [[0.0]]
+
+
+def test_cruces_sugeridos(hato_mrode):
+    ped = main.pedigri("v1", hato_mrode)
+    toros, vientres = hato_mrode[hato_mrode["ID"].isin(["4", "5"])], hato_mrode[hato_mrode["ID"].isin(["3", "6"])]
+    sugeridos = main.cruces_sugeridos(ped, toros, vientres).set_index("ID Vaca")
+    assert sugeridos["Toro Sugerido"].tolist() == ["Toro 4", "Toro 4"]
+    assert sugeridos["F Cría"].tolist() == pytest.approx([0.125, 0.15625])
+    assert sugeridos.loc["3", "Toros a Evitar"] == "Toro 4, Toro 5"
+    assert main.cruces_sugeridos(ped, toros.iloc[:0], vientres).empty
@@ -0,0 +1,106 @@
+"""Pruebas de la ganancia diaria de peso (GMD) y sus proyecciones."""
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def hace(dias):
+    return str(date.today() - timedelta(days=dias))
+
+
+class HojaFalsa:
+    def __init__(self, ids):
+        self.ids, self.cambios = list(ids), []
+
+    def col_values(self, columna):
+        return ["ID"] + self.ids
+
+    def batch_update(self, cambios):
+        self.cambios.extend(cambios)
+
+
+@pytest.fixture
+def hato_pesos():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3"],
+        "Nombre": ["Toro", "Novilla", "Becerro"],
+        "Tipo": ["Toro", "Novilla", "Becerro"],
+        "Sexo": ["Macho", "Hembra", "Macho"],
+        "Lote": ["Ceba", "Ceba", "Cría"],
+        "Estado": "Sano",
+        "Peso": ["205", "300", "250"],
+        "Nacimiento": ["2024-01-01", hace(270), ""],
+        "PesoNac": ["", "30", ""],
+    })
+
+
+@pytest.fixture
+def hist_pesos():
+    return historial([
+        ["2026-01-21", "PESAJE", "1", "221"],
+        ["2026-01-01", "PESAJE", "1", "200"],
+        ["2026-01-11", "PESAJE", "1", "210"],
+        # Pesos nulos o ilegibles no cuentan
+        ["2026-01-15", "PESAJE", "1", "0"],
+        ["2026-01-16", "PESAJE", "1", "abc"],
+        [hace(1), "PESAJE", "2", "300"],
+    ])
+
+
+def test_gmd_por_regresion_y_desde_el_nacimiento(hato_pesos, hist_pesos):
+    resultado = main.analitica_peso("v1", "a1", hato_pesos, hist_pesos)
+    por_animal = resultado["por_animal"].set_index("ID Animal")
+    # Pendiente de 200, 210 y 221 kg a los días 0, 10 y 20
+    assert por_animal.loc["1", "GMD"] == pytest.approx(1.05)
+    assert por_animal.loc["1", "Pesajes"] == 3
+    assert por_animal.loc["1", "Último Peso"] == 221
+    # Un solo pesaje: se usa el peso al nacer registrado y la edad
+    assert por_animal.loc["2", "GMD"] == pytest.approx((300 - 30) / 270)
+    # Sin pesajes ni peso al nacer no se inventa una GMD
+    assert pd.isna(por_animal.loc["3", "GMD"])
+    assert por_animal.loc["3", "Peso Ficha"] == "250"
+
+    pesajes = resultado["pesajes"]
+    assert pesajes.loc[pesajes["ID Animal"] == "1", "Ganancia"].tolist()[1:] == [10, 11]
+
+
+def test_dias_a_peso_objetivo(hato_pesos, hist_pesos):
+    por_animal = main.analitica_peso("v1", "a1", hato_pesos, hist_pesos)["por_animal"]
+    dias = main.dias_a_peso_objetivo(por_animal, 431).tolist()
+    assert dias[:2] == [200, 131]
+    assert pd.isna(dias[2])
+    # Un animal que ya pasó el objetivo está a 0 días
+    assert main.dias_a_peso_objetivo(por_animal, 100).tolist() == [0, 0, 0]
+
+
+def test_distribucion_peso_por_lote(hato_pesos, hist_pesos):
+    por_animal = main.analitica_peso("v1", "a1", hato_pesos, hist_pesos)["por_animal"]
+    hato = main.distribucion_peso(por_animal).iloc[0]
+    assert (hato["Animales"], hato["Con GMD"]) == (3, 2)
+    por_lote = main.distribucion_peso(por_animal, "Lote").set_index("Lote")
+    assert por_lote.loc["Ceba", "GMD Promedio"] == pytest.approx((1.05 + 1.0) / 2)
+    assert por_lote.loc["Cría", "Con GMD"] == 0
+
+
+def test_sincronizar_pesos_en_un_solo_lote(monkeypatch):
+    monkeypatch.setattr(main, "invalidar_datos", lambda nombre: None)
+    hoja = HojaFalsa(["1", "2", "3"])
+    assert main.sincronizar_pesos(hoja, {"3": 250.0, "1": 221.0, "99": 10.0}) == 2
+    assert {cambio["range"]: cambio["values"] for cambio in hoja.cambios} == {"G4": [["250.0"]], "G2": [["221.0"]]}
+
+
+def test_peso_sin_datos():
+    resultado = main.analitica_peso("v0", "a0", pd.DataFrame(), pd.DataFrame())
+    assert resultado["pesajes"].empty and resultado["por_animal"].empty
@@ -0,0 +1,85 @@
+"""Pruebas de la analítica de producción (lactancia) sobre un historial armado a mano."""
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def hace(dias):
+    return str(date.today() - timedelta(days=dias))
+
+
+@pytest.fixture
+def hist_leche():
+    return historial([
+        [hace(400), "PARTO", "1"],
+        [hace(350), "PRODUCCION_LECHE", "1", "20", "Mañana"],
+        [hace(30), "PARTO", "1"],
+        # Mañana y tarde del mismo día suman un solo registro
+        [hace(20), "PRODUCCION_LECHE", "1", "10", "Mañana"],
+        [hace(20), "PRODUCCION_LECHE", "1", "5", "Tarde"],
+        [hace(10), "PRODUCCION_LECHE", "1", "12", "Mañana"],
+        [hace(2), "PRODUCCION_LECHE", "1", "9", "Mañana"],
+        [hace(2), "PRODUCCION_LECHE", "LOTE_GENERAL", "100", "Total"],
+        [hace(3), "PRODUCCION_LECHE", "2", "7", "Mañana"],
+        [hace(3), "PRODUCCION_LECHE", "2", "no es un número", "Tarde"],
+    ])
+
+
+def test_lactancia_actual_por_vaca(hist_leche):
+    por_vaca = main.analitica_leche("v1", hist_leche)["por_vaca"].set_index("ID Animal")
+    vaca = por_vaca.loc["1"]
+    # La lactancia anterior (20 L hace 350 días) no cuenta para el pico ni el acumulado
+    assert vaca["Registros"] == 3
+    assert vaca["Pico"] == 15
+    assert vaca["DEL Pico"] == 10
+    assert vaca["Acumulado"] == 36
+    assert vaca["DEL"] == 30
+    assert vaca["Prom 7d"] == pytest.approx(9.0)
+    assert vaca["Prom 30d"] == pytest.approx(12.0)
+    assert vaca["Proyección 305d"] == pytest.approx(36 + 9 * (main.DIAS_LACTANCIA_ESTANDAR - 30))
+    # Sin parto registrado no hay DEL, pero sí acumulado
+    assert pd.isna(por_vaca.loc["2", "DEL"])
+    assert por_vaca.loc["2", "Acumulado"] == 7
+    assert "LOTE_GENERAL" not in por_vaca.index
+
+
+def test_serie_del_hato_y_curva(hist_leche):
+    resultado = main.analitica_leche("v1", hist_leche)
+    hato = resultado["hato"].set_index("Fecha_DT")["Litros"]
+    assert hato[pd.Timestamp(hace(2))] == 109
+    assert hato.sum() == 20 + 15 + 12 + 109 + 7
+    diario = resultado["diario"]
+    assert len(diario[diario["ID Animal"] == "1"]) == 4
+    curva = resultado["curva"].set_index("Semana")["Litros"]
+    assert curva.to_dict() == pytest.approx({1: 15.0, 2: 12.0, 4: 9.0, 7: 20.0})
+
+
+def test_leche_descartada_no_cuenta(hist_leche):
+    descartes = historial([
+        [hace(1), "PRODUCCION_LECHE", "1", "30", f"Mañana | {main.MARCA_DESCARTE}"],
+        # Registro anterior a la marca: solo la nota dice que se descartó
+        [hace(1), "PRODUCCION_LECHE", "1", "25", "Tarde", "Descartada (retiro hasta 2025-01-01) | Hato: A"],
+    ])
+    assert main.leche_descartada(descartes).tolist() == [True, True]
+    assert not main.leche_descartada(hist_leche).any()
+    resultado = main.analitica_leche("v2", pd.concat([hist_leche, descartes], ignore_index=True))
+    assert resultado["por_vaca"].set_index("ID Animal").loc["1", "Acumulado"] == 36
+    assert pd.Timestamp(hace(1)) not in resultado["hato"].set_index("Fecha_DT").index
+
+
+def test_lactancia_sin_datos():
+    resultado = main.analitica_leche("v0", pd.DataFrame())
+    assert resultado["por_vaca"].empty and resultado["curva"].empty
+    assert "Proyección 305d" in resultado["por_vaca"].columns
@@ -0,0 +1,73 @@
+"""Pruebas del renderizado real de los historiales clínicos (fpdf2 y pypdf)."""
+import io
+
+import pytest
+
+pytest.importorskip("fpdf")
+pypdf = pytest.importorskip("pypdf")
+
+import reportes_pdf  # noqa: E402
+
+FICHA = {"ID": "1", "Nombre": "Ñata", "Raza": "Carora", "Sexo": "Hembra", "Nacimiento": "2020-01-01", "Estado": "Sano"}
+
+
+def evento(i, notas=""):
+    return {"Fecha": f"2026-01-{i % 28 + 1:02d}", "Tipo Evento": "TRATAMIENTO", "Detalle 1": "Curativo | Mastitis",
+            "Detalle 2": "Penicilina | 3 días", "Notas": notas}
+
+
+def texto_pdf(datos):
+    return "\n".join(pagina.extract_text() for pagina in pypdf.PdfReader(io.BytesIO(datos)).pages)
+
+
+def test_pdf_con_texto_unicode():
+    if reportes_pdf.fuente_unicode() is None:
+        pytest.skip("No hay una fuente Unicode instalada")
+    datos = reportes_pdf.pdf_historial_clinico(FICHA, [evento(1, "ñandú, 5 € y 2 ml/kg → revisar")], "2026-10-19")
+    assert datos.startswith(b"%PDF")
+    texto = texto_pdf(datos)
+    assert "Ñata" in texto and "ñandú" in texto and "€" in texto
+
+
+def test_tabla_larga_en_varias_paginas():
+    datos = reportes_pdf.pdf_historial_clinico(FICHA, [evento(i) for i in range(120)], "2026-10-19")
+    paginas = pypdf.PdfReader(io.BytesIO(datos)).pages
+    assert len(paginas) > 1
+    # El encabezado de la tabla se repite en cada página
+    assert all("Fecha" in pagina.extract_text() for pagina in paginas)
+
+
+def test_sin_fuente_unicode_usa_helvetica(monkeypatch):
+    monkeypatch.setattr(reportes_pdf, "fuente_documentos", lambda: None)
+    datos = reportes_pdf.pdf_historial_clinico(FICHA, [evento(1, "flecha → y ñ")], "2026-10-19")
+    texto = texto_pdf(datos)
+    assert "Ñata" in texto and "flecha ? y ñ" in texto
+
+
+def test_fuente_reducida_una_vez_por_maquina(tmp_path, monkeypatch):
+    fuente = reportes_pdf.fuente_unicode()
+    if fuente is None:
+        pytest.skip("No hay una fuente Unicode instalada")
+    monkeypatch.setattr(reportes_pdf, "DIRECTORIO_FUENTES_REDUCIDAS", str(tmp_path))
+    reducida = reportes_pdf.reducir_fuente(fuente[0])
+    assert reducida.startswith(str(tmp_path))
+    assert 0 < len(open(reducida, "rb").read()) < len(open(fuente[0], "rb").read())
+    # La segunda vez se reutiliza el archivo ya preparado
+    monkeypatch.setattr(reportes_pdf.subset, "load_font", lambda *a, **k: pytest.fail("se volvió a reducir la fuente"))
+    assert reportes_pdf.reducir_fuente(fuente[0]) == reducida
+    assert [p.name for p in tmp_path.iterdir()] == [reducida.rsplit("/", 1)[-1]]
+
+
+def test_sin_eventos():
+    texto = texto_pdf(reportes_pdf.pdf_historial_clinico(FICHA, [], "2026-10-19"))
+    assert "No se encontraron registros" in texto
+
+
+def test_lote_en_el_pool_y_union():
+    trabajos = [((str(i), "firma", "2026-10-19"), dict(FICHA, ID=str(i)), [evento(i)], "2026-10-19") for i in range(reportes_pdf.MIN_PDFS_PARA_POOL)]
+    avances = []
+    pdfs = reportes_pdf.generar_pdfs(trabajos, lambda hechos, total: avances.append((hechos, total)), procesos=2)
+    assert sorted(pdfs) == sorted(clave for clave, *_ in trabajos)
+    assert avances[-1] == (len(trabajos), len(trabajos))
+    unido = reportes_pdf.unir_pdfs([pdfs[clave] for clave, *_ in trabajos])
+    assert len(pypdf.PdfReader(io.BytesIO(unido)).pages) == len(trabajos)
@@ -0,0 +1,74 @@
+"""Pruebas de los indicadores reproductivos del hato."""
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+@pytest.fixture
+def hato_repro():
+    return pd.DataFrame({"ID": ["1", "2", "3", "4"], "Sexo": ["Hembra", "Hembra", "Hembra", "Macho"]})
+
+
+@pytest.fixture
+def hist_repro():
+    return historial([
+        ["2024-01-01", "PARTO", "1"],
+        ["2025-01-01", "PARTO", "1"],
+        ["2025-03-01", "FECUNDACION", "1", "Monta natural"],
+        ["2025-04-01", "FECUNDACION", "1", "Inseminación"],
+        ["2025-05-15", "CHEQUEO_REPRO", "1", "Preñada"],
+        ["2025-02-01", "PARTO", "2"],
+        ["2025-05-01", "FECUNDACION", "2"],
+        ["2025-07-01", "ABORTO", "2"],
+        ["2025-08-01", "FECUNDACION", "2"],
+        ["2025-09-01", "CHEQUEO_REPRO", "2", "Vacía"],
+    ])
+
+
+def test_kpis_por_vaca(hato_repro, hist_repro):
+    por_vaca = main.kpis_reproductivos("v1", "a1", hato_repro, hist_repro)["por_vaca"].set_index("ID Animal")
+    assert sorted(por_vaca.index) == ["1", "2", "3"]
+
+    vaca = por_vaca.loc["1"]
+    # La concepción es el último servicio antes del chequeo positivo
+    assert vaca["Concepción Actual"] == pd.Timestamp("2025-04-01")
+    assert vaca["Días Abiertos"] == 90
+    assert vaca["IEP Promedio"] == 366
+    assert vaca["Servicios Ciclo"] == 2
+    assert vaca["Fecha Probable Parto"] == pd.Timestamp("2025-04-01") + pd.Timedelta(days=main.DIAS_GESTACION)
+
+    # Tras el aborto solo cuenta el servicio posterior y la vaca queda vacía
+    vaca = por_vaca.loc["2"]
+    assert (vaca["Partos"], vaca["Abortos"], vaca["Servicios"], vaca["Servicios Ciclo"]) == (1, 1, 2, 1)
+    assert pd.isna(vaca["Concepción Actual"])
+
+    vaca = por_vaca.loc["3"]
+    assert (vaca["Partos"], vaca["Servicios"], vaca["Concepciones"]) == (0, 0, 0)
+    assert pd.isna(vaca["Servicios por Concepción"])
+
+
+def test_kpis_del_hato_y_calendario(hato_repro, hist_repro):
+    resultado = main.kpis_reproductivos("v1", "a1", hato_repro, hist_repro)
+    hato = resultado["hato"]
+    assert hato["IEP Promedio"] == 366
+    assert hato["Preñadas"] == 1
+    assert hato["Tasa de Abortos"] == pytest.approx(25.0)
+    assert hato["Servicios por Concepción"] == pytest.approx(1.0)
+    calendario = resultado["calendario"]
+    assert calendario["ID Animal"].tolist() == ["1"]
+
+
+def test_kpis_sin_datos():
+    resultado = main.kpis_reproductivos("v0", "a0", pd.DataFrame(), pd.DataFrame())
+    assert resultado["por_vaca"].empty and resultado["calendario"].empty
+    assert resultado["hato"]["Preñadas"] == 0
@@ -0,0 +1,87 @@
+"""Pruebas de los retiros de medicamentos: catálogo, fechas de liberación e índice por animal."""
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+@pytest.fixture
+def hist_retiros():
+    return historial([
+        ["2025-02-01", "MEDICAMENTO_CONFIG", "", "Medicamento: oxitetraciclina la", "Retiro carne: 30 d | Retiro leche: 10 d"],
+        ["2025-02-01", "MEDICAMENTO_CONFIG", "", "Medicamento: Tilosina", "Retiro carne: 21 d | Retiro leche: 4 d"],
+        ["2025-03-01", "TRATAMIENTO", "1", "Curativo | Mastitis", "Oxitetraciclina LA | 3 días"],
+        ["2025-03-05", "VACUNACION", "2", "Ivermectina 1%"],
+        ["2025-03-06", "TRATAMIENTO", "3", "Curativo | Cojera", "Producto sin catálogo | 1 días"],
+    ])
+
+
+class Sesion(dict):
+    __getattr__, __setattr__ = dict.__getitem__, dict.__setitem__
+
+
+@pytest.fixture
+def sesion(monkeypatch):
+    sesion = Sesion()
+    monkeypatch.setattr(main.st, "session_state", sesion)
+    return sesion
+
+
+def test_catalogo_registrado_prevalece(hist_retiros):
+    catalogo = main.catalogo_medicamentos("v1", hist_retiros).set_index("Medicamento")
+    assert "Oxitetraciclina LA" not in catalogo.index
+    assert catalogo.loc["oxitetraciclina la", ["Retiro Carne", "Retiro Leche"]].tolist() == [30, 10]
+    assert catalogo.loc["Tilosina", ["Retiro Carne", "Retiro Leche"]].tolist() == [21, 4]
+    assert len(catalogo) == len(main.CATALOGO_MEDICAMENTOS_BASE) + 1
+
+
+def test_retiros_corren_desde_la_ultima_dosis(hist_retiros):
+    catalogo = main.catalogo_medicamentos("v1", hist_retiros)
+    ev = main.eventos_de_tipo(hist_retiros, ["TRATAMIENTO", "VACUNACION"])
+    retiros = main.retiros_de_eventos(ev, catalogo).set_index("ID Animal")
+    assert retiros.index.tolist() == ["1", "2"]
+    assert retiros["Carne"].dt.strftime("%Y-%m-%d").to_dict() == {"1": "2025-04-02", "2": "2025-04-09"}
+    assert retiros["Leche"].dt.strftime("%Y-%m-%d").to_dict() == {"1": "2025-03-13", "2": "2025-04-02"}
+
+
+def test_liberacion_consulta_el_indice(hist_retiros, sesion):
+    indice = main.indice_retiros("v1", hist_retiros)
+    assert main.liberacion(indice, "1", "Leche", "2025-03-12") == pd.Timestamp("2025-03-13")
+    assert main.liberacion(indice, "1", "Leche", "2025-03-13") is None
+    assert main.liberacion(indice, 2, "Carne", "2025-04-01") == pd.Timestamp("2025-04-09")
+    assert main.liberacion(indice, "3", "Carne", "2025-03-06") is None
+
+
+def test_indice_refleja_ediciones_y_borrados(hist_retiros):
+    assert main.retiros_historial("v1", hist_retiros)["Leche"] == {"1": pd.Timestamp("2025-03-13"), "2": pd.Timestamp("2025-04-02")}
+    # Se corrigen los días del tratamiento y se borra la vacuna en la hoja
+    editado = hist_retiros.drop(index=3).reset_index(drop=True)
+    editado.loc[2, "Detalle 2"] = "Oxitetraciclina LA | 5 días"
+    indice = main.retiros_historial("v2", editado)
+    assert indice["Leche"] == {"1": pd.Timestamp("2025-03-15")} and "2" not in indice["Carne"]
+    assert main.retiros_historial("v0", historial([])) == {"Carne": {}, "Leche": {}}
+
+
+def test_anotar_retiro_solo_para_la_sesion(hist_retiros, sesion):
+    main.indice_retiros("v1", hist_retiros)
+    main.anotar_retiro(["2025-03-10", "TRATAMIENTO", "4", "Curativo | Neumonía", "Tilosina | 1 días", ""])
+    main.anotar_retiro(["2025-03-10", "TRATAMIENTO", "1", "Curativo | Mastitis", "Tilosina | 1 días", ""])
+    main.anotar_retiro(["2025-03-10", "PESAJE", "5", "300", "", ""])
+    indice = main.indice_retiros("v1", hist_retiros)
+    assert main.liberacion(indice, "4", "Carne", "2025-03-30") == pd.Timestamp("2025-03-31")
+    # Gana la liberación más tardía entre el Historial y lo anotado
+    assert indice["Leche"]["1"] == pd.Timestamp("2025-03-14") and indice["Carne"]["1"] == pd.Timestamp("2025-04-02")
+    assert "5" not in indice["Carne"]
+    # El índice cacheado no se toca: otra sesión no ve lo anotado
+    assert "4" not in main.retiros_historial("v1", hist_retiros)["Carne"]
+    # Con la nueva versión del Historial lo anotado se descarta (la recarga ya lo trae)
+    assert "4" not in main.indice_retiros("v2", hist_retiros)["Carne"]
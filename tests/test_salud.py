@@ -0,0 +1,89 @@
+"""Pruebas de la analítica sanitaria: episodios, incidencia, recaídas, mortalidad y costos."""
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+def hace(dias):
+    return str(date.today() - timedelta(days=dias))
+
+
+def mes(dias):
+    return hace(dias)[:7]
+
+
+@pytest.fixture
+def hato():
+    return pd.DataFrame({"ID": ["1", "2", "3"], "Nombre": list("abc"), "Tipo": "Vaca", "Sexo": "Hembra",
+                         "Nacimiento": "2020-01-01", "Estado": "Sano", "Lote": "General"})
+
+
+@pytest.fixture
+def hist_salud():
+    return historial([
+        [hace(200), "MASTITIS", "1"],
+        [hace(100), "MASTITIS", "1"],
+        [hace(200), "MASTITIS", "2"],
+        [hace(150), "TRATAMIENTO", "2", "Curativo | Neumonía", "Oxitetraciclina LA | 3 días"],
+        # Dos eventos a menos de DIAS_EPISODIO días son el mismo caso
+        [hace(60), "MASTITIS", "3"],
+        [hace(55), "MASTITIS", "3"],
+        [hace(60), "GASTO_OPERATIVO", "FINANZAS", "Monto: 100.0 (Cuenta: Caja)", main.CATEGORIA_GASTO_SANIDAD, "antibióticos"],
+        [hace(10), "MUERTE", "3", "Neumonía"],
+    ])
+
+
+@pytest.fixture
+def cuentas():
+    return pd.DataFrame({"Nombre": ["Caja"], "Moneda": ["USD ($)"], "Saldo": ["900"]})
+
+
+def test_casos_y_episodios(hist_salud):
+    casos = main.casos_sanitarios(hist_salud)
+    assert casos["Enfermedad"].tolist() == ["Mastitis", "Mastitis", "Mastitis", "Otra Enfermedad", "Mastitis", "Mastitis"]
+    assert casos["Días Tratamiento"].tolist() == [1, 1, 1, 3, 1, 1]
+    episodios = main.episodios_sanitarios(casos)
+    assert len(episodios) == 5
+    assert episodios.loc[episodios["ID Animal"] == "1", "Número"].tolist() == [1, 2]
+    assert episodios.loc[episodios["ID Animal"] == "3", ["Eventos", "Inicio", "Fin"]].values.tolist() == [
+        [2, pd.Timestamp(hace(60)), pd.Timestamp(hace(55))]]
+
+
+def test_indicadores_del_hato(hato, hist_salud, cuentas):
+    salud = main.salud_hato("v1", "a1", "c1", "USD", hato, hist_salud, cuentas)
+    assert len(salud["episodios"]) == 5
+    incidencia = salud["incidencia"].set_index(["Enfermedad", "Mes"])
+    assert incidencia.loc[("Mastitis", mes(60)), ["Casos", "Población"]].tolist() == [1, 3]
+    assert incidencia.loc[("Mastitis", mes(60)), "Incidencia"] == pytest.approx(100 / 3)
+
+    # Dos enfermedades distintas en la misma vaca no son una recaída
+    recurrencia = salud["recurrencia"].set_index("ID Animal")
+    assert recurrencia.index.tolist() == ["1"]
+    assert recurrencia.loc["1", ["Nombre", "Episodios", "Recaídas", "Mastitis", "Enfermedades"]].tolist() == ["a", 2, 1, 1, "Mastitis"]
+
+    mortalidad = salud["mortalidad"].set_index("Mes")
+    assert mortalidad.loc[mes(10), ["Muertes", "Población"]].tolist() == [1, 3]
+    assert salud["causas"].values.tolist() == [["Neumonía", 1]]
+
+    # El gasto del mes se reparte entre los casos que empezaron ese mes
+    assert salud["costos"].values.tolist() == [[mes(60), "Mastitis", pytest.approx(100)]]
+    costo = salud["costo_enfermedad"].set_index("Enfermedad")
+    assert costo.loc["Mastitis", "Costo por Episodio"] == pytest.approx(100 / 4)
+
+
+def test_salud_hato_sin_datos():
+    salud = main.salud_hato("v0", "a0", "c0", "USD", pd.DataFrame(), pd.DataFrame(), pd.DataFrame())
+    assert salud["episodios"].empty and salud["recurrencia"].empty and salud["costos"].empty
+    assert len(salud["mortalidad"]) == main.MESES_ANALISIS_SALUD
@@ -0,0 +1,112 @@
+"""Pruebas del calendario de vacunación del hato."""
+import pandas as pd
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("gspread")
+
+import main  # noqa: E402
+
+COLUMNAS_HISTORIAL = ["Fecha", "Tipo Evento", "ID Animal", "Detalle 1", "Detalle 2", "Notas", "ID Evento"]
+HOY = "2026-10-19"
+
+
+def historial(filas):
+    return pd.DataFrame([fila + [""] * (len(COLUMNAS_HISTORIAL) - len(fila)) for fila in filas], columns=COLUMNAS_HISTORIAL)
+
+
+@pytest.fixture
+def hato_vacunas():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3", "4"],
+        "Tipo": ["Vaca", "Becerro", "Toro", "Vaca"],
+        "Nombre": list("abcd"),
+        "Sexo": ["Hembra", "Hembra", "Macho", "Hembra"],
+        "Nacimiento": ["2020-01-01", "2026-07-01", "2020-01-01", "2020-01-01"],
+        "Estado": ["Lactancia", "Sano", "Sano", "VENDIDO"],
+        "Lote": "General",
+    })
+
+
+@pytest.fixture
+def hato_especies():
+    return pd.DataFrame({
+        "ID": ["1", "2", "3", "4", "5"],
+        "Tipo": ["Vaca", "Equino", "Porcino", "Becerro", "Vaca"],
+        "Nombre": list("abcde"),
+        "Sexo": ["Hembra", "Macho", "Macho", "Hembra", "Hembra"],
+        "Nacimiento": ["2020-01-01", "2019-05-05", "2025-12-01", "2026-07-01", ""],
+        "Estado": ["Lactancia", "Sano", "Sano", "Sano", "Sano"],
+        "Lote": "General",
+    })
+
+
+@pytest.fixture
+def hist_vacunas():
+    return historial([
+        ["2026-01-10", "VACUNACION", "1", "Fiebre Aftosa"],
+        ["2026-10-01", "VACUNACION", "1", "Complejo Clostridial"],
+        ["2026-06-01", "VACUNACION", "1", "rabia"],
+    ])
+
+
+def test_proxima_dosis_segun_el_protocolo(hato_vacunas, hist_vacunas):
+    calendario = main.calendario_vacunacion("v1", "a1", HOY, hato_vacunas, hist_vacunas).set_index(["ID Animal", "Vacuna"])
+    # Revacunación por intervalo, refuerzo tras la primera dosis y primera dosis por edad
+    assert calendario.loc[("1", "Fiebre Aftosa"), ["Próxima Dosis", "Estado"]].tolist() == [pd.Timestamp("2026-07-09"), "Vencida"]
+    assert calendario.loc[("1", "Complejo Clostridial"), ["Próxima Dosis", "Días", "Estado"]].tolist() == [pd.Timestamp("2026-10-31"), 12, "Próxima"]
+    assert calendario.loc[("1", "Rabia"), ["Dosis", "Estado"]].tolist() == [1, "Al día"]
+    assert calendario.loc[("2", "Leptospirosis"), ["Próxima Dosis", "Estado"]].tolist() == [pd.Timestamp("2026-10-29"), "Próxima"]
+    # Sin ninguna dosis registrada y pasada la edad de la primera no cuenta como vencida
+    assert calendario.loc[("2", "Brucelosis"), ["Próxima Dosis", "Estado"]].tolist() == [pd.Timestamp("2026-09-29"), "Sin registro"]
+    # La brucelosis es de hembras y solo hasta los 240 días; los vendidos no figuran
+    assert ("1", "Brucelosis") not in calendario.index and ("3", "Brucelosis") not in calendario.index
+    assert "4" not in calendario.index.get_level_values("ID Animal")
+    assert calendario["Días"].is_monotonic_increasing
+
+
+def test_protocolo_registrado_y_dosis_unica(hato_vacunas, hist_vacunas):
+    hist = pd.concat([hist_vacunas, historial([
+        ["2026-01-01", "PROTOCOLO_VACUNA", "FINCA", "Vacuna: fiebre aftosa", "Edad: 90 d | Refuerzo: 0 d | Intervalo: 365 d"],
+        ["2026-10-05", "VACUNACION", "2", "Brucelosis"],
+    ])], ignore_index=True)
+    protocolos = main.protocolos_vacunacion("v2", hist)
+    assert protocolos["Vacuna"].str.lower().value_counts()["fiebre aftosa"] == 1
+    calendario = main.calendario_vacunacion("v2", "a1", HOY, hato_vacunas, hist).set_index(["ID Animal", "Vacuna"])
+    assert calendario.loc[("1", "fiebre aftosa"), ["Próxima Dosis", "Estado"]].tolist() == [pd.Timestamp("2027-01-10"), "Al día"]
+    assert ("2", "Brucelosis") not in calendario.index
+
+
+def test_calendario_filtra_por_especie_y_sexo(hato_especies):
+    calendario = main.calendario_vacunacion("v1", "a1", HOY, hato_especies, historial([]))
+    vacunas = calendario.groupby("ID Animal")["Vacuna"].agg(set)
+    assert vacunas["2"] == {"Rabia", "Antiparasitario"}
+    assert vacunas["3"] == {"Fiebre Aftosa", "Leptospirosis", "Antiparasitario"}
+    assert "Brucelosis" not in vacunas["3"]
+
+
+def test_calendario_sin_registro_y_vencidas(hato_especies):
+    hist = historial([
+        ["2026-01-10", "VACUNACION", "1", "Fiebre Aftosa"],
+        ["2026-01-01", "PROTOCOLO_VACUNA", "FINCA", "Vacuna: Rabia", "Edad: 120 d | Intervalo: 300 d | Especie: Equino"],
+    ])
+    calendario = main.calendario_vacunacion("v2", "a1", HOY, hato_especies, hist).set_index(["ID Animal", "Vacuna"])
+    assert calendario.loc[("1", "Fiebre Aftosa"), "Estado"] == "Vencida"
+    # Nunca vacunados y pasados de la edad de la primera dosis, o sin fecha de nacimiento
+    assert calendario.loc[("2", "Rabia"), "Estado"] == "Sin registro"
+    assert set(calendario.xs("5", level="ID Animal")["Estado"]) == {"Sin registro"}
+    assert calendario.loc[("4", "Leptospirosis"), "Estado"] == "Próxima"
+    # El protocolo registrado reemplaza al de referencia: la rabia ya no aplica a bovinos
+    assert ("1", "Rabia") not in calendario.index
+    assert (calendario["Estado"] == "Vencida").sum() == 1
+
+
+def test_protocolos_sin_columnas_internas():
+    protocolos = main.protocolos_vacunacion("v0", pd.DataFrame())
+    assert list(protocolos.columns) == main.COLUMNAS_PROTOCOLO
+
+
+def test_calendario_vacio(hato_vacunas):
+    assert main.calendario_vacunacion("v0", "a0", HOY, pd.DataFrame(), pd.DataFrame()).empty
+    vendidos = hato_vacunas.assign(Estado="VENDIDO")
+    assert main.calendario_vacunacion("v0", "a2", HOY, vendidos, pd.DataFrame()).empty